@@ -0,0 +1,9 @@
+"""效能量測模組
+
+以 in-memory Qdrant、可重現的假嵌入模型與可設定延遲的假聊天模型取代外部服務，
+在本機離線量測三個 graph 的延遲、吞吐量、記憶體與各階段耗時。
+
+用法：
+    python -m benchmark --requests 200 --concurrency 16 --llm-latency 0.2
+    python -m benchmark.load --rate 20 --duration 60      # open-loop 並行負載測試，見 benchmark.load
+"""
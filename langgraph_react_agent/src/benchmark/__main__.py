@@ -0,0 +1,3 @@
+from benchmark.harness import main
+
+main()
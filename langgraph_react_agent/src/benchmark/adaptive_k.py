@@ -0,0 +1,224 @@
+"""
+adaptive k 的離線評估。
+
+比較固定 k(retrieve_limit)與 shared.adaptive_k 各組參數的平均文件數、估計 token 數、recall 與 precision，
+用來挑選不降低 recall、又能縮小 prompt 的 adaptive_score_gap / adaptive_relative_threshold / adaptive_token_budget。
+
+有標註的查詢集(JSONL，每行 {"query": ..., "relevant": [doc_name 或 point id, ...], "document_type": "insurance"})
+以目前環境變數設定的向量資料庫檢索候選；沒有標註資料時以 --synthetic 產生相關文件數 1~N 不等的模擬查詢。
+recall 的分母為 min(相關文件數, 候選數)。
+
+用法：
+    python -m benchmark.adaptive_k --queries eval/insurance.jsonl --embedding-model BAAI/bge-m3
+    python -m benchmark.adaptive_k --synthetic 500 --score-gap 0 0.2 0.3 --relative-threshold 0 0.15 0.25
+"""
+
+import argparse
+import itertools
+import json
+import sys
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+from shared.adaptive_k import choose_k, estimate_tokens
+
+
+@dataclass
+class EvalQuery:
+    """一筆查詢的候選(由好到壞)與標註"""
+
+    scores: list[float]
+    tokens: list[int]
+    relevant: list[bool]
+    """每筆候選是否相關"""
+    relevant_total: int
+
+
+@dataclass
+class EvalRun:
+    """一組參數的評估結果"""
+
+    name: str
+    score_gap: float
+    relative_threshold: float
+    token_budget: int
+    mean_k: float
+    mean_tokens: float
+    recall: float
+    precision: float
+    cutoff_reasons: dict[str, int]
+
+
+def synthetic_queries(count: int, max_k: int, max_relevant: int = 8, dimensions: int = 64, seed: int = 0) -> list[EvalQuery]:
+    """以單位向量模擬查詢：相關文件、容易混淆的文件與背景文件離查詢的距離依序增加，相關文件數 1~max_relevant"""
+    rng = np.random.default_rng(seed)
+
+    def around(query: np.ndarray, scale: float, n: int) -> np.ndarray:
+        vectors = query + rng.normal(scale=scale / np.sqrt(dimensions), size=(n, dimensions))
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    queries = []
+    for _ in range(count):
+        query = rng.normal(size=dimensions)
+        query /= np.linalg.norm(query)
+        relevant_total = int(rng.integers(1, max_relevant + 1))
+        relevant = np.concatenate([around(query, scale, 1) for scale in rng.uniform(0.6, 0.9, relevant_total)])
+        distractors = around(query, 1.2, 6)
+        background = around(query, 2.5, 200)
+        vectors = np.concatenate([relevant, distractors, background])
+        distances = np.linalg.norm(vectors - query, axis=1)
+        order = np.argsort(distances)[:max_k]
+        queries.append(
+            EvalQuery(
+                scores=distances[order].tolist(),
+                tokens=rng.integers(150, 700, size=len(order)).tolist(),
+                relevant=(order < relevant_total).tolist(),
+                relevant_total=relevant_total,
+            )
+        )
+    return queries
+
+
+def labeled_queries(path: str, max_k: int, configurable: dict[str, Any]) -> tuple[list[EvalQuery], bool]:
+    """以實際的 retriever 取得標註查詢的候選，回傳 (查詢, 分數是否越大越好)"""
+    from langchain_core.runnables import RunnableConfig
+
+    from shared import retrieval
+
+    queries, higher_is_better = [], False
+    with open(path, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    for item in items:
+        config = RunnableConfig(
+            configurable={
+                **configurable,
+                "adaptive_k": True,
+                "adaptive_max_k": max_k,
+                **({"document_type": item["document_type"]} if "document_type" in item else {}),
+            }
+        )
+        with retrieval.get_retriever(config) as retriever:
+            adaptive = retriever.default
+            higher_is_better = adaptive.higher_is_better
+            candidates = adaptive.candidates(item["query"])
+        relevant = set(item["relevant"])
+        queries.append(
+            EvalQuery(
+                scores=[score for _, score in candidates],
+                tokens=[estimate_tokens(doc.page_content) for doc, _ in candidates],
+                relevant=[doc.metadata.get("doc_name") in relevant or str(doc.metadata.get("_id")) in relevant for doc, _ in candidates],
+                relevant_total=len(relevant),
+            )
+        )
+    return queries, higher_is_better
+
+
+def evaluate(
+    queries: list[EvalQuery],
+    name: str,
+    higher_is_better: bool,
+    *,
+    fixed_k: Optional[int] = None,
+    min_k: int = 1,
+    score_gap: float = 0.0,
+    relative_threshold: float = 0.0,
+    token_budget: int = 0,
+) -> EvalRun:
+    ks, tokens, recalls, precisions, reasons = [], [], [], [], {}
+    for query in queries:
+        if fixed_k is not None:
+            k, reason = min(fixed_k, len(query.scores)), "fixed"
+        else:
+            cutoff = choose_k(
+                query.scores,
+                query.tokens,
+                higher_is_better=higher_is_better,
+                min_k=min_k,
+                score_gap=score_gap,
+                relative_threshold=relative_threshold,
+                token_budget=token_budget,
+            )
+            k, reason = cutoff.k, cutoff.reason
+        hits = sum(query.relevant[:k])
+        ks.append(k)
+        tokens.append(sum(query.tokens[:k]))
+        recalls.append(hits / max(min(query.relevant_total, len(query.scores)), 1))
+        precisions.append(hits / k if k else 0.0)
+        reasons[reason] = reasons.get(reason, 0) + 1
+    return EvalRun(
+        name=name,
+        score_gap=score_gap,
+        relative_threshold=relative_threshold,
+        token_budget=token_budget,
+        mean_k=round(float(np.mean(ks)), 3),
+        mean_tokens=round(float(np.mean(tokens)), 1),
+        recall=round(float(np.mean(recalls)), 4),
+        precision=round(float(np.mean(precisions)), 4),
+        cutoff_reasons=reasons,
+    )
+
+
+def format_runs(runs: list[EvalRun]) -> str:
+    lines = [f"{'設定':<28}{'gap':>6}{'rel':>6}{'budget':>8}{'平均 k':>9}{'平均 tokens':>13}{'recall':>9}{'precision':>11}  截斷原因"]
+    for run in runs:
+        lines.append(
+            f"{run.name:<28}{run.score_gap:>6}{run.relative_threshold:>6}{run.token_budget:>8}{run.mean_k:>9}"
+            f"{run.mean_tokens:>13}{run.recall:>9}{run.precision:>11}  {run.cutoff_reasons}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmark.adaptive_k", description="固定 k 與 adaptive k 的離線評估")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--queries", help="標註查詢集(JSONL)")
+    source.add_argument("--synthetic", type=int, help="產生 N 筆模擬查詢")
+    parser.add_argument("--embedding-model", default=None, help="標註查詢集使用的 embedding 模型")
+    parser.add_argument("--configurable", default="{}", help="額外傳入 retriever 的 configurable(JSON)")
+    parser.add_argument("--k", type=int, default=5, help="比較基準的固定 k")
+    parser.add_argument("--max-k", type=int, default=10, help="候選數")
+    parser.add_argument("--min-k", type=int, default=1)
+    parser.add_argument("--score-gap", type=float, nargs="+", default=[0.0, 0.2, 0.3, 0.4])
+    parser.add_argument("--relative-threshold", type=float, nargs="+", default=[0.0, 0.1, 0.2, 0.3])
+    parser.add_argument("--token-budget", type=int, nargs="+", default=[0, 4000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", default=None, help="將結果輸出為 JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> list[EvalRun]:
+    args = parse_args(argv)
+    if args.synthetic:
+        queries, higher_is_better = synthetic_queries(args.synthetic, args.max_k, seed=args.seed), False
+    else:
+        configurable = json.loads(args.configurable)
+        if args.embedding_model:
+            configurable["embedding_model"] = args.embedding_model
+        queries, higher_is_better = labeled_queries(args.queries, args.max_k, configurable)
+
+    runs = [evaluate(queries, f"fixed k={args.k}", higher_is_better, fixed_k=args.k)]
+    for score_gap, relative_threshold, token_budget in itertools.product(args.score_gap, args.relative_threshold, args.token_budget):
+        if not score_gap and not relative_threshold and not token_budget:
+            continue
+        runs.append(
+            evaluate(
+                queries,
+                "adaptive",
+                higher_is_better,
+                min_k=args.min_k,
+                score_gap=score_gap,
+                relative_threshold=relative_threshold,
+                token_budget=token_budget,
+            )
+        )
+    sys.stdout.write(format_runs(runs) + "\n")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump([asdict(run) for run in runs], f, indent=2, ensure_ascii=False)
+    return runs
+
+
+if __name__ == "__main__":
+    main()
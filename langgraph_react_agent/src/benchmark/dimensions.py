@@ -0,0 +1,184 @@
+"""
+降維後的 recall@k 與查詢延遲量測。
+
+從既有 collection(預設為 gemini 的 collection)讀出向量，轉換為各維度的暫存 collection(`原名稱_bench_d{維度}_{方式}`)，
+隨機抽出部分文件向量作為查詢(排除自身)，以原始維度的精確搜尋結果為基準，量測 recall@k 與 Qdrant 查詢延遲。
+來源 collection 只讀取；PCA 投影矩陣只保留在記憶體，不會寫入 PCA_MODEL_DIR，也不會動到正式的 `_d{維度}` collection。
+
+用法：
+    python -m benchmark.dimensions --document-type insurance --dimensions 3072 1536 768 --methods truncate pca
+    python -m benchmark.dimensions --seed 5000      # 以 in-memory Qdrant 與假向量驗證流程
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from benchmark.harness import percentile
+from shared.dimension_reduction import (
+    DimensionReducer,
+    PCAReducer,
+    TruncateReducer,
+    normalize,
+    read_dense_vectors,
+    write_reduced_collection,
+)
+
+SCRATCH_SUFFIX = "_bench"
+"""暫存 collection 名稱的後綴，與正式的降維 collection(`_d{維度}`)區隔"""
+
+
+@dataclass
+class DimensionRun:
+    """單一維度、降維方式的量測結果"""
+
+    dimensions: int
+    method: str
+    recall_at_k: float
+    latency_ms: dict[str, float] = field(default_factory=dict)
+    vector_mb: float = 0.0
+
+
+def exact_top_k(vectors: np.ndarray, query_indices: list[int], k: int) -> list[set[int]]:
+    """以 numpy 計算原始維度下的精確 top-k(排除查詢自身)，回傳各查詢的列索引"""
+    results = []
+    for index in query_indices:
+        distances = np.linalg.norm(vectors - vectors[index], axis=1)
+        distances[index] = np.inf
+        results.append(set(np.argpartition(distances, k)[:k].tolist()))
+    return results
+
+
+def measure(client, collection_name: str, queries: np.ndarray, query_ids: list, id_to_row: dict, truth: list[set[int]], k: int) -> tuple[float, list[float]]:
+    """在 collection 上逐筆查詢，回傳 recall@k 與延遲"""
+    hits, latencies = [], []
+    for query, query_id, expected in zip(queries, query_ids, truth):
+        started = time.perf_counter()
+        points = client.query_points(
+            collection_name=collection_name,
+            query=query.tolist(),
+            using="dense_text",
+            limit=k + 1,
+            with_payload=False,
+        ).points
+        latencies.append(time.perf_counter() - started)
+        found = [id_to_row[point.id] for point in points if point.id != query_id][:k]
+        hits.append(len(expected & set(found)) / k)
+    return float(np.mean(hits)), latencies
+
+
+def seed_collection(client, collection_name: str, size: int, dimensions: int = 3072) -> None:
+    """建立假向量 collection；前段維度變異較大，模擬 Matryoshka 向量的能量分布"""
+    from qdrant_client.http import models
+
+    rng = np.random.default_rng(0)
+    scale = np.linspace(1.0, 0.1, dimensions, dtype=np.float32)
+    vectors = normalize(rng.standard_normal((size, dimensions), dtype=np.float32) * scale)
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={"dense_text": models.VectorParams(size=dimensions, distance=models.Distance.EUCLID)},
+    )
+    for start in range(0, size, 256):
+        client.upsert(
+            collection_name=collection_name,
+            points=[models.PointStruct(id=start + i, vector={"dense_text": v.tolist()}) for i, v in enumerate(vectors[start:start + 256])],
+        )
+
+
+def scratch_collection_name(collection_name: str, dimensions: int, method: str) -> str:
+    return f"{collection_name}{SCRATCH_SUFFIX}_d{dimensions}_{method}"
+
+
+def fit_reducer(method: str, vectors: np.ndarray, dimensions: int) -> DimensionReducer:
+    """量測用的降維方式；pca 以來源向量擬合，投影矩陣不寫入檔案"""
+    return PCAReducer.fit(vectors, dimensions) if method == "pca" else TruncateReducer(dimensions)
+
+
+def run(client, collection_name: str, dimensions: list[int], methods: list[str], query_count: int, k: int, keep: bool) -> list[DimensionRun]:
+    ids, vectors, payloads = read_dense_vectors(client, collection_name)
+    full_dimensions = vectors.shape[1]
+    id_to_row = {point_id: row for row, point_id in enumerate(ids)}
+    query_rows = random.Random(0).sample(range(len(ids)), min(query_count, len(ids)))
+    query_ids = [ids[row] for row in query_rows]
+    truth = exact_top_k(normalize(vectors), query_rows, k)
+
+    runs = []
+    for dim in dimensions:
+        for method in methods if dim < full_dimensions else ["full"]:
+            if method == "pca" and len(ids) < dim:
+                sys.stdout.write(f"dim={dim:<5} pca       略過：向量數量 {len(ids)} 少於目標維度\n")
+                continue
+            if method == "full":
+                target, queries = collection_name, vectors[query_rows]
+            else:
+                reducer = fit_reducer(method, vectors, dim)
+                target = write_reduced_collection(
+                    client, collection_name, scratch_collection_name(collection_name, dim, method), reducer, ids, vectors, payloads
+                )
+                queries = reducer.transform(vectors[query_rows])
+            try:
+                recall, latencies = measure(client, target, queries, query_ids, id_to_row, truth, k)
+            finally:
+                if target != collection_name and not keep:
+                    client.delete_collection(target)
+            result = DimensionRun(
+                dimensions=min(dim, full_dimensions),
+                method=method,
+                recall_at_k=round(recall, 4),
+                latency_ms={"p50": round(percentile(latencies, 50) * 1000, 3), "p95": round(percentile(latencies, 95) * 1000, 3)},
+                vector_mb=round(len(ids) * min(dim, full_dimensions) * 4 / 1024 / 1024, 3),
+            )
+            sys.stdout.write(
+                f"dim={result.dimensions:<5} {method:<9} recall@{k}={result.recall_at_k:.4f}  "
+                f"p50={result.latency_ms['p50']:.2f}ms p95={result.latency_ms['p95']:.2f}ms  vectors={result.vector_mb:.1f}MB\n"
+            )
+            sys.stdout.flush()
+            runs.append(result)
+    return runs
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmark.dimensions", description="量測 gemini 向量降維後的 recall@k 與延遲")
+    parser.add_argument("--document-type", choices=("insurance", "system_analysis"), default="insurance")
+    parser.add_argument("--collection", default=None, help="來源 collection，預設依 document type 取 gemini 的 collection")
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[3072, 1536, 768])
+    parser.add_argument("--methods", nargs="+", choices=("truncate", "pca"), default=["truncate", "pca"])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0, help="以 in-memory Qdrant 與 N 筆假向量執行")
+    parser.add_argument("--keep", action="store_true", help=f"保留降維後的暫存 collection(`*{SCRATCH_SUFFIX}_d*`)")
+    parser.add_argument("--report", default=None, help="將結果輸出為 JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.seed:
+        os.environ["QDRANT_URL"] = ":memory:"
+
+    from shared.retrieval import get_qdrant_client, get_qdrant_collection_name
+    from shared.settings import reload_settings
+
+    reload_settings()
+
+    client = get_qdrant_client()
+    if args.seed:
+        collection_name = "bench_dimensions"
+        seed_collection(client, collection_name, args.seed)
+    else:
+        collection_name = args.collection or get_qdrant_collection_name("google_genai", args.document_type)
+    runs = run(client, collection_name, args.dimensions, args.methods, args.queries, args.k, args.keep)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump([asdict(r) for r in runs], f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+本機嵌入模型的吞吐量量測與參數調校。
+
+對 batch_size、CPU 執行緒數、fp16、max_length 的所有組合，以樣本語料量測 texts/s、每個 batch 的延遲與 RSS，
+並將吞吐量最高的組合寫入 EMBEDDING_SETTINGS_FILE，供 get_match_embedding 在載入模型時讀取。
+
+用法：
+    python -m benchmark.embedding --model BAAI/bge-m3 --batch-sizes 8 16 32 --threads 4 8 --corpus ./docs
+"""
+
+import argparse
+import gc
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from benchmark.harness import percentile
+from shared.embedding_settings import (
+    DEFAULT_SETTINGS,
+    LocalEmbeddingSettings,
+    save_embedding_settings,
+    settings_path,
+    thread_settings,
+)
+
+MODELS = ("BAAI/bge-m3", "Microsoft/intfloat/multilingual-e5-large")
+
+SAMPLE_TOPICS = (
+    "信用卡年費減免條件與申請流程",
+    "旅遊平安險的理賠範圍與除外責任",
+    "房屋貸款提前清償違約金計算方式",
+    "外幣定存的利率、期別與解約規定",
+    "數位帳戶開戶所需文件與身分驗證",
+    "醫療險住院日額給付與實支實付差異",
+    "基金申購手續費與信託管理費說明",
+    "掛失補發金融卡的作業時間與費用",
+)
+
+
+@dataclass
+class EmbeddingRun:
+    """一組參數的量測結果"""
+
+    settings: LocalEmbeddingSettings
+    texts_per_second: float
+    batch_latency_ms: dict[str, float] = field(default_factory=dict)
+    rss_mb: float = 0.0
+    error: Optional[str] = None
+
+
+def load_corpus(path: Optional[str], size: int) -> list[str]:
+    """讀取樣本語料。path 可為檔案(每行一段)或資料夾(每個 .txt/.md 一段)；未指定時產生合成語料"""
+    if path is None:
+        rng = random.Random(0)
+        return [
+            "，".join(rng.choice(SAMPLE_TOPICS) for _ in range(rng.randint(2, 12)))
+            for _ in range(size)
+        ]
+    source = Path(path)
+    if source.is_dir():
+        texts = [p.read_text(encoding="utf-8") for p in sorted(source.rglob("*")) if p.suffix in (".txt", ".md")]
+    else:
+        texts = [line for line in source.read_text(encoding="utf-8").splitlines() if line.strip()]
+    if not texts:
+        raise ValueError(f"樣本語料為空: {path}")
+    return list(itertools.islice(itertools.cycle(texts), size))
+
+
+def current_rss_mb() -> float:
+    """目前的 RSS(MB)；無 /proc 時退回 process 的最大 RSS"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 3)
+    except (OSError, ValueError):
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 3)
+
+
+def load_local_embedding(model: str, settings: LocalEmbeddingSettings):
+    """依參數載入新的本機嵌入模型(不經 process 內的模型快取)，回傳 embed_documents 函式"""
+    match model:
+        case "BAAI/bge-m3":
+            from shared.baai_bge_m3 import BGEM3QdrantDenseEmbeddings
+            return BGEM3QdrantDenseEmbeddings(settings).embed_documents
+        case "Microsoft/intfloat/multilingual-e5-large":
+            from shared.retrieval import create_huggingface_embedding
+            return create_huggingface_embedding(model.split("/", maxsplit=1)[1], settings).embed_documents
+        case _:
+            raise ValueError(f"不支援的本機 embedding 模型: {model}")
+
+
+def measure(model: str, settings: LocalEmbeddingSettings, corpus: list[str], warmup: int = 1) -> EmbeddingRun:
+    """以指定參數量測一次：先跑 warmup 個 batch，再逐 batch 計時整份語料
+
+    模型每組參數載入一次，量測 RSS 後即釋放，RSS 只包含這一組參數的模型
+    """
+    # torch 的執行緒數是 process 全域的，量測結束後還原，避免影響下一組參數與同一個 process 中的其他模型
+    with thread_settings(settings):
+        embed = load_local_embedding(model, settings)
+        batches = [corpus[i:i + settings.batch_size] for i in range(0, len(corpus), settings.batch_size)]
+        for batch in batches[:warmup]:
+            embed(batch)
+        latencies = []
+        started = time.perf_counter()
+        for batch in batches:
+            batch_started = time.perf_counter()
+            embed(batch)
+            latencies.append(time.perf_counter() - batch_started)
+        elapsed = time.perf_counter() - started
+        rss_mb = current_rss_mb()
+        del embed
+        gc.collect()
+    return EmbeddingRun(
+        settings=settings,
+        texts_per_second=round(len(corpus) / elapsed, 3),
+        batch_latency_ms={
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "max": round(max(latencies) * 1000, 3),
+        },
+        rss_mb=rss_mb,
+    )
+
+
+def sweep(model: str, corpus: list[str], batch_sizes: list[int], threads: list[Optional[int]], fp16: list[bool], max_lengths: list[int]) -> list[EmbeddingRun]:
+    """量測所有參數組合；單一組合失敗(例如 CPU 不支援 fp16)時記錄錯誤並繼續"""
+    runs = []
+    for batch_size, num_threads, use_fp16, max_length in itertools.product(batch_sizes, threads, fp16, max_lengths):
+        settings = LocalEmbeddingSettings(batch_size=batch_size, num_threads=num_threads, use_fp16=use_fp16, max_length=max_length)
+        try:
+            run = measure(model, settings, corpus)
+        except Exception as e:
+            run = EmbeddingRun(settings=settings, texts_per_second=0.0, error=f"{type(e).__name__}: {e}")
+        sys.stdout.write(format_run(run) + "\n")
+        sys.stdout.flush()
+        runs.append(run)
+    return runs
+
+
+def best_run(runs: list[EmbeddingRun]) -> Optional[EmbeddingRun]:
+    """吞吐量最高的組合；吞吐量相同時取 RSS 較低者"""
+    succeeded = [run for run in runs if run.error is None]
+    return max(succeeded, key=lambda run: (run.texts_per_second, -run.rss_mb), default=None)
+
+
+def format_run(run: EmbeddingRun) -> str:
+    s = run.settings
+    head = f"batch={s.batch_size:<4} threads={str(s.num_threads):<5} fp16={str(s.use_fp16):<5} max_len={s.max_length:<5}"
+    if run.error:
+        return f"{head} ERROR {run.error}"
+    latency = run.batch_latency_ms
+    return (
+        f"{head} {run.texts_per_second:>9.2f} texts/s  "
+        f"batch p50={latency['p50']:.1f}ms p95={latency['p95']:.1f}ms  rss={run.rss_mb:.0f}MB"
+    )
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmark.embedding", description="量測並調校本機嵌入模型的推論參數")
+    parser.add_argument("--model", choices=MODELS, default=MODELS[0])
+    parser.add_argument("--corpus", default=None, help="樣本語料，檔案(每行一段)或資料夾；未指定時使用合成語料")
+    parser.add_argument("--corpus-size", type=int, default=256, help="量測的文字數量")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--threads", type=int, nargs="+", default=None, help="CPU 執行緒數，未指定時使用 torch 預設值")
+    parser.add_argument("--fp16", choices=("off", "on", "both"), default="off")
+    parser.add_argument("--max-lengths", type=int, nargs="+", default=None, help="未指定時使用模型預設上限")
+    parser.add_argument("--output", default=None, help=f"參數設定檔，預設為 EMBEDDING_SETTINGS_FILE({settings_path()})")
+    parser.add_argument("--report", default=None, help="將所有量測結果輸出為 JSON")
+    parser.add_argument("--dry-run", action="store_true", help="只量測，不寫入設定檔")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    corpus = load_corpus(args.corpus, args.corpus_size)
+    fp16 = {"off": [False], "on": [True], "both": [False, True]}[args.fp16]
+    max_lengths = args.max_lengths or [DEFAULT_SETTINGS[args.model].max_length]
+    runs = sweep(args.model, corpus, args.batch_sizes, args.threads or [None], fp16, max_lengths)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump([asdict(run) for run in runs], f, indent=2, ensure_ascii=False)
+
+    best = best_run(runs)
+    if best is None:
+        raise SystemExit("所有參數組合都失敗，未寫入設定檔")
+    sys.stdout.write(f"\n建議參數: {format_run(best)}\n")
+    if not args.dry_run:
+        path = save_embedding_settings(args.model, best.settings, Path(args.output) if args.output else None)
+        sys.stdout.write(f"已寫入 {path}\n")
+
+
+if __name__ == "__main__":
+    main()
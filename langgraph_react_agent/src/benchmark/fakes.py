@@ -0,0 +1,214 @@
+"""
+benchmark 使用的本機替代品。
+
+所有假模型都是可重現的：相同輸入一定得到相同輸出，延遲則依參數模擬，讓每次量測的差異只來自程式本身。
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_qdrant.sparse_embeddings import SparseEmbeddings, SparseVector
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+class FakeDenseEmbeddings(Embeddings):
+    """以文字 hash 為亂數種子產生固定向量的密集嵌入模型"""
+
+    def __init__(self, size: int = 1024, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+
+    def _embed(self, text: str) -> list[float]:
+        rng = random.Random(_seed(text))
+        vector = [rng.gauss(0, 1) for _ in range(self.size)]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, query: str) -> list[float]:
+        return self.embed_documents([query])[0]
+
+
+class FakeSparseEmbeddings(SparseEmbeddings):
+    """以字元 bigram hash 計數產生稀疏向量的嵌入模型"""
+
+    def __init__(self, vocab_size: int = 250002):
+        self.vocab_size = vocab_size
+
+    def _embed(self, text: str) -> SparseVector:
+        weights: dict[int, float] = {}
+        for i in range(max(len(text) - 1, 1)):
+            index = _seed(text[i:i + 2]) % self.vocab_size
+            weights[index] = weights.get(index, 0.0) + 1.0
+        return SparseVector(indices=list(weights.keys()), values=list(weights.values()))
+
+    def embed_documents(self, texts: list[str]) -> list[SparseVector]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, query: str) -> SparseVector:
+        return self._embed(query)
+
+
+class FakeBGEM3Embedding(Embeddings):
+    """與 shared.baai_bge_m3.BAAIBGEM3Embedding 相同介面(dense / sparse)的假模型"""
+
+    def __init__(self, latency: float = 0.0):
+        self.dense = FakeDenseEmbeddings(1024, latency)
+        self.sparse = FakeSparseEmbeddings()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return []
+
+    def embed_query(self, query: str) -> list[float]:
+        return []
+
+
+EMBEDDING_DIMENSIONS = {
+    "AWS.Bedrock": 1024,
+    "BAAI": 1024,
+    "Microsoft": 1024,
+    "google_genai": 3072,
+}
+"""各 embedding provider 的密集向量維度"""
+
+
+def get_fake_embedding(model: str, latency: float = 0.0) -> Embeddings:
+    """依 embedding_model 名稱取得相同維度、相同介面的假嵌入模型"""
+    provider = model.split("/", maxsplit=1)[0]
+    if provider == "BAAI":
+        return FakeBGEM3Embedding(latency)
+    return FakeDenseEmbeddings(EMBEDDING_DIMENSIONS.get(provider, 1024), latency)
+
+
+class FakeChatModel(BaseChatModel):
+    """可設定延遲與 token 速率的假聊天模型
+
+    有綁定 tools 且最後一則訊息不是 ToolMessage 時，呼叫第一個 tool(字串參數帶入使用者訊息)；
+    否則回覆固定文字。支援 with_structured_output 與 streaming。
+    """
+
+    latency: float = 0.0
+    """第一個 token 前的延遲(秒)"""
+
+    tokens_per_second: float = 0.0
+    """輸出 token 的速率，0 表示不模擬逐 token 延遲"""
+
+    response_text: str = "根據檢索到的文件，這是測試用的回答內容。參考文件：benchmark。"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark-chat-model"
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[str] = None, **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _build_message(self, messages: list[BaseMessage], tools: Optional[list[dict[str, Any]]]) -> AIMessage:
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        if tools and not isinstance(messages[-1], ToolMessage):
+            function = tools[0]["function"]
+            text = str(messages[-1].content)
+            properties = function.get("parameters", {}).get("properties", {})
+            args = {name: text if prop.get("type", "string") == "string" else None for name, prop in properties.items()}
+            return AIMessage(
+                content="",
+                tool_calls=[{"name": function["name"], "args": args, "id": f"call_{_seed(text) % 10**8}"}],
+                usage_metadata={"input_tokens": input_tokens, "output_tokens": 16, "total_tokens": input_tokens + 16},
+            )
+        output_tokens = len(self.response_text)
+        return AIMessage(
+            content=self.response_text,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+    def _generation_time(self, message: AIMessage) -> float:
+        if not self.tokens_per_second:
+            return self.latency
+        return self.latency + message.usage_metadata["output_tokens"] / self.tokens_per_second
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self._build_message(messages, kwargs.get("tools"))
+        time.sleep(self._generation_time(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self._build_message(messages, kwargs.get("tools"))
+        await asyncio.sleep(self._generation_time(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> Iterator[AIMessageChunk]:
+        if message.tool_calls:
+            call = message.tool_calls[0]
+            yield AIMessageChunk(
+                content="",
+                tool_call_chunks=[{"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}],
+                usage_metadata=message.usage_metadata,
+            )
+            return
+        for i, char in enumerate(message.content):
+            yield AIMessageChunk(content=char, usage_metadata=message.usage_metadata if i == 0 else None)
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        message = self._build_message(messages, kwargs.get("tools"))
+        time.sleep(self.latency)
+        for chunk in self._chunks(message):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            if run_manager:
+                run_manager.on_llm_new_token(str(chunk.content), chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._build_message(messages, kwargs.get("tools"))
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(message):
+            if self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            if run_manager:
+                await run_manager.on_llm_new_token(str(chunk.content), chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
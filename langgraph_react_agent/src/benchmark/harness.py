@@ -0,0 +1,288 @@
+"""
+離線 RAG benchmark harness。
+
+以 in-memory Qdrant、假嵌入模型、假聊天模型執行三個 compiled graph，
+回報 p50/p95/p99 延遲、並行 N 個對話 thread 時的吞吐量、記憶體高水位與各 node / 階段耗時。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Any, Optional
+
+from benchmark.fakes import FakeChatModel, get_fake_embedding
+from fake_services.qdrant import DEFAULT_COLLECTION_ENV, SAMPLE_TOPICS, seed_collections as seed_fake_collections
+
+GRAPH_NAMES = ("retrieval_graph", "react_agent", "kb_retrieval_agent")
+
+REPORTED_ERRORS = 5
+"""報表中每個 graph 列出的錯誤種類數"""
+
+@dataclass(kw_only=True)
+class BenchmarkOptions:
+    """benchmark 的執行參數"""
+
+    graphs: tuple[str, ...] = GRAPH_NAMES
+    requests: int = 100
+    concurrency: int = 8
+    embedding_model: str = "AWS.Bedrock/cohere.embed-multilingual-v3"
+    corpus_size: int = 500
+    llm_latency: float = 0.05
+    tokens_per_second: float = 0.0
+    embedding_latency: float = 0.0
+    qdrant_url: str = ":memory:"
+    log_level: str = "WARNING"
+    configurable: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class GraphReport:
+    """單一 graph 的量測結果"""
+
+    graph: str
+    requests: int
+    errors: int
+    concurrency: int
+    wall_seconds: float
+    throughput_rps: float
+    latency_ms: dict[str, float]
+    peak_traced_mb: float
+    max_rss_mb: float
+    breakdown_ms: dict[str, dict[str, float]]
+    cache_hit_rate: dict[str, float] = field(default_factory=dict)
+    """各快取(含 speculative_retrieval)的命中率"""
+    error_counts: dict[str, int] = field(default_factory=dict)
+    """失敗請求的「例外類型: 訊息」→ 次數，依次數排序"""
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """以線性內插計算百分位數"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize_latency(latencies: list[float]) -> dict[str, float]:
+    """將延遲(秒)整理為 ms 的統計值"""
+    return {
+        "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50": round(percentile(latencies, 50) * 1000, 3),
+        "p95": round(percentile(latencies, 95) * 1000, 3),
+        "p99": round(percentile(latencies, 99) * 1000, 3),
+        "max": round(max(latencies, default=0.0) * 1000, 3),
+    }
+
+
+def setup_offline_environment(options: BenchmarkOptions) -> None:
+    """將外部服務替換為本機替代品
+
+    必須在第一次建立 Qdrant client 之前呼叫；graph 模組中的 load_chat_model 與 shared.retrieval
+    的 get_match_embedding 會被替換為假模型
+    """
+    os.environ["QDRANT_URL"] = options.qdrant_url
+    os.environ.setdefault("QDRANT_API_KEY", "")
+    for key, value in DEFAULT_COLLECTION_ENV.items():
+        os.environ.setdefault(key, value)
+
+    from shared import retrieval
+    from shared.logger import set_logger_level
+    from shared.settings import reload_settings
+
+    reload_settings()
+
+    for logger_name in ("retrieval", "react_agent", "kb_retrieval_agent"):
+        set_logger_level(logger_name, options.log_level)
+
+    retrieval.get_match_embedding = lambda model: get_fake_embedding(model, options.embedding_latency)
+
+    from shared.llm_gateway import gateway_model, reset_gateway
+
+    reset_gateway()
+
+    def load_fake_chat_model(fully_specified_name: str):
+        return gateway_model(
+            FakeChatModel(latency=options.llm_latency, tokens_per_second=options.tokens_per_second), fully_specified_name
+        )
+
+    import kb_retrieval_agent.graph
+    import react_agent.graph
+    import retrieval_graph.graph
+
+    for module in (retrieval_graph.graph, react_agent.graph, kb_retrieval_agent.graph):
+        module.load_chat_model = load_fake_chat_model
+
+
+def seed_collections(options: BenchmarkOptions) -> None:
+    """在 Qdrant 建立受測 embedding 模型的 collections，並寫入可重現的合成文件，見 fake_services.qdrant"""
+    from shared.retrieval import get_qdrant_client
+
+    seed_fake_collections(get_qdrant_client(), options.embedding_model, options.corpus_size)
+
+
+def load_graph(name: str) -> Any:
+    """取得 langgraph.json 中同名的 compiled graph"""
+    match name:
+        case "retrieval_graph":
+            from retrieval_graph.graph import graph
+        case "react_agent":
+            from react_agent.graph import graph
+        case "kb_retrieval_agent":
+            from kb_retrieval_agent.graph import graph
+        case _:
+            raise ValueError(f"不支援的 graph: {name}")
+    return graph
+
+
+def _breakdown(snapshot: dict[str, Any], graph_name: str) -> dict[str, dict[str, float]]:
+    """將 instrumentation 的 histogram 整理為每個 node / 階段的平均耗時"""
+    result = {}
+    for key, hist in snapshot["histograms"].items():
+        if 'graph="' in key and f'graph="{graph_name}"' not in key:
+            continue
+        count = hist["count"]
+        result[key] = {"count": count, "mean_ms": round(hist["sum"] / count * 1000, 3) if count else 0.0}
+    return result
+
+
+def _cache_hit_rate(snapshot: dict[str, Any]) -> dict[str, float]:
+    """由 rag_cache_requests_total 計算各快取的命中率"""
+    counts: dict[str, list[float]] = {}
+    for key, value in snapshot["counters"].items():
+        if not key.startswith("rag_cache_requests_total{"):
+            continue
+        labels = dict(pair.split("=", 1) for pair in key[key.index("{") + 1 : -1].split(","))
+        hit_total = counts.setdefault(labels["cache"].strip('"'), [0.0, 0.0])
+        hit_total[0] += value if labels["result"] == '"hit"' else 0
+        hit_total[1] += value
+    return {cache: round(hit / total, 3) for cache, (hit, total) in sorted(counts.items()) if total}
+
+
+async def run_graph(name: str, options: BenchmarkOptions) -> GraphReport:
+    """以固定並行數執行 options.requests 次 graph，每次使用新的對話 thread"""
+    from shared.instrumentation import metrics
+
+    graph = load_graph(name)
+    semaphore = asyncio.Semaphore(options.concurrency)
+    latencies: list[float] = []
+    errors: Counter[str] = Counter()
+
+    async def one_request(i: int) -> None:
+        question = f"{SAMPLE_TOPICS[i % len(SAMPLE_TOPICS)]} 要如何設定？(#{i})"
+        config = {"configurable": {"thread_id": str(uuid.uuid4()), "embedding_model": options.embedding_model, **options.configurable}}
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await graph.ainvoke({"messages": [("user", question)]}, config)
+            except Exception as e:
+                errors[f"{type(e).__name__}: {str(e)[:200]}"] += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    metrics.reset()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(options.requests)))
+    wall = time.perf_counter() - start
+    snapshot = metrics.snapshot()
+
+    return GraphReport(
+        graph=name,
+        requests=options.requests,
+        errors=sum(errors.values()),
+        concurrency=options.concurrency,
+        wall_seconds=round(wall, 3),
+        throughput_rps=round(len(latencies) / wall, 3) if wall else 0.0,
+        latency_ms=summarize_latency(latencies),
+        peak_traced_mb=round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 3),
+        max_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 3),
+        breakdown_ms=_breakdown(snapshot, name),
+        cache_hit_rate=_cache_hit_rate(snapshot),
+        error_counts=dict(errors.most_common()),
+    )
+
+
+async def run_benchmark(options: BenchmarkOptions) -> list[GraphReport]:
+    """準備離線環境並依序量測每個 graph"""
+    setup_offline_environment(options)
+    seed_collections(options)
+    tracemalloc.start()
+    try:
+        return [await run_graph(name, options) for name in options.graphs]
+    finally:
+        tracemalloc.stop()
+
+
+def format_report(reports: list[GraphReport]) -> str:
+    """將量測結果整理為文字表格"""
+    lines = [
+        f"{'graph':<20}{'req':>6}{'err':>5}{'conc':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MB':>10}{'rss MB':>10}"
+    ]
+    for r in reports:
+        lines.append(
+            f"{r.graph:<20}{r.requests:>6}{r.errors:>5}{r.concurrency:>6}{r.throughput_rps:>10}"
+            f"{r.latency_ms['p50']:>10}{r.latency_ms['p95']:>10}{r.latency_ms['p99']:>10}{r.peak_traced_mb:>10}{r.max_rss_mb:>10}"
+        )
+    for r in reports:
+        lines.append(f"\n[{r.graph}] 各階段平均耗時")
+        for key, value in sorted(r.breakdown_ms.items()):
+            lines.append(f"  {key:<90}{value['count']:>8.0f}{value['mean_ms']:>12} ms")
+        if r.cache_hit_rate:
+            lines.append(f"[{r.graph}] 快取命中率: " + ", ".join(f"{k}={v:.1%}" for k, v in r.cache_hit_rate.items()))
+        if r.error_counts:
+            lines.append(f"[{r.graph}] 錯誤({len(r.error_counts)} 種)")
+            for message, count in list(r.error_counts.items())[:REPORTED_ERRORS]:
+                lines.append(f"  {count:>6}  {message}")
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> tuple[BenchmarkOptions, Optional[str]]:
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="離線量測三個 graph 的效能")
+    parser.add_argument("--graphs", nargs="+", choices=GRAPH_NAMES, default=list(GRAPH_NAMES))
+    parser.add_argument("--requests", type=int, default=100, help="每個 graph 的請求數")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時執行的對話 thread 數")
+    parser.add_argument("--embedding-model", default="AWS.Bedrock/cohere.embed-multilingual-v3")
+    parser.add_argument("--corpus-size", type=int, default=500, help="每個 collection 寫入的合成文件數")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="假聊天模型第一個 token 前的延遲(秒)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="假聊天模型輸出速率，0 表示不模擬")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="假嵌入模型每次呼叫的延遲(秒)")
+    parser.add_argument("--qdrant-url", default=":memory:", help="Qdrant 位置，預設 in-memory")
+    parser.add_argument("--log-level", default="WARNING", help="graph logger 的等級，預設 WARNING 避免 console 輸出干擾")
+    parser.add_argument("--configurable", default="{}", help="額外傳入 graph 的 configurable(JSON)")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔案")
+    args = parser.parse_args(argv)
+    options = BenchmarkOptions(
+        graphs=tuple(args.graphs),
+        requests=args.requests,
+        concurrency=args.concurrency,
+        embedding_model=args.embedding_model,
+        corpus_size=args.corpus_size,
+        llm_latency=args.llm_latency,
+        tokens_per_second=args.tokens_per_second,
+        embedding_latency=args.embedding_latency,
+        qdrant_url=args.qdrant_url,
+        log_level=args.log_level,
+        configurable=json.loads(args.configurable),
+    )
+    return options, args.output
+
+
+def main(argv: Optional[list[str]] = None) -> list[GraphReport]:
+    options, output = parse_args(argv)
+    reports = asyncio.run(run_benchmark(options))
+    sys.stdout.write(format_report(reports) + "\n")
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"options": asdict(options), "reports": [asdict(r) for r in reports]}, f, ensure_ascii=False, indent=2)
+    return reports
@@ -0,0 +1,160 @@
+"""
+graph 模組的 import 時間報告。
+
+以 `python -X importtime` 在獨立的 process 中分別載入 langgraph.json 列出的每個 graph(每次都是冷啟動)，
+統計總耗時、各頂層套件的累計耗時與最慢的模組，用來確認重量級套件沒有在 import 時被載入。
+
+用法：
+    python -m benchmark.import_time
+    python -m benchmark.import_time --repeat 5 --top 30 --report import_time.json
+    python -m benchmark.import_time --baseline import_time.json   # 與先前的報告比較
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+LANGGRAPH_JSON = Path(__file__).resolve().parents[2] / "langgraph.json"
+
+HEAVY_PACKAGES = (
+    "torch",
+    "transformers",
+    "FlagEmbedding",
+    "sentence_transformers",
+    "onnxruntime",
+    "qdrant_client",
+    "langchain_qdrant",
+    "langchain_community",
+    "langchain_aws",
+    "boto3",
+    "langchain_google_genai",
+    "numpy",
+)
+"""不應在 graph import 時載入的套件，累計耗時超過 HEAVY_THRESHOLD_MS 時在報告中標示"""
+
+HEAVY_THRESHOLD_MS = 5.0
+"""低於此耗時視為只是探測套件是否存在(例如 langchain_core 檢查 transformers)"""
+
+
+@dataclass
+class ImportReport:
+    graph: str
+    module: str
+    total_ms: float
+    """多次量測的中位數"""
+    packages_ms: dict[str, float] = field(default_factory=dict)
+    """頂層套件的累計耗時(只計入該套件第一次被 import 的那一層)"""
+    slowest: list[tuple[str, float]] = field(default_factory=list)
+    """self 耗時最高的模組"""
+    heavy: list[str] = field(default_factory=list)
+
+
+def graph_modules(path: Path = LANGGRAPH_JSON) -> dict[str, str]:
+    """langgraph.json 的 graph 名稱 → module 名稱"""
+    graphs = json.loads(path.read_text(encoding="utf-8"))["graphs"]
+    return {name: target.split(":")[0].removeprefix("./src/").removesuffix(".py").replace("/", ".") for name, target in graphs.items()}
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, float, float]]:
+    """解析 -X importtime 輸出為 (module, 深度, self 毫秒, cumulative 毫秒)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), depth, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return rows
+
+
+def measure(module: str, src_dir: Path) -> list[tuple[str, int, float, float]]:
+    env = {**os.environ, "PYTHONPATH": str(src_dir), "WARMUP_ON_STARTUP": "false"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} 失敗:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def build_report(graph: str, module: str, src_dir: Path, repeat: int, top: int) -> ImportReport:
+    runs = [measure(module, src_dir) for _ in range(repeat)]
+    totals = [sum(self_ms for _, _, self_ms, _ in rows) for rows in runs]
+    # 以中位數那次的明細產生報告
+    rows = runs[totals.index(sorted(totals)[len(totals) // 2])]
+
+    packages: dict[str, float] = {}
+    for name, _, _, cumulative_ms in rows:
+        package = name.split(".")[0]
+        if name == package:
+            packages[package] = packages.get(package, 0.0) + cumulative_ms
+    return ImportReport(
+        graph=graph,
+        module=module,
+        total_ms=statistics.median(totals),
+        packages_ms=dict(sorted(packages.items(), key=lambda item: -item[1])[:top]),
+        slowest=[(name, self_ms) for name, _, self_ms, _ in sorted(rows, key=lambda row: -row[2])[:top]],
+        heavy=[package for package in HEAVY_PACKAGES if packages.get(package, 0.0) >= HEAVY_THRESHOLD_MS],
+    )
+
+
+def format_report(report: ImportReport, baseline: Optional[dict] = None, top: int = 15) -> str:
+    lines = [f"[{report.graph}] import {report.module}: {report.total_ms:.0f} ms"]
+    if baseline:
+        delta = report.total_ms - baseline["total_ms"]
+        lines[0] += f"(基準 {baseline['total_ms']:.0f} ms，{delta:+.0f} ms)"
+    if report.heavy:
+        lines.append(f"  載入了重量級套件: {', '.join(report.heavy)}")
+    lines.append("  頂層套件累計:")
+    for package, ms in list(report.packages_ms.items())[:top]:
+        previous = (baseline or {}).get("packages_ms", {}).get(package)
+        suffix = f"  ({ms - previous:+.1f})" if previous is not None else ""
+        lines.append(f"    {package:<40}{ms:>10.1f} ms{suffix}")
+    lines.append("  self 耗時最高的模組:")
+    for name, ms in report.slowest[:top]:
+        lines.append(f"    {name:<60}{ms:>8.1f} ms")
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="graph 模組的 import 時間報告")
+    parser.add_argument("--graphs", nargs="+", help="只量測這些 graph，預設 langgraph.json 中的全部")
+    parser.add_argument("--repeat", type=int, default=3, help="每個 graph 量測次數，取中位數")
+    parser.add_argument("--top", type=int, default=15, help="列出的套件與模組數")
+    parser.add_argument("--baseline", type=Path, help="先前 --report 產生的 JSON，列出差異")
+    parser.add_argument("--report", type=Path, help="將結果寫入 JSON 檔案")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    src_dir = Path(__file__).resolve().parents[1]
+    graphs = graph_modules()
+    baseline = {}
+    if args.baseline:
+        baseline = {item["graph"]: item for item in json.loads(args.baseline.read_text(encoding="utf-8"))}
+
+    reports = []
+    for graph, module in graphs.items():
+        if args.graphs and graph not in args.graphs:
+            continue
+        report = build_report(graph, module, src_dir, args.repeat, max(args.top, 50))
+        reports.append(report)
+        sys.stdout.write(format_report(report, baseline.get(graph), args.top) + "\n\n")
+        sys.stdout.flush()
+
+    if args.report:
+        args.report.write_text(json.dumps([asdict(r) for r in reports], ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
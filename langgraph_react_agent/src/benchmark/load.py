@@ -0,0 +1,526 @@
+"""
+並行負載測試。
+
+依 JSONL 對話腳本以 open-loop 到達率(不等待前一個對話完成)重播多輪對話，
+對象可為同一個 process 內的 compiled graph，或 LangGraph server API(langgraph dev / langgraph up)。
+記錄每輪與整段對話的延遲 histogram、錯誤率、排程延遲與 event loop lag，並可與先前儲存的 baseline 比較。
+
+對話腳本(JSONL，每行一段對話，graph 省略時依 --graphs 輪流分配)：
+    {"graph": "kb_retrieval_agent", "turns": ["保險理賠要準備哪些文件？", "線上可以申請嗎？"], "configurable": {}}
+
+in-process 的 --backend：
+    fake            benchmark.fakes 的假模型與 in-memory Qdrant(與 python -m benchmark 相同)
+    fake-services   真實的 Bedrock / Gemini client 連線到 fake_services 的假 server，含 HTTP 與序列化成本
+    live            使用目前環境變數設定的模型與向量資料庫
+
+用法：
+    python -m benchmark.load --rate 20 --duration 60 --max-in-flight 500
+    python -m benchmark.load --scripts load/conversations.jsonl --backend fake-services --save-baseline load/baseline.json
+    python -m benchmark.load --target server --url http://127.0.0.1:2024 --rate 5 --baseline load/baseline.json
+
+與 baseline 比較時任一 graph 的 p50/p95/p99 延遲或 event loop lag 增加超過 --tolerance、
+吞吐量下降超過 --tolerance，或錯誤率增加超過 --error-tolerance 即視為退化，結束代碼為 1。
+server 模式下的 event loop lag 為負載產生器本身的 lag，用來確認量測結果未受產生器拖累。
+in-process 時設定 LOOP_MONITOR_ENABLED=true 會一併列出阻塞 event loop 的 node / tool(見 shared.loop_monitor)。
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from typing import Any, Optional
+
+from benchmark.harness import GRAPH_NAMES, BenchmarkOptions, _breakdown, _cache_hit_rate, load_graph, summarize_latency
+from fake_services.qdrant import SAMPLE_TOPICS
+from shared.instrumentation import DEFAULT_BUCKETS
+from shared.loop_monitor import get_loop_monitor
+
+FOLLOW_UPS = ["還有其他需要注意的地方嗎？", "可以再說明詳細一點嗎？", "需要準備哪些文件？"]
+
+MIN_LATENCY_DELTA_MS = 5.0
+"""延遲類指標的變化小於此值時不視為退化，避免極短延遲的雜訊"""
+
+
+@dataclass
+class Conversation:
+    """一段多輪對話腳本"""
+
+    graph: str
+    turns: list[str]
+    configurable: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(kw_only=True)
+class LoadOptions:
+    """負載測試的執行參數"""
+
+    graphs: tuple[str, ...] = GRAPH_NAMES
+    scripts: Optional[str] = None
+    target: str = "inprocess"
+    url: str = "http://127.0.0.1:2024"
+    backend: str = "fake"
+    rate: float = 10.0
+    """每秒開始的對話數"""
+    duration: float = 30.0
+    arrival: str = "poisson"
+    max_in_flight: int = 1000
+    """同時進行的對話上限，超過時該次到達記為 dropped"""
+    think_time: float = 0.0
+    """同一段對話兩輪之間的等待(秒)"""
+    timeout: float = 120.0
+    """每輪的逾時(秒)"""
+    seed: int = 0
+    embedding_model: str = "AWS.Bedrock/cohere.embed-multilingual-v3"
+    corpus_size: int = 500
+    llm_latency: float = 0.05
+    tokens_per_second: float = 0.0
+    embedding_latency: float = 0.0
+    lag_interval: float = 0.05
+    log_level: str = "WARNING"
+    configurable: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class GraphLoad:
+    """單一 graph 的負載測試結果"""
+
+    graph: str
+    conversations: int
+    turns: int
+    errors: int
+    error_rate: float
+    errors_by_type: dict[str, int]
+    dropped: int
+    throughput_rps: float
+    """每秒完成的對話輪數"""
+    turn_latency_ms: dict[str, float]
+    conversation_latency_ms: dict[str, float]
+    histogram: dict[str, int]
+    """每輪延遲的 histogram，key 為上界(秒)"""
+    breakdown_ms: dict[str, dict[str, float]] = field(default_factory=dict)
+
+
+@dataclass
+class LoadReport:
+    """整次負載測試的結果"""
+
+    offered_rate: float
+    wall_seconds: float
+    peak_in_flight: int
+    loop_lag_ms: dict[str, float]
+    schedule_delay_ms: dict[str, float]
+    """實際開始對話的時間與預定到達時間的差"""
+    graphs: list[GraphLoad]
+    cache_hit_rate: dict[str, float] = field(default_factory=dict)
+    """in-process 時各快取的命中率(所有 graph 合計)"""
+    blocked_by: dict[str, int] = field(default_factory=dict)
+    """in-process 且啟用 shared.loop_monitor 時，阻塞 event loop 的來源與次數"""
+
+
+def load_scripts(path: str, graphs: tuple[str, ...]) -> list[Conversation]:
+    """讀取 JSONL 對話腳本，未指定 graph 的對話依 graphs 輪流分配"""
+    conversations = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            graph = row.get("graph") or graphs[len(conversations) % len(graphs)]
+            if graph not in GRAPH_NAMES:
+                raise ValueError(f"不支援的 graph: {graph}")
+            if graph in graphs:
+                conversations.append(Conversation(graph=graph, turns=list(row["turns"]), configurable=row.get("configurable") or {}))
+    if not conversations:
+        raise ValueError(f"{path} 沒有屬於 {', '.join(graphs)} 的對話")
+    return conversations
+
+
+def synthetic_scripts(graphs: tuple[str, ...], count: int = 64, seed: int = 0) -> list[Conversation]:
+    """未提供腳本時產生 1~3 輪的合成對話"""
+    rng = random.Random(seed)
+    return [
+        Conversation(
+            graph=graphs[i % len(graphs)],
+            turns=[f"{SAMPLE_TOPICS[i % len(SAMPLE_TOPICS)]} 要如何設定？"] + rng.sample(FOLLOW_UPS, rng.randint(0, 2)),
+        )
+        for i in range(count)
+    ]
+
+
+def arrival_times(rate: float, duration: float, arrival: str, seed: int = 0) -> list[float]:
+    """duration 秒內各對話的預定開始時間(相對於開始)"""
+    if rate <= 0:
+        raise ValueError("rate 必須大於 0")
+    rng = random.Random(seed)
+    times = []
+    t = 0.0
+    while True:
+        match arrival:
+            case "poisson":
+                t += rng.expovariate(rate)
+            case "uniform":
+                t += 1 / rate
+            case _:
+                raise ValueError(f"不支援的到達分布: {arrival}")
+        if t >= duration:
+            return times
+        times.append(t)
+
+
+def histogram(latencies: list[float], buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> dict[str, int]:
+    """累積 histogram(與 Prometheus 相同，le 為上界)"""
+    result = {str(bound): sum(1 for v in latencies if v <= bound) for bound in buckets}
+    result["+Inf"] = len(latencies)
+    return result
+
+
+class LoopLagMonitor:
+    """定期 sleep interval 秒，以實際醒來的延遲估計 event loop lag"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class InProcessTarget:
+    """在同一個 process 內呼叫 compiled graph；graph 沒有 checkpointer，由 client 端保留對話歷史"""
+
+    def __init__(self, options: LoadOptions):
+        self.options = options
+        self._stack = ExitStack()
+
+    async def __aenter__(self) -> "InProcessTarget":
+        from benchmark import harness
+
+        match self.options.backend:
+            case "fake":
+                benchmark_options = BenchmarkOptions(
+                    graphs=self.options.graphs,
+                    embedding_model=self.options.embedding_model,
+                    corpus_size=self.options.corpus_size,
+                    llm_latency=self.options.llm_latency,
+                    tokens_per_second=self.options.tokens_per_second,
+                    embedding_latency=self.options.embedding_latency,
+                    log_level=self.options.log_level,
+                )
+                harness.setup_offline_environment(benchmark_options)
+                harness.seed_collections(benchmark_options)
+            case "fake-services":
+                from fake_services.common import ServiceOptions
+                from fake_services.environment import fake_environment
+
+                service_options = ServiceOptions(
+                    latency=self.options.llm_latency,
+                    tokens_per_second=self.options.tokens_per_second,
+                    embedding_latency=self.options.embedding_latency,
+                )
+                self._stack.enter_context(fake_environment(service_options, [self.options.embedding_model], self.options.corpus_size))
+            case "live":
+                pass
+            case _:
+                raise ValueError(f"不支援的 backend: {self.options.backend}")
+        if self.options.backend != "fake":
+            from shared.logger import set_logger_level
+
+            for logger_name in ("retrieval", "react_agent", "kb_retrieval_agent"):
+                set_logger_level(logger_name, self.options.log_level)
+        self._graphs = {name: load_graph(name) for name in self.options.graphs}
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self._stack.close()
+
+    async def new_thread(self, graph: str) -> dict[str, Any]:
+        return {"thread_id": str(uuid.uuid4()), "messages": []}
+
+    async def send(self, graph: str, thread: dict[str, Any], text: str, configurable: dict[str, Any]) -> None:
+        config = {"configurable": {"thread_id": thread["thread_id"], "embedding_model": self.options.embedding_model, **configurable}}
+        result = await self._graphs[graph].ainvoke({"messages": [*thread["messages"], ("user", text)]}, config)
+        thread["messages"] = result["messages"]
+
+
+class ServerTarget:
+    """透過 LangGraph server API 執行，對話歷史由 server 的 checkpointer 保存"""
+
+    def __init__(self, options: LoadOptions):
+        self.options = options
+
+    async def __aenter__(self) -> "ServerTarget":
+        from langgraph_sdk import get_client
+
+        self._client = get_client(url=self.options.url, timeout=self.options.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self._client.http.client.aclose()
+
+    async def new_thread(self, graph: str) -> dict[str, Any]:
+        thread = await self._client.threads.create()
+        return {"thread_id": thread["thread_id"]}
+
+    async def send(self, graph: str, thread: dict[str, Any], text: str, configurable: dict[str, Any]) -> None:
+        result = await self._client.runs.wait(
+            thread["thread_id"],
+            graph,
+            input={"messages": [{"role": "user", "content": text}]},
+            config={"configurable": {"embedding_model": self.options.embedding_model, **configurable}},
+        )
+        if isinstance(result, dict) and "__error__" in result:
+            raise RuntimeError(result["__error__"].get("error") or "run failed")
+
+
+@dataclass
+class _GraphStats:
+    conversations: int = 0
+    dropped: int = 0
+    turns: list[float] = field(default_factory=list)
+    completed: list[float] = field(default_factory=list)
+    errors: dict[str, int] = field(default_factory=dict)
+
+
+async def run_load(options: LoadOptions) -> LoadReport:
+    """依到達時間啟動對話，等待所有對話完成後彙整結果"""
+    from shared.instrumentation import metrics
+
+    scripts = load_scripts(options.scripts, options.graphs) if options.scripts else synthetic_scripts(options.graphs, seed=options.seed)
+    schedule = arrival_times(options.rate, options.duration, options.arrival, options.seed)
+    stats = {name: _GraphStats() for name in options.graphs}
+    schedule_delays: list[float] = []
+    in_flight = 0
+    peak_in_flight = 0
+
+    target = ServerTarget(options) if options.target == "server" else InProcessTarget(options)
+    async with target:
+
+        async def conversation(script: Conversation) -> None:
+            nonlocal in_flight
+            graph_stats = stats[script.graph]
+            start = time.perf_counter()
+            failed = False
+            try:
+                thread = await target.new_thread(script.graph)
+                for i, text in enumerate(script.turns):
+                    if i and options.think_time:
+                        await asyncio.sleep(options.think_time)
+                    turn_start = time.perf_counter()
+                    try:
+                        await asyncio.wait_for(target.send(script.graph, thread, text, {**options.configurable, **script.configurable}), options.timeout)
+                    except Exception as e:
+                        graph_stats.errors[type(e).__name__] = graph_stats.errors.get(type(e).__name__, 0) + 1
+                        failed = True
+                        break
+                    graph_stats.turns.append(time.perf_counter() - turn_start)
+            except Exception as e:
+                graph_stats.errors[type(e).__name__] = graph_stats.errors.get(type(e).__name__, 0) + 1
+                failed = True
+            finally:
+                in_flight -= 1
+            if not failed:
+                graph_stats.completed.append(time.perf_counter() - start)
+
+        metrics.reset()
+        lag = LoopLagMonitor(options.lag_interval)
+        lag.start()
+        loop = asyncio.get_running_loop()
+        tasks = []
+        start = loop.time()
+        for i, offset in enumerate(schedule):
+            delay = start + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            schedule_delays.append(max(0.0, loop.time() - start - offset))
+            script = scripts[i % len(scripts)]
+            if in_flight >= options.max_in_flight:
+                stats[script.graph].dropped += 1
+                continue
+            in_flight += 1
+            peak_in_flight = max(peak_in_flight, in_flight)
+            stats[script.graph].conversations += 1
+            tasks.append(asyncio.create_task(conversation(script)))
+        await asyncio.gather(*tasks)
+        wall = loop.time() - start
+        await lag.stop()
+        monitor = get_loop_monitor() if options.target == "inprocess" else None
+        snapshot = metrics.snapshot()
+
+    graphs = []
+    for name, graph_stats in stats.items():
+        errors = sum(graph_stats.errors.values())
+        attempted = len(graph_stats.turns) + errors
+        graphs.append(
+            GraphLoad(
+                graph=name,
+                conversations=graph_stats.conversations,
+                turns=len(graph_stats.turns),
+                errors=errors,
+                error_rate=round(errors / attempted, 4) if attempted else 0.0,
+                errors_by_type=graph_stats.errors,
+                dropped=graph_stats.dropped,
+                throughput_rps=round(len(graph_stats.turns) / wall, 3) if wall else 0.0,
+                turn_latency_ms=summarize_latency(graph_stats.turns),
+                conversation_latency_ms=summarize_latency(graph_stats.completed),
+                histogram=histogram(graph_stats.turns),
+                breakdown_ms=_breakdown(snapshot, name) if options.target == "inprocess" else {},
+            )
+        )
+    return LoadReport(
+        offered_rate=options.rate,
+        wall_seconds=round(wall, 3),
+        peak_in_flight=peak_in_flight,
+        loop_lag_ms=summarize_latency(lag.samples),
+        schedule_delay_ms=summarize_latency(schedule_delays),
+        graphs=graphs,
+        cache_hit_rate=_cache_hit_rate(snapshot) if options.target == "inprocess" else {},
+        blocked_by=dict(monitor.owners.most_common()) if monitor else {},
+    )
+
+
+def compare_baseline(report: LoadReport, baseline: dict[str, Any], tolerance: float, error_tolerance: float) -> list[str]:
+    """與 baseline(save_baseline 寫入的 JSON)比較，回傳退化項目的說明"""
+
+    def worse(name: str, current: float, previous: float, higher_is_worse: bool = True, min_delta: float = 0.0) -> Optional[str]:
+        delta = current - previous if higher_is_worse else previous - current
+        if delta > max(previous * tolerance, min_delta):
+            return f"{name}: {previous} → {current}"
+        return None
+
+    regressions = []
+    previous_graphs = {g["graph"]: g for g in baseline["report"]["graphs"]}
+    for graph in report.graphs:
+        previous = previous_graphs.get(graph.graph)
+        if not previous or not graph.turns:
+            continue
+        checks = [
+            worse(f"{graph.graph} turn {pct}", graph.turn_latency_ms[pct], previous["turn_latency_ms"][pct], min_delta=MIN_LATENCY_DELTA_MS)
+            for pct in ("p50", "p95", "p99")
+        ]
+        checks.append(worse(f"{graph.graph} throughput_rps", graph.throughput_rps, previous["throughput_rps"], higher_is_worse=False))
+        if graph.error_rate - previous["error_rate"] > error_tolerance:
+            checks.append(f"{graph.graph} error_rate: {previous['error_rate']} → {graph.error_rate}")
+        regressions.extend(c for c in checks if c)
+    lag = worse("loop lag p99", report.loop_lag_ms["p99"], baseline["report"]["loop_lag_ms"]["p99"], min_delta=MIN_LATENCY_DELTA_MS)
+    if lag:
+        regressions.append(lag)
+    return regressions
+
+
+def format_report(report: LoadReport) -> str:
+    """將結果整理為文字表格"""
+    lines = [
+        f"offered {report.offered_rate} conv/s, wall {report.wall_seconds}s, peak in-flight {report.peak_in_flight}",
+        f"event loop lag ms: p50={report.loop_lag_ms['p50']} p99={report.loop_lag_ms['p99']} max={report.loop_lag_ms['max']}; "
+        f"schedule delay ms: p99={report.schedule_delay_ms['p99']} max={report.schedule_delay_ms['max']}",
+        f"{'graph':<20}{'conv':>6}{'turns':>7}{'err%':>7}{'drop':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+    ]
+    for g in report.graphs:
+        lines.append(
+            f"{g.graph:<20}{g.conversations:>6}{g.turns:>7}{g.error_rate:>7.1%}{g.dropped:>6}{g.throughput_rps:>9}"
+            f"{g.turn_latency_ms['p50']:>10}{g.turn_latency_ms['p95']:>10}{g.turn_latency_ms['p99']:>10}{g.turn_latency_ms['max']:>10}"
+        )
+    for g in report.graphs:
+        if not g.turns and not g.errors:
+            continue
+        lines.append(f"\n[{g.graph}] 每輪延遲 histogram(累積)")
+        lines.append("  " + "  ".join(f"≤{bound if bound == '+Inf' else bound + 's'}:{count}" for bound, count in g.histogram.items()))
+        if g.errors_by_type:
+            lines.append(f"[{g.graph}] 錯誤: " + ", ".join(f"{k}={v}" for k, v in sorted(g.errors_by_type.items())))
+    if report.cache_hit_rate:
+        lines.append("\n快取命中率: " + ", ".join(f"{k}={v:.1%}" for k, v in report.cache_hit_rate.items()))
+    if report.blocked_by:
+        lines.append("阻塞 event loop 的來源: " + ", ".join(f"{k}={v}" for k, v in report.blocked_by.items()))
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmark.load", description="以 open-loop 到達率對三個 graph 進行並行負載測試")
+    parser.add_argument("--graphs", nargs="+", choices=GRAPH_NAMES, default=list(GRAPH_NAMES))
+    parser.add_argument("--scripts", help="JSONL 對話腳本，未指定時使用合成對話")
+    parser.add_argument("--target", choices=("inprocess", "server"), default="inprocess")
+    parser.add_argument("--url", default="http://127.0.0.1:2024", help="LangGraph server 位址(--target server)")
+    parser.add_argument("--backend", choices=("fake", "fake-services", "live"), default="fake", help="in-process 時模型與向量資料庫的來源")
+    parser.add_argument("--rate", type=float, default=10.0, help="每秒開始的對話數")
+    parser.add_argument("--duration", type=float, default=30.0, help="產生到達的時間長度(秒)")
+    parser.add_argument("--arrival", choices=("poisson", "uniform"), default="poisson")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="同時進行的對話上限，超過時丟棄該次到達")
+    parser.add_argument("--think-time", type=float, default=0.0, help="同一段對話兩輪之間的等待(秒)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="每輪的逾時(秒)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embedding-model", default="AWS.Bedrock/cohere.embed-multilingual-v3")
+    parser.add_argument("--corpus-size", type=int, default=500)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="假聊天模型第一個 token 前的延遲(秒)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.0)
+    parser.add_argument("--lag-interval", type=float, default=0.05, help="event loop lag 的取樣間隔(秒)")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--configurable", default="{}", help="額外傳入 graph 的 configurable(JSON)")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔案")
+    parser.add_argument("--baseline", help="與此 baseline 比較，退化時結束代碼為 1")
+    parser.add_argument("--save-baseline", help="將本次結果存為 baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="延遲與吞吐量可接受的相對變化")
+    parser.add_argument("--error-tolerance", type=float, default=0.01, help="錯誤率可接受的增加量")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> LoadReport:
+    args = parse_args(argv)
+    options = LoadOptions(
+        graphs=tuple(args.graphs),
+        scripts=args.scripts,
+        target=args.target,
+        url=args.url,
+        backend=args.backend,
+        rate=args.rate,
+        duration=args.duration,
+        arrival=args.arrival,
+        max_in_flight=args.max_in_flight,
+        think_time=args.think_time,
+        timeout=args.timeout,
+        seed=args.seed,
+        embedding_model=args.embedding_model,
+        corpus_size=args.corpus_size,
+        llm_latency=args.llm_latency,
+        tokens_per_second=args.tokens_per_second,
+        embedding_latency=args.embedding_latency,
+        lag_interval=args.lag_interval,
+        log_level=args.log_level,
+        configurable=json.loads(args.configurable),
+    )
+    report = asyncio.run(run_load(options))
+    sys.stdout.write(format_report(report) + "\n")
+    result = {"options": asdict(options), "report": asdict(report)}
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_baseline(report, json.load(f), args.tolerance, args.error_tolerance)
+        if regressions:
+            sys.stdout.write("\n與 baseline 相比退化：\n  " + "\n  ".join(regressions) + "\n")
+            raise SystemExit(1)
+        sys.stdout.write("\n與 baseline 相比無退化\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
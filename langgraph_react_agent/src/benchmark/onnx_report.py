@@ -0,0 +1,166 @@
+"""
+ONNX Runtime 後端與 PyTorch 基準的準確度/速度比較報告。
+
+以同一份樣本語料比較 pytorch、onnx(fp32)、onnx-int8 三種後端：
+    texts/s、每個 batch 的延遲、RSS
+    密集向量與 PyTorch 向量的 cosine 相似度(平均/最小)
+    以語料前 N 段為查詢時，top-k 檢索結果與 PyTorch 結果的重疊率(recall@k)
+    bge-m3 另外比較稀疏向量(lexical weights)的 cosine 相似度
+
+用法：
+    python -m benchmark.onnx_report --model BAAI/bge-m3 --corpus ./docs --report onnx_report.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional
+
+import numpy as np
+
+from benchmark.embedding import MODELS, current_rss_mb, load_corpus
+from benchmark.harness import percentile
+from shared.embedding_settings import get_embedding_settings
+
+BACKENDS = ("pytorch", "onnx", "onnx-int8")
+
+
+@dataclass
+class BackendReport:
+    """單一後端的量測結果，準確度欄位以 PyTorch 為基準"""
+
+    backend: str
+    texts_per_second: float
+    batch_latency_ms: dict[str, float] = field(default_factory=dict)
+    rss_mb: float = 0.0
+    dense_cosine_mean: float = 1.0
+    dense_cosine_min: float = 1.0
+    recall_at_k: float = 1.0
+    sparse_cosine_mean: Optional[float] = None
+
+
+def load_backend(model: str, backend: str) -> tuple[Callable[[list[str]], list], Optional[Callable[[list[str]], list]]]:
+    """回傳(密集嵌入函式, 稀疏嵌入函式)；非 bge-m3 時稀疏嵌入函式為 None"""
+    if backend == "pytorch":
+        if model == "BAAI/bge-m3":
+            from shared.baai_bge_m3 import BGEM3QdrantDenseEmbeddings, BGEM3QdrantSparseEmbeddings
+            return BGEM3QdrantDenseEmbeddings().embed_documents, BGEM3QdrantSparseEmbeddings().embed_documents
+        from shared.retrieval import load_huggingface_embedding
+        return load_huggingface_embedding(model.split("/", maxsplit=1)[1], get_embedding_settings(model)).embed_documents, None
+
+    from shared.onnx_embedding import load_onnx_embedding
+
+    embedding = load_onnx_embedding(f"{model}-{backend}")
+    if model == "BAAI/bge-m3":
+        return embedding.dense.embed_documents, embedding.sparse.embed_documents
+    return embedding.embed_documents, None
+
+
+def timed_embed(embed: Callable[[list[str]], list], corpus: list[str], batch_size: int) -> tuple[np.ndarray, list[float]]:
+    """逐 batch 嵌入整份語料，回傳向量矩陣與每個 batch 的耗時"""
+    embed(corpus[:batch_size])  # warm-up
+    vectors, latencies = [], []
+    for start in range(0, len(corpus), batch_size):
+        started = time.perf_counter()
+        vectors.extend(embed(corpus[start:start + batch_size]))
+        latencies.append(time.perf_counter() - started)
+    return np.asarray(vectors, dtype=np.float32), latencies
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """以內積取每個查詢的 top-k 文件索引(向量皆已正規化)"""
+    scores = queries @ vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def recall_at_k(baseline: np.ndarray, candidate: np.ndarray) -> float:
+    """候選 top-k 中出現在基準 top-k 的比例"""
+    hits = [len(set(b.tolist()) & set(c.tolist())) / len(b) for b, c in zip(baseline, candidate)]
+    return float(np.mean(hits))
+
+
+def sparse_cosine(a, b) -> float:
+    """兩個 SparseVector 的 cosine 相似度"""
+    left, right = dict(zip(a.indices, a.values)), dict(zip(b.indices, b.values))
+    dot = sum(value * right.get(index, 0.0) for index, value in left.items())
+    norm = np.sqrt(sum(v * v for v in left.values())) * np.sqrt(sum(v * v for v in right.values()))
+    return float(dot / norm) if norm else 0.0
+
+
+def build_report(model: str, corpus: list[str], backends: list[str], queries: int, k: int) -> list[BackendReport]:
+    """依序量測各後端，第一個後端(pytorch)作為準確度基準"""
+    batch_size = get_embedding_settings(model).batch_size
+    query_count = min(queries, len(corpus))
+    reports = []
+    baseline_vectors = baseline_top_k = baseline_sparse = None
+    for backend in backends:
+        dense, sparse = load_backend(model, backend)
+        vectors, latencies = timed_embed(dense, corpus, batch_size)
+        vectors = _normalize(vectors)
+        ranked = top_k(vectors, vectors[:query_count], k)
+        sparse_vectors = sparse(corpus) if sparse else None
+
+        report = BackendReport(
+            backend=backend,
+            texts_per_second=round(len(corpus) / sum(latencies), 3),
+            batch_latency_ms={
+                "p50": round(percentile(latencies, 50) * 1000, 3),
+                "p95": round(percentile(latencies, 95) * 1000, 3),
+            },
+            rss_mb=current_rss_mb(),
+        )
+        if baseline_vectors is None:
+            baseline_vectors, baseline_top_k, baseline_sparse = vectors, ranked, sparse_vectors
+        else:
+            cosine = np.sum(vectors * baseline_vectors, axis=1)
+            report.dense_cosine_mean = round(float(cosine.mean()), 6)
+            report.dense_cosine_min = round(float(cosine.min()), 6)
+            report.recall_at_k = round(recall_at_k(baseline_top_k, ranked), 6)
+        if sparse_vectors is not None and baseline_sparse is not None:
+            report.sparse_cosine_mean = round(float(np.mean([sparse_cosine(a, b) for a, b in zip(sparse_vectors, baseline_sparse)])), 6)
+        sys.stdout.write(format_report(report, k) + "\n")
+        sys.stdout.flush()
+        reports.append(report)
+    return reports
+
+
+def format_report(report: BackendReport, k: int) -> str:
+    line = (
+        f"{report.backend:<10} {report.texts_per_second:>9.2f} texts/s  "
+        f"batch p50={report.batch_latency_ms['p50']:.1f}ms p95={report.batch_latency_ms['p95']:.1f}ms  rss={report.rss_mb:.0f}MB  "
+        f"cos mean={report.dense_cosine_mean:.4f} min={report.dense_cosine_min:.4f}  recall@{k}={report.recall_at_k:.3f}"
+    )
+    if report.sparse_cosine_mean is not None:
+        line += f"  sparse cos={report.sparse_cosine_mean:.4f}"
+    return line
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmark.onnx_report", description="比較 ONNX Runtime 後端與 PyTorch 的準確度與速度")
+    parser.add_argument("--model", choices=MODELS, default=MODELS[0])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS), help="第一個後端作為準確度基準")
+    parser.add_argument("--corpus", default=None, help="樣本語料，檔案(每行一段)或資料夾；未指定時使用合成語料")
+    parser.add_argument("--corpus-size", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=32, help="以語料前 N 段作為查詢計算 recall@k")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--report", default=None, help="將結果輸出為 JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    corpus = load_corpus(args.corpus, args.corpus_size)
+    reports = build_report(args.model, corpus, args.backends, args.queries, args.k)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "k": args.k, "backends": [asdict(r) for r in reports]}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
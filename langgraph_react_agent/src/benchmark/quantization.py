@@ -0,0 +1,209 @@
+"""
+向量量化的 recall / 延遲量測。
+
+對每個 embedding provider，從該模型實際的 collection(或 --fixture 的合成 collection)以 read_dense_vectors 讀出文件向量，
+抽出 --queries 筆作為查詢(不放入量測用 collection)，其餘最多 --corpus-size 筆分別建立 none、scalar、binary 量化的 collection，
+以精確搜尋(exact=True)的結果為基準，量測量化搜尋(oversampling + rescore)的 recall@k 與查詢延遲。
+來源 collection 只讀取，不會修改。
+
+Qdrant 的 local / in-memory 模式不支援量化，量測用 collection 請建立在 Qdrant server：
+    python -m benchmark.quantization --qdrant-url http://localhost:6333 --document-type insurance --oversampling 2 3
+    python -m benchmark.quantization --source-url http://prod:6333 --qdrant-url http://localhost:6333
+    python -m benchmark.quantization --fixture 5000     # 來源改為 fake_services 的合成 collection，只用來驗證流程
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from benchmark.fakes import EMBEDDING_DIMENSIONS
+from benchmark.harness import percentile
+from shared.dimension_reduction import read_dense_vectors
+from shared.vector_quantization import quantization_config, quantization_search_params
+
+MODES = ("none", "scalar", "binary")
+
+BYTES_PER_DIMENSION = {"none": 4, "scalar": 1, "binary": 1 / 8}
+"""常駐記憶體中每個維度佔用的 bytes"""
+
+
+@dataclass
+class QuantizationRun:
+    """單一 provider、量化方式、oversampling 的量測結果"""
+
+    provider: str
+    dimensions: int
+    mode: str
+    oversampling: float
+    rescore: bool
+    recall_at_k: float
+    latency_ms: dict[str, float] = field(default_factory=dict)
+    vector_ram_mb: float = 0.0
+
+
+def _wait_until_indexed(client: QdrantClient, collection_name: str, timeout: float = 600.0) -> None:
+    started = time.monotonic()
+    while client.get_collection(collection_name).status != models.CollectionStatus.GREEN:
+        if time.monotonic() - started > timeout:
+            raise TimeoutError(f"collection {collection_name} 在 {timeout} 秒內未完成索引")
+        time.sleep(0.5)
+
+
+def build_collection(client: QdrantClient, collection_name: str, vectors: list[list[float]], mode: str, batch_size: int = 256) -> None:
+    """建立與正式 collection 相同向量設定(dense_text、EUCLID)的量測用 collection"""
+    quantized = mode != "none"
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={"dense_text": models.VectorParams(size=len(vectors[0]), distance=models.Distance.EUCLID, on_disk=quantized)},
+        quantization_config=quantization_config(mode),
+        # 小量資料也建立 HNSW 與量化索引，避免退化成全表掃描
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=1000),
+    )
+    for start in range(0, len(vectors), batch_size):
+        client.upsert(
+            collection_name=collection_name,
+            points=[
+                models.PointStruct(id=start + i, vector={"dense_text": vector})
+                for i, vector in enumerate(vectors[start:start + batch_size])
+            ],
+            wait=True,
+        )
+    _wait_until_indexed(client, collection_name)
+
+
+def search(client: QdrantClient, collection_name: str, queries: list[list[float]], k: int, search_params: Optional[models.SearchParams]) -> tuple[list[set[int]], list[float]]:
+    """逐筆查詢，回傳每個查詢的 top-k id 與延遲"""
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        points = client.query_points(
+            collection_name=collection_name,
+            query=query,
+            using="dense_text",
+            limit=k,
+            search_params=search_params,
+            with_payload=False,
+        ).points
+        latencies.append(time.perf_counter() - started)
+        results.append({point.id for point in points})
+    return results, latencies
+
+
+def sample_vectors(source: QdrantClient, collection_name: str, corpus_size: int, query_count: int) -> tuple[list[list[float]], list[list[float]]]:
+    """從來源 collection 讀出向量，隨機抽出 query_count 筆作為查詢，其餘最多 corpus_size 筆作為語料"""
+    _, vectors, _ = read_dense_vectors(source, collection_name)
+    if len(vectors) <= query_count:
+        raise ValueError(f"collection {collection_name} 只有 {len(vectors)} 筆向量，不足以抽出 {query_count} 筆查詢")
+    rows = list(range(len(vectors)))
+    random.Random(0).shuffle(rows)
+    queries = vectors[rows[:query_count]].tolist()
+    corpus = vectors[rows[query_count:query_count + corpus_size]].tolist()
+    return corpus, queries
+
+
+def run_provider(client: QdrantClient, provider: str, vectors: list[list[float]], queries: list[list[float]], k: int, modes: list[str], oversamplings: list[float], rescore: bool, keep: bool) -> list[QuantizationRun]:
+    """量測單一 provider 的向量在所有量化方式下的 recall 與延遲"""
+    dimensions = len(vectors[0])
+    runs = []
+    truth: Optional[list[set[int]]] = None
+    for mode in modes:
+        collection_name = f"bench_quantization_{provider.replace('.', '_').lower()}_{mode}_{uuid.uuid4().hex[:8]}"
+        build_collection(client, collection_name, vectors, mode)
+        try:
+            if truth is None:
+                truth, _ = search(client, collection_name, queries, k, models.SearchParams(exact=True))
+            for oversampling in oversamplings if mode != "none" else [1.0]:
+                found, latencies = search(client, collection_name, queries, k, quantization_search_params(mode, rescore, oversampling))
+                run = QuantizationRun(
+                    provider=provider,
+                    dimensions=dimensions,
+                    mode=mode,
+                    oversampling=oversampling,
+                    rescore=rescore,
+                    recall_at_k=round(sum(len(a & b) / k for a, b in zip(truth, found)) / len(truth), 4),
+                    latency_ms={
+                        "p50": round(percentile(latencies, 50) * 1000, 3),
+                        "p95": round(percentile(latencies, 95) * 1000, 3),
+                        "p99": round(percentile(latencies, 99) * 1000, 3),
+                    },
+                    vector_ram_mb=round(len(vectors) * dimensions * BYTES_PER_DIMENSION[mode] / 1024 / 1024, 3),
+                )
+                sys.stdout.write(format_run(run, k) + "\n")
+                sys.stdout.flush()
+                runs.append(run)
+        finally:
+            if not keep:
+                client.delete_collection(collection_name)
+    return runs
+
+
+def format_run(run: QuantizationRun, k: int) -> str:
+    return (
+        f"{run.provider:<13} dim={run.dimensions:<5} {run.mode:<7} oversampling={run.oversampling:<4} "
+        f"recall@{k}={run.recall_at_k:.4f}  p50={run.latency_ms['p50']:.2f}ms p95={run.latency_ms['p95']:.2f}ms  "
+        f"ram={run.vector_ram_mb:.1f}MB"
+    )
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmark.quantization", description="量測各 embedding 模型的向量在量化後的 recall 與延遲")
+    parser.add_argument("--providers", nargs="+", choices=list(EMBEDDING_DIMENSIONS), default=list(EMBEDDING_DIMENSIONS))
+    parser.add_argument("--document-type", choices=("insurance", "system_analysis"), default="insurance", help="依文件類型取各模型的來源 collection")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--corpus-size", type=int, default=10000, help="量測用 collection 最多寫入的向量數")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[2.0])
+    parser.add_argument("--no-rescore", action="store_true", help="不以原始向量重新計分")
+    parser.add_argument("--qdrant-url", default=os.environ.get("QDRANT_URL", "http://localhost:6333"), help="建立量測用 collection 的 Qdrant server")
+    parser.add_argument("--source-url", default=None, help="來源 collection 所在的 Qdrant，預設與 --qdrant-url 相同")
+    parser.add_argument("--fixture", type=int, default=0, help="以 N 筆合成文件建立 in-memory 來源 collection(fake_services.qdrant)")
+    parser.add_argument("--keep", action="store_true", help="量測後保留 collection")
+    parser.add_argument("--report", default=None, help="將結果輸出為 JSON")
+    return parser.parse_args(argv)
+
+
+def source_client(args: argparse.Namespace) -> QdrantClient:
+    """來源 collection 所在的 client；--fixture 時建立只有此 process 可見的合成 collection"""
+    from shared.settings import reload_settings
+
+    if not args.fixture:
+        return QdrantClient(url=args.source_url or args.qdrant_url, api_key=os.environ.get("QDRANT_API_KEY"), timeout=60)
+
+    from fake_services.qdrant import DEFAULT_COLLECTION_ENV, seed_collections
+
+    for key, value in DEFAULT_COLLECTION_ENV.items():
+        os.environ.setdefault(key, value)
+    reload_settings()
+    source = QdrantClient(":memory:")
+    for provider in args.providers:
+        seed_collections(source, provider, args.fixture, [args.document_type])
+    return source
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    from shared.retrieval import get_qdrant_collection_name
+
+    args = parse_args(argv)
+    client = QdrantClient(url=args.qdrant_url, api_key=os.environ.get("QDRANT_API_KEY"), timeout=60)
+    source = source_client(args)
+    runs = []
+    for provider in args.providers:
+        vectors, queries = sample_vectors(source, get_qdrant_collection_name(provider, args.document_type), args.corpus_size, args.queries)
+        runs.extend(run_provider(client, provider, vectors, queries, args.k, args.modes, args.oversampling, not args.no_rescore, args.keep))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump([asdict(run) for run in runs], f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
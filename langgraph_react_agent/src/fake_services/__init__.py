@@ -0,0 +1,18 @@
+"""負載測試用的本機替代服務
+
+在單一台 Linux 主機上不呼叫付費服務、可重現地量測 graph 的吞吐量與 tail latency：
+
+    bedrock  假的 Bedrock Runtime(Converse / ConverseStream / InvokeModel)，聊天與嵌入
+    gemini   假的 Gemini API(generateContent / streamGenerateContent / embedContent)
+    qdrant   以 Qdrant local mode 建立並寫入合成文件的 collections
+
+應用程式不需修改，只透過環境變數連線(AWS_ENDPOINT_URL_BEDROCK_RUNTIME、GOOGLE_API_ENDPOINT、QDRANT_URL / QDRANT_PATH)。
+與 benchmark 直接替換 Python 物件不同，假服務經過真正的 HTTP client、序列化與 connection pool。
+
+用法：
+    python -m fake_services --latency 0.3 --tokens-per-second 40 --qdrant-path ./.fake_qdrant
+    # 依輸出的環境變數啟動 graph server，例如 langgraph dev
+
+    with fake_environment(ServiceOptions(latency=0.3)) as services:  # 同一個 process 內
+        ...
+"""
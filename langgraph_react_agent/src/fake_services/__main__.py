@@ -0,0 +1,64 @@
+"""啟動假的 Bedrock / Gemini server，並可選擇在 QDRANT_PATH 目錄寫入 seeded collections"""
+
+import argparse
+import shlex
+import signal
+import sys
+import time
+from typing import Optional
+
+from fake_services.common import ServiceOptions
+from fake_services.environment import service_environment, start_services
+from fake_services.qdrant import qdrant_environment, seeded_qdrant
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m fake_services", description="負載測試用的本機替代服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--bedrock-port", type=int, default=8701)
+    parser.add_argument("--gemini-port", type=int, default=8702)
+    parser.add_argument("--latency", type=float, default=0.05, help="聊天模型第一個 token 前的延遲(秒)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="聊天模型輸出速率，0 表示一次輸出")
+    parser.add_argument("--embedding-latency", type=float, default=0.01, help="每個嵌入請求的延遲(秒)")
+    parser.add_argument("--qdrant-path", help="在此目錄寫入 seeded collections(Qdrant local mode)，供其他 process 以 QDRANT_PATH 開啟")
+    parser.add_argument(
+        "--embedding-models", nargs="+", default=["AWS.Bedrock/cohere.embed-multilingual-v3"], help="要建立 collections 的 embedding 模型"
+    )
+    parser.add_argument("--corpus-size", type=int, default=500, help="每個 collection 寫入的合成文件數")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    environ = {}
+    if args.qdrant_path:
+        # local mode 同時只能由一個 process 開啟，寫入後關閉讓 graph server 使用
+        with seeded_qdrant(args.embedding_models, args.corpus_size, path=args.qdrant_path):
+            pass
+        environ.update(qdrant_environment(args.qdrant_path))
+
+    options = ServiceOptions(latency=args.latency, tokens_per_second=args.tokens_per_second, embedding_latency=args.embedding_latency)
+    services = start_services(options, args.host, args.bedrock_port, args.gemini_port)
+    environ.update(service_environment(services))
+    sys.stdout.write("# 以下環境變數連線到假服務\n")
+    for key, value in environ.items():
+        sys.stdout.write(f"export {key}={shlex.quote(value)}\n")
+    sys.stdout.write(f"# Bedrock: {services.bedrock.url}  Gemini: {services.gemini.url}，Ctrl-C 結束\n")
+    sys.stdout.flush()
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # 關閉期間忽略重複的 Ctrl-C
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        services.stop()
+        sys.stdout.write(f"# 請求數 Bedrock: {services.bedrock.requests} Gemini: {services.gemini.requests}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+假的 Bedrock Runtime endpoint。
+
+以 AWS_ENDPOINT_URL_BEDROCK_RUNTIME 指向此 server，boto3(ChatBedrockConverse、ChatBedrock、BedrockEmbeddings)
+不需修改程式即可連線：
+
+    POST /model/{model_id}/converse                       Converse
+    POST /model/{model_id}/converse-stream                ConverseStream(AWS event stream)
+    POST /model/{model_id}/invoke                         Anthropic Messages、Cohere / Titan 嵌入
+    POST /model/{model_id}/invoke-with-response-stream    Anthropic Messages 串流
+
+聊天模型的行為與 benchmark.fakes.FakeChatModel 相同：有 tools 且最後一則訊息不是 tool 結果時呼叫第一個 tool，
+否則回覆 ServiceOptions.response_text。不驗證 SigV4 簽章。
+"""
+
+import base64
+import binascii
+import json
+import struct
+import time
+import uuid
+from typing import Any, Iterable, Optional
+from urllib.parse import unquote
+
+from fake_services.common import FakeServiceHandler, FakeServiceServer, ServiceOptions, fake_vector, tokens, tool_arguments
+
+
+EMBEDDING_SIZE = 1024
+
+
+def encode_event(event_type: str, payload: dict[str, Any]) -> bytes:
+    """以 application/vnd.amazon.eventstream 格式編碼一個 event"""
+    headers = b""
+    for name, value in ((":event-type", event_type), (":content-type", "application/json"), (":message-type", "event")):
+        encoded = value.encode("utf-8")
+        headers += bytes([len(name)]) + name.encode("utf-8") + b"\x07" + struct.pack(">H", len(encoded)) + encoded
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    total = 12 + len(headers) + len(body) + 4
+    prelude = struct.pack(">II", total, len(headers))
+    message = prelude + struct.pack(">I", binascii.crc32(prelude)) + headers + body
+    return message + struct.pack(">I", binascii.crc32(message))
+
+
+def _text(content: Any) -> str:
+    """Converse 或 Anthropic 格式的 content 中的文字"""
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+def _has_tool_result(content: Any) -> bool:
+    return isinstance(content, list) and any(
+        isinstance(block, dict) and ("toolResult" in block or block.get("type") == "tool_result") for block in content
+    )
+
+
+class BedrockHandler(FakeServiceHandler):
+    def route(self, path: str, body: dict[str, Any]) -> bool:
+        parts = path.split("?", maxsplit=1)[0].strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "model":
+            return False
+        model_id, operation = unquote(parts[1]), parts[2]
+        match operation:
+            case "converse":
+                self.converse(model_id, body, stream=False)
+            case "converse-stream":
+                self.converse(model_id, body, stream=True)
+            case "invoke" if "texts" in body or "inputText" in body:
+                self.embed(model_id, body)
+            case "invoke":
+                self.anthropic(model_id, body, stream=False)
+            case "invoke-with-response-stream":
+                self.anthropic(model_id, body, stream=True)
+            case _:
+                return False
+        return True
+
+    # ===== Converse ================================================
+    def _converse_reply(self, body: dict[str, Any]) -> tuple[Optional[dict[str, Any]], str]:
+        """回傳 (要呼叫的 tool, 使用者訊息文字)"""
+        messages = body.get("messages") or []
+        last = messages[-1] if messages else {"content": []}
+        tools = [tool["toolSpec"] for tool in (body.get("toolConfig") or {}).get("tools", []) if "toolSpec" in tool]
+        text = _text(last.get("content") or [])
+        if tools and not _has_tool_result(last.get("content")):
+            spec = tools[0]
+            schema = (spec.get("inputSchema") or {}).get("json") or {}
+            return {"toolUseId": f"tooluse_{uuid.uuid4().hex[:16]}", "name": spec["name"], "input": tool_arguments(schema, text)}, text
+        return None, text
+
+    def converse(self, model_id: str, body: dict[str, Any], stream: bool) -> None:
+        start = time.perf_counter()
+        tool, text = self._converse_reply(body)
+        input_tokens = sum(len(_text(m.get("content") or [])) for m in body.get("messages") or []) // 4
+        output = tokens(self.options.response_text) if tool is None else [json.dumps(tool["input"], ensure_ascii=False)]
+        usage = {"inputTokens": input_tokens, "outputTokens": len(output), "totalTokens": input_tokens + len(output)}
+        stop_reason = "tool_use" if tool else "end_turn"
+
+        if not stream:
+            self.generation_delay(len(output))
+            content = [{"toolUse": tool}] if tool else [{"text": self.options.response_text}]
+            self.send_json({
+                "output": {"message": {"role": "assistant", "content": content}},
+                "stopReason": stop_reason,
+                "usage": usage,
+                "metrics": {"latencyMs": int((time.perf_counter() - start) * 1000)},
+            })
+            return
+
+        def events() -> Iterable[bytes]:
+            yield encode_event("messageStart", {"role": "assistant"})
+            if tool:
+                yield encode_event("contentBlockStart", {"contentBlockIndex": 0, "start": {"toolUse": {"toolUseId": tool["toolUseId"], "name": tool["name"]}}})
+            for piece in self.paced(output):
+                delta = {"toolUse": {"input": piece}} if tool else {"text": piece}
+                yield encode_event("contentBlockDelta", {"contentBlockIndex": 0, "delta": delta})
+            yield encode_event("contentBlockStop", {"contentBlockIndex": 0})
+            yield encode_event("messageStop", {"stopReason": stop_reason})
+            yield encode_event("metadata", {"usage": usage, "metrics": {"latencyMs": int((time.perf_counter() - start) * 1000)}})
+
+        self.send_stream("application/vnd.amazon.eventstream", events())
+
+    # ===== Anthropic Messages(InvokeModel) ============================
+    def anthropic(self, model_id: str, body: dict[str, Any], stream: bool) -> None:
+        start = time.perf_counter()
+        messages = body.get("messages") or []
+        last = messages[-1] if messages else {"content": ""}
+        text = _text(last.get("content") or "")
+        tools = body.get("tools") or []
+        tool = None
+        if tools and not _has_tool_result(last.get("content")):
+            tool = {"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:16]}", "name": tools[0]["name"], "input": tool_arguments(tools[0].get("input_schema") or {}, text)}
+        input_tokens = sum(len(_text(m.get("content") or "")) for m in messages) // 4
+        output = tokens(self.options.response_text) if tool is None else [json.dumps(tool["input"], ensure_ascii=False)]
+        stop_reason = "tool_use" if tool else "end_turn"
+        message_id = f"msg_{uuid.uuid4().hex[:16]}"
+
+        if not stream:
+            self.generation_delay(len(output))
+            self.send_json({
+                "id": message_id,
+                "type": "message",
+                "role": "assistant",
+                "model": model_id,
+                "content": [tool] if tool else [{"type": "text", "text": self.options.response_text}],
+                "stop_reason": stop_reason,
+                "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": len(output)},
+            })
+            return
+
+        def chunk(payload: dict[str, Any]) -> bytes:
+            data = base64.b64encode(json.dumps(payload, ensure_ascii=False).encode("utf-8")).decode("ascii")
+            return encode_event("chunk", {"bytes": data})
+
+        def events() -> Iterable[bytes]:
+            yield chunk({
+                "type": "message_start",
+                "message": {
+                    "id": message_id, "type": "message", "role": "assistant", "model": model_id, "content": [],
+                    "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": input_tokens, "output_tokens": 1},
+                },
+            })
+            block = {"type": "tool_use", "id": tool["id"], "name": tool["name"], "input": {}} if tool else {"type": "text", "text": ""}
+            yield chunk({"type": "content_block_start", "index": 0, "content_block": block})
+            first_byte = None
+            for piece in self.paced(output):
+                first_byte = first_byte or time.perf_counter()
+                delta = {"type": "input_json_delta", "partial_json": piece} if tool else {"type": "text_delta", "text": piece}
+                yield chunk({"type": "content_block_delta", "index": 0, "delta": delta})
+            yield chunk({"type": "content_block_stop", "index": 0})
+            yield chunk({"type": "message_delta", "delta": {"stop_reason": stop_reason, "stop_sequence": None}, "usage": {"output_tokens": len(output)}})
+            yield chunk({
+                "type": "message_stop",
+                "amazon-bedrock-invocationMetrics": {
+                    "inputTokenCount": input_tokens,
+                    "outputTokenCount": len(output),
+                    "invocationLatency": int((time.perf_counter() - start) * 1000),
+                    "firstByteLatency": int(((first_byte or time.perf_counter()) - start) * 1000),
+                },
+            })
+
+        self.send_stream("application/vnd.amazon.eventstream", events())
+
+    # ===== 嵌入(InvokeModel) =========================================
+    def embed(self, model_id: str, body: dict[str, Any]) -> None:
+        time.sleep(self.options.embedding_latency)
+        if "texts" in body:
+            texts = body["texts"]
+            if len(texts) > 96:
+                self.send_json(
+                    {"message": "Malformed input request: expected maxItems: 96"}, 400, {"x-amzn-ErrorType": "ValidationException"}
+                )
+                return
+            self.send_json({
+                "id": str(uuid.uuid4()),
+                "response_type": "embeddings_floats",
+                "texts": texts,
+                "embeddings": [fake_vector(text, EMBEDDING_SIZE) for text in texts],
+            })
+        else:
+            size = body.get("dimensions") or EMBEDDING_SIZE
+            self.send_json({"embedding": fake_vector(body["inputText"], size), "inputTextTokenCount": len(body["inputText"]) // 4})
+
+
+def start_bedrock(options: ServiceOptions, host: str = "127.0.0.1", port: int = 0) -> FakeServiceServer:
+    """在背景 thread 啟動假的 Bedrock Runtime，port 為 0 時由系統分配"""
+    return FakeServiceServer((host, port), BedrockHandler, options).start()
@@ -0,0 +1,160 @@
+"""假服務共用的 HTTP server、延遲模擬與回應內容"""
+
+import json
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterable, Optional
+
+from benchmark.fakes import FakeDenseEmbeddings
+
+
+@dataclass(kw_only=True)
+class ServiceOptions:
+    """假服務的延遲與回應設定，server 執行中修改會立即生效"""
+
+    latency: float = 0.05
+    """聊天模型第一個 token 前的延遲(秒)"""
+
+    tokens_per_second: float = 0.0
+    """聊天模型輸出 token 的速率，0 表示一次輸出"""
+
+    embedding_latency: float = 0.01
+    """每個嵌入請求的延遲(秒)"""
+
+    response_text: str = "根據檢索到的文件，這是測試用的回答內容。參考文件：benchmark。"
+
+
+def tool_arguments(schema: dict[str, Any], text: str) -> dict[str, Any]:
+    """與 benchmark.fakes.FakeChatModel 相同：字串參數帶入使用者訊息，其他參數為 None"""
+    properties = schema.get("properties") or {}
+    return {
+        name: text if str(prop.get("type", "string")).lower() in ("string", "1") else None
+        for name, prop in properties.items()
+    }
+
+
+def tokens(text: str) -> list[str]:
+    """以字元作為 token，與 FakeChatModel 的 output_tokens 計算方式相同"""
+    return list(text)
+
+
+_embeddings: dict[int, FakeDenseEmbeddings] = {}
+
+
+def fake_vector(text: str, size: int) -> list[float]:
+    """與 benchmark.fakes.FakeDenseEmbeddings 相同的向量，seeded collection 才能以假服務的 query 向量檢索"""
+    if size not in _embeddings:
+        _embeddings[size] = FakeDenseEmbeddings(size)
+    return _embeddings[size]._embed(text)
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    """JSON request / response 與 chunked 串流的共用 handler，子類別實作 route()"""
+
+    protocol_version = "HTTP/1.1"
+    """keep-alive，client 的 connection pool 才能重複使用連線"""
+
+    server: "FakeServiceServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    @property
+    def options(self) -> ServiceOptions:
+        return self.server.options
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json({"message": "invalid JSON body"}, 400)
+            return
+        self.server.count(self.path)
+        try:
+            if not self.route(self.path, body):
+                self.send_json({"message": f"unknown path {self.path}"}, 404)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def route(self, path: str, body: dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    def send_json(self, payload: Any, status: int = 200, headers: Optional[dict[str, str]] = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, content_type: str, parts: Iterable[bytes]) -> None:
+        """以 chunked transfer encoding 逐段送出，每段送出後立即 flush"""
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for part in parts:
+            self.wfile.write(f"{len(part):x}\r\n".encode() + part + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def paced(self, pieces: list[str]) -> Iterable[str]:
+        """依 tokens_per_second 逐個產生 token，第一個 token 前等待 latency"""
+        time.sleep(self.options.latency)
+        for piece in pieces:
+            if self.options.tokens_per_second:
+                time.sleep(1 / self.options.tokens_per_second)
+            yield piece
+
+    def generation_delay(self, output_tokens: int) -> None:
+        """非串流回應的總延遲"""
+        delay = self.options.latency
+        if self.options.tokens_per_second:
+            delay += output_tokens / self.options.tokens_per_second
+        time.sleep(delay)
+
+
+class FakeServiceServer(ThreadingHTTPServer):
+    """每個連線一個 thread 的 HTTP server，記錄各 path 的請求數"""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address: tuple[str, int], handler: type[FakeServiceHandler], options: ServiceOptions):
+        super().__init__(address, handler)
+        self.options = options
+        self.requests: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, path: str) -> None:
+        key = path.split("?", maxsplit=1)[0].rsplit("/", maxsplit=1)[-1]
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        """client 關閉 keep-alive 連線屬於正常情況，不輸出 traceback"""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def start(self) -> "FakeServiceServer":
+        """在背景 thread 執行"""
+        self._thread = threading.Thread(target=self.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,83 @@
+"""啟動假服務並設定連線用的環境變數"""
+
+import os
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Generator, Iterable, Optional
+
+from fake_services.bedrock import start_bedrock
+from fake_services.common import FakeServiceServer, ServiceOptions
+from fake_services.gemini import start_gemini
+from fake_services.qdrant import seeded_qdrant
+
+
+@dataclass
+class FakeServices:
+    bedrock: FakeServiceServer
+    gemini: FakeServiceServer
+    options: ServiceOptions
+
+    def stop(self) -> None:
+        self.bedrock.stop()
+        self.gemini.stop()
+
+
+def service_environment(services: FakeServices) -> dict[str, str]:
+    """連線到假服務的環境變數；boto3 與 Gemini client 要求憑證存在，以假值填入"""
+    return {
+        "AWS_ENDPOINT_URL_BEDROCK_RUNTIME": services.bedrock.url,
+        "AWS_REGION": "us-east-1",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "fake",
+        "AWS_SECRET_ACCESS_KEY": "fake",
+        "GOOGLE_API_ENDPOINT": services.gemini.url,
+        "GOOGLE_API_KEY": "fake",
+    }
+
+
+def start_services(options: ServiceOptions, host: str = "127.0.0.1", bedrock_port: int = 0, gemini_port: int = 0) -> FakeServices:
+    return FakeServices(
+        bedrock=start_bedrock(options, host, bedrock_port),
+        gemini=start_gemini(options, host, gemini_port),
+        options=options,
+    )
+
+
+def _reset_clients() -> None:
+    """清除已建立的模型與連線，之後的呼叫才會讀取新的環境變數"""
+    from shared.llm_gateway import reset_gateway
+    from shared.retrieval import get_match_embedding
+    from shared.settings import reload_settings
+
+    reload_settings()
+    get_match_embedding.cache_clear()
+    reset_gateway()
+    for name in ("react_agent.utils", "kb_retrieval_agent.utils", "retrieval_graph.utils"):
+        if name in sys.modules:
+            sys.modules[name].load_chat_model.cache_clear()
+
+
+@contextmanager
+def fake_environment(
+    options: Optional[ServiceOptions] = None,
+    embedding_models: Iterable[str] = ("AWS.Bedrock/cohere.embed-multilingual-v3",),
+    corpus_size: int = 500,
+) -> Generator[FakeServices, None, None]:
+    """在同一個 process 內啟動假服務與 in-memory Qdrant，並將環境變數指向它們，離開時還原"""
+    services = start_services(options or ServiceOptions())
+    environ = service_environment(services)
+    previous = {key: os.environ.get(key) for key in environ}
+    os.environ.update(environ)
+    _reset_clients()
+    try:
+        with seeded_qdrant(list(embedding_models), corpus_size):
+            yield services
+    finally:
+        services.stop()
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        _reset_clients()
@@ -0,0 +1,119 @@
+"""
+假的 Gemini(Generative Language API)endpoint。
+
+以 GOOGLE_API_ENDPOINT 指向此 server 時，ChatGoogleGenerativeAI 與 GoogleGenerativeAIEmbeddings
+改以 REST transport 連線到此 server(見 shared.settings.Settings.client_kwargs)：
+
+    POST /v1beta/models/{model}:generateContent
+    POST /v1beta/models/{model}:streamGenerateContent     JSON array 串流；?alt=sse 時為 server-sent events
+    POST /v1beta/models/{model}:embedContent
+    POST /v1beta/models/{model}:batchEmbedContents
+
+聊天模型的行為與 benchmark.fakes.FakeChatModel 相同；嵌入向量與 benchmark.fakes.FakeDenseEmbeddings 相同。不驗證 API key。
+"""
+
+import json
+import time
+from typing import Any, Iterable, Optional
+
+from fake_services.common import FakeServiceHandler, FakeServiceServer, ServiceOptions, fake_vector, tokens, tool_arguments
+
+
+EMBEDDING_SIZE = 3072
+"""gemini-embedding-exp-03-07 的維度，請求帶有 outputDimensionality 時以其為準"""
+
+MAX_BATCH = 100
+
+
+def _user_text(contents: list[dict[str, Any]]) -> tuple[str, bool]:
+    """最後一則訊息的文字，以及是否為 function 的回傳結果"""
+    parts = (contents[-1].get("parts") or []) if contents else []
+    return "".join(part.get("text", "") for part in parts), any("functionResponse" in part for part in parts)
+
+
+class GeminiHandler(FakeServiceHandler):
+    def route(self, path: str, body: dict[str, Any]) -> bool:
+        resource, _, query = path.partition("?")
+        method = resource.rpartition(":")[2]
+        match method:
+            case "generateContent":
+                self.generate(body, stream=None)
+            case "streamGenerateContent":
+                self.generate(body, stream="sse" if "alt=sse" in query else "json")
+            case "embedContent":
+                time.sleep(self.options.embedding_latency)
+                self.send_json({"embedding": self._embed(body)})
+            case "batchEmbedContents":
+                requests = body.get("requests") or []
+                if len(requests) > MAX_BATCH:
+                    self.send_json({"error": {"code": 400, "message": f"at most {MAX_BATCH} requests can be in one batch", "status": "INVALID_ARGUMENT"}}, 400)
+                    return True
+                time.sleep(self.options.embedding_latency)
+                self.send_json({"embeddings": [self._embed(request) for request in requests]})
+            case _:
+                return False
+        return True
+
+    def _embed(self, request: dict[str, Any]) -> dict[str, Any]:
+        text = "".join(part.get("text", "") for part in (request.get("content") or {}).get("parts") or [])
+        return {"values": fake_vector(text, request.get("outputDimensionality") or EMBEDDING_SIZE)}
+
+    def generate(self, body: dict[str, Any], stream: Optional[str]) -> None:
+        contents = body.get("contents") or []
+        text, is_function_response = _user_text(contents)
+        declarations = [d for tool in body.get("tools") or [] for d in tool.get("functionDeclarations") or []]
+        call = None
+        if declarations and not is_function_response:
+            call = {"name": declarations[0]["name"], "args": tool_arguments(declarations[0].get("parameters") or {}, text)}
+        input_tokens = sum(len(_user_text([content])[0]) for content in contents) // 4
+        output = [json.dumps(call["args"], ensure_ascii=False)] if call else tokens(self.options.response_text)
+
+        def response(parts: list[dict[str, Any]], finished: bool) -> dict[str, Any]:
+            candidate: dict[str, Any] = {"content": {"role": "model", "parts": parts}, "index": 0}
+            if finished:
+                candidate["finishReason"] = "STOP"
+            return {
+                "candidates": [candidate],
+                "usageMetadata": {"promptTokenCount": input_tokens, "candidatesTokenCount": len(output), "totalTokenCount": input_tokens + len(output)},
+                "modelVersion": "fake-gemini",
+            }
+
+        if stream is None:
+            self.generation_delay(len(output))
+            self.send_json(response([{"functionCall": call}] if call else [{"text": self.options.response_text}], True))
+            return
+
+        def payloads() -> Iterable[dict[str, Any]]:
+            if call:
+                yield from (response([{"functionCall": call}], True) for _ in self.paced(output))
+                return
+            # 晚一個 token 送出，最後一段才能帶上 finishReason
+            previous = None
+            for piece in self.paced(output):
+                if previous is not None:
+                    yield response([{"text": previous}], False)
+                previous = piece
+            if previous is not None:
+                yield response([{"text": previous}], True)
+
+        def sse() -> Iterable[bytes]:
+            for payload in payloads():
+                yield f"data: {json.dumps(payload, ensure_ascii=False)}\r\n\r\n".encode("utf-8")
+
+        def json_array() -> Iterable[bytes]:
+            # REST transport 以 JSON array 串流回應(rest_streaming.ResponseIterator)
+            separator = b"["
+            for payload in payloads():
+                yield separator + json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                separator = b",\r\n"
+            yield b"[]" if separator == b"[" else b"]"
+
+        if stream == "sse":
+            self.send_stream("text/event-stream", sse())
+        else:
+            self.send_stream("application/json", json_array())
+
+
+def start_gemini(options: ServiceOptions, host: str = "127.0.0.1", port: int = 0) -> FakeServiceServer:
+    """在背景 thread 啟動假的 Gemini API，port 為 0 時由系統分配"""
+    return FakeServiceServer((host, port), GeminiHandler, options).start()
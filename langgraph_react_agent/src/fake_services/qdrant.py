@@ -0,0 +1,126 @@
+"""
+以 Qdrant local mode 建立並寫入合成文件的 collections。
+
+collection 名稱由 shared.retrieval.get_qdrant_collection_name 決定，與 graph 檢索時使用的名稱相同；
+向量由 benchmark.fakes 的假嵌入模型產生，與假的 Bedrock / Gemini 嵌入 endpoint 回傳的向量一致。
+
+    seeded_qdrant(model)                同一個 process 內使用 in-memory Qdrant(QDRANT_URL=":memory:")
+    seeded_qdrant(model, path=...)      寫入 QDRANT_PATH 目錄，結束後其他 process(例如 langgraph dev)可開啟該目錄
+"""
+
+import os
+import uuid
+from contextlib import contextmanager
+from typing import Any, Generator, Iterable, Optional
+
+from benchmark.fakes import EMBEDDING_DIMENSIONS, get_fake_embedding
+
+DOCUMENT_TYPES = ("insurance", "system_analysis")
+
+# 與 .env.example 相同的 collection 名稱，只在環境變數未設定時使用
+DEFAULT_COLLECTION_ENV = {
+    "QDRANT_COLLECTION_BAAI_BGEM3_AWS_EC2": "aws_ec2_collection_baai_bgem3",
+    "QDRANT_COLLECTION_MICROSOFT_E5_LARGE_AWS_EC2": "aws_ec2_collection_microsoft_multilingual_e5_large",
+    "QDRANT_COLLECTION_COHERE_MULTILINGUAL_V3_AWS_EC2": "aws_ec2_collection_cohere_multilingual_v3",
+    "QDRANT_COLLECTION_GEMINI_EXP_03_07_AWS_EC2": "aws_ec2_collection_gemini_exp_03_07",
+    "QDRANT_COLLECTION_BAAI_BGEM3_SA": "sa_collection_baai_bgem3",
+    "QDRANT_COLLECTION_MICROSOFT_E5_LARGE_SA": "sa_collection_microsoft_multilingual_e5_large",
+    "QDRANT_COLLECTION_COHERE_MULTILINGUAL_V3_SA": "sa_collection_cohere_multilingual_v3",
+    "QDRANT_COLLECTION_GEMINI_EXP_03_07_SA": "sa_collection_gemini_exp_03_07",
+}
+
+SAMPLE_TOPICS = ["EC2 執行個體", "安全群組", "EBS 磁碟區", "自動擴展", "保險理賠", "台幣轉帳", "基金申購", "歷史明細"]
+
+
+def sample_documents(corpus_size: int) -> list[Any]:
+    """可重現的合成文件，doc_name 共 len(SAMPLE_TOPICS) × 25 種"""
+    from langchain_core.documents import Document
+
+    return [
+        Document(
+            page_content=f"{SAMPLE_TOPICS[i % len(SAMPLE_TOPICS)]} 說明第 {i} 段：" + "設定步驟與注意事項。" * (5 + i % 20),
+            metadata={"doc_name": f"{SAMPLE_TOPICS[i % len(SAMPLE_TOPICS)]}_{i % 25}"},
+        )
+        for i in range(corpus_size)
+    ]
+
+
+def seed_collections(client: Any, embedding_model: str, corpus_size: int, document_types: Iterable[str] = DOCUMENT_TYPES) -> list[str]:
+    """在 client 建立 embedding_model 各文件類型的 collection 並寫入合成文件，已存在的 collection 不重複寫入"""
+    from langchain_qdrant import QdrantVectorStore, RetrievalMode
+    from qdrant_client.http.models import Distance, SparseIndexParams, SparseVectorParams, VectorParams
+
+    from shared.qdrant_collections import copy_payload_fields
+    from shared.retrieval import get_qdrant_collection_name
+
+    provider = embedding_model.split("/", maxsplit=1)[0]
+    embedding = get_fake_embedding(embedding_model)
+    docs = sample_documents(corpus_size)
+    names = []
+    for doc_type in document_types:
+        collection_name = get_qdrant_collection_name(provider, doc_type)
+        names.append(collection_name)
+        if client.collection_exists(collection_name):
+            continue
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config={"dense_text": VectorParams(size=EMBEDDING_DIMENSIONS.get(provider, 1024), distance=Distance.EUCLID)},
+            sparse_vectors_config={"sparse_text": SparseVectorParams(index=SparseIndexParams(on_disk=False))} if provider == "BAAI" else None,
+        )
+        vstore = QdrantVectorStore(
+            client=client,
+            collection_name=collection_name,
+            embedding=embedding.dense if provider == "BAAI" else embedding,
+            vector_name="dense_text",
+            distance=Distance.EUCLID,
+            sparse_embedding=embedding.sparse if provider == "BAAI" else None,
+            sparse_vector_name="sparse_text",
+            retrieval_mode=RetrievalMode.HYBRID if provider == "BAAI" else RetrievalMode.DENSE,
+        )
+        vstore.add_documents(docs, ids=[str(uuid.UUID(int=i)) for i in range(len(docs))])
+        copy_payload_fields(client, collection_name)
+    return names
+
+
+def qdrant_environment(path: Optional[str] = None) -> dict[str, str]:
+    """連線到 local mode Qdrant 的環境變數，collection 名稱只補上未設定的部分"""
+    environ = {"QDRANT_URL": "", "QDRANT_PATH": path} if path else {"QDRANT_URL": ":memory:", "QDRANT_API_KEY": ""}
+    for key, value in DEFAULT_COLLECTION_ENV.items():
+        environ[key] = os.environ.get(key, value)
+    return environ
+
+
+@contextmanager
+def seeded_qdrant(
+    embedding_models: str | Iterable[str],
+    corpus_size: int = 500,
+    path: Optional[str] = None,
+    document_types: Iterable[str] = DOCUMENT_TYPES,
+) -> Generator[Any, None, None]:
+    """設定環境變數、建立 process 共用的 Qdrant client 並寫入 collections，回傳該 client
+
+    path 為 None 時使用 in-memory mode，只有同一個 process 看得到；指定 path 時離開後關閉 client，釋放目錄的鎖讓其他 process 開啟。
+    離開後都會還原環境變數與 settings，並清除 process 共用的 client，之後的 get_qdrant_client 依原本的設定重新連線
+    """
+    from shared import retrieval
+    from shared.settings import reload_settings
+
+    previous = {key: os.environ.get(key) for key in qdrant_environment(path)}
+    os.environ.update(qdrant_environment(path))
+    reload_settings()
+    retrieval._qdrant_client = None
+    client = retrieval.get_qdrant_client()
+    try:
+        for model in [embedding_models] if isinstance(embedding_models, str) else embedding_models:
+            seed_collections(client, model, corpus_size, document_types)
+        yield client
+    finally:
+        if path:
+            client.close()
+        retrieval._qdrant_client = None
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        reload_settings()
@@ -2,13 +2,15 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass, field, fields
+from dataclasses import dataclass, field
 from typing import Annotated, Any, Literal, Optional, Type, TypeVar
 
-from langchain_core.runnables import RunnableConfig, ensure_config
+from langchain_core.runnables import RunnableConfig
 
+from shared.base_configuration import resolve_configuration
 
-@dataclass(kw_only=True)
+
+@dataclass(kw_only=True, frozen=True)
 class IndexConfiguration:
     """
     indexing 和 retrive 資料的 configuration。
@@ -82,10 +84,7 @@ class IndexConfiguration:
         Returns:
             T: An instance of IndexConfiguration with the specified configuration.
         """
-        config = ensure_config(config)
-        configurable = config.get("configurable") or {}
-        _fields = {f.name for f in fields(cls) if f.init}
-        return cls(**{k: v for k, v in configurable.items() if k in _fields})
+        return resolve_configuration(cls, config)
 
 
 T = TypeVar("T", bound=IndexConfiguration)
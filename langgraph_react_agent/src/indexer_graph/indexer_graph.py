@@ -1,5 +1,6 @@
 """This "graph" simply exposes an endpoint for a user to upload docs to be indexed."""
 
+import asyncio
 from typing import Optional, Sequence
 
 from langchain_core.documents import Document
@@ -11,6 +12,11 @@ from langgraph.checkpoint.memory import MemorySaver
 from indexer_graph.configuration import IndexConfiguration
 from indexer_graph.state import IndexState
 from shared import retrieval
+from shared.base_configuration import BaseConfiguration
+from shared.doc_name_index import add_doc_names
+
+DEFAULT_BATCH_SIZE = 64
+"""本機嵌入模型每批寫入的文件數(與 QdrantVectorStore.add_texts 的預設值相同)"""
 
 
 def ensure_docs_have_user_id(docs: Sequence[Document], config: RunnableConfig) -> list[Document]:
@@ -43,9 +49,30 @@ async def index_docs(state: IndexState, *, config: Optional[RunnableConfig] = No
 
     if not config:
         raise ValueError("Configuration required to run index_docs.")
+    configuration = BaseConfiguration.from_runnable_config(config)
+    # 遠端嵌入模型每批送出足以填滿所有並行請求的文件數，見 shared.remote_embedding
+    embedding = retrieval.get_match_embedding(configuration.embedding_model)
+    batch_size = getattr(embedding, "parallel_batch_size", DEFAULT_BATCH_SIZE)
+    # 設定 embedding_dimensions 時 retriever 的嵌入模型會先降維，文件寫入 `_d{維度}` 的 collection，見 shared.dimension_reduction
     with retrieval.get_retriever(config) as retriever:
         stamped_docs = ensure_docs_have_user_id(state.docs, config)
-        await retriever.aadd_documents(stamped_docs)
+        point_ids = await retriever.aadd_documents(stamped_docs, batch_size=batch_size)
+
+    # 更新 doc_name 字典，retrieve_ctbc_sa_doc 以此將 task_name 對應到確切的 doc_name
+    doc_names = {doc.metadata.get("doc_name") for doc in stamped_docs}
+    add_doc_names(retrieval.get_collection_name(configuration), doc_names)
+    if configuration.retriever_provider == "qdrant":
+        # doc_name 的全文 index 建在複製的 doc_name_text 欄位，見 shared.qdrant_collections；每個 doc_name 一次 set_payload，在 thread 中執行
+        from shared.qdrant_collections import copy_payload_fields
+
+        await asyncio.to_thread(
+            copy_payload_fields, retrieval.get_qdrant_client(), retrieval.get_collection_name(configuration), doc_names
+        )
+    if configuration.chunk_store and configuration.retriever_provider == "qdrant":
+        # 同步寫入本機 chunk store，檢索時才能只向 Qdrant 取 point id
+        from shared.chunk_store import append_chunks
+
+        append_chunks(retrieval.get_collection_name(configuration), point_ids, stamped_docs)
     return {"docs": "delete"} # 這步驟會把 decs 從 state 中刪除
 
 
@@ -25,6 +25,8 @@ from typing import Annotated, Any, Literal, Optional, Sequence, Union
 
 from langchain_core.documents import Document
 
+from shared.logger import indexer_graph_logger as logger
+
 ############################  Doc Indexing State  #############################
 
 
@@ -49,8 +51,11 @@ def reduce_docs(
             The new input to process. Can be a sequence of Documents, dictionaries, strings, a single string,
             or the literal "delete".
     """
-    print("existing_value ->", existing_value)
-    print("new_value ->", new_value)
+    logger.debug(
+        "reduce_docs existing=%d new=%s",
+        len(existing_value or []),
+        new_value if isinstance(new_value, str) else f"{len(new_value)} items",
+    )
     if new_value == "delete":
         return []
     if isinstance(new_value, str):
@@ -2,16 +2,16 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass, field, fields
+from dataclasses import dataclass, field
 from typing import Annotated, Any, Literal, Optional
 
-from langchain_core.runnables import RunnableConfig, ensure_config
+from langchain_core.runnables import RunnableConfig
 
 from kb_retrieval_agent import prompts
-from shared.base_configuration import BaseConfiguration
+from shared.base_configuration import BaseConfiguration, resolve_configuration
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, frozen=True)
 class Configuration(BaseConfiguration):
     """The configuration for the agent."""
 
@@ -23,17 +23,38 @@ class Configuration(BaseConfiguration):
         },
     )
 
+    prompt_cache: bool = field(
+        default=True,
+        metadata={
+            "description": "在 system prompt 的固定前綴之後加上 prompt caching checkpoint(模型支援時)，見 shared.prompt_cache"
+        },
+    )
+
     max_search_results: int = field(
         default=10,
         metadata={"description": "每個搜尋查詢傳回的最大搜尋結果數"},
     )
 
+    speculative_retrieval: bool = field(
+        default=False,
+        metadata={
+            "description": "推測式檢索。開啟後第一次呼叫 LLM 的同時以使用者訊息預先檢索，tool 查詢內容相近時直接使用結果，見 shared.speculative_retrieval"
+        },
+    )
+
+    speculative_document_types: list[Literal["insurance", "system_analysis"]] = field(
+        default_factory=lambda: ["insurance", "system_analysis"],
+        metadata={"description": "推測式檢索要預先檢索的文件類型"},
+    )
+
+    speculative_min_similarity: float = field(
+        default=0.5,
+        metadata={"description": "tool 查詢內容出現在使用者訊息中的比例(字元 bigram)達到此值才使用預先檢索的結果"},
+    )
+
     @classmethod
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
     ) -> Configuration:
         """從 RunnableConfig 建立一個 Configuration instance 物件"""
-        config = ensure_config(config)
-        configurable = config.get("configurable") or {}
-        _fields = {f.name for f in fields(cls) if f.init}
-        return cls(**{k: v for k, v in configurable.items() if k in _fields})
+        return resolve_configuration(cls, config)
@@ -6,9 +6,9 @@
 
 from langgraph.checkpoint.memory import MemorySaver
 from datetime import datetime, timezone
-from typing import Dict, List, Literal, cast
+from typing import Dict, List, Literal
 
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph
 from langgraph.prebuilt import ToolNode
@@ -16,9 +16,14 @@ from langgraph.prebuilt import ToolNode
 from kb_retrieval_agent.configuration import Configuration
 from kb_retrieval_agent.state import InputState, State
 from kb_retrieval_agent.tools import TOOLS
-from kb_retrieval_agent.utils import load_chat_model
+from kb_retrieval_agent.utils import get_message_text, load_chat_model
 
+from shared.instrumentation import instrument_graph
+from shared.prompt_cache import build_system_message
 from shared.logger import kb_retrieval_agent_logger as logger
+from shared.speculative_retrieval import cancel_prefetch, start_prefetch
+from shared.streaming import astream_message
+from shared.warmup import start_warm_up
 
 # Define the function that calls the model
 
@@ -39,21 +44,35 @@ async def call_model(state: State, config: RunnableConfig) -> Dict[str, List[AIM
     configuration = Configuration.from_runnable_config(config)
 
     # 使用 tool 綁定初始化模型。在此處變更模型或新增更多 tool
-    model = load_chat_model(configuration.response_model).bind_tools(TOOLS)
-
-    # format 系統提示。自訂此項以變更 Agent 程式的行為
-    system_message = configuration.system_prompt.format(
-        system_time=datetime.now(tz=timezone.utc).isoformat()
+    chat_model = load_chat_model(configuration.response_model)
+    model = chat_model.bind_tools(TOOLS)
+
+    # format 系統提示。自訂此項以變更 Agent 程式的行為；
+    # system_time 移到 cache checkpoint 之後，system prompt 與 tool 定義可被 provider 快取
+    system_message = build_system_message(
+        configuration.system_prompt,
+        chat_model,
+        cache=configuration.prompt_cache,
+        system_time=datetime.now(tz=timezone.utc).isoformat(),
     )
 
-    # 取得模型回應
-    response = cast(
-        AIMessage,
-        await model.ainvoke(
-            [{"role": "system", "content": system_message}, *state.messages], config
-        ),
+    # 使用者剛提問時 LLM 幾乎都會呼叫檢索 tool，先以原始訊息預先檢索；
+    # 回到 call_model 時(tool 已執行完)取消未被使用的預先檢索
+    if configuration.speculative_retrieval:
+        last_message = state.messages[-1]
+        if isinstance(last_message, HumanMessage):
+            start_prefetch(config, get_message_text(last_message), configuration.speculative_document_types)
+        else:
+            cancel_prefetch(config, "unused")
+
+    # 取得模型回應，以串流呼叫讓 token 即時經由 stream_mode="messages" 送出
+    response = await astream_message(
+        model, [system_message, *state.messages], config
     )
 
+    if configuration.speculative_retrieval and (not response.tool_calls or state.is_last_step):
+        cancel_prefetch(config, "no tool call")
+
     # 處理在 last step 時模型仍想使用 tool 的情況
     if state.is_last_step and response.tool_calls:
         return {
@@ -141,3 +160,7 @@ graph = builder.compile(
     interrupt_after=[],  # Add node names here to update state after they're called
 )
 graph.name = "ReAct Agent"  # This customizes the name in LangSmith
+# 掛上 node、LLM、tool 的耗時與 token 量測，見 shared.instrumentation
+# 啟動時驗證環境變數(設定錯誤時 graph 無法載入)，WARMUP_ON_STARTUP=true 時在背景預熱
+start_warm_up("kb_retrieval_agent", Configuration, load_chat_model)
+graph = instrument_graph(graph, "kb_retrieval_agent")
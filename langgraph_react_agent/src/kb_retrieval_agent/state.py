@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Sequence
+from typing import Sequence, Union
 
 from langchain_core.messages import AnyMessage
 from langchain_core.documents import Document
@@ -11,6 +11,8 @@ from langgraph.graph import add_messages
 from langgraph.managed import IsLastStep
 from typing_extensions import Annotated
 
+from shared.doc_cache import DocRef
+
 
 @dataclass
 class InputState:
@@ -54,8 +56,10 @@ class State(InputState):
     It is set to 'True' when the step count reaches recursion_limit - 1.
     """
 
-    retrieved_docs: list[Document] = field(default_factory=list)
-    """由 retriever 檢索到的文件。這是 agent 可以參考的文件清單。"""
+    retrieved_docs: list[Union[Document, DocRef]] = field(default_factory=list)
+    """由 retriever 檢索到的文件。這是 agent 可以參考的文件清單。
+
+    開啟 doc_reference_mode 時只保存 DocRef，完整內容由 shared.doc_cache 取回。"""
 
     # Additional attributes can be added here as needed.
     # Common examples include:
@@ -6,10 +6,10 @@ These tools are intended as free examples to get started. For production use,
 consider implementing more robust and specialized tools tailored to your needs.
 """
 
+import asyncio
 from dataclasses import field
 from typing import Any, Callable, List, Optional, cast
 
-from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import InjectedToolArg
 from langchain_core.tools import tool
@@ -20,7 +20,11 @@ from typing_extensions import Annotated
 
 from shared import retrieval
 from kb_retrieval_agent.configuration import Configuration
-from shared.base_configuration import BaseConfiguration
+from shared.doc_cache import to_tool_docs
+from shared.doc_name_index import doc_name_filter
+from shared.logger import kb_retrieval_agent_logger as logger
+from shared.speculative_retrieval import take_prefetched
+from shared.streaming import emit_citations
 
 
 # 中途 AI 詢問人類的時候要用以下格式回應
@@ -40,6 +44,22 @@ class AskHuman(BaseModel):
     question: str
 
 
+async def _take_prefetched(
+    config: RunnableConfig, configuration: Configuration, query: str, doc_filter: Any = None
+) -> Optional[list[Document]]:
+    """speculative_retrieval 開啟時取用 call_model 預先檢索的結果，不可用時回傳 None，見 shared.speculative_retrieval"""
+    if not configuration.speculative_retrieval:
+        return None
+    return await take_prefetched(
+        config,
+        retrieval.get_collection_name(configuration),
+        query,
+        configuration.retrieve_limit,
+        doc_filter,
+        configuration.speculative_min_similarity,
+    )
+
+
 @tool
 async def retrieve_insurance_doc(
     query: Annotated[str, {"__tool_param__": {"kind": "查詢條件"}}] = field(
@@ -67,21 +87,26 @@ async def retrieve_insurance_doc(
 
     """
     config.setdefault("document_type", "insurance")
-    configuration = BaseConfiguration.from_runnable_config(config)
-    with retrieval.get_retriever(config) as retriever:
-        queryStr = f"{query}, 年齡: {age}, 性別:{gender}"
-        response = await retriever.ainvoke(queryStr, RunnableConfig(
-            configurable={
-                "search_kwargs": {
-                    "k": configuration.retrieve_limit,
-                    "filter": None
-                },
-            }
-        ))
-        if len(response) == 0:
-            return "無搜尋到相關資訊"
-        else:
-            return [{"doc_name": doc.metadata["doc_name"], "pageContent": doc.page_content, "metadata": doc.metadata} for doc in response]
+    configuration = Configuration.from_runnable_config(config)
+    queryStr = f"{query}, 年齡: {age}, 性別:{gender}"
+    # 預先檢索的結果可用時不必再檢索；以實際檢索的 queryStr(含年齡、性別)比較，條件不在原始訊息中時改為實際檢索
+    response = await _take_prefetched(config, configuration, queryStr)
+    if response is None:
+        with retrieval.get_retriever(config) as retriever:
+            response = await retriever.ainvoke(queryStr, RunnableConfig(
+                configurable={
+                    "search_kwargs": {
+                        "k": configuration.retrieve_limit,
+                        "filter": None
+                    },
+                }
+            ))
+    # 不等 LLM 讀完 tool 結果，先把引用送到前端
+    emit_citations(response, tool="retrieve_insurance_doc", query=queryStr)
+    if len(response) == 0:
+        return "無搜尋到相關資訊"
+    else:
+        return to_tool_docs(response, configuration.doc_reference_mode)
 
 
 @tool
@@ -111,41 +136,36 @@ async def retrieve_ctbc_sa_doc(
 
     """
     config.setdefault("document_type", "system_analysis")
-    configuration = BaseConfiguration.from_runnable_config(config)
-    with retrieval.get_retriever(config) as retriever:
-        from qdrant_client.models import Filter, FieldCondition, MatchValue, MatchText
-        should_condition = []
-        # if task_id:
-        #     should_condition.append(FieldCondition(
-        #         key=f"metadata.doc_name",
-        #         match=MatchText(text=task_id)
-        #     ))
-        if task_name:
-            should_condition.append(FieldCondition(
-                key=f"metadata.doc_name",
-                match=MatchText(text=task_name)
-            ))
-        try:
-            response = await retriever.ainvoke(
-            search_content,
-            RunnableConfig(
-                configurable={
-                    "search_kwargs": {
-                        "k": configuration.retrieve_limit,
-                        "filter": Filter(
-                            should=should_condition,
-                        ),
-                    },
-                }
+    configuration = Configuration.from_runnable_config(config)
+    # task_name 先對應到確切的 doc_name，以 keyword index 篩選，見 shared.doc_name_index；
+    # 模糊比對與第一次的 payload index 查詢在 thread 中執行
+    client = retrieval.get_qdrant_client() if configuration.retriever_provider == "qdrant" else None
+    doc_filter = await asyncio.to_thread(doc_name_filter, retrieval.get_collection_name(configuration), task_name, client)
+    # 預先檢索的結果中有足夠符合篩選條件的文件時不必再檢索
+    response = await _take_prefetched(config, configuration, search_content, doc_filter)
+    if response is None:
+        with retrieval.get_retriever(config) as retriever:
+            try:
+                response = await retriever.ainvoke(
+                search_content,
+                RunnableConfig(
+                    configurable={
+                        "search_kwargs": {
+                            "k": configuration.retrieve_limit,
+                            "filter": doc_filter,
+                        },
+                    }
+                )
             )
-        )
-        except Exception as e:
-            print(e)
-        
-        if len(response) == 0:
-            return "無搜尋到相關資訊"
-        else:
-            return [{"link": "https://123456", "doc_name": doc.metadata["doc_name"], "pageContent": doc.page_content, "metadata": doc.metadata} for doc in response]
+            except Exception:
+                logger.exception("檢索規格書失敗 task_name=[%s]", task_name)
+                response = []
+    emit_citations(response, tool="retrieve_ctbc_sa_doc", query=search_content)
+
+    if len(response) == 0:
+        return "無搜尋到相關資訊"
+    else:
+        return to_tool_docs(response, configuration.doc_reference_mode, link="https://123456")
 
         # modify_config = RunnableConfig(
         #     configurable={
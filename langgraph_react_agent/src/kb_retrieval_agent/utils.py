@@ -1,10 +1,15 @@
 """Utility & helper functions."""
 
 import os
+from functools import lru_cache
+
 from langchain.chat_models import init_chat_model
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import BaseMessage
 
+from shared.llm_gateway import gateway_model
+from shared.settings import get_settings
+
 
 def get_message_text(msg: BaseMessage) -> str:
     """取得訊息的文字內容
@@ -36,6 +41,7 @@ def get_message_text(msg: BaseMessage) -> str:
         return "".join(txts).strip()
 
 
+@lru_cache
 def load_chat_model(fully_specified_name: str) -> BaseChatModel:
     """從指定的名稱載入聊天模型
     Args:
@@ -57,15 +63,18 @@ def load_chat_model(fully_specified_name: str) -> BaseChatModel:
         # )
         # return bedrock_chat_model
         from langchain_aws import ChatBedrockConverse
+        # 使用設定中的模型 id，shared.prompt_cache 依此判斷是否支援 prompt caching
         bedrock_chat_model = ChatBedrockConverse(
-            model_id="anthropic.claude-3-5-sonnet-20240620-v1:0",
+            model_id=model,
             temperature=0.0,
             max_tokens=8192,
             # other params...
         )
-        return bedrock_chat_model
+        return gateway_model(bedrock_chat_model, fully_specified_name)
     elif provider == "ollama":
         from langchain_ollama import ChatOllama
-        return ChatOllama(model=model, base_url="...")
+        return gateway_model(ChatOllama(model=model, base_url="..."), fully_specified_name)
     else:
-        return init_chat_model(model, model_provider=provider)
+        return gateway_model(
+            init_chat_model(model, model_provider=provider, **get_settings().client_kwargs(provider)), fully_specified_name
+        )
@@ -2,16 +2,16 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass, field, fields
+from dataclasses import dataclass, field
 from typing import Annotated, Any, Literal, Optional
 
-from langchain_core.runnables import RunnableConfig, ensure_config
+from langchain_core.runnables import RunnableConfig
 
 from react_agent import prompts
-from shared.base_configuration import BaseConfiguration
+from shared.base_configuration import BaseConfiguration, resolve_configuration
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, frozen=True)
 class Configuration(BaseConfiguration):
     """The configuration for the agent."""
 
@@ -23,10 +23,14 @@ class Configuration(BaseConfiguration):
         },
     )
 
+    prompt_cache: bool = field(
+        default=True,
+        metadata={
+            "description": "在 system prompt 的固定前綴之後加上 prompt caching checkpoint(模型支援時)，見 shared.prompt_cache"
+        },
+    )
+
     @classmethod
     def from_runnable_config(cls, config: Optional[RunnableConfig] = None) -> Configuration:
         """從 RunnableConfig 建立一個 Configuration instance 物件"""
-        config = ensure_config(config)
-        configurable = config.get("configurable") or {}
-        _fields = {f.name for f in fields(cls) if f.init}
-        return cls(**{k: v for k, v in configurable.items() if k in _fields})
+        return resolve_configuration(cls, config)
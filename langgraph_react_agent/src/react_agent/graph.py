@@ -5,7 +5,7 @@
 """
 
 from datetime import datetime, timezone
-from typing import Dict, List, Literal, cast
+from typing import Dict, List, Literal
 
 from langchain_core.messages import AIMessage
 from langchain_core.runnables import RunnableConfig
@@ -17,6 +17,11 @@ from react_agent.state import InputState, State
 from react_agent.tools import TOOLS
 from react_agent.utils import load_chat_model
 
+from shared.instrumentation import instrument_graph
+from shared.prompt_cache import build_system_message
+from shared.streaming import astream_message
+from shared.warmup import start_warm_up
+
 # Define the function that calls the model
 
 
@@ -35,19 +40,21 @@ async def call_model(state: State, config: RunnableConfig) -> Dict[str, List[AIM
     configuration = Configuration.from_runnable_config(config)
 
     # 使用 tool 綁定初始化模型。在此處變更模型或新增更多 tool
-    model = load_chat_model(configuration.response_model).bind_tools(TOOLS)
-
-    # format 系統提示。自訂此項以變更 Agent 程式的行為
-    system_message = configuration.system_prompt.format(
-        system_time=datetime.now(tz=timezone.utc).isoformat()
+    chat_model = load_chat_model(configuration.response_model)
+    model = chat_model.bind_tools(TOOLS)
+
+    # format 系統提示。自訂此項以變更 Agent 程式的行為；
+    # system_time 移到 cache checkpoint 之後，system prompt 與 tool 定義可被 provider 快取
+    system_message = build_system_message(
+        configuration.system_prompt,
+        chat_model,
+        cache=configuration.prompt_cache,
+        system_time=datetime.now(tz=timezone.utc).isoformat(),
     )
 
-    # 取得模型回應
-    response = cast(
-        AIMessage,
-        await model.ainvoke(
-            [{"role": "system", "content": system_message}, *state.messages], config
-        ),
+    # 取得模型回應，以串流呼叫讓 token 即時經由 stream_mode="messages" 送出
+    response = await astream_message(
+        model, [system_message, *state.messages], config
     )
 
     # 處理在 last step 時模型仍想使用 tool 的情況
@@ -116,3 +123,7 @@ graph = builder.compile(
     interrupt_after=[],  # Add node names here to update state after they're called
 )
 graph.name = "ReAct Agent"  # This customizes the name in LangSmith
+# 掛上 node、LLM、tool 的耗時與 token 量測，見 shared.instrumentation
+# 啟動時驗證環境變數(設定錯誤時 graph 無法載入)，WARMUP_ON_STARTUP=true 時在背景預熱
+start_warm_up("react_agent", Configuration, load_chat_model)
+graph = instrument_graph(graph, "react_agent")
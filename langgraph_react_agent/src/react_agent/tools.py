@@ -9,13 +9,14 @@ consider implementing more robust and specialized tools tailored to your needs.
 from dataclasses import field
 from typing import Any, Callable, List, Optional, cast
 
-from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import InjectedToolArg
 from langchain_core.tools import tool
 from typing_extensions import Annotated
 
 from shared import retrieval
+from shared.doc_cache import to_tool_docs
+from shared.streaming import emit_citations
 from react_agent.configuration import Configuration
 
 
@@ -32,6 +33,9 @@ async def search(query: str, *, config: Annotated[RunnableConfig, InjectedToolAr
     Returns:
         Optional[list[dict[str, Any]]]: list of search result
     """
+    # langchain_community 載入約需 0.1 秒，延後到第一次搜尋時才 import
+    from langchain_community.tools.tavily_search import TavilySearchResults
+
     configuration = Configuration.from_runnable_config(config)
     wrapped = TavilySearchResults(max_results=configuration.max_search_results)
     result = await wrapped.ainvoke({"query": query})
@@ -47,13 +51,16 @@ async def retrieve(
     config: Annotated[RunnableConfig, InjectedToolArg]
 ) -> Optional[list[dict[str, Any]]]:
     """檢索知識庫提供 LLM 的參考回應"""
+    configuration = Configuration.from_runnable_config(config)
     with retrieval.get_retriever(config) as retriever:
         try:
             response = await retriever.ainvoke(query, config)
+            # 不等 LLM 讀完 tool 結果，先把引用送到前端
+            emit_citations(response, tool="retrieve", query=query)
         except Exception as e:
             print(e)
         # return cast(list[dict[str, Any]], response)
-        return [{"link": "https://123456", "doc_name": doc.metadata["doc_name"], "pageContent": doc.page_content, "metadata": doc.metadata} for doc in response]
+        return to_tool_docs(response, configuration.doc_reference_mode, link="https://123456")
 
 
 @tool
@@ -1,10 +1,14 @@
 """Utility & helper functions."""
 
-import os
+from functools import lru_cache
+
 from langchain.chat_models import init_chat_model
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import BaseMessage
 
+from shared.llm_gateway import gateway_model
+from shared.settings import get_settings
+
 
 def get_message_text(msg: BaseMessage) -> str:
     """取得訊息的文字內容
@@ -36,6 +40,7 @@ def get_message_text(msg: BaseMessage) -> str:
         return "".join(txts).strip()
 
 
+@lru_cache
 def load_chat_model(fully_specified_name: str) -> BaseChatModel:
     """從指定的名稱載入聊天模型
     Args:
@@ -49,12 +54,14 @@ def load_chat_model(fully_specified_name: str) -> BaseChatModel:
 
     if provider == "AWS.Bedrock":
         from langchain_aws import ChatBedrock
-        aws_region = os.environ["AWS_REGION"]
+        aws_region = get_settings().require("aws_region")
         bedrock_chat_model = ChatBedrock(
             model_id=model,
             model_kwargs=dict(temperature=0),
             region_name=aws_region,
         )
-        return bedrock_chat_model
+        return gateway_model(bedrock_chat_model, fully_specified_name)
     else:
-        return init_chat_model(model, model_provider=provider)
+        return gateway_model(
+            init_chat_model(model, model_provider=provider, **get_settings().client_kwargs(provider)), fully_specified_name
+        )
@@ -2,16 +2,16 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass, field, fields
+from dataclasses import dataclass, field
 from typing import Annotated, Any, Literal, Optional, Type, TypeVar
 
-from langchain_core.runnables import RunnableConfig, ensure_config
+from langchain_core.runnables import RunnableConfig
 
 from retrieval_graph import prompts
-from shared.base_configuration import BaseConfiguration
+from shared.base_configuration import BaseConfiguration, resolve_configuration
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, frozen=True)
 class IndexConfiguration:
     """
     indexing 和 retrive 資料的 configuration。
@@ -85,16 +85,13 @@ class IndexConfiguration:
         Returns:
             T: An instance of IndexConfiguration with the specified configuration.
         """
-        config = ensure_config(config)
-        configurable = config.get("configurable") or {}
-        _fields = {f.name for f in fields(cls) if f.init}
-        return cls(**{k: v for k, v in configurable.items() if k in _fields})
+        return resolve_configuration(cls, config)
 
 
 T = TypeVar("T", bound=IndexConfiguration)
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, frozen=True)
 class Configuration(BaseConfiguration):
     """Agent 設定"""
 
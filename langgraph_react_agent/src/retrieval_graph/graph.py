@@ -20,7 +20,11 @@ from retrieval_graph.state import InputState, State
 from retrieval_graph.utils import format_docs, format_docs_as_json, get_message_text, load_chat_model
 
 from shared import retrieval
+from shared.doc_cache import DocRef, aresolve_docs, to_doc_refs
+from shared.instrumentation import instrument_graph, stage
 from shared.logger import retrieval_graph_logger as logger
+from shared.streaming import NOSTREAM_TAGS, astream_message, emit_citations
+from shared.warmup import start_warm_up
 
 # Define the function that calls the model
 
@@ -68,7 +72,6 @@ async def generate_query(state: State, *, config: RunnableConfig) -> dict[str, l
         logger.info("查詢條件 -> %s", [human_input])
         return {"queries": [human_input]}
     else:
-        configuration = Configuration.from_runnable_config(config)
         # Feel free to customize the prompt, model, and other logic!
         prompt = ChatPromptTemplate.from_messages(
             [
@@ -76,7 +79,8 @@ async def generate_query(state: State, *, config: RunnableConfig) -> dict[str, l
                 ("placeholder", "{messages}"),
             ]
         )
-        model = load_chat_model(configuration.query_model).with_structured_output(SearchQuery)
+        # 檢索查詢只給 retrieve 使用，不以 messages stream 送到前端
+        model = load_chat_model(configuration.query_model).with_structured_output(SearchQuery).with_config(tags=NOSTREAM_TAGS)
 
         message_value = await prompt.ainvoke(
             {
@@ -93,7 +97,7 @@ async def generate_query(state: State, *, config: RunnableConfig) -> dict[str, l
         return {"queries": [generated.query]}
 
 
-async def retrieve(state: State, *, config: RunnableConfig) -> dict[str, list[Document]]:
+async def retrieve(state: State, *, config: RunnableConfig) -> dict[str, list[Document] | list[DocRef]]:
     """根據 state 裡最新的 user query 檢索文件。
 
     此函數取得目前 state 和 config，使用最新的 query 檢索相關文檔，並返回檢索到的文檔。
@@ -103,10 +107,16 @@ async def retrieve(state: State, *, config: RunnableConfig) -> dict[str, list[Do
         config (RunnableConfig | None, optional): 檢索過程中使用到的設定
 
     Returns:
-        dict[str, list[Document]]: 包含單一 key -> "retrieved_docs" 的 dicti 物件，內容為 Document 陣列物件
+        dict[str, list[Document] | list[DocRef]]: 包含單一 key -> "retrieved_docs" 的 dicti 物件，
+            內容為 Document 陣列物件；開啟 doc_reference_mode 時為 DocRef 陣列物件
     """
+    configuration = Configuration.from_runnable_config(config)
     with retrieval.get_retriever(config) as retriever:
         response = await retriever.ainvoke(state.queries[-1], config)
+        # 不等 respond 產生回應，先把引用送到前端
+        emit_citations(response, query=state.queries[-1])
+        if configuration.doc_reference_mode:
+            return {"retrieved_docs": to_doc_refs(response)}
         return {"retrieved_docs": response}
 
 
@@ -122,7 +132,8 @@ async def respond(state: State, *, config: RunnableConfig) -> dict[str, list[Bas
     )
     model = load_chat_model(configuration.response_model)
 
-    retrieved_docs = format_docs_as_json(state.retrieved_docs)
+    with stage("format_docs"):
+        retrieved_docs = format_docs_as_json(await aresolve_docs(state.retrieved_docs))
     message_value = await prompt.ainvoke(
         {
             "messages": state.messages,
@@ -131,7 +142,8 @@ async def respond(state: State, *, config: RunnableConfig) -> dict[str, list[Bas
         },
         config,
     )
-    response = await model.ainvoke(message_value, config)
+    # 以串流呼叫，token 即時經由 stream_mode="messages" 送出
+    response = await astream_message(model, message_value, config)
 
     logger.info("LLM 回應 -> %s", str(response.content))
     logger.info("檢索文件  -> \n%s", retrieved_docs)
@@ -163,3 +175,7 @@ graph = builder.compile(
     # checkpointer=memory,
 )
 graph.name = "Graph"
+# 掛上 node、LLM、tool 的耗時與 token 量測，見 shared.instrumentation
+# 啟動時驗證環境變數(設定錯誤時 graph 無法載入)，WARMUP_ON_STARTUP=true 時在背景預熱
+start_warm_up("retrieval_graph", Configuration, load_chat_model)
+graph = instrument_graph(graph, "retrieval_graph")
@@ -20,12 +20,14 @@ these state management operations.
 """
 
 from dataclasses import dataclass, field
-from typing import Annotated, Sequence
+from typing import Annotated, Sequence, Union
 
 from langchain_core.documents import Document
 from langchain_core.messages import AnyMessage
 from langgraph.graph import add_messages
 
+from shared.doc_cache import DocRef
+
 
 # Optional, the InputState is a restricted version of the State that is used to
 # define a narrower interface to the outside world vs. what is maintained
@@ -94,8 +96,10 @@ class State(InputState):
     queries: Annotated[list[str], add_queries] = field(default_factory=list)
     """agent 產生的搜尋 query 清單。"""
 
-    retrieved_docs: list[Document] = field(default_factory=list)
-    """由 retriever 檢索到的文件。這是 agent 可以參考的文件清單。"""
+    retrieved_docs: list[Union[Document, DocRef]] = field(default_factory=list)
+    """由 retriever 檢索到的文件。這是 agent 可以參考的文件清單。
+
+    開啟 doc_reference_mode 時只保存 DocRef，完整內容由 shared.doc_cache 取回。"""
 
     # Feel free to add additional attributes to your state as needed.
     # Common examples include retrieved documents, extracted entities, API connections, etc.
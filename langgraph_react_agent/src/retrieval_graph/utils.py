@@ -6,8 +6,8 @@ Functions:
     format_docs: 將文件內容轉換為 xml 格式的字串
 """
 
-import os
 import json
+from functools import lru_cache
 from typing import Optional
 
 from langchain.chat_models import init_chat_model
@@ -15,6 +15,9 @@ from langchain_core.documents import Document
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import AnyMessage
 
+from shared.llm_gateway import gateway_model
+from shared.settings import get_settings
+
 
 def get_message_text(msg: AnyMessage) -> str:
     """Get the text content of a message.
@@ -80,6 +83,7 @@ def format_docs_as_json(docs: Optional[list[Document]]) -> str:
     return formated_json_docs
 
 
+@lru_cache
 def load_chat_model(fully_specified_name: str) -> BaseChatModel:
     """從指定的名稱載入聊天模型。參數格式為：「provider/model」的字串。"""
 
@@ -91,15 +95,17 @@ def load_chat_model(fully_specified_name: str) -> BaseChatModel:
 
     if provider == "AWS.Bedrock":
         from langchain_aws import ChatBedrockConverse
-        aws_region = os.environ["AWS_REGION"]
+        aws_region = get_settings().require("aws_region")
         bedrock_chat_model = ChatBedrockConverse(
             model_id=model,
             temperature=0,
             region_name=aws_region,
         )
-        return bedrock_chat_model
+        return gateway_model(bedrock_chat_model, fully_specified_name)
     elif provider == "ollama":
         from langchain_ollama import ChatOllama
-        return ChatOllama(model=model, base_url="...")
+        return gateway_model(ChatOllama(model=model, base_url="..."), fully_specified_name)
     else:
-        return init_chat_model(model, model_provider=provider)
+        return gateway_model(
+            init_chat_model(model, model_provider=provider, **get_settings().client_kwargs(provider)), fully_specified_name
+        )
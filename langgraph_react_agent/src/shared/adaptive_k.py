@@ -0,0 +1,162 @@
+"""
+依檢索分數分布決定每次檢索的文件數(adaptive k)。
+
+固定 k 會在只有一兩份文件相關時把低相關的文件也送進 prompt，相關文件很多時又不夠。
+開啟 adaptive_k 後，retriever 先以相似度取 max(k, adaptive_max_k) 筆候選，依序套用：
+
+    1. relative threshold  與第一名的差距超過第一名分數(距離)的 adaptive_relative_threshold 倍時截斷(第一名為 0 時以全距為基準)
+    2. score gap           剩下的文件中最大的相鄰落差(分數曲線的 knee)達到候選分數全距的 adaptive_score_gap 倍時從該處截斷
+    3. token budget        累計的估計 token 數超過 adaptive_token_budget 時截斷
+
+至少保留 adaptive_min_k 筆。候選以相似度排序而非 MMR(MMR 的順序不是分數順序，無法依分數截斷)。
+每份文件的 metadata 會附上 `_score`。
+
+離線評估見 benchmark.adaptive_k。
+
+metrics:
+    rag_adaptive_k_queries_total{reason=...}  各截斷原因(threshold / gap / budget / max / empty)的次數
+    rag_adaptive_k_docs_total                 回傳的文件數，除以 queries_total 即平均 k
+    rag_adaptive_k_tokens_total               回傳文件的估計 token 數
+"""
+
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+from pydantic import ConfigDict, Field
+
+from shared.instrumentation import metrics
+
+
+MMR_ONLY_KWARGS = ("fetch_k", "lambda_mult")
+"""相似度搜尋不接受的 MMR 參數"""
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估 token 數：中日韓文字每字約 1 個 token，其他字元約 4 個一個 token"""
+    cjk = sum(1 for ch in text if "⺀" <= ch <= "鿿" or "가" <= ch <= "힯" or "豈" <= ch <= "﫿")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+@dataclass(frozen=True)
+class Cutoff:
+    """截斷的結果"""
+
+    k: int
+    reason: str
+    """threshold、gap、budget、max(沒有截斷，取滿候選)或 empty(沒有候選)"""
+
+
+def choose_k(
+    scores: Sequence[float],
+    token_counts: Sequence[int],
+    *,
+    higher_is_better: bool,
+    min_k: int = 2,
+    score_gap: float = 0.3,
+    relative_threshold: float = 0.3,
+    token_budget: int = 0,
+) -> Cutoff:
+    """依分數(由好到壞排序)與每份文件的 token 數決定保留的筆數
+
+    score_gap、relative_threshold、token_budget 為 0 時不套用該規則
+    """
+    n = len(scores)
+    if n == 0:
+        return Cutoff(0, "empty")
+    # 統一為越大越好，Euclid 距離取負值
+    relevance = list(scores) if higher_is_better else [-s for s in scores]
+    best, spread = relevance[0], relevance[0] - relevance[-1]
+
+    k, reason = n, "max"
+    # 第一名分數為 0(例如距離為 0 的完全相同向量)時無法取倍數，改以候選分數的全距為基準
+    scale = abs(best) or spread
+    if relative_threshold:
+        for i in range(max(min_k, 1), n):
+            if best - relevance[i] > relative_threshold * scale:
+                k, reason = i, "threshold"
+                break
+    # 在保留範圍內找最大的相鄰落差(knee)，落差夠大時從該處截斷
+    if score_gap and spread > 0 and k > max(min_k, 1):
+        knee = max(range(max(min_k, 1), k), key=lambda i: relevance[i - 1] - relevance[i])
+        if relevance[knee - 1] - relevance[knee] >= score_gap * spread:
+            k, reason = knee, "gap"
+
+    if token_budget:
+        total = 0
+        for i in range(k):
+            total += token_counts[i]
+            if total > token_budget:
+                if max(i, min_k, 1) < k:
+                    k, reason = max(i, min_k, 1), "budget"
+                break
+    return Cutoff(min(k, n), reason)
+
+
+class AdaptiveRetriever(BaseRetriever):
+    """以相似度取候選，再依 choose_k 截斷的 retriever
+
+    search_kwargs 與 VectorStoreRetriever 相同(k、filter、search_params 等)，可經由 configurable 動態調整；
+    k 與 max_k 中較大者為候選數
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: VectorStore
+    search_kwargs: dict[str, Any] = Field(default_factory=dict)
+    higher_is_better: bool = False
+    """分數是否越大越好；Euclid 距離為 False，混合檢索的 RRF 分數為 True"""
+    min_k: int = 2
+    max_k: int = 10
+    score_gap: float = 0.3
+    relative_threshold: float = 0.3
+    token_budget: int = 0
+
+    search_params: Optional[Any] = None
+    """量化 collection 的檢索參數，查詢時併入 search_kwargs，見 shared.vector_quantization"""
+
+    def _search_kwargs(self) -> tuple[int, dict[str, Any]]:
+        kwargs = {k: v for k, v in self.search_kwargs.items() if k not in MMR_ONLY_KWARGS}
+        if self.search_params is not None:
+            kwargs.setdefault("search_params", self.search_params)
+        return max(kwargs.pop("k", self.max_k), self.max_k), kwargs
+
+    def select(self, candidates: Sequence[tuple[Document, float]]) -> tuple[list[Document], Cutoff]:
+        """從 (文件, 分數) 候選中依分數分布截斷，回傳附上 `_score` 的文件"""
+        tokens = [estimate_tokens(doc.page_content) for doc, _ in candidates]
+        cutoff = choose_k(
+            [score for _, score in candidates],
+            tokens,
+            higher_is_better=self.higher_is_better,
+            min_k=self.min_k,
+            score_gap=self.score_gap,
+            relative_threshold=self.relative_threshold,
+            token_budget=self.token_budget,
+        )
+        metrics.inc("rag_adaptive_k_queries_total", reason=cutoff.reason)
+        metrics.inc("rag_adaptive_k_docs_total", cutoff.k)
+        metrics.inc("rag_adaptive_k_tokens_total", sum(tokens[: cutoff.k]))
+        docs = [
+            Document(id=doc.id, page_content=doc.page_content, metadata={**doc.metadata, "_score": score})
+            for doc, score in candidates[: cutoff.k]
+        ]
+        return docs, cutoff
+
+    def candidates(self, query: str) -> list[tuple[Document, float]]:
+        k, kwargs = self._search_kwargs()
+        return self.vectorstore.similarity_search_with_score(query, k=k, **kwargs)
+
+    async def acandidates(self, query: str) -> list[tuple[Document, float]]:
+        k, kwargs = self._search_kwargs()
+        return await self.vectorstore.asimilarity_search_with_score(query, k=k, **kwargs)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        return self.select(self.candidates(query))[0]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return self.select(await self.acandidates(query))[0]
@@ -1,33 +1,60 @@
+from functools import lru_cache
+from typing import Optional
+
 from langchain_core.embeddings import Embeddings
 from langchain_qdrant.sparse_embeddings import SparseEmbeddings
 from langchain_qdrant.sparse_embeddings import SparseVector
 from FlagEmbedding import BGEM3FlagModel
 
+from shared.embedding_settings import LocalEmbeddingSettings, apply_thread_settings, get_embedding_settings
+from shared.instrumentation import timed
+
 # BAAI/bge-m3 模型變數宣告
 # 參考 https://huggingface.co/BAAI/bge-m3
 
+MODEL_NAME = "BAAI/bge-m3"
+
+
+@lru_cache
+def load_bge_m3_model(use_fp16: bool = False) -> BGEM3FlagModel:
+    """載入 BAAI/bge-m3 模型，密集與稀疏嵌入共用同一份模型"""
+    return BGEM3FlagModel(MODEL_NAME, use_fp16=use_fp16, cache_dir="D:\\model")
+
 
 class BGEM3QdrantDenseEmbeddings(Embeddings):
     """使用 BAAI/bge-m3 為 Langchain_qdrant 客製的密集向量嵌入模型"""
 
-    def __init__(self):
-        self.model = BGEM3FlagModel("BAAI/bge-m3", use_fp16=False, cache_dir="D:\\model")
+    def __init__(self, settings: Optional[LocalEmbeddingSettings] = None):
+        self.settings = settings or get_embedding_settings(MODEL_NAME)
+        apply_thread_settings(self.settings)
+        self.model = load_bge_m3_model(self.settings.use_fp16)
+
+    def _encode(self, texts: list[str], **kwargs) -> dict:
+        return self.model.encode(texts, batch_size=self.settings.batch_size, max_length=self.settings.max_length, **kwargs)
 
+    @timed("embedding", model="bge-m3-dense")
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
-        return self.model.encode(texts, return_dense=True, return_sparse=False)["dense_vecs"]
+        return self._encode(texts, return_dense=True, return_sparse=False)["dense_vecs"]
 
+    @timed("embedding", model="bge-m3-dense")
     def embed_query(self, query: str) -> list[float]:
-        return self.model.encode([query], return_dense=True, return_sparse=False)["dense_vecs"][0]
+        return self._encode([query], return_dense=True, return_sparse=False)["dense_vecs"][0]
 
 
 class BGEM3QdrantSparseEmbeddings(SparseEmbeddings):
     """使用 BAAI/bge-m3 為 Langchain_qdrant 客製的稀疏向量嵌入模型"""
 
-    def __init__(self):
-        self.model = BGEM3FlagModel("BAAI/bge-m3", use_fp16=False, cache_dir="D:\\model")
+    def __init__(self, settings: Optional[LocalEmbeddingSettings] = None):
+        self.settings = settings or get_embedding_settings(MODEL_NAME)
+        apply_thread_settings(self.settings)
+        self.model = load_bge_m3_model(self.settings.use_fp16)
+
+    def _encode(self, texts: list[str], **kwargs) -> dict:
+        return self.model.encode(texts, batch_size=self.settings.batch_size, max_length=self.settings.max_length, **kwargs)
 
+    @timed("embedding", model="bge-m3-sparse")
     def embed_documents(self, texts: list[str]) -> list[SparseVector]:
-        sparse_embeddings = self.model.encode(texts, return_dense=False, return_sparse=True)["lexical_weights"]
+        sparse_embeddings = self._encode(texts, return_dense=False, return_sparse=True)["lexical_weights"]
         return [
             SparseVector(
                 indices=list(map(lambda x: int(x), dict(default_dict).keys())),
@@ -36,8 +63,9 @@ class BGEM3QdrantSparseEmbeddings(SparseEmbeddings):
             for default_dict in sparse_embeddings
         ]
 
+    @timed("embedding", model="bge-m3-sparse")
     def embed_query(self, query: str) -> SparseVector:
-        sparse_embeddings = self.model.encode(
+        sparse_embeddings = self._encode(
             [query], return_dense=False, return_sparse=True)["lexical_weights"]
         return [
             SparseVector(
@@ -2,26 +2,36 @@
 
 from __future__ import annotations
 
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass, field, fields
-from typing import Annotated, Any, Literal, Optional, Type, TypeVar
+from functools import cache
+from types import MappingProxyType
+from typing import Annotated, Any, Hashable, Literal, Optional, Type, TypeVar
 from langchain_core.runnables import RunnableConfig, ensure_config
 
+from shared.instrumentation import record_cache
 
-@dataclass(kw_only=True)
+
+@dataclass(kw_only=True, frozen=True)
 class BaseConfiguration:
-    """基礎 Agent 設定"""
+    """基礎 Agent 設定，instance 會在請求間共用，建立後不可修改"""
 
     embedding_model: Annotated[
         Literal[
             "AWS.Bedrock/cohere.embed-multilingual-v3",
             "BAAI/bge-m3",
+            "BAAI/bge-m3-onnx",
+            "BAAI/bge-m3-onnx-int8",
             "Microsoft/intfloat/multilingual-e5-large",
+            "Microsoft/intfloat/multilingual-e5-large-onnx",
+            "Microsoft/intfloat/multilingual-e5-large-onnx-int8",
             "google_genai/gemini-embedding-exp-03-07"
         ],
         {"__template_metadata__": {"kind": "embeddings"}},
     ] = field(
         default="AWS.Bedrock/cohere.embed-multilingual-v3",
-        metadata={"description": "嵌入模型的名稱。名稱格式:provider/model-name"},
+        metadata={"description": "嵌入模型的名稱。名稱格式:provider/model-name，本機模型加上 -onnx 或 -onnx-int8 後綴改用 ONNX Runtime 推論"},
     )
 
     query_model: Annotated[
@@ -59,12 +69,12 @@ class BaseConfiguration:
     )
 
     retriever_provider: Annotated[
-        Literal["qdrant", "elastic", "elastic-local", "pinecone", "mongodb"],
+        Literal["qdrant", "local", "elastic", "elastic-local", "pinecone", "mongodb"],
         {"__template_metadata__": {"kind": "retriever"}},
     ] = field(
         default="qdrant",
         metadata={
-            "description": """用於檢索的向量儲存提供者。選項包括"qdrant"、"elastic"、"pinecone"或"mongodb"。"""
+            "description": """用於檢索的向量儲存提供者。選項包括"qdrant"、"local"(process 內的本機向量索引)、"elastic"、"pinecone"或"mongodb"。"""
         },
     )
 
@@ -100,6 +110,96 @@ class BaseConfiguration:
         metadata={"description": "限制檢索範圍的篩選器 text 值"},
     )
 
+    vector_quantization: Annotated[
+        Literal["none", "scalar", "binary"],
+        {"__template_metadata__": {"kind": "quantization"}},
+    ] = field(
+        default="none",
+        metadata={
+            "description": """collection 的向量量化方式，選項包括"none"、"scalar"(int8)、"binary"。建立 collection 時依此設定量化，檢索時依此決定是否使用量化搜尋參數"""
+        },
+    )
+
+    quantization_rescore: bool = field(
+        default=True,
+        metadata={"description": "量化搜尋後是否以原始向量重新計分"},
+    )
+
+    quantization_oversampling: float = field(
+        default=2.0,
+        metadata={"description": "量化搜尋時的候選倍數，實際取 k * oversampling 筆候選再重新計分"},
+    )
+
+    adaptive_k: bool = field(
+        default=False,
+        metadata={
+            "description": "依檢索分數分布決定文件數。開啟後以相似度取候選，在分數落差或相對門檻處截斷，並以 token 預算設上限，見 shared.adaptive_k"
+        },
+    )
+
+    adaptive_min_k: int = field(
+        default=2,
+        metadata={"description": "adaptive k 至少保留的文件數"},
+    )
+
+    adaptive_max_k: int = field(
+        default=10,
+        metadata={"description": "adaptive k 的候選數(與 retrieve_limit 取較大者)，也是回傳文件數的上限"},
+    )
+
+    adaptive_score_gap: float = field(
+        default=0.3,
+        metadata={"description": "相鄰兩筆的分數落差達到候選分數全距的此倍數時截斷，0 表示不使用"},
+    )
+
+    adaptive_relative_threshold: float = field(
+        default=0.3,
+        metadata={"description": "與第一名的分數(距離)差距超過第一名的此倍數時截斷，0 表示不使用"},
+    )
+
+    adaptive_token_budget: int = field(
+        default=4000,
+        metadata={"description": "檢索文件的估計 token 數上限，0 表示不限制"},
+    )
+
+    embedding_dimensions: Optional[int] = field(
+        default=None,
+        metadata={
+            "description": "密集向量降維後的維度(例如 gemini 的 3072 降為 1536、768)，None 表示使用模型原始維度。檢索改用 `原 collection 名稱_d{維度}` 的 collection"
+        },
+    )
+
+    dimension_reduction: Annotated[
+        Literal["truncate", "pca"],
+        {"__template_metadata__": {"kind": "dimension reduction"}},
+    ] = field(
+        default="truncate",
+        metadata={
+            "description": """降維方式，選項包括"truncate"(Matryoshka 截斷，適用 gemini)、"pca"(以既有向量擬合的投影)"""
+        },
+    )
+
+    collection_version: Optional[str] = field(
+        default=None,
+        metadata={
+            "description": "blue/green 重新索引時寫入的 collection 版本(`collection 名稱__{版本}`)，None 表示使用 alias 目前指向的版本，見 shared.collection_aliases"
+        },
+    )
+
+    chunk_store: bool = field(
+        default=False,
+        metadata={
+            "description": "使用本機 chunk store。開啟後向 Qdrant 檢索只取 point id，文件內容由本機 mmap 檔案讀取"
+        },
+    )
+
+    doc_reference_mode: bool = field(
+        default=False,
+        metadata={
+            "description": "文件參照模式。開啟後 state 只保存文件參照(collection、point id、score)，完整內容在 respond 時才從快取取回"
+        },
+    )
+
     @classmethod
     def from_runnable_config(
         cls: Type[T], config: Optional[RunnableConfig] = None
@@ -113,10 +213,84 @@ class BaseConfiguration:
         Returns:
             T: An instance of IndexConfiguration with the specified configuration.
         """
-        config = ensure_config(config)
-        configurable = config.get("configurable") or {}
-        _fields = {f.name for f in fields(cls) if f.init}
-        return cls(**{k: v for k, v in configurable.items() if k in _fields})
+        return resolve_configuration(cls, config)
 
 
 T = TypeVar("T", bound=BaseConfiguration)
+
+
+CONFIGURATION_CACHE_SIZE = 256
+"""快取的 configuration instance 數量"""
+
+_configurations: OrderedDict[tuple, Any] = OrderedDict()
+_configurations_lock = threading.Lock()
+
+
+@cache
+def _init_fields(cls: type) -> frozenset[str]:
+    return frozenset(f.name for f in fields(cls) if f.init)
+
+
+def _freeze(value: Any) -> Hashable:
+    """將 configurable 的值轉為可 hash 的 key，無法轉換時拋出 TypeError"""
+    match value:
+        case dict():
+            return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+        case list() | tuple():
+            return tuple(_freeze(v) for v in value)
+        case set() | frozenset():
+            return frozenset(_freeze(v) for v in value)
+        case _:
+            hash(value)
+            return value
+
+
+C = TypeVar("C")
+
+
+def _readonly(instance: C) -> C:
+    """將 instance 中的 dict / list / set 欄位換為 MappingProxyType / tuple / frozenset
+
+    快取的 instance 由相同 configurable 的所有請求共用，欄位內容被修改會影響之後的請求
+    """
+    for f in fields(instance):
+        match getattr(instance, f.name):
+            case dict() as value:
+                object.__setattr__(instance, f.name, MappingProxyType(value))
+            case list() as value:
+                object.__setattr__(instance, f.name, tuple(value))
+            case set() as value:
+                object.__setattr__(instance, f.name, frozenset(value))
+    return instance
+
+
+
+
+def resolve_configuration(cls: Type[C], config: Optional[RunnableConfig] = None) -> C:
+    """從 RunnableConfig 建立 configuration instance
+
+    同一個 class 與相同 configurable 值會回傳同一個(不可變的)instance，一個請求中各 node 與 tool 不必重複建立；
+    configurable 含有無法 hash 的值(例如 qdrant Filter)時不快取。
+    dict、list 欄位(search_kwargs、speculative_document_types 等)以唯讀的 MappingProxyType、tuple 保存，需要修改時先複製。
+    """
+    config = ensure_config(config)
+    configurable = config.get("configurable") or {}
+    names = _init_fields(cls)
+    values = {k: v for k, v in configurable.items() if k in names}
+    try:
+        key = (cls, _freeze(values))
+    except TypeError:
+        return _readonly(cls(**values))
+
+    with _configurations_lock:
+        instance = _configurations.get(key)
+        if instance is not None:
+            _configurations.move_to_end(key)
+    record_cache("configuration", instance is not None)
+    if instance is None:
+        instance = _readonly(cls(**values))
+        with _configurations_lock:
+            _configurations[key] = instance
+            if len(_configurations) > CONFIGURATION_CACHE_SIZE:
+                _configurations.popitem(last=False)
+    return instance
@@ -0,0 +1,212 @@
+"""
+唯讀的本機 chunk store：以 mmap 存放每個 point 的 page_content 與 metadata。
+
+開啟 chunk_store 設定後，向 Qdrant 檢索時只取 point id 與分數(with_payload=False)，
+命中的文件內容再依 point id 從本機檔案解碼，省去每次檢索的 payload 傳輸與整份 JSON 解析。
+
+每個 collection 是 CHUNK_STORE_DIR(預設 ./chunk_store)下的一個資料夾：
+    ids.npy      依字串排序的 point id，以二分搜尋定位 row
+    offsets.npy  每個 row 在 chunks.bin 的(content 起點, metadata 起點, 結尾)
+    chunks.bin   依 row 順序串接的 UTF-8 page_content 與 metadata JSON
+
+檔案由 indexer 寫入(append_chunks)或從既有 Qdrant collection 建立(build_from_qdrant)。
+append_chunks 每批只寫一個小 segment(`<collection>.segments/` 下，格式相同)，下次開啟 store 時才依寫入順序合併進主檔，
+ingestion 的寫入成本與語料總量無關。寫入時先寫到暫存資料夾再整個換上，已開啟的讀取端不受影響。
+store 中沒有的 point 會退回向 Qdrant 取 payload。
+"""
+
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+def chunk_store_dir() -> Path:
+    return Path(os.environ.get("CHUNK_STORE_DIR", "./chunk_store"))
+
+
+class ChunkStore:
+    """單一 collection 的唯讀 chunk store"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.ids = np.load(path / "ids.npy", mmap_mode="r")
+        self.offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        with (path / "chunks.bin").open("rb") as f:
+            # 空檔案無法 mmap
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _row(self, point_id: Any) -> Optional[int]:
+        key = str(point_id)
+        row = int(np.searchsorted(self.ids, key))
+        if row < len(self.ids) and self.ids[row] == key:
+            return row
+        return None
+
+    def payload(self, point_id: Any) -> Optional[dict[str, Any]]:
+        """取得與 Qdrant 相同格式的 payload；不存在時回傳 None"""
+        row = self._row(point_id)
+        if row is None:
+            return None
+        content_start, metadata_start, end = (int(v) for v in self.offsets[row])
+        return {
+            "page_content": self.data[content_start:metadata_start].decode("utf-8"),
+            "metadata": json.loads(self.data[metadata_start:end]),
+        }
+
+    def items(self) -> Iterable[tuple[str, dict[str, Any]]]:
+        for point_id in self.ids:
+            yield str(point_id), self.payload(point_id)
+
+
+def write_chunk_store(path: Path, payloads: dict[str, dict[str, Any]]) -> None:
+    """寫入(覆蓋)整個 chunk store，payloads 為 point id 對應 payload"""
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    ids = sorted(payloads)
+    offsets = np.zeros((len(ids), 3), dtype=np.int64)
+    position = 0
+    with (tmp / "chunks.bin").open("wb") as f:
+        for row, point_id in enumerate(ids):
+            payload = payloads[point_id]
+            content = (payload.get("page_content") or "").encode("utf-8")
+            metadata = json.dumps(payload.get("metadata") or {}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            f.write(content)
+            f.write(metadata)
+            offsets[row] = (position, position + len(content), position + len(content) + len(metadata))
+            position = int(offsets[row, 2])
+    np.save(tmp / "ids.npy", np.asarray(ids, dtype=str) if ids else np.asarray([], dtype="<U1"))
+    np.save(tmp / "offsets.npy", offsets)
+
+    old = path.with_name(path.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if path.exists():
+        path.rename(old)
+    tmp.rename(path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+_stores: dict[str, ChunkStore] = {}
+_stores_lock = threading.Lock()
+
+
+def _segments_dir(path: Path) -> Path:
+    return path.with_name(path.name + ".segments")
+
+
+def _pending_segments(path: Path) -> list[Path]:
+    """已寫完的 segment，依寫入順序排列(寫入中的暫存資料夾以 .tmp / .old 結尾)"""
+    segments = _segments_dir(path)
+    if not segments.exists():
+        return []
+    return sorted(p for p in segments.iterdir() if not p.name.endswith((".tmp", ".old")))
+
+
+def compact_chunk_store(path: Path) -> None:
+    """將 segments 依寫入順序合併進主檔(相同 point id 以較新的為準)後刪除；沒有 segment 時不做任何事"""
+    segments = _pending_segments(path)
+    if not segments:
+        return
+    payloads = dict(ChunkStore(path).items()) if (path / "ids.npy").exists() else {}
+    for segment in segments:
+        payloads.update(ChunkStore(segment).items())
+    write_chunk_store(path, payloads)
+    for segment in segments:
+        shutil.rmtree(segment, ignore_errors=True)
+
+
+def get_chunk_store(collection_name: str) -> Optional[ChunkStore]:
+    """取得 process 內共用的 chunk store，開啟時先合併 append_chunks 寫入的 segment；尚未建立時回傳 None"""
+    store = _stores.get(collection_name)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(collection_name)
+            path = chunk_store_dir() / collection_name
+            if store is None:
+                compact_chunk_store(path)
+                if (path / "ids.npy").exists():
+                    store = _stores[collection_name] = ChunkStore(path)
+    return store
+
+
+def append_chunks(collection_name: str, point_ids: Iterable[Any], docs: Iterable[Document]) -> None:
+    """indexer 寫入 Qdrant 後，將同一批文件寫成新的 segment(相同 point id 在合併時以較新的為準)"""
+    payloads = {
+        str(point_id): {"page_content": doc.page_content, "metadata": doc.metadata} for point_id, doc in zip(point_ids, docs)
+    }
+    if not payloads:
+        return
+    path = chunk_store_dir() / collection_name
+    write_chunk_store(_segments_dir(path) / f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}", payloads)
+    # 已開啟的 store 看不到新的 segment，下次 get_chunk_store 時重新開啟並合併
+    _stores.pop(collection_name, None)
+
+
+def build_from_qdrant(client, collection_name: str, batch_size: int = 512) -> Path:
+    """從既有 Qdrant collection 的 payload 建立 chunk store"""
+    payloads: dict[str, dict[str, Any]] = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=collection_name, limit=batch_size, offset=offset, with_payload=True, with_vectors=False)
+        for point in points:
+            payloads[str(point.id)] = point.payload or {}
+        if offset is None:
+            break
+    path = chunk_store_dir() / collection_name
+    with _stores_lock:
+        # 以 Qdrant 的內容為準，尚未合併的 segment 已包含在內
+        shutil.rmtree(_segments_dir(path), ignore_errors=True)
+        write_chunk_store(path, payloads)
+        _stores.pop(collection_name, None)
+    return path
+
+
+class ChunkStoreClient:
+    """包裝 QdrantClient：query_points 不向 Qdrant 取 payload，改由 chunk store 補上
+
+    MMR 需要的向量只取 vector_name 一組，其餘方法原樣轉給 QdrantClient。
+    """
+
+    def __init__(self, client, store: ChunkStore, vector_name: str = "dense_text"):
+        self._client = client
+        self._store = store
+        self._vector_name = vector_name
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+    def query_points(self, collection_name: str, *args: Any, **kwargs: Any):
+        with_payload = kwargs.get("with_payload", False)
+        kwargs["with_payload"] = False
+        if kwargs.get("with_vectors") is True:
+            kwargs["with_vectors"] = [self._vector_name]
+        response = self._client.query_points(collection_name, *args, **kwargs)
+        if with_payload:
+            self.fill_payloads(collection_name, response.points)
+        return response
+
+    def fill_payloads(self, collection_name: str, points: list) -> None:
+        """以 chunk store 補上 payload，store 中沒有的 point 再向 Qdrant 取"""
+        missing = []
+        for point in points:
+            point.payload = self._store.payload(point.id)
+            if point.payload is None:
+                missing.append(point)
+        if missing:
+            fetched = self._client.retrieve(collection_name=collection_name, ids=[p.id for p in missing], with_payload=True, with_vectors=False)
+            payloads = {str(p.id): p.payload for p in fetched}
+            for point in missing:
+                point.payload = payloads.get(str(point.id)) or {}
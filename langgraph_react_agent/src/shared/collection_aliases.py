@@ -0,0 +1,330 @@
+"""
+以 Qdrant alias 進行 blue/green 重新索引。
+
+get_qdrant_collection_name 回傳的名稱改為 alias，實際資料放在帶版本的 collection(`<alias>__<version>`)。
+重新索引時不再刪除線上 collection：
+
+    1. create   依 shared.qdrant_collections 的宣告建立新版本的 collection
+    2. 以 configurable collection_version=<version> 執行 indexer，寫入新版本(chunk store、doc_name 字典也以新版本名稱建立)
+    3. promote  驗證筆數與抽樣 recall，通過後以單一 update_collection_aliases 將 alias 換到新版本
+    4. cleanup  刪除 alias 未指向的舊版本，保留最近幾個版本以便 rollback
+
+檢索端以 resolve_alias 將 alias 解析為實際 collection(每 COLLECTION_ALIAS_TTL_SECONDS 秒重新查詢)，
+doc cache、chunk store 與 doc_name 字典都以實際 collection 名稱為 key，換版後自然改用新版本的快取，
+舊版本的快取不會被新版本的資料污染，也不需要整批清空。
+
+alias 不能與既有 collection 同名：第一次切換時既有 collection 會被刪除後立即建立 alias(--replace-collection)，
+之後的切換都不會中斷服務。
+
+命令列：
+    python -m shared.collection_aliases status --provider BAAI --document-type system_analysis
+    python -m shared.collection_aliases create --provider BAAI --document-type system_analysis
+    python -m shared.collection_aliases promote --provider BAAI --document-type system_analysis --version v20250101120000
+    python -m shared.collection_aliases rollback --provider BAAI --document-type system_analysis
+    python -m shared.collection_aliases cleanup --provider BAAI --document-type system_analysis --keep 1
+"""
+
+import argparse
+import os
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from shared.logger import retrieval_graph_logger as logger
+
+VERSION_SEPARATOR = "__"
+
+VERSION_FORMAT = "v%Y%m%d%H%M%S"
+VERSION_PATTERN = re.compile(r"v\d{14}")
+"""版本名稱固定為 vYYYYmmddHHMMSS，字典序即為建立順序(rollback、cleanup 依此判斷新舊)"""
+
+ALIAS_TTL = float(os.environ.get("COLLECTION_ALIAS_TTL_SECONDS", "30"))
+"""alias 解析結果的快取秒數，換版後各 process 最晚在此時間內改用新版本"""
+
+
+def new_version() -> str:
+    return time.strftime(VERSION_FORMAT)
+
+
+def check_version(version: str) -> str:
+    """版本名稱不符合 vYYYYmmddHHMMSS 時拋出 ValueError"""
+    if not VERSION_PATTERN.fullmatch(version):
+        raise ValueError(f"版本名稱 {version!r} 不符合 vYYYYmmddHHMMSS 格式")
+    return version
+
+
+def versioned_collection_name(alias: str, version: str) -> str:
+    return f"{alias}{VERSION_SEPARATOR}{version}"
+
+
+def list_versions(client, alias: str) -> list[str]:
+    """alias 的所有版本 collection，依版本排序(舊 → 新)；版本不符合 vYYYYmmddHHMMSS 的 collection 不列入"""
+    prefix = alias + VERSION_SEPARATOR
+    return sorted(
+        c.name
+        for c in client.get_collections().collections
+        if c.name.startswith(prefix) and VERSION_PATTERN.fullmatch(c.name[len(prefix) :])
+    )
+
+
+# ===== alias 解析 ================================================
+_aliases: dict[str, str] = {}
+_aliases_checked = 0.0
+_aliases_lock = threading.Lock()
+
+
+def _alias_map(client) -> dict[str, str]:
+    global _aliases, _aliases_checked
+    if time.monotonic() - _aliases_checked < ALIAS_TTL:
+        return _aliases
+    with _aliases_lock:
+        if time.monotonic() - _aliases_checked >= ALIAS_TTL:
+            try:
+                _aliases = {a.alias_name: a.collection_name for a in client.get_aliases().aliases}
+            except Exception:
+                # Qdrant 暫時無法連線時沿用上次的解析結果
+                logger.warning("無法取得 Qdrant alias，沿用上次的解析結果", exc_info=True)
+            _aliases_checked = time.monotonic()
+    return _aliases
+
+
+def resolve_alias(client, name: str) -> str:
+    """alias 解析為實際 collection 名稱；不是 alias 時原樣回傳"""
+    return _alias_map(client).get(name, name)
+
+
+def invalidate_aliases() -> None:
+    """下一次 resolve_alias 重新向 Qdrant 查詢"""
+    global _aliases_checked
+    with _aliases_lock:
+        _aliases_checked = 0.0
+
+
+# ===== 驗證 ================================================
+@dataclass
+class ValidationReport:
+    collection: str
+    count: int
+    live_count: Optional[int]
+    """目前 alias 指向的 collection 筆數，尚無線上版本時為 None"""
+    recall: Optional[float]
+    """抽樣向量以索引搜尋相對於精確搜尋的 recall@k，collection 為空時為 None"""
+    errors: list[str]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def sample_recall(client, collection_name: str, sample: int = 20, k: int = 10, vector_name: str = "dense_text") -> Optional[float]:
+    """以 collection 中的向量查詢，比較索引搜尋與精確搜尋的前 k 筆"""
+    from qdrant_client.http import models
+
+    points, _ = client.scroll(collection_name=collection_name, limit=sample, with_payload=False, with_vectors=[vector_name])
+    if not points:
+        return None
+    hits = 0
+    for point in points:
+        vector = point.vector[vector_name] if isinstance(point.vector, dict) else point.vector
+        approx = client.query_points(collection_name, query=vector, using=vector_name, limit=k, with_payload=False)
+        exact = client.query_points(
+            collection_name,
+            query=vector,
+            using=vector_name,
+            limit=k,
+            with_payload=False,
+            search_params=models.SearchParams(exact=True),
+        )
+        expected = {p.id for p in exact.points}
+        hits += len(expected & {p.id for p in approx.points}) / max(len(expected), 1)
+    return hits / len(points)
+
+
+def validate_version(
+    client,
+    alias: str,
+    collection_name: str,
+    min_count_ratio: float = 0.95,
+    min_recall: float = 0.9,
+    sample: int = 20,
+    k: int = 10,
+) -> ValidationReport:
+    """換版前檢查：新版本不可為空、筆數不少於線上版本的 min_count_ratio、抽樣 recall 不低於 min_recall"""
+    from shared.qdrant_collections import DENSE_VECTOR_NAME
+
+    errors = []
+    count = client.count(collection_name, exact=True).count
+    live = resolve_alias_now(client, alias)
+    if live is None and client.collection_exists(alias):
+        # 尚未改用 blue/green，線上版本是與 alias 同名的 collection
+        live = alias
+    live_count = client.count(live, exact=True).count if live and live != collection_name else None
+
+    if count == 0:
+        errors.append(f"{collection_name} 沒有任何資料")
+    elif live_count and count < live_count * min_count_ratio:
+        errors.append(f"{collection_name} 筆數 {count} 少於線上版本 {live} 的 {min_count_ratio:.0%}({live_count})")
+
+    recall = sample_recall(client, collection_name, sample, k, DENSE_VECTOR_NAME) if count else None
+    if recall is not None and recall < min_recall:
+        errors.append(f"{collection_name} 抽樣 recall@{k}={recall:.3f} 低於 {min_recall}")
+    return ValidationReport(collection_name, count, live_count, recall, errors)
+
+
+# ===== 建立與換版 ================================================
+def resolve_alias_now(client, alias: str) -> Optional[str]:
+    """不經快取查詢 alias 目前指向的 collection；alias 不存在時回傳 None"""
+    for a in client.get_aliases().aliases:
+        if a.alias_name == alias:
+            return a.collection_name
+    return None
+
+
+def create_version(client, spec, version: Optional[str] = None) -> str:
+    """依宣告設定建立新版本的 collection，回傳版本；spec.name 為 alias"""
+    from shared.qdrant_collections import ensure_collection
+
+    version = check_version(version) if version else new_version()
+    ensure_collection(client, replace(spec, name=versioned_collection_name(spec.name, version)))
+    return version
+
+
+def swap_alias(client, alias: str, collection_name: str, replace_collection: bool = False) -> Optional[str]:
+    """以單一操作將 alias 指向 collection_name，回傳原本指向的 collection
+
+    alias 名稱仍是一般 collection 時(尚未改用 blue/green)，需 replace_collection=True 才會刪除該 collection 後建立 alias。
+    """
+    from qdrant_client.http import models
+
+    previous = resolve_alias_now(client, alias)
+    if previous is None and client.collection_exists(alias):
+        if not replace_collection:
+            raise ValueError(f"{alias} 是既有 collection 而不是 alias，確認新版本後以 replace_collection=True 取代")
+        logger.warning("刪除 collection [%s] 並改為指向 [%s] 的 alias", alias, collection_name)
+        client.delete_collection(alias)
+
+    operations = []
+    if previous is not None:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(
+        models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias))
+    )
+    client.update_collection_aliases(change_aliases_operations=operations)
+    invalidate_aliases()
+    logger.info("alias [%s] 由 [%s] 切換至 [%s]", alias, previous, collection_name)
+    return previous
+
+
+def promote(client, alias: str, version: str, force: bool = False, replace_collection: bool = False, **validate_kwargs) -> ValidationReport:
+    """驗證新版本後換版；驗證失敗時不換版(force=True 時仍換版)"""
+    collection_name = versioned_collection_name(alias, version)
+    report = validate_version(client, alias, collection_name, **validate_kwargs)
+    if report.ok or force:
+        swap_alias(client, alias, collection_name, replace_collection=replace_collection)
+    return report
+
+
+def rollback(client, alias: str) -> str:
+    """alias 換回目前版本之前的最新版本；目前指向的不是版本 collection 時換回最新版本"""
+    current = resolve_alias_now(client, alias)
+    versions = list_versions(client, alias)
+    older = versions[: versions.index(current)] if current in versions else versions
+    if not older:
+        raise ValueError(f"{alias} 沒有可以 rollback 的舊版本")
+    swap_alias(client, alias, older[-1])
+    return older[-1]
+
+
+def cleanup(client, alias: str, keep: int = 1) -> list[str]:
+    """刪除 alias 未指向的舊版本，保留最近 keep 個舊版本；比線上版本新的(尚未換版)不刪除"""
+    current = resolve_alias_now(client, alias)
+    versions = list_versions(client, alias)
+    if current not in versions:
+        return []
+    older = versions[: versions.index(current)]
+    removed = older[: max(len(older) - keep, 0)]
+    for name in removed:
+        client.delete_collection(name)
+        logger.info("刪除舊版本 collection [%s]", name)
+    return removed
+
+
+def _version_arg(value: str) -> str:
+    try:
+        return check_version(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    from shared.qdrant_collections import DOCUMENT_TYPES, PROVIDER_DENSE_SIZE
+
+    parser = argparse.ArgumentParser(description="Qdrant collection 的 blue/green 重新索引")
+    parser.add_argument("command", choices=["status", "create", "promote", "rollback", "cleanup"])
+    parser.add_argument("--provider", choices=list(PROVIDER_DENSE_SIZE), required=True)
+    parser.add_argument("--document-type", choices=DOCUMENT_TYPES, required=True)
+    parser.add_argument("--quantization", choices=["none", "scalar", "binary"], help="預設為 QDRANT_VECTOR_QUANTIZATION")
+    parser.add_argument("--dimensions", type=int, default=None)
+    parser.add_argument("--version", type=_version_arg, help="create 指定版本名稱；promote 要換上的版本(vYYYYmmddHHMMSS)")
+    parser.add_argument("--min-count-ratio", type=float, default=0.95)
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    parser.add_argument("--force", action="store_true", help="驗證失敗仍換版")
+    parser.add_argument("--replace-collection", action="store_true", help="alias 名稱是既有 collection 時刪除後改為 alias")
+    parser.add_argument("--keep", type=int, default=1, help="cleanup 保留的舊版本數")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    from shared.qdrant_collections import collection_spec
+    from shared.retrieval import get_qdrant_client
+    from shared.settings import get_settings
+
+    args = parse_args(argv)
+    client = get_qdrant_client()
+    quantization = args.quantization or get_settings().qdrant_vector_quantization
+    spec = collection_spec(args.provider, args.document_type, quantization, args.dimensions)
+    alias = spec.name
+
+    match args.command:
+        case "status":
+            current = resolve_alias_now(client, alias)
+            sys.stdout.write(f"alias {alias} -> {current or ('(一般 collection)' if client.collection_exists(alias) else '(不存在)')}\n")
+            for name in list_versions(client, alias):
+                count = client.count(name, exact=True).count
+                sys.stdout.write(f"{'*' if name == current else ' '} {name}  {count} points\n")
+        case "create":
+            version = create_version(client, spec, args.version)
+            sys.stdout.write(f"{version}\n")
+            sys.stdout.write(f"以 configurable collection_version={version} 執行 indexer 後執行 promote --version {version}\n")
+        case "promote":
+            if not args.version:
+                raise SystemExit("promote 需要 --version")
+            report = promote(
+                client,
+                alias,
+                args.version,
+                force=args.force,
+                replace_collection=args.replace_collection,
+                min_count_ratio=args.min_count_ratio,
+                min_recall=args.min_recall,
+            )
+            recall = f"{report.recall:.3f}" if report.recall is not None else "-"
+            sys.stdout.write(f"{report.collection}: {report.count} points(線上 {report.live_count})，recall {recall}\n")
+            for error in report.errors:
+                sys.stdout.write(f"[FAIL] {error}\n")
+            if not report.ok and not args.force:
+                return 1
+            sys.stdout.write(f"alias {alias} -> {report.collection}\n")
+        case "rollback":
+            sys.stdout.write(f"alias {alias} -> {rollback(client, alias)}\n")
+        case "cleanup":
+            for name in cleanup(client, alias, args.keep):
+                sys.stdout.write(f"deleted {name}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,243 @@
+"""
+嵌入向量降維。
+
+gemini-embedding-exp-03-07 以 Matryoshka(MRL)方式訓練，前 N 維本身就是有效的低維向量，
+直接截斷並重新正規化即可(truncate)；其他模型可改用以既有向量擬合的 PCA 投影(pca)。
+
+index 與 query 必須使用相同的降維方式與維度，降維後的向量存放在獨立的 collection(原 collection 名稱加上 `_d{維度}`)：
+
+    query 時    get_retriever 以 ReducedEmbeddings 包裝嵌入模型，查詢 `_d{維度}` 的 collection
+    index 時    indexer_graph 的 index_docs 同樣經由 get_retriever 寫入，設定 embedding_dimensions 時文件直接以降維後的向量
+                寫入 `_d{維度}` 的 collection(pca 需先以下方命令列擬合投影矩陣)
+    既有資料    build_reduced_collection 從原 collection 的向量轉換，不需重新呼叫嵌入 API
+
+PCA 投影矩陣存放在 PCA_MODEL_DIR(預設 ./pca_models)。
+
+命令列(由原 collection 建立降維 collection，pca 同時擬合並儲存投影矩陣)：
+    python -m shared.dimension_reduction --document-type insurance --dimensions 1536 768 --method truncate
+"""
+
+import argparse
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Literal, Optional, Protocol
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+ReductionMethod = Literal["truncate", "pca"]
+
+
+class DimensionReducer(Protocol):
+    dimensions: int
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray: ...
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+class TruncateReducer:
+    """保留前 dimensions 維並重新正規化，適用 Matryoshka 訓練的模型"""
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        return normalize(vectors[:, :self.dimensions])
+
+
+class PCAReducer:
+    """以 PCA 投影到前 dimensions 個主成分並重新正規化"""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray):
+        self.mean = mean
+        self.components = components
+        self.dimensions = components.shape[0]
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        return normalize((vectors - self.mean) @ self.components.T)
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, dimensions: int) -> "PCAReducer":
+        """以既有向量擬合投影矩陣，向量數量必須不少於目標維度"""
+        if len(vectors) < dimensions:
+            raise ValueError(f"PCA 降到 {dimensions} 維至少需要 {dimensions} 筆向量，目前只有 {len(vectors)} 筆")
+        mean = vectors.mean(axis=0)
+        _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+        return cls(mean.astype(np.float32), vt[:dimensions].astype(np.float32))
+
+    def save(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, mean=self.mean, components=self.components)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "PCAReducer":
+        data = np.load(path)
+        return cls(data["mean"], data["components"])
+
+
+def pca_model_path(embedding_model: str, dimensions: int) -> Path:
+    """取得 PCA 投影矩陣的檔案路徑"""
+    name = embedding_model.replace("/", "__")
+    return Path(os.environ.get("PCA_MODEL_DIR", "./pca_models")) / f"{name}_d{dimensions}.npz"
+
+
+@lru_cache
+def get_reducer(method: ReductionMethod, embedding_model: str, dimensions: int) -> DimensionReducer:
+    """取得降維方式；pca 需事先以 build_reduced_collection 擬合並儲存投影矩陣"""
+    match method:
+        case "truncate":
+            return TruncateReducer(dimensions)
+        case "pca":
+            path = pca_model_path(embedding_model, dimensions)
+            if not path.exists():
+                raise FileNotFoundError(
+                    f"找不到 PCA 投影矩陣 {path}，請先以 python -m shared.dimension_reduction --method pca 建立降維 collection"
+                )
+            return PCAReducer.load(path)
+        case _:
+            raise ValueError(f"不支援的降維方式: {method}")
+
+
+class ReducedEmbeddings(Embeddings):
+    """將密集嵌入模型的輸出降維"""
+
+    def __init__(self, embedding: Embeddings, reducer: DimensionReducer):
+        self.embedding = embedding
+        self.reducer = reducer
+
+    def _reduce(self, vectors: list[list[float]]) -> list[list[float]]:
+        return self.reducer.transform(np.asarray(vectors, dtype=np.float32)).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._reduce(self.embedding.embed_documents(texts))
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._reduce([self.embedding.embed_query(text)])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._reduce(await self.embedding.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return self._reduce([await self.embedding.aembed_query(text)])[0]
+
+
+def reduced_collection_name(collection_name: str, dimensions: Optional[int]) -> str:
+    """降維後的 collection 名稱；dimensions 為 None 時回傳原名稱"""
+    return f"{collection_name}_d{dimensions}" if dimensions else collection_name
+
+
+def read_dense_vectors(client, collection_name: str, batch_size: int = 256):
+    """讀出 collection 的所有 point，回傳(ids, 密集向量矩陣, payloads)"""
+    ids, vectors, payloads = [], [], []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=["dense_text"],
+        )
+        for point in points:
+            ids.append(point.id)
+            vectors.append(point.vector["dense_text"])
+            payloads.append(point.payload)
+        if offset is None:
+            break
+    return ids, np.asarray(vectors, dtype=np.float32), payloads
+
+
+def write_reduced_collection(
+    client,
+    source: str,
+    target: str,
+    reducer: DimensionReducer,
+    ids: list,
+    vectors: np.ndarray,
+    payloads: list,
+    batch_size: int = 256,
+) -> str:
+    """將 read_dense_vectors 讀出的向量降維後寫入 target(已存在時重新建立)，沿用 source 的 payload index"""
+    from qdrant_client.http import models
+
+    reduced = reducer.transform(vectors)
+    if client.collection_exists(target):
+        client.delete_collection(target)
+    client.create_collection(
+        collection_name=target,
+        vectors_config={"dense_text": models.VectorParams(size=reducer.dimensions, distance=models.Distance.EUCLID)},
+    )
+    # 沿用原 collection 的 payload index，篩選 metadata.doc_name 時才不會退化為全表掃描
+    for field_name, info in client.get_collection(source).payload_schema.items():
+        client.create_payload_index(target, field_name, field_schema=info.params or info.data_type)
+    for start in range(0, len(ids), batch_size):
+        client.upsert(
+            collection_name=target,
+            points=[
+                models.PointStruct(id=point_id, vector={"dense_text": vector.tolist()}, payload=payload)
+                for point_id, vector, payload in zip(
+                    ids[start:start + batch_size], reduced[start:start + batch_size], payloads[start:start + batch_size]
+                )
+            ],
+            wait=True,
+        )
+    return target
+
+
+def build_reduced_collection(
+    client,
+    collection_name: str,
+    embedding_model: str,
+    dimensions: int,
+    method: ReductionMethod = "truncate",
+    batch_size: int = 256,
+) -> str:
+    """由原 collection 的向量轉換出降維 collection(point id 與 payload 不變)，回傳新 collection 名稱
+
+    method 為 pca 時以原 collection 的全部向量擬合投影矩陣並儲存，查詢時以 get_reducer 載入同一份矩陣。
+    """
+    ids, vectors, payloads = read_dense_vectors(client, collection_name, batch_size)
+    if method == "pca":
+        PCAReducer.fit(vectors, dimensions).save(pca_model_path(embedding_model, dimensions))
+        get_reducer.cache_clear()
+    return write_reduced_collection(
+        client,
+        collection_name,
+        reduced_collection_name(collection_name, dimensions),
+        get_reducer(method, embedding_model, dimensions),
+        ids,
+        vectors,
+        payloads,
+        batch_size,
+    )
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m shared.dimension_reduction", description="由原 collection 建立降維後的 collection")
+    parser.add_argument("--embedding-model", default="google_genai/gemini-embedding-exp-03-07")
+    parser.add_argument("--document-type", choices=("insurance", "system_analysis"), required=True)
+    parser.add_argument("--dimensions", type=int, nargs="+", required=True)
+    parser.add_argument("--method", choices=("truncate", "pca"), default="truncate")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    from shared.logger import indexer_graph_logger as logger
+    from shared.retrieval import get_qdrant_client, get_qdrant_collection_name
+
+    args = parse_args(argv)
+    provider = args.embedding_model.split("/", maxsplit=1)[0]
+    source = get_qdrant_collection_name(provider, args.document_type)
+    client = get_qdrant_client()
+    for dimensions in args.dimensions:
+        target = build_reduced_collection(client, source, args.embedding_model, dimensions, args.method)
+        logger.info("已由 [%s] 建立 %s 維的 collection [%s](%s)", source, dimensions, target, args.method)
+
+
+if __name__ == "__main__":
+    main()
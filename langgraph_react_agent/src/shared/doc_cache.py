@@ -0,0 +1,171 @@
+"""
+文件參照模式 (doc-reference mode) 使用的 in-process 文件快取。
+
+graph state 只保存精簡的 DocRef(collection、point id、score)，
+完整的 page_content 與 metadata 存放在此模組的 LRU 快取中，
+直到 respond 格式化 prompt 時才取回，讓每一步 state 序列化 / checkpoint 的大小大幅縮小。
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Optional, Sequence, Union
+
+from langchain_core.documents import Document
+
+from shared.instrumentation import record_cache
+
+
+DOC_CACHE_MAXSIZE = 4096
+"""快取保留的文件數量上限"""
+
+
+@dataclass(frozen=True)
+class DocRef:
+    """指向向量資料庫中單一分塊的精簡參照"""
+
+    collection: str
+    """分塊所在的 collection 名稱"""
+
+    point_id: str
+    """分塊在 collection 中的 point id"""
+
+    score: Optional[float] = None
+    """檢索分數，retriever 沒有回傳分數時為 None"""
+
+
+class DocCache:
+    """以 (collection, point id) 為 key 的 thread-safe LRU 文件快取"""
+
+    def __init__(self, maxsize: int = DOC_CACHE_MAXSIZE):
+        self.maxsize = maxsize
+        self._docs: OrderedDict[tuple[str, str], Document] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, ref: DocRef, doc: Document) -> None:
+        """放入一份文件，超過上限時淘汰最久未使用的文件"""
+        key = (ref.collection, ref.point_id)
+        with self._lock:
+            self._docs[key] = doc
+            self._docs.move_to_end(key)
+            while len(self._docs) > self.maxsize:
+                self._docs.popitem(last=False)
+
+    def get(self, ref: DocRef) -> Optional[Document]:
+        """取得參照對應的文件，不存在時回傳 None"""
+        key = (ref.collection, ref.point_id)
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is not None:
+                self._docs.move_to_end(key)
+        record_cache("doc", doc is not None)
+        return doc
+
+    def clear(self) -> None:
+        """清空快取"""
+        with self._lock:
+            self._docs.clear()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+
+doc_cache = DocCache()
+"""process 內共用的文件快取"""
+
+
+def to_doc_refs(docs: Sequence[Document], cache: DocCache = doc_cache) -> list[DocRef]:
+    """將檢索出的文件放入快取，並回傳對應的 DocRef 清單
+
+    langchain_qdrant 會在 metadata 中附上 `_id` 與 `_collection_name`，作為參照的 key
+    """
+    refs = []
+    for doc in docs:
+        metadata = doc.metadata or {}
+        ref = DocRef(
+            collection=str(metadata.get("_collection_name", "")),
+            point_id=str(metadata.get("_id", doc.id or "")),
+            score=metadata.get("_score"),
+        )
+        cache.put(ref, doc)
+        refs.append(ref)
+    return refs
+
+
+def _lookup(
+    items: Sequence[Union[Document, DocRef]], cache: DocCache
+) -> tuple[list[Optional[Document]], dict[str, list[tuple[int, DocRef]]]]:
+    """從快取還原文件，回傳 (還原結果, 依 collection 分組的未命中參照)"""
+    resolved: list[Optional[Document]] = []
+    missing: dict[str, list[tuple[int, DocRef]]] = {}
+    for item in items:
+        if isinstance(item, Document):
+            resolved.append(item)
+            continue
+        doc = cache.get(item)
+        if doc is None:
+            missing.setdefault(item.collection, []).append((len(resolved), item))
+        resolved.append(doc)
+    return resolved, missing
+
+
+def _fill(
+    resolved: list[Optional[Document]], entries: list[tuple[int, DocRef]], fetched: dict[str, Document], cache: DocCache
+) -> None:
+    for index, ref in entries:
+        doc = fetched.get(ref.point_id)
+        if doc is not None:
+            cache.put(ref, doc)
+            resolved[index] = doc
+
+
+def resolve_docs(
+    items: Optional[Sequence[Union[Document, DocRef]]], cache: DocCache = doc_cache
+) -> list[Document]:
+    """將 state 中的 DocRef 還原為完整文件，Document 則原樣保留
+
+    快取未命中的參照(例如 worker 重啟後從 checkpoint 恢復)會依 collection 分組回向量資料庫取回；
+    graph node 中請使用 aresolve_docs
+    """
+    if not items:
+        return []
+    resolved, missing = _lookup(items, cache)
+    if missing:
+        from shared.retrieval import fetch_documents
+
+        for collection, entries in missing.items():
+            _fill(resolved, entries, fetch_documents(collection, [ref.point_id for _, ref in entries]), cache)
+    return [doc for doc in resolved if doc is not None]
+
+
+async def aresolve_docs(
+    items: Optional[Sequence[Union[Document, DocRef]]], cache: DocCache = doc_cache
+) -> list[Document]:
+    """resolve_docs 的非同步版本，快取未命中時在 thread 中取回，不阻塞 event loop"""
+    if not items:
+        return []
+    resolved, missing = _lookup(items, cache)
+    if missing:
+        from shared.retrieval import fetch_documents
+
+        for collection, entries in missing.items():
+            fetched = await asyncio.to_thread(fetch_documents, collection, [ref.point_id for _, ref in entries])
+            _fill(resolved, entries, fetched, cache)
+    return [doc for doc in resolved if doc is not None]
+
+
+def to_tool_docs(docs: Sequence[Document], reference_mode: bool, **extra: Any) -> list[dict[str, Any]]:
+    """將檢索出的文件轉為 tool 的輸出格式
+
+    tool 輸出會成為 ToolMessage 給 LLM 閱讀，因此一律保留 pageContent；
+    開啟參照模式時以 DocRef 取代完整的 metadata dict，文件同時放入快取
+    """
+    if not reference_mode:
+        return [{**extra, "doc_name": doc.metadata["doc_name"], "pageContent": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+    refs = to_doc_refs(docs)
+    return [
+        {**extra, "doc_name": doc.metadata["doc_name"], "pageContent": doc.page_content, "ref": asdict(ref)}
+        for doc, ref in zip(docs, refs)
+    ]
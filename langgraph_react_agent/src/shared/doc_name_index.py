@@ -0,0 +1,225 @@
+"""
+metadata.doc_name 的本機字典與篩選條件快取。
+
+retrieve_ctbc_sa_doc 的 task_name 是使用者口語的規格書名稱，過去直接以 MatchText 交給 Qdrant 做全文篩選。
+改為先在本機字典中把 task_name 對應到確切的 doc_name(正規化後完全相同 → 包含/前綴 → 模糊比對)，
+再以 MatchAny keyword 篩選，讓 Qdrant 走 keyword payload index；相同 task_name 的結果會被快取。
+
+字典在 indexer 寫入文件時更新(add_doc_names)，或以 build_from_qdrant 從既有 collection 建立，
+存放在 DOC_NAME_INDEX_DIR(預設 ./doc_name_index)/<collection>.json。Qdrant collection 尚未建立字典時，
+第一次查詢會在背景執行緒以 build_from_qdrant 建立，建立完成前沿用 MatchText 全文篩選：
+collection 已有 doc_name_text 全文 index(見 shared.qdrant_collections)時篩選該欄位，否則與過去相同篩選 metadata.doc_name。
+"""
+
+import difflib
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from shared.instrumentation import record_cache
+from shared.logger import retrieval_graph_logger as logger
+
+DOC_NAME_KEY = "metadata.doc_name"
+
+DOC_NAME_TEXT_KEY = "doc_name_text"
+"""doc_name 的全文 index 欄位(Qdrant 每個欄位只能有一種 index)，見 shared.qdrant_collections"""
+
+RESOLVE_CACHE_SIZE = int(os.environ.get("DOC_NAME_CACHE_SIZE", "1024"))
+"""每個 collection 快取的 task_name 解析結果數量"""
+
+RELOAD_INTERVAL = float(os.environ.get("DOC_NAME_INDEX_RELOAD_SECONDS", "30"))
+"""檢查字典檔是否被 indexer 更新的間隔(秒)"""
+
+MAX_MATCHES = 5
+"""一個 task_name 最多對應的 doc_name 數量"""
+
+
+def doc_name_index_dir() -> Path:
+    return Path(os.environ.get("DOC_NAME_INDEX_DIR", "./doc_name_index"))
+
+
+def normalize(text: str) -> str:
+    """全形轉半形、忽略大小寫與空白"""
+    return "".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+class DocNameIndex:
+    """單一 collection 的 doc_name 字典"""
+
+    def __init__(self, names: Iterable[str]):
+        self.names = sorted(set(names))
+        self._normalized: dict[str, list[str]] = {}
+        for name in self.names:
+            self._normalized.setdefault(normalize(name), []).append(name)
+        self._keys = list(self._normalized)
+        self._cache: OrderedDict[str, tuple[str, ...]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _match(self, query: str) -> tuple[str, ...]:
+        if query in self._normalized:
+            return tuple(self._normalized[query])
+        # 規格書名稱常是 task_name 加上前後綴(例如代碼、版本)，包含 task_name 的名稱優先，越短越接近
+        contained = sorted((key for key in self._keys if query in key), key=len)
+        if not contained:
+            contained = difflib.get_close_matches(query, self._keys, n=MAX_MATCHES, cutoff=0.6)
+        return tuple(name for key in contained[:MAX_MATCHES] for name in self._normalized[key])
+
+    def resolve(self, task_name: str) -> tuple[str, ...]:
+        """將 task_name 對應到確切的 doc_name，找不到時回傳空 tuple"""
+        query = normalize(task_name)
+        if not query:
+            return ()
+        with self._lock:
+            names = self._cache.get(query)
+            if names is not None:
+                self._cache.move_to_end(query)
+        record_cache("doc_name", names is not None)
+        if names is None:
+            names = self._match(query)
+            with self._lock:
+                self._cache[query] = names
+                if len(self._cache) > RESOLVE_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return names
+
+
+def _index_path(collection_name: str) -> Path:
+    return doc_name_index_dir() / f"{collection_name}.json"
+
+
+_indexes: dict[str, tuple[DocNameIndex, float, float]] = {}
+"""collection 名稱 → (字典, 檔案 mtime, 上次檢查時間)"""
+_indexes_lock = threading.Lock()
+
+
+def get_doc_name_index(collection_name: str) -> Optional[DocNameIndex]:
+    """取得 collection 的字典；尚未建立時回傳 None。字典檔更新後會在 RELOAD_INTERVAL 內重新載入"""
+    now = time.monotonic()
+    entry = _indexes.get(collection_name)
+    if entry is not None and now - entry[2] < RELOAD_INTERVAL:
+        return entry[0]
+
+    path = _index_path(collection_name)
+    with _indexes_lock:
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            _indexes.pop(collection_name, None)
+            return None
+        if entry is None or entry[1] != mtime:
+            index = DocNameIndex(json.loads(path.read_text(encoding="utf-8")))
+        else:
+            index = entry[0]
+        _indexes[collection_name] = (index, mtime, now)
+    return index
+
+
+def save_doc_names(collection_name: str, names: Iterable[str]) -> Path:
+    """覆寫 collection 的字典檔"""
+    path = _index_path(collection_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(sorted(set(names)), ensure_ascii=False, indent=0), encoding="utf-8")
+    tmp.replace(path)
+    with _indexes_lock:
+        _indexes.pop(collection_name, None)
+    return path
+
+
+def add_doc_names(collection_name: str, names: Iterable[Optional[str]]) -> None:
+    """indexer 寫入文件後，將新的 doc_name 加入字典"""
+    new_names = {name for name in names if name}
+    path = _index_path(collection_name)
+    existing = set(json.loads(path.read_text(encoding="utf-8"))) if path.exists() else set()
+    if not new_names <= existing:
+        save_doc_names(collection_name, existing | new_names)
+
+
+def build_from_qdrant(client, collection_name: str, batch_size: int = 1024) -> Path:
+    """從既有 Qdrant collection 讀出所有 doc_name 建立字典"""
+    from qdrant_client.http import models
+
+    names = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=models.PayloadSelectorInclude(include=[DOC_NAME_KEY]),
+            with_vectors=False,
+        )
+        for point in points:
+            name = ((point.payload or {}).get("metadata") or {}).get("doc_name")
+            if name:
+                names.add(name)
+        if offset is None:
+            break
+    return save_doc_names(collection_name, names)
+
+
+_text_indexes: dict[str, tuple[bool, float]] = {}
+"""collection 名稱 → (是否有 doc_name_text 全文 index, 檢查時間)"""
+
+_builds: dict[str, threading.Thread] = {}
+"""背景建立字典的執行緒"""
+_builds_lock = threading.Lock()
+
+
+def has_text_index(client, collection_name: str) -> bool:
+    """collection 是否已建立 doc_name_text 全文 index，結果保留 RELOAD_INTERVAL 秒"""
+    now = time.monotonic()
+    entry = _text_indexes.get(collection_name)
+    if entry is not None and now - entry[1] < RELOAD_INTERVAL:
+        return entry[0]
+    try:
+        indexed = DOC_NAME_TEXT_KEY in (client.get_collection(collection_name).payload_schema or {})
+    except Exception:
+        logger.warning("無法取得 collection [%s] 的 payload index", collection_name, exc_info=True)
+        indexed = False
+    _text_indexes[collection_name] = (indexed, now)
+    return indexed
+
+
+def _build_in_background(client, collection_name: str) -> None:
+    """在背景執行緒從 Qdrant 建立字典，同一個 collection 同時只建立一次，失敗時下一次查詢重試"""
+
+    def build() -> None:
+        try:
+            build_from_qdrant(client, collection_name)
+            logger.info("已從 Qdrant 建立 collection [%s] 的 doc_name 字典", collection_name)
+        except Exception:
+            logger.warning("建立 collection [%s] 的 doc_name 字典失敗", collection_name, exc_info=True)
+
+    with _builds_lock:
+        thread = _builds.get(collection_name)
+        if thread is not None and thread.is_alive():
+            return
+        thread = _builds[collection_name] = threading.Thread(target=build, name=f"doc-name-index-{collection_name}", daemon=True)
+        thread.start()
+
+
+def doc_name_filter(collection_name: str, task_name: Optional[str], client: Any = None):
+    """依 task_name 產生 Qdrant 篩選條件
+
+    能對應到確切 doc_name 時使用 MatchAny keyword 篩選；字典尚未建立或找不到時沿用 MatchText 全文篩選，
+    client(Qdrant)顯示已有 doc_name_text 全文 index 時篩選該欄位，否則篩選 metadata.doc_name；
+    沒有 task_name 時回傳 None(不篩選)。指定 client 且字典尚未建立時在背景從 Qdrant 建立。
+    """
+    from qdrant_client.models import FieldCondition, Filter, MatchAny, MatchText
+
+    if not task_name:
+        return None
+    index = get_doc_name_index(collection_name)
+    if index is None and client is not None:
+        _build_in_background(client, collection_name)
+    names = index.resolve(task_name) if index is not None else ()
+    if names:
+        return Filter(must=[FieldCondition(key=DOC_NAME_KEY, match=MatchAny(any=list(names)))])
+    key = DOC_NAME_TEXT_KEY if client is not None and has_text_index(client, collection_name) else DOC_NAME_KEY
+    return Filter(must=[FieldCondition(key=key, match=MatchText(text=task_name))])
@@ -0,0 +1,99 @@
+"""
+本機嵌入模型(BAAI/bge-m3、multilingual-e5-large)的推論參數。
+
+參數由 `python -m benchmark.embedding` 依實際主機量測後寫入 EMBEDDING_SETTINGS_FILE(預設 ./embedding_settings.json)，
+get_match_embedding 在第一次載入模型時讀取；檔案不存在時使用預設值。
+
+檔案格式:
+    {
+        "BAAI/bge-m3": {"batch_size": 16, "num_threads": 8, "use_fp16": false, "max_length": 8192},
+        "Microsoft/intfloat/multilingual-e5-large": {"batch_size": 32, "num_threads": 8, "use_fp16": false, "max_length": 512}
+    }
+"""
+
+import json
+import os
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, fields
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+@dataclass(frozen=True)
+class LocalEmbeddingSettings:
+    """單一本機嵌入模型的推論參數"""
+
+    batch_size: int = 16
+    """每次送進模型的文字數量"""
+
+    num_threads: Optional[int] = None
+    """torch 使用的 CPU 執行緒數，None 表示使用 torch 預設值"""
+
+    use_fp16: bool = False
+    """是否以半精度推論，GPU 上較快，CPU 上不一定"""
+
+    max_length: int = 8192
+    """輸入 token 上限，超過的部分會被截斷"""
+
+
+DEFAULT_SETTINGS = {
+    "BAAI/bge-m3": LocalEmbeddingSettings(max_length=8192),
+    # multilingual-e5-large 的輸入上限只有 512 tokens
+    "Microsoft/intfloat/multilingual-e5-large": LocalEmbeddingSettings(max_length=512),
+}
+
+
+def settings_path() -> Path:
+    """取得設定檔路徑"""
+    return Path(os.environ.get("EMBEDDING_SETTINGS_FILE", "./embedding_settings.json"))
+
+
+def _read_file(path: Path) -> dict[str, dict]:
+    if not path.exists():
+        return {}
+    with path.open(encoding="utf-8") as f:
+        return json.load(f)
+
+
+@lru_cache
+def get_embedding_settings(model: str) -> LocalEmbeddingSettings:
+    """取得模型的推論參數，設定檔中沒有的欄位使用預設值"""
+    default = DEFAULT_SETTINGS.get(model, LocalEmbeddingSettings())
+    overrides = _read_file(settings_path()).get(model, {})
+    names = {f.name for f in fields(LocalEmbeddingSettings)}
+    return LocalEmbeddingSettings(**{**asdict(default), **{k: v for k, v in overrides.items() if k in names}})
+
+
+def save_embedding_settings(model: str, settings: LocalEmbeddingSettings, path: Optional[Path] = None) -> Path:
+    """將模型的推論參數寫入設定檔，保留檔案中其他模型的設定"""
+    path = path or settings_path()
+    content = _read_file(path)
+    content[model] = asdict(settings)
+    path.write_text(json.dumps(content, indent=4, ensure_ascii=False), encoding="utf-8")
+    get_embedding_settings.cache_clear()
+    return path
+
+
+def apply_thread_settings(settings: LocalEmbeddingSettings) -> None:
+    """設定 torch 的 CPU 執行緒數。torch 的設定是 process 全域的"""
+    if settings.num_threads:
+        import torch
+
+        torch.set_num_threads(settings.num_threads)
+
+
+@contextmanager
+def thread_settings(settings: LocalEmbeddingSettings) -> Iterator[None]:
+    """在 with 區塊內套用 settings 的執行緒數，離開時還原 torch 原本的設定(供參數量測使用)"""
+    if not settings.num_threads:
+        yield
+        return
+    import torch
+
+    previous = torch.get_num_threads()
+    try:
+        apply_thread_settings(settings)
+        yield
+    finally:
+        torch.set_num_threads(previous)
@@ -0,0 +1,435 @@
+"""
+三個 graph 共用的效能量測層。
+
+透過 LangChain callback handler 記錄每個 node、LLM 呼叫(含 time-to-first-token 與 token 數)、
+graph 開始到第一個送到前端的 token 的時間(見 shared.streaming)、
+tool 與 retriever 的耗時，並提供 stage() 量測 embedding、prompt 格式化等區段，
+結果匯出為 Prometheus 格式的 metrics 以及寫入 LOG_DIR/trace.jsonl 的逐筆 trace，不需依賴 LangSmith。
+
+環境變數:
+    INSTRUMENTATION_ENABLED: 是否啟用量測，預設 true
+    METRICS_PORT: 設定後在此 port 提供 /metrics HTTP endpoint
+"""
+
+import functools
+import inspect
+import os
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+from typing import Any, Callable, Generator, Optional, TypeVar
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langgraph.constants import TAG_NOSTREAM
+
+from shared.logger import get_logger
+from shared.loop_monitor import ensure_loop_monitor
+from shared.profiling import ProfilingCallbackHandler
+
+
+INSTRUMENTATION_ENABLED = os.environ.get("INSTRUMENTATION_ENABLED", "true").lower() in ("1", "true", "yes")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+"""耗時 histogram 的預設 bucket 上界(秒)"""
+
+trace_logger = get_logger("trace", "trace.jsonl", console=False)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class MetricsRegistry:
+    """thread-safe 的 counter、gauge 與 histogram 集合，可輸出為 Prometheus text format"""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+        self._histograms: dict[tuple[str, tuple[tuple[str, str], ...]], list[float]] = {}
+        self._gauges: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict[str, Any]) -> tuple[str, tuple[tuple[str, str], ...]]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """累加 counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """設定 gauge 的目前值"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """記錄一筆 histogram 觀測值。內部格式為 [各 bucket 累計數..., count, sum]"""
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += 1
+            hist[-1] += value
+
+    def snapshot(self) -> dict[str, Any]:
+        """回傳目前所有 metrics 的複本，histogram 只保留 count 與 sum"""
+        with self._lock:
+            return {
+                "counters": {self._format_name(n, labels): v for (n, labels), v in self._counters.items()},
+                "gauges": {self._format_name(n, labels): v for (n, labels), v in self._gauges.items()},
+                "histograms": {
+                    self._format_name(n, labels): {"count": h[-2], "sum": h[-1]}
+                    for (n, labels), h in self._histograms.items()
+                },
+            }
+
+    def reset(self) -> None:
+        """清空所有 metrics"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+
+    @staticmethod
+    def _format_name(name: str, labels: tuple[tuple[str, str], ...], extra: str = "") -> str:
+        pairs = [f'{k}="{v}"' for k, v in labels]
+        if extra:
+            pairs.append(extra)
+        return f"{name}{{{','.join(pairs)}}}" if pairs else name
+
+    def render_prometheus(self) -> str:
+        """輸出 Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{self._format_name(name, labels)} {value}")
+        for (name, labels), value in gauges:
+            if name not in declared:
+                lines.append(f"# TYPE {name} gauge")
+                declared.add(name)
+            lines.append(f"{self._format_name(name, labels)} {value}")
+        for (name, labels), hist in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            for bound, count in zip(self.buckets, hist):
+                le = f'le="{bound}"'
+                lines.append(f"{self._format_name(name + '_bucket', labels, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self._format_name(name + '_bucket', labels, le)} {hist[-2]}")
+            lines.append(f"{self._format_name(name + '_count', labels)} {hist[-2]}")
+            lines.append(f"{self._format_name(name + '_sum', labels)} {hist[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+"""process 內共用的 metrics"""
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """記錄一次快取查詢結果"""
+    metrics.inc("rag_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def stage(name: str, **labels: Any) -> Generator[None, None, None]:
+    """量測一個區段的耗時，例如 embedding、prompt 格式化"""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe("rag_stage_duration_seconds", perf_counter() - start, stage=name, **labels)
+
+
+def timed(name: str, **labels: Any) -> Callable[[F], F]:
+    """以 stage() 量測整個函數的 decorator，支援一般與 async 函數"""
+
+    def decorator(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with stage(name, **labels):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage(name, **labels):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+class InstrumentationCallbackHandler(BaseCallbackHandler):
+    """記錄 graph、node、LLM、tool、retriever 各層級耗時與 token 數的 callback handler"""
+
+    run_inline = True
+    """handler 只做記錄，直接在呼叫端執行，避免 async run 時額外切換到 thread pool"""
+
+    def __init__(self, graph_name: str):
+        self.graph_name = graph_name
+        self._spans: dict[UUID, dict[str, Any]] = {}
+        self._roots: dict[UUID, UUID] = {}
+        """run id → 所屬 graph 的 root run id，用來把 token 歸屬到 graph 計算 rag_graph_ttft_seconds"""
+
+    def _track_root(self, run_id: UUID, parent_run_id: Optional[UUID]) -> UUID:
+        root = run_id if parent_run_id is None else self._roots.get(parent_run_id, parent_run_id)
+        self._roots[run_id] = root
+        return root
+
+    def _start(self, run_id: UUID, kind: str, name: str, metadata: Optional[dict[str, Any]]) -> dict[str, Any]:
+        metadata = metadata or {}
+        span = self._spans[run_id] = {
+            "kind": kind,
+            "name": name,
+            "start": perf_counter(),
+            "thread_id": metadata.get("thread_id"),
+            "model": metadata.get("ls_model_name", ""),
+        }
+        return span
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None, **fields: Any) -> Optional[dict[str, Any]]:
+        self._roots.pop(run_id, None)
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return None
+        duration = perf_counter() - span["start"]
+        kind, name = span["kind"], span["name"]
+        match kind:
+            case "graph":
+                metrics.observe("rag_graph_duration_seconds", duration, graph=self.graph_name)
+            case "node":
+                metrics.observe("rag_node_duration_seconds", duration, graph=self.graph_name, node=name)
+            case "llm":
+                metrics.observe("rag_llm_duration_seconds", duration, graph=self.graph_name, model=span["model"])
+            case "tool":
+                metrics.observe("rag_tool_duration_seconds", duration, graph=self.graph_name, tool=name)
+            case "retriever":
+                metrics.observe("rag_retriever_duration_seconds", duration, graph=self.graph_name)
+        if error is not None:
+            metrics.inc("rag_errors_total", graph=self.graph_name, kind=kind, error=type(error).__name__)
+
+        trace_logger.info(
+            "span",
+            extra={
+                "graph": self.graph_name,
+                "kind": kind,
+                "span": name,
+                "run_id": str(run_id),
+                "thread_id": span["thread_id"],
+                "duration_ms": round(duration * 1000, 3),
+                "error": type(error).__name__ if error is not None else None,
+                **{k: span[k] for k in ("ttft_ms", "model") if span.get(k)},
+                **fields,
+            },
+        )
+        return span
+
+    # ===== graph / node =====
+    def on_chain_start(
+        self,
+        serialized: Optional[dict[str, Any]],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        name = kwargs.get("name") or ""
+        node = (metadata or {}).get("langgraph_node")
+        self._track_root(run_id, parent_run_id)
+        if parent_run_id is None:
+            ensure_loop_monitor()
+            self._start(run_id, "graph", name or self.graph_name, metadata)
+        elif node and name == node:
+            self._start(run_id, "node", node, metadata)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    # ===== LLM =====
+    def on_chat_model_start(
+        self,
+        serialized: Optional[dict[str, Any]],
+        messages: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        tags: Optional[list[str]] = None,
+        metadata: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        span = self._start(run_id, "llm", kwargs.get("name") or "chat_model", metadata)
+        span["root"] = self._track_root(run_id, parent_run_id)
+        # 帶 nostream tag 的呼叫(例如產生檢索查詢)不會送到前端，不計入 graph 的 TTFT
+        span["visible"] = TAG_NOSTREAM not in (tags or [])
+
+    def on_llm_start(
+        self,
+        serialized: Optional[dict[str, Any]],
+        prompts: list[str],
+        *,
+        run_id: UUID,
+        metadata: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, "llm", kwargs.get("name") or "llm", metadata)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self._spans.get(run_id)
+        if span is None:
+            return
+        now = perf_counter()
+        if "ttft_ms" not in span:
+            ttft = now - span["start"]
+            span["ttft_ms"] = round(ttft * 1000, 3)
+            metrics.observe("rag_llm_ttft_seconds", ttft, graph=self.graph_name, model=span["model"])
+        # graph 層級的 TTFT 只計算第一個有文字內容的可見 token(tool call 的 chunk 沒有文字)
+        if token and span.get("visible"):
+            root = self._spans.get(span.get("root"))
+            if root is not None and root["kind"] == "graph" and "ttft_ms" not in root:
+                ttft = now - root["start"]
+                root["ttft_ms"] = round(ttft * 1000, 3)
+                metrics.observe("rag_graph_ttft_seconds", ttft, graph=self.graph_name)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        input_tokens, output_tokens = _token_usage(response)
+        span = self._end(run_id, input_tokens=input_tokens, output_tokens=output_tokens)
+        if span is not None:
+            metrics.inc("rag_llm_tokens_total", input_tokens, graph=self.graph_name, model=span["model"], type="input")
+            metrics.inc("rag_llm_tokens_total", output_tokens, graph=self.graph_name, model=span["model"], type="output")
+            for kind, tokens in _cache_usage(response).items():
+                metrics.inc("rag_llm_tokens_total", tokens, graph=self.graph_name, model=span["model"], type=kind)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    # ===== tool =====
+    def on_tool_start(
+        self,
+        serialized: Optional[dict[str, Any]],
+        input_str: str,
+        *,
+        run_id: UUID,
+        metadata: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        self._track_root(run_id, kwargs.get("parent_run_id"))
+        self._start(run_id, "tool", name, metadata)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    # ===== retriever =====
+    def on_retriever_start(
+        self,
+        serialized: Optional[dict[str, Any]],
+        query: str,
+        *,
+        run_id: UUID,
+        metadata: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, "retriever", kwargs.get("name") or "retriever", metadata)
+
+    def on_retriever_end(self, documents: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, documents=len(documents))
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+
+def _token_usage(response: LLMResult) -> tuple[int, int]:
+    """從 LLMResult 取出 input / output token 數，取不到時為 0"""
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+    if not input_tokens and not output_tokens and response.llm_output:
+        usage = response.llm_output.get("usage") or response.llm_output.get("token_usage") or {}
+        input_tokens = usage.get("input_tokens", usage.get("prompt_tokens", 0))
+        output_tokens = usage.get("output_tokens", usage.get("completion_tokens", 0))
+    return input_tokens, output_tokens
+
+
+def _cache_usage(response: LLMResult) -> dict[str, int]:
+    """prompt caching 讀取與寫入的 input token 數(cache_read / cache_creation)，沒有使用快取時為空"""
+    usage: dict[str, int] = {}
+    for generations in response.generations:
+        for generation in generations:
+            details = (getattr(getattr(generation, "message", None), "usage_metadata", None) or {}).get("input_token_details") or {}
+            for kind in ("cache_read", "cache_creation"):
+                if details.get(kind):
+                    usage[kind] = usage.get(kind, 0) + details[kind]
+    return usage
+
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def start_metrics_server(port: int) -> None:
+    """在背景執行緒提供 /metrics endpoint，重複呼叫不會啟動第二個 server"""
+    global _metrics_server
+    if _metrics_server is not None:
+        return
+    _metrics_server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsRequestHandler)
+    threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+
+
+def instrument_graph(graph: Any, graph_name: str) -> Any:
+    """為 compiled graph 掛上 InstrumentationCallbackHandler 與 ProfilingCallbackHandler(見 shared.profiling)
+
+    handler 會隨 graph 的預設 config 合併到每次呼叫中，呼叫端自行傳入的 callbacks 不受影響
+    """
+    if not INSTRUMENTATION_ENABLED:
+        return graph
+    if os.environ.get("METRICS_PORT"):
+        start_metrics_server(int(os.environ["METRICS_PORT"]))
+    return graph.with_config(callbacks=[InstrumentationCallbackHandler(graph_name), ProfilingCallbackHandler(graph_name)])
@@ -0,0 +1,489 @@
+"""
+聊天模型共用的 LLM gateway。
+
+Bedrock 與 Gemini 以帳號為單位限制每秒請求數與每分鐘 token 數，大量對話同時呼叫時會被 throttle，
+各自重試又造成重試風暴。load_chat_model 回傳的模型包上 GatewayChatModel 後，同一個 process 內對同一個模型的
+async 呼叫(ainvoke / astream)都經過此 gateway：
+
+    1. 相同請求合併    內容與參數完全相同的請求進行中時，後到的請求共用同一次呼叫的結果(串流時重播 chunk)
+    2. 優先權佇列      interactive(對話)優先於 batch(批次作業)，以 batch_priority() 或 configurable 的 llm_priority 指定
+    3. 自適應並行數    成功且延遲正常時並行上限緩慢增加；串流的第一個 chunk 延遲超過基準的 LATENCY_TOLERANCE 倍時略降，
+                       被 throttle 時減半(AIMD)。非串流呼叫的總延遲隨輸出長度變化，不作為負載訊號
+    4. token bucket    有設定 rps / tpm 時依配額節流，tpm 先以估計的輸入 token 預扣，回應後補扣輸出 token
+    5. throttle 重試   被 throttle 時整個模型暫停 exponential backoff + jitter 的時間後重試，最多 MAX_RETRIES 次
+
+同步呼叫(invoke / stream)只套用 throttle 重試。
+
+環境變數:
+    LLM_GATEWAY_ENABLED: 是否啟用，預設 true
+    LLM_RATE_LIMITS: 模型名稱(provider/model)、provider 或 "default" 對應的限制，例如
+        {"AWS.Bedrock": {"rps": 5, "tpm": 400000, "max_concurrency": 32}, "default": {"max_concurrency": 16}}
+
+metrics:
+    rag_llm_gateway_requests_total{model, outcome}   ok / throttled / error / deduplicated
+    rag_llm_gateway_wait_seconds{model, priority}    排隊與節流等待時間
+    rag_llm_gateway_concurrency_limit{model}         目前的並行上限
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import heapq
+import itertools
+import json
+import random
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Generator, Iterator, Mapping, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.runnables.config import var_child_runnable_config
+
+from shared.adaptive_k import estimate_tokens
+from shared.instrumentation import metrics
+from shared.logger import retrieval_graph_logger as logger
+
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+LATENCY_TOLERANCE = 2.0
+"""延遲超過基準(近期最低延遲)的倍數時視為過載"""
+
+MAX_RETRIES = 3
+
+BASE_BACKOFF = 1.0
+"""第一次 throttle 的暫停秒數，之後每次加倍"""
+
+MAX_BACKOFF = 30.0
+
+THROTTLE_MARKERS = ("throttl", "too many requests", "toomanyrequests", "rate limit", "rate exceeded", "resource_exhausted", "resourceexhausted", "429")
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default="interactive")
+
+
+@contextmanager
+def batch_priority() -> Generator[None, None, None]:
+    """區塊內的 LLM 呼叫以 batch 優先權排隊，例如批次索引或離線評估"""
+    token = _priority.set("batch")
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    """configurable 的 llm_priority 優先，其次為 batch_priority() 設定的值"""
+    config = var_child_runnable_config.get() or {}
+    priority = (config.get("configurable") or {}).get("llm_priority") or _priority.get()
+    return priority if priority in PRIORITIES else "interactive"
+
+
+def is_throttle(error: BaseException) -> bool:
+    """判斷例外是否為配額或速率限制(boto3 ThrottlingException、Gemini ResourceExhausted、HTTP 429 等)"""
+    code = ((getattr(error, "response", None) or {}).get("Error") or {}).get("Code", "") if isinstance(getattr(error, "response", None), dict) else ""
+    text = f"{type(error).__name__} {code} {error}".lower()
+    return getattr(error, "status_code", None) == 429 or any(marker in text for marker in THROTTLE_MARKERS)
+
+
+def backoff_seconds(attempt: int) -> float:
+    """第 attempt 次(從 0 開始)重試前的等待秒數：exponential backoff 加上 ±50% 的 jitter，避免同時重試"""
+    return min(MAX_BACKOFF, BASE_BACKOFF * 2**attempt) * random.uniform(0.5, 1.5)
+
+
+class TokenBucket:
+    """每秒補充 rate、最多累積 capacity 的 token bucket；允許預支，預支的量以等待時間償還"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        """扣除 amount，回傳需要等待的秒數"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+@dataclass(frozen=True)
+class RateLimits:
+    """單一模型的限制，未設定 rps / tpm 時只做自適應並行控制"""
+
+    rps: Optional[float] = None
+    tpm: Optional[float] = None
+    max_concurrency: int = 32
+    initial_concurrency: int = 4
+
+
+class ModelLimiter:
+    """單一模型的優先權佇列、並行上限與 token bucket，只在 event loop 中使用"""
+
+    def __init__(self, model: str, limits: RateLimits):
+        self.model = model
+        self.limits = limits
+        self.limit = float(min(limits.initial_concurrency, limits.max_concurrency))
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        """近期最低延遲，作為判斷過載的基準"""
+        self.paused_until = 0.0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._requests = TokenBucket(limits.rps, max(limits.rps, 1.0)) if limits.rps else None
+        self._tokens = TokenBucket(limits.tpm / 60, limits.tpm) if limits.tpm else None
+        metrics.set_gauge("rag_llm_gateway_concurrency_limit", self.limit, model=model)
+
+    def _dispatch(self) -> None:
+        while self._waiters and self.in_flight < max(int(self.limit), 1):
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    async def acquire(self, priority: str, tokens: int) -> None:
+        """取得一個並行名額並等待配額，離開前必須呼叫 release()"""
+        start = time.perf_counter()
+        if self.in_flight < max(int(self.limit), 1) and not self._waiters:
+            self.in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (PRIORITIES[priority], next(self._seq), waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.release()
+                raise
+        try:
+            delay = self.paused_until - time.monotonic()
+            if self._requests is not None:
+                delay = max(delay, self._requests.reserve(1))
+            if self._tokens is not None:
+                delay = max(delay, self._tokens.reserve(tokens))
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self.release()
+            raise
+        metrics.observe("rag_llm_gateway_wait_seconds", time.perf_counter() - start, model=self.model, priority=priority)
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _set_limit(self, limit: float) -> None:
+        self.limit = min(max(limit, 1.0), float(self.limits.max_concurrency))
+        metrics.set_gauge("rag_llm_gateway_concurrency_limit", self.limit, model=self.model)
+        self._dispatch()
+
+    def on_success(self, latency: Optional[float], output_tokens: int = 0) -> None:
+        """latency 為串流第一個 chunk 的延遲；None(非串流呼叫)時只依成功增加並行上限"""
+        if self._tokens is not None and output_tokens:
+            self._tokens.reserve(output_tokens)
+        if latency is None:
+            self._set_limit(self.limit + 1 / self.limit)
+            return
+        # 基準追蹤延遲的下緣，延遲長期上升時緩慢跟上
+        self.baseline = latency if self.baseline is None else min(latency, 0.95 * self.baseline + 0.05 * latency)
+        if latency > self.baseline * LATENCY_TOLERANCE:
+            self._set_limit(self.limit * 0.9)
+        else:
+            self._set_limit(self.limit + 1 / self.limit)
+
+    def on_throttle(self, attempt: int) -> float:
+        """並行上限減半並暫停整個模型，回傳暫停秒數"""
+        self._set_limit(self.limit / 2)
+        backoff = backoff_seconds(attempt)
+        self.paused_until = max(self.paused_until, time.monotonic() + backoff)
+        logger.warning("[%s] 被 throttle，並行上限降為 %d，暫停 %.1f 秒", self.model, int(self.limit), backoff)
+        return backoff
+
+
+@dataclass
+class _Shared:
+    """進行中的請求，供相同請求共用結果"""
+
+    chunks: list[ChatGenerationChunk] = field(default_factory=list)
+    result: Optional[ChatResult] = None
+    error: Optional[BaseException] = None
+    done: bool = False
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+def _output_tokens(message: Any) -> int:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("output_tokens", 0)
+
+
+class LLMGateway:
+    """process 內共用的 gateway，依模型名稱建立 ModelLimiter"""
+
+    def __init__(self, rate_limits: Mapping[str, Mapping[str, float]]):
+        self.rate_limits = rate_limits
+        self._limiters: dict[str, ModelLimiter] = {}
+        self._in_flight: dict[str, _Shared] = {}
+
+    def limiter(self, model: str) -> ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            provider = model.split("/", maxsplit=1)[0]
+            limits = self.rate_limits.get(model) or self.rate_limits.get(provider) or self.rate_limits.get("default") or {}
+            limiter = self._limiters[model] = ModelLimiter(
+                model, RateLimits(**{k: int(v) if k.endswith("concurrency") else v for k, v in limits.items()})
+            )
+        return limiter
+
+    async def generate(self, model: str, key: str, tokens: int, call: Callable[[], Awaitable[ChatResult]]) -> ChatResult:
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            metrics.inc("rag_llm_gateway_requests_total", model=model, outcome="deduplicated")
+            while not shared.done:
+                await shared.changed.wait()
+            if shared.result is not None:
+                return shared.result.model_copy(deep=True)
+            if not isinstance(shared.error, asyncio.CancelledError):
+                raise shared.error
+            # 原本的請求被取消時自己重新呼叫
+
+        shared = self._in_flight[key] = _Shared()
+        try:
+            shared.result = await self._call(model, tokens, call)
+            return shared.result
+        except BaseException as e:
+            shared.error = e
+            raise
+        finally:
+            shared.done = True
+            shared.notify()
+            self._in_flight.pop(key, None)
+
+    async def _call(self, model: str, tokens: int, call: Callable[[], Awaitable[ChatResult]]) -> ChatResult:
+        limiter = self.limiter(model)
+        for attempt in itertools.count():
+            await limiter.acquire(current_priority(), tokens)
+            try:
+                result = await call()
+            except Exception as e:
+                if is_throttle(e) and attempt < MAX_RETRIES:
+                    metrics.inc("rag_llm_gateway_requests_total", model=model, outcome="throttled")
+                    limiter.on_throttle(attempt)
+                    continue
+                metrics.inc("rag_llm_gateway_requests_total", model=model, outcome="error")
+                raise
+            finally:
+                limiter.release()
+            # 總延遲與輸出長度成正比，較長的回答不代表過載；非串流呼叫只以 throttle 降低並行上限
+            limiter.on_success(None, sum(_output_tokens(g.message) for g in result.generations))
+            metrics.inc("rag_llm_gateway_requests_total", model=model, outcome="ok")
+            return result
+        raise AssertionError("unreachable")
+
+    async def stream(
+        self, model: str, key: str, tokens: int, open_stream: Callable[[], AsyncIterator[ChatGenerationChunk]]
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            metrics.inc("rag_llm_gateway_requests_total", model=model, outcome="deduplicated")
+            index = 0
+            while True:
+                while index < len(shared.chunks):
+                    yield shared.chunks[index].model_copy(deep=True)
+                    index += 1
+                if shared.done:
+                    break
+                await shared.changed.wait()
+            if shared.error is None:
+                return
+            if not isinstance(shared.error, (asyncio.CancelledError, GeneratorExit)) or index:
+                raise shared.error
+            # 原本的請求在產生任何 chunk 前被取消時自己重新呼叫
+
+        shared = self._in_flight[key] = _Shared()
+        try:
+            async for chunk in self._stream(model, tokens, open_stream):
+                shared.chunks.append(chunk)
+                shared.notify()
+                yield chunk
+        except BaseException as e:
+            shared.error = e
+            raise
+        finally:
+            shared.done = True
+            shared.notify()
+            self._in_flight.pop(key, None)
+
+    async def _stream(
+        self, model: str, tokens: int, open_stream: Callable[[], AsyncIterator[ChatGenerationChunk]]
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        limiter = self.limiter(model)
+        for attempt in itertools.count():
+            await limiter.acquire(current_priority(), tokens)
+            start = time.perf_counter()
+            first_chunk: Optional[float] = None
+            output_tokens = 0
+            try:
+                async for chunk in open_stream():
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter() - start
+                    output_tokens += _output_tokens(chunk.message)
+                    yield chunk
+            except Exception as e:
+                # 已經送出 chunk 後無法重試
+                if is_throttle(e) and first_chunk is None and attempt < MAX_RETRIES:
+                    metrics.inc("rag_llm_gateway_requests_total", model=model, outcome="throttled")
+                    limiter.on_throttle(attempt)
+                    continue
+                metrics.inc("rag_llm_gateway_requests_total", model=model, outcome="error")
+                raise
+            finally:
+                limiter.release()
+            # 串流以第一個 chunk 的延遲作為負載訊號，不受輸出長度影響
+            limiter.on_success(first_chunk if first_chunk is not None else time.perf_counter() - start, output_tokens)
+            metrics.inc("rag_llm_gateway_requests_total", model=model, outcome="ok")
+            return
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """各模型目前的並行上限、進行中與排隊的請求數"""
+        return {
+            model: {
+                "limit": round(limiter.limit, 2),
+                "in_flight": limiter.in_flight,
+                "queued": sum(1 for _, _, waiter in limiter._waiters if not waiter.done()),
+                "baseline_ms": round(limiter.baseline * 1000, 1) if limiter.baseline is not None else None,
+            }
+            for model, limiter in self._limiters.items()
+        }
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        from shared.settings import get_settings
+
+        _gateway = LLMGateway(get_settings().llm_rate_limits)
+    return _gateway
+
+
+def reset_gateway() -> None:
+    """設定變更後(例如 benchmark)重新建立 gateway"""
+    global _gateway
+    _gateway = None
+
+
+def request_key(model: str, messages: Sequence[BaseMessage], stop: Optional[list[str]], kwargs: Mapping[str, Any]) -> str:
+    """以模型、訊息內容與呼叫參數計算請求的 key，完全相同的請求才會被合併"""
+    payload = json.dumps(
+        [model, [(m.type, m.content, getattr(m, "tool_calls", None), getattr(m, "tool_call_id", None)) for m in messages], stop, kwargs],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def estimate_input_tokens(messages: Sequence[BaseMessage]) -> int:
+    return sum(estimate_tokens(m.content if isinstance(m.content, str) else json.dumps(m.content, ensure_ascii=False)) for m in messages)
+
+
+def _sync_retry(model: str, call: Callable[[], Any]) -> Any:
+    for attempt in itertools.count():
+        try:
+            return call()
+        except Exception as e:
+            if not is_throttle(e) or attempt >= MAX_RETRIES:
+                raise
+            metrics.inc("rag_llm_gateway_requests_total", model=model, outcome="throttled")
+            time.sleep(backoff_seconds(attempt))
+
+
+class GatewayChatModel(BaseChatModel):
+    """將呼叫轉給 inner 模型，async 呼叫經過 LLMGateway 排程"""
+
+    inner: BaseChatModel
+    gateway_key: str
+    """gateway 中的模型名稱(provider/model)，同名的模型共用限制"""
+
+    @property
+    def _llm_type(self) -> str:
+        return self.inner._llm_type
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {**self.inner._identifying_params, "gateway_key": self.gateway_key}
+
+    def _get_ls_params(self, stop: Optional[list[str]] = None, **kwargs: Any) -> Any:
+        return self.inner._get_ls_params(stop=stop, **kwargs)
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        # 由 inner 模型轉換 tool 格式，再綁定到 gateway 模型上
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return _sync_retry(self.gateway_key, lambda: self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        yield from self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await get_gateway().generate(
+            self.gateway_key,
+            request_key(self.gateway_key, messages, stop, kwargs),
+            estimate_input_tokens(messages),
+            lambda: self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs),
+        )
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in get_gateway().stream(
+            self.gateway_key,
+            request_key(self.gateway_key, messages, stop, {**kwargs, "stream": True}),
+            estimate_input_tokens(messages),
+            lambda: self.inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs),
+        ):
+            yield chunk
+
+
+def gateway_model(model: BaseChatModel, fully_specified_name: str) -> BaseChatModel:
+    """LLM_GATEWAY_ENABLED 時以 GatewayChatModel 包裝模型"""
+    from shared.settings import get_settings
+
+    if not get_settings().llm_gateway_enabled:
+        return model
+    return GatewayChatModel(inner=model, gateway_key=fully_specified_name)
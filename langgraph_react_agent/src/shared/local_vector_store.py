@@ -0,0 +1,533 @@
+"""
+process 內的本機向量檢索引擎(retriever_provider="local")。
+
+每個 collection 是 LOCAL_VECTOR_DIR(預設 ./vector_store)下的一個資料夾：
+    meta.json       維度、筆數、向量型別
+    dense.npy       float32 或 int8 的密集向量矩陣，以 mmap 開啟
+    scale.npy       int8 時每個維度的縮放係數
+    norms.npy       向量的平方長度，計算歐氏距離用
+    payloads.bin    依 row 順序串接的 UTF-8 page_content 與 metadata JSON，以 mmap 開啟，取出文件時才解碼
+    payload_offsets.npy  每個 row 在 payloads.bin 的(content 起點, metadata 起點, 結尾)
+    ids.json        point id
+    sparse_*.npy    稀疏向量的倒排索引(bge-m3 混合檢索)
+    hnsw.bin        筆數超過 LOCAL_HNSW_THRESHOLD 且安裝 hnswlib 時建立的 HNSW 索引
+    segments/       add_texts 每次寫入的小 segment(格式同上)，下次開啟 collection 時合併回主檔
+
+小型 collection 以 numpy 暴力搜尋(精確)，大型 collection 使用 HNSW(近似)。分數與 Qdrant 一致：
+密集檢索為 Euclid 距離(越小越相似)，混合檢索為 RRF 分數(越大越相似)。
+篩選條件用到的 payload 欄位第一次使用時建立「值 → rows」的索引(類似 Qdrant 的 payload index)，之後的篩選只做集合運算。
+collection 名稱與 Qdrant 相同，可用 export_qdrant_collection 從 Qdrant 匯出，或由 indexer 直接寫入。
+"""
+
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+from shared.logger import retrieval_graph_logger as logger
+from shared.qdrant_collections import DEFAULT_PAYLOAD_INDEXES
+
+COPIED_PAYLOAD_FIELDS = {index.field_name: index.source for index in DEFAULT_PAYLOAD_INDEXES if index.source}
+
+HNSW_THRESHOLD = int(os.environ.get("LOCAL_HNSW_THRESHOLD", "100000"))
+"""超過此筆數時改用 HNSW 索引"""
+
+RRF_K = 60
+"""混合檢索 Reciprocal Rank Fusion 的常數，與 Qdrant 相同"""
+
+
+def local_vector_dir() -> Path:
+    return Path(os.environ.get("LOCAL_VECTOR_DIR", "./vector_store"))
+
+
+class SparseIndex:
+    """稀疏向量的倒排索引，以 token 排序的 CSR 格式存放"""
+
+    def __init__(self, token_ids: np.ndarray, offsets: np.ndarray, rows: np.ndarray, weights: np.ndarray, count: int):
+        self.token_ids = token_ids
+        self.offsets = offsets
+        self.rows = rows
+        self.weights = weights
+        self.count = count
+
+    @classmethod
+    def build(cls, vectors: Sequence[tuple[Sequence[int], Sequence[float]]]) -> "SparseIndex":
+        tokens, rows, weights = [], [], []
+        for row, (indices, values) in enumerate(vectors):
+            tokens.extend(indices)
+            rows.extend([row] * len(indices))
+            weights.extend(values)
+        tokens = np.asarray(tokens, dtype=np.int64)
+        order = np.argsort(tokens, kind="stable")
+        token_ids, counts = np.unique(tokens[order], return_counts=True)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(
+            token_ids,
+            offsets,
+            np.asarray(rows, dtype=np.int32)[order],
+            np.asarray(weights, dtype=np.float32)[order],
+            len(vectors),
+        )
+
+    def save(self, path: Path) -> None:
+        for name in ("token_ids", "offsets", "rows", "weights"):
+            np.save(path / f"sparse_{name}.npy", getattr(self, name))
+
+    @classmethod
+    def load(cls, path: Path, count: int) -> Optional["SparseIndex"]:
+        if not (path / "sparse_token_ids.npy").exists():
+            return None
+        arrays = [np.load(path / f"sparse_{name}.npy", mmap_mode="r") for name in ("token_ids", "offsets", "rows", "weights")]
+        return cls(*arrays, count)
+
+    def to_vectors(self) -> list[tuple[list[int], list[float]]]:
+        """還原每個 row 的稀疏向量(append 時重建索引用)"""
+        tokens = np.repeat(self.token_ids, np.diff(self.offsets))
+        order = np.argsort(self.rows, kind="stable")
+        bounds = np.cumsum(np.bincount(self.rows, minlength=self.count))[:-1]
+        return [
+            (token_group.tolist(), weight_group.tolist())
+            for token_group, weight_group in zip(np.split(tokens[order], bounds), np.split(np.asarray(self.weights)[order], bounds))
+        ]
+
+    def search(self, indices: Sequence[int], values: Sequence[float], k: int, mask: Optional[np.ndarray] = None) -> tuple[np.ndarray, np.ndarray]:
+        """內積計分，回傳分數最高的 k 個 row 與分數"""
+        scores = np.zeros(self.count, dtype=np.float32)
+        for token, value in zip(indices, values):
+            position = np.searchsorted(self.token_ids, token)
+            if position < len(self.token_ids) and self.token_ids[position] == token:
+                start, end = self.offsets[position], self.offsets[position + 1]
+                np.add.at(scores, self.rows[start:end], value * self.weights[start:end])
+        if mask is not None:
+            scores[~mask] = 0.0
+        candidates = np.nonzero(scores)[0]
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+        return top, scores[top]
+
+
+class LocalCollection:
+    """以 mmap 開啟的單一 collection"""
+
+    def __init__(self, name: str, path: Path):
+        self.name = name
+        self.path = path
+        self.meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        self.dense = np.load(path / "dense.npy", mmap_mode="r")
+        self.scale = np.load(path / "scale.npy") if self.meta["dtype"] == "int8" else None
+        self.norms = np.load(path / "norms.npy", mmap_mode="r")
+        self.ids: list = json.loads((path / "ids.json").read_text(encoding="utf-8"))
+        self._rows = {str(point_id): row for row, point_id in enumerate(self.ids)}
+        self.payload_offsets = np.load(path / "payload_offsets.npy", mmap_mode="r")
+        with (path / "payloads.bin").open("rb") as f:
+            # 空檔案無法 mmap
+            self._payload_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        self.sparse = SparseIndex.load(path, len(self.ids))
+        self.hnsw = self._load_hnsw()
+        self._masks: dict[str, np.ndarray] = {}
+        self._field_indexes: dict[str, dict[Any, np.ndarray]] = {}
+        self._field_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _load_hnsw(self):
+        if not (self.path / "hnsw.bin").exists():
+            return None
+        import hnswlib
+
+        index = hnswlib.Index(space="l2", dim=self.meta["dimensions"])
+        index.load_index(str(self.path / "hnsw.bin"), max_elements=len(self.ids))
+        index.set_ef(max(64, int(os.environ.get("LOCAL_HNSW_EF", "128"))))
+        return index
+
+    # ===== 寫入 ==========================================================
+    @staticmethod
+    def write(
+        path: Path,
+        ids: Sequence,
+        vectors: np.ndarray,
+        payloads: Sequence[dict],
+        sparse_vectors: Optional[Sequence[tuple[Sequence[int], Sequence[float]]]] = None,
+        dtype: str = "float32",
+    ) -> None:
+        """寫入(覆蓋)整個 collection"""
+        path.mkdir(parents=True, exist_ok=True)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if dtype == "int8":
+            scale = np.clip(np.abs(vectors).max(axis=0), 1e-12, None) / 127.0
+            stored = np.round(vectors / scale).astype(np.int8)
+            np.save(path / "scale.npy", scale.astype(np.float32))
+            restored = stored.astype(np.float32) * scale
+        else:
+            stored, restored = vectors, vectors
+        np.save(path / "dense.npy", stored)
+        np.save(path / "norms.npy", np.einsum("ij,ij->i", restored, restored).astype(np.float32))
+        (path / "ids.json").write_text(json.dumps(list(ids)), encoding="utf-8")
+        offsets = np.zeros((len(payloads), 3), dtype=np.int64)
+        position = 0
+        with (path / "payloads.bin").open("wb") as f:
+            for row, payload in enumerate(payloads):
+                content = (payload.get("page_content") or "").encode("utf-8")
+                metadata = json.dumps(payload.get("metadata") or {}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                f.write(content)
+                f.write(metadata)
+                offsets[row] = (position, position + len(content), position + len(content) + len(metadata))
+                position = int(offsets[row, 2])
+        np.save(path / "payload_offsets.npy", offsets)
+        if sparse_vectors is not None:
+            SparseIndex.build(sparse_vectors).save(path)
+        (path / "hnsw.bin").unlink(missing_ok=True)
+        if len(ids) > HNSW_THRESHOLD:
+            try:
+                import hnswlib
+            except ImportError:
+                logger.warning("collection 筆數 %d 超過 HNSW 門檻但未安裝 hnswlib，改用暴力搜尋", len(ids))
+            else:
+                index = hnswlib.Index(space="l2", dim=vectors.shape[1])
+                index.init_index(max_elements=len(ids), ef_construction=200, M=16)
+                index.add_items(restored, np.arange(len(ids)))
+                index.save_index(str(path / "hnsw.bin"))
+        (path / "meta.json").write_text(
+            json.dumps({"dimensions": int(vectors.shape[1]), "count": len(ids), "dtype": dtype}),
+            encoding="utf-8",
+        )
+
+    def dense_matrix(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """取出 float32 向量(int8 時還原)"""
+        dense = self.dense if rows is None else self.dense[rows]
+        if self.scale is None:
+            return np.asarray(dense, dtype=np.float32)
+        return dense.astype(np.float32) * self.scale
+
+    def _metadata(self, row: int) -> dict[str, Any]:
+        _, metadata_start, end = (int(v) for v in self.payload_offsets[row])
+        return json.loads(self._payload_data[metadata_start:end])
+
+    def payload(self, row: int) -> dict[str, Any]:
+        """與 Qdrant 相同格式的 payload，由 mmap 解碼"""
+        content_start, metadata_start, _ = (int(v) for v in self.payload_offsets[row])
+        return {
+            "page_content": self._payload_data[content_start:metadata_start].decode("utf-8"),
+            "metadata": self._metadata(row),
+        }
+
+    def payloads(self) -> Iterable[dict[str, Any]]:
+        for row in range(len(self)):
+            yield self.payload(row)
+
+    def sparse_vectors(self) -> Optional[list[tuple[list[int], list[float]]]]:
+        if self.sparse is None:
+            return None
+        return self.sparse.to_vectors()
+
+    # ===== 檢索 ==========================================================
+    def field_index(self, key: str) -> dict[Any, np.ndarray]:
+        """payload 欄位的「值 → rows」索引，第一次使用該欄位時掃描一次 payload 建立；陣列欄位的每個元素分別索引
+
+        Qdrant 上由其他欄位複製的欄位(例如 doc_name_text)直接使用來源欄位的值
+        """
+        key = COPIED_PAYLOAD_FIELDS.get(key, key)
+        index = self._field_indexes.get(key)
+        if index is not None:
+            return index
+        with self._field_lock:
+            index = self._field_indexes.get(key)
+            if index is None:
+                rows: dict[Any, list[int]] = {}
+                for row in range(len(self)):
+                    value = _payload_value(self.payload(row) if not key.startswith("metadata.") else {"metadata": self._metadata(row)}, key)
+                    for item in value if isinstance(value, list) else [value]:
+                        if isinstance(item, dict):
+                            item = json.dumps(item, sort_keys=True)
+                        rows.setdefault(item, []).append(row)
+                index = self._field_indexes[key] = {value: np.asarray(r, dtype=np.int64) for value, r in rows.items()}
+        return index
+
+    def _rows_mask(self, key: str, matches: Callable[[Any], bool]) -> np.ndarray:
+        """欄位值符合 matches 的 rows；只對欄位的相異值呼叫 matches"""
+        mask = np.zeros(len(self), dtype=bool)
+        for value, rows in self.field_index(key).items():
+            if matches(value):
+                mask[rows] = True
+        return mask
+
+    def _condition_mask(self, item: Any) -> np.ndarray:
+        if hasattr(item, "must") or hasattr(item, "should"):
+            return self._filter_mask(item)
+        match = item.match
+        if hasattr(match, "any"):
+            options = set(match.any)
+            return self._rows_mask(item.key, lambda value: value in options)
+        if hasattr(match, "text"):
+            return self._rows_mask(item.key, lambda value: match.text in str(value if value is not None else ""))
+        return self._rows_mask(item.key, lambda value: value == match.value)
+
+    def _filter_mask(self, filter: Any) -> np.ndarray:
+        """支援 {"metadata.doc_name": "值"} 形式的 dict，以及 qdrant Filter(must / should / must_not 搭配
+        FieldCondition 的 MatchValue、MatchAny、MatchText)。與 Qdrant 相同，空的 should 不限制結果。
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if isinstance(filter, dict):
+            for key, expected in filter.items():
+                mask &= self._rows_mask(key, lambda value, expected=expected: value == expected)
+            return mask
+        for condition in filter.must or []:
+            mask &= self._condition_mask(condition)
+        if filter.should:
+            should = np.zeros(len(self), dtype=bool)
+            for condition in filter.should:
+                should |= self._condition_mask(condition)
+            mask &= should
+        for condition in filter.must_not or []:
+            mask &= ~self._condition_mask(condition)
+        return mask
+
+    def filter_mask(self, filter: Any) -> Optional[np.ndarray]:
+        """將篩選條件轉為 row 的布林遮罩，相同條件的遮罩會被快取"""
+        if filter is None:
+            return None
+        key = repr(filter)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._filter_mask(filter)
+            if len(self._masks) >= 256:
+                self._masks.clear()
+            self._masks[key] = mask
+        return mask
+
+    def dense_search(self, query: Sequence[float], k: int, mask: Optional[np.ndarray] = None) -> tuple[np.ndarray, np.ndarray]:
+        """回傳歐氏距離最小的 k 個 row 與距離"""
+        query = np.asarray(query, dtype=np.float32)
+        if self.hnsw is not None:
+            allowed = None if mask is None else (lambda row: bool(mask[row]))
+            k = min(k, len(self) if mask is None else int(mask.sum()))
+            if k == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            labels, distances = self.hnsw.knn_query(query, k=k, filter=allowed)
+            return labels[0].astype(np.int64), np.sqrt(distances[0])
+
+        # ||x - q||² = ||x||² - 2 x·q + ||q||²
+        if self.scale is None:
+            dots = self.dense @ query
+        else:
+            dots = self.dense @ (query * self.scale)
+        distances = np.asarray(self.norms) - 2 * dots + float(query @ query)
+        if mask is not None:
+            distances = np.where(mask, distances, np.inf)
+        k = min(k, len(self))
+        top = np.argpartition(distances, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+        top = top[np.argsort(distances[top], kind="stable")]
+        top = top[np.isfinite(distances[top])]
+        return top, np.sqrt(np.clip(distances[top], 0.0, None))
+
+    def hybrid_search(self, dense_query: Sequence[float], sparse_query: tuple[Sequence[int], Sequence[float]], k: int, mask: Optional[np.ndarray] = None) -> tuple[np.ndarray, np.ndarray]:
+        """密集與稀疏各取 k 筆，以 Reciprocal Rank Fusion 合併"""
+        dense_rows, _ = self.dense_search(dense_query, k, mask)
+        sparse_rows, _ = self.sparse.search(*sparse_query, k, mask)
+        fused: dict[int, float] = {}
+        for rows in (dense_rows, sparse_rows):
+            for rank, row in enumerate(rows.tolist()):
+                fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank + 1)
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        return np.asarray([row for row, _ in ranked], dtype=np.int64), np.asarray([score for _, score in ranked], dtype=np.float32)
+
+    def document(self, row: int) -> Document:
+        payload = self.payload(row)
+        metadata = payload["metadata"]
+        metadata["_id"] = self.ids[row]
+        metadata["_collection_name"] = self.name
+        return Document(page_content=payload["page_content"], metadata=metadata)
+
+    def fetch(self, point_ids: Iterable[str]) -> dict[str, Document]:
+        """依 point id 取回文件"""
+        return {
+            str(point_id): self.document(self._rows[str(point_id)]) for point_id in point_ids if str(point_id) in self._rows
+        }
+
+
+def _payload_value(payload: dict, key: str) -> Any:
+    value: Any = payload
+    for part in key.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+_collections: dict[str, LocalCollection] = {}
+_collections_lock = threading.Lock()
+
+
+def open_collection(name: str) -> LocalCollection:
+    """取得 process 內共用的 collection，第一次使用時以 mmap 開啟"""
+    collection = _collections.get(name)
+    if collection is None:
+        with _collections_lock:
+            collection = _collections.get(name)
+            if collection is None:
+                path = local_vector_dir() / name
+                compact_segments(path)
+                if not (path / "meta.json").exists():
+                    raise FileNotFoundError(f"找不到本機 collection {path}，請先以 export_qdrant_collection 匯出或由 indexer 寫入")
+                collection = _collections[name] = LocalCollection(name, path)
+    return collection
+
+
+def write_segment(path: Path, ids: Sequence, vectors: np.ndarray, payloads: Sequence[dict], sparse_vectors=None, dtype: str = "float32") -> Path:
+    """將一批文件寫成 path/segments 下的新 segment，不讀取或重寫既有資料"""
+    segments = path / "segments"
+    segments.mkdir(parents=True, exist_ok=True)
+    name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+    tmp = segments / f".{name}.tmp"
+    LocalCollection.write(tmp, ids, vectors, payloads, sparse_vectors, dtype)
+    # 寫完才換上，合併時不會讀到寫到一半的 segment
+    tmp.rename(segments / name)
+    return segments / name
+
+
+def compact_segments(path: Path) -> None:
+    """將 segments 依寫入順序合併進主檔後刪除；沒有 segment 時不做任何事"""
+    segments_dir = path / "segments"
+    segments = sorted(p for p in segments_dir.iterdir() if not p.name.startswith(".")) if segments_dir.exists() else []
+    if not segments:
+        return
+    parts = ([LocalCollection(path.name, path)] if (path / "meta.json").exists() else []) + [
+        LocalCollection(path.name, segment) for segment in segments
+    ]
+    dtype = parts[0].meta["dtype"]
+    ids = [point_id for part in parts for point_id in part.ids]
+    vectors = np.concatenate([part.dense_matrix() for part in parts])
+    payloads = [payload for part in parts for payload in part.payloads()]
+    sparse = None
+    if any(part.sparse is not None for part in parts):
+        sparse = [vector for part in parts for vector in (part.sparse_vectors() or [([], [])] * len(part))]
+    tmp = path.with_name(path.name + ".compact")
+    shutil.rmtree(tmp, ignore_errors=True)
+    LocalCollection.write(tmp, ids, vectors, payloads, sparse, dtype)
+    # 已開啟的 mmap 仍指向舊檔案；新主檔沒有的檔案(例如筆數不到門檻時的 hnsw.bin)一併移除
+    written = set(os.listdir(tmp))
+    for stale in path.iterdir():
+        if stale.is_file() and stale.name not in written:
+            stale.unlink()
+    for name in written:
+        os.replace(tmp / name, path / name)
+    shutil.rmtree(tmp, ignore_errors=True)
+    for segment in segments:
+        shutil.rmtree(segment, ignore_errors=True)
+    logger.info("本機 collection [%s] 合併 %d 個 segment，共 %d 筆", path.name, len(segments), len(ids))
+
+
+def reload_collection(name: str) -> None:
+    """寫入後讓下次 open_collection 重新開啟"""
+    with _collections_lock:
+        _collections.pop(name, None)
+
+
+def is_open(name: str) -> bool:
+    """此 process 是否已開啟該本機 collection"""
+    return name in _collections
+
+
+class LocalVectorStore(VectorStore):
+    """LocalCollection 的 langchain VectorStore 介面；有 sparse_embedding 時以混合檢索取候選"""
+
+    def __init__(self, collection_name: str, embedding: Embeddings, sparse_embedding: Optional[Any] = None, dtype: str = "float32"):
+        self.collection_name = collection_name
+        self.embedding = embedding
+        self.sparse_embedding = sparse_embedding
+        self.dtype = dtype
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @property
+    def collection(self) -> LocalCollection:
+        return open_collection(self.collection_name)
+
+    def _search(self, query: str, k: int, filter: Any = None) -> tuple[LocalCollection, np.ndarray, np.ndarray]:
+        collection = self.collection
+        mask = collection.filter_mask(filter)
+        dense_query = self.embedding.embed_query(query)
+        if self.sparse_embedding is not None and collection.sparse is not None:
+            sparse = self.sparse_embedding.embed_query(query)
+            rows, scores = collection.hybrid_search(dense_query, (sparse.indices, sparse.values), k, mask)
+        else:
+            rows, scores = collection.dense_search(dense_query, k, mask)
+        return collection, rows, scores
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Any = None, **kwargs: Any) -> list[tuple[Document, float]]:
+        collection, rows, scores = self._search(query, k, filter)
+        return [(collection.document(row), float(score)) for row, score in zip(rows.tolist(), scores.tolist())]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Any = None, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, filter: Any = None, **kwargs: Any) -> list[Document]:
+        collection = self.collection
+        rows, _ = collection.dense_search(embedding, k, collection.filter_mask(filter))
+        return [collection.document(row) for row in rows.tolist()]
+
+    def max_marginal_relevance_search(
+        self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, filter: Any = None, **kwargs: Any
+    ) -> list[Document]:
+        collection, rows, _ = self._search(query, max(fetch_k, k), filter)
+        if len(rows) == 0:
+            return []
+        query_vector = np.asarray(self.embedding.embed_query(query), dtype=np.float32)
+        selected = maximal_marginal_relevance(query_vector, collection.dense_matrix(rows), k=k, lambda_mult=lambda_mult)
+        return [collection.document(int(rows[i])) for i in selected]
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[list[dict]] = None, ids: Optional[list[str]] = None, **kwargs: Any) -> list[str]:
+        """加入文件：每次呼叫寫入一個 segment，下次開啟 collection 時才合併，寫入成本只與這批文件數有關"""
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        sparse = None
+        if self.sparse_embedding is not None:
+            sparse = [(v.indices, v.values) for v in self.sparse_embedding.embed_documents(texts)]
+        payloads = [{"page_content": text, "metadata": metadata} for text, metadata in zip(texts, metadatas)]
+
+        write_segment(local_vector_dir() / self.collection_name, ids, vectors, payloads, sparse, self.dtype)
+        reload_collection(self.collection_name)
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas: Optional[list[dict]] = None, *, collection_name: str, **kwargs: Any) -> "LocalVectorStore":
+        store = cls(collection_name, embedding, kwargs.get("sparse_embedding"), kwargs.get("dtype", "float32"))
+        store.add_texts(texts, metadatas, kwargs.get("ids"))
+        return store
+
+
+def export_qdrant_collection(client, collection_name: str, dtype: str = "float32", batch_size: int = 256) -> Path:
+    """將 Qdrant collection(含 dense_text、sparse_text、payload)匯出為本機 collection"""
+    ids, vectors, payloads, sparse = [], [], [], []
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=collection_name, limit=batch_size, offset=offset, with_payload=True, with_vectors=True)
+        for point in points:
+            ids.append(point.id)
+            vectors.append(point.vector["dense_text"])
+            payloads.append(point.payload or {})
+            if "sparse_text" in point.vector:
+                sparse.append((point.vector["sparse_text"].indices, point.vector["sparse_text"].values))
+        if offset is None:
+            break
+    path = local_vector_dir() / collection_name
+    with _collections_lock:
+        shutil.rmtree(path / "segments", ignore_errors=True)
+        LocalCollection.write(path, ids, np.asarray(vectors, dtype=np.float32), payloads, sparse or None, dtype)
+        _collections.pop(collection_name, None)
+    return path
@@ -1,30 +1,211 @@
+"""
+非阻塞、結構化的 logging 管線。
+
+各 graph 的 logger 只把 record 放進 queue(QueueHandler)，由背景執行緒(QueueListener)
+負責格式化為 JSON 並寫入依大小輪替的檔案，async node 中的 logging 不會因檔案 I/O 阻塞 event loop。
+
+環境變數:
+    LOG_DIR: log 檔案目錄，預設 ./log
+    LOG_LEVEL: 預設 log 等級，預設 INFO
+    LOG_LEVELS: 個別 logger 的等級，例如 "retrieval=DEBUG,kb_retrieval_agent=WARNING"
+    LOG_MAX_BYTES: 單一 log 檔案輪替前的大小上限，預設 10MB
+    LOG_BACKUP_COUNT: 輪替保留的檔案數量，預設 5
+    LOG_MAX_FIELD_CHARS: 單一欄位保留的字元數上限，超過時只保留頭尾片段，預設 2000
+"""
+
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Any
+
+
+LOG_DIR = Path(os.environ.get("LOG_DIR", "./log"))
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", 5))
+LOG_MAX_FIELD_CHARS = int(os.environ.get("LOG_MAX_FIELD_CHARS", 2000))
+
+# LogRecord 內建的屬性，其餘屬性視為透過 extra 傳入的結構化欄位
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def truncate(value: str, limit: int = LOG_MAX_FIELD_CHARS) -> str:
+    """過長的字串只保留頭尾片段，並註明省略的字元數"""
+    if limit <= 0 or len(value) <= limit:
+        return value
+    head = limit * 3 // 4
+    tail = limit - head
+    return f"{value[:head]} ...({len(value) - limit} chars truncated)... {value[-tail:]}"
+
+
+def _snapshot(value: Any) -> Any:
+    """在呼叫端執行緒將參數轉為不可變的精簡值，避免背景執行緒讀取到被修改的物件"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return truncate(value if isinstance(value, str) else str(value))
+
+
+def _snapshot_field(value: Any) -> Any:
+    """extra 欄位的快照：保留 dict / list 結構以便輸出為 JSON，其中的字串與其他物件同 _snapshot 截斷"""
+    if isinstance(value, dict):
+        return {str(k): _snapshot_field(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_snapshot_field(v) for v in value]
+    return _snapshot(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """將 LogRecord 格式化為單行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": truncate(record.getMessage()),
+            "module": record.module,
+            "func": record.funcName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """只在呼叫端做最少的工作：快照參數與 extra 欄位後放入 queue，字串格式化交給背景執行緒"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if isinstance(record.args, dict):
+            record.args = {k: _snapshot(v) for k, v in record.args.items()}
+        elif record.args:
+            record.args = tuple(_snapshot(arg) for arg in record.args)
+        if not isinstance(record.msg, str):
+            record.msg = _snapshot(record.msg)
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                setattr(record, key, _snapshot_field(value))
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _RoutingHandler(logging.Handler):
+    """在背景執行緒中依 logger 名稱將 record 分派到各自的輪替檔案"""
+
+    def __init__(self):
+        super().__init__()
+        self._file_handlers: dict[str, logging.Handler] = {}
+        self._silent: set[str] = set()
+        self._console = logging.StreamHandler(sys.stderr)
+        self._console.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+
+    def route(self, logger_name: str, filename: str, console: bool = True) -> None:
+        """指定 logger 寫入的檔案，檔案在第一次寫入時才開啟"""
+        handler = RotatingFileHandler(
+            LOG_DIR / filename,
+            maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT,
+            encoding="utf-8",
+            delay=True,
+        )
+        handler.setFormatter(JsonFormatter())
+        self._file_handlers[logger_name] = handler
+        if not console:
+            self._silent.add(logger_name)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        handler = self._file_handlers.get(record.name)
+        if handler is not None:
+            handler.handle(record)
+        if record.name not in self._silent:
+            self._console.handle(record)
+
+    def close(self) -> None:
+        for handler in self._file_handlers.values():
+            handler.close()
+        super().close()
+
+
+def _parse_levels(spec: str) -> dict[str, str]:
+    """解析 LOG_LEVELS，格式為 "logger=LEVEL,logger=LEVEL" """
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", maxsplit=1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+_LOGGER_LEVELS = _parse_levels(os.environ.get("LOG_LEVELS", ""))
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_router = _RoutingHandler()
+_listener = QueueListener(_log_queue, _router, respect_handler_level=False)
+_listener_started = False
+
+
+def get_logger(name: str, filename: str, console: bool = True) -> logging.Logger:
+    """取得寫入 LOG_DIR/filename 的非阻塞 logger，console=False 時只寫入檔案"""
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    _router.route(name, filename, console)
+
+    logger = logging.getLogger(name)
+    logger.setLevel(_LOGGER_LEVELS.get(name, LOG_LEVEL))
+    if not any(isinstance(h, NonBlockingQueueHandler) for h in logger.handlers):
+        logger.addHandler(NonBlockingQueueHandler(_log_queue))
+    # 已經由背景執行緒輸出到 console，不再往 root logger 傳遞
+    logger.propagate = False
+    return logger
+
+
+def set_logger_level(name: str, level: str | int) -> None:
+    """動態調整個別 logger 的等級"""
+    logging.getLogger(name).setLevel(level.upper() if isinstance(level, str) else level)
+
 
+def _configure_root() -> None:
+    """與原本的 logging.basicConfig(level=INFO) 相同：root logger 尚未設定時，第三方套件的 log 以 INFO 輸出到 stderr，
+    但同樣經由 queue 交給背景執行緒輸出；已由 server 等設定過 root logger 時不更動"""
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    root.setLevel(logging.INFO)
+    root.addHandler(NonBlockingQueueHandler(_log_queue))
 
-Path("./log").mkdir(parents=True, exist_ok=True)
 
+def start() -> None:
+    """啟動背景執行緒(重複呼叫無作用)"""
+    global _listener_started
+    if not _listener_started:
+        _listener.start()
+        _listener_started = True
 
-logging.basicConfig(level=logging.INFO)
 
-retrieval_graph_logger = logging.getLogger("retrieval")
-retrieval_graph_logger.addHandler(
-    logging.StreamHandler(
-        open(file="./log/retrieval_graph.log", mode="a", encoding="utf-8")
-    )
-)
+def shutdown() -> None:
+    """停止背景執行緒並寫出 queue 中剩餘的 record"""
+    global _listener_started
+    if _listener_started:
+        _listener.stop()
+        _listener_started = False
+    _router.close()
 
 
-react_agent_logger = logging.getLogger("react_agent")
-react_agent_logger.addHandler(
-    logging.StreamHandler(
-        open(file="./log/react_agent.log", mode="a", encoding="utf-8")
-    )
-)
+retrieval_graph_logger = get_logger("retrieval", "retrieval_graph.log")
+react_agent_logger = get_logger("react_agent", "react_agent.log")
+kb_retrieval_agent_logger = get_logger("kb_retrieval_agent", "kb_retrieval_agent.log")
+indexer_graph_logger = get_logger("indexer", "indexer_graph.log")
 
-kb_retrieval_agent_logger = logging.getLogger("kb_retrieval_agent")
-kb_retrieval_agent_logger.addHandler(
-    logging.StreamHandler(
-        open(file="./log/kb_retrieval_agent.log", mode="a", encoding="utf-8")
-    )
-)
+_configure_root()
+start()
+atexit.register(shutdown)
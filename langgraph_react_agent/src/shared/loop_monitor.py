@@ -0,0 +1,200 @@
+"""
+event loop 健康監控與阻塞呼叫偵測。
+
+每個 event loop 一個 LoopMonitor，由 graph 第一次在該 loop 上執行時啟動(見 instrumentation 的 on_chain_start)：
+
+    heartbeat task   每 interval 秒 sleep 一次，醒來的延遲即為 event loop lag
+    watchdog thread  heartbeat 超過 threshold 未醒來時，持續取樣 event loop thread 當下的 stack
+
+阻塞結束後每個 stack 歸屬到最內層的 graph 函式(node、tool、reducer)，例如
+kb_retrieval_agent.tools.retrieve_insurance_doc；stack 中沒有 graph 函式時歸屬到最內層的 src 底下其他函式(shared 等)，
+取樣中最常出現的歸屬即為該次阻塞的來源。loop 當下沒有執行 callback(在 select 等待，
+通常是其他 thread 佔用 GIL)時歸屬為 event_loop。
+事件寫入 LOG_DIR/loop_monitor.log(含完整 stack)並記錄為 metrics：
+
+    rag_event_loop_lag_seconds                 heartbeat 的延遲 histogram
+    rag_event_loop_blocked_total{owner}        超過 threshold 的阻塞次數
+    rag_event_loop_blocked_seconds{owner}      阻塞的時間 histogram
+
+環境變數:
+    LOOP_MONITOR_ENABLED: 是否啟用，預設 false
+    LOOP_BLOCK_THRESHOLD_MS: 視為阻塞的 event loop lag，預設 100
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import Counter, deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from shared.logger import get_logger
+
+GRAPH_PACKAGES = ("react_agent", "kb_retrieval_agent", "retrieval_graph")
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+
+MAX_EVENTS = 100
+"""每個 monitor 保留的最近阻塞事件數"""
+
+MAX_STACK_FRAMES = 40
+
+IDLE_OWNER = "event_loop"
+
+loop_monitor_logger = get_logger("loop_monitor", "loop_monitor.log")
+
+
+@dataclass
+class BlockingEvent:
+    """一次超過 threshold 的阻塞"""
+
+    duration: float
+    owner: str
+    """最內層的 graph 函式(module.function)，無法判斷時為 unknown"""
+    site: str
+    """阻塞當下執行的位置(最內層 frame)"""
+    stack: list[str]
+    timestamp: float
+
+
+def _module_name(filename: str) -> Optional[str]:
+    """src 底下的檔案轉為 module 名稱，其他檔案回傳 None"""
+    try:
+        relative = Path(filename).resolve().relative_to(SRC_DIR)
+    except ValueError:
+        return None
+    return ".".join(relative.with_suffix("").parts)
+
+
+def attribute(frames: list[traceback.FrameSummary]) -> str:
+    """由內而外找到第一個 graph 套件的 frame，其次為 src 底下其他 module 的 frame"""
+    if not any(frame.name == "_run" and frame.filename.endswith(("asyncio/events.py", "asyncio\\events.py")) for frame in frames):
+        return IDLE_OWNER
+    fallback = None
+    for frame in reversed(frames):
+        module = _module_name(frame.filename)
+        if module is None:
+            continue
+        if module.split(".", maxsplit=1)[0] in GRAPH_PACKAGES:
+            return f"{module}.{frame.name}"
+        fallback = fallback or f"{module}.{frame.name}"
+    return fallback or "unknown"
+
+
+class LoopMonitor:
+    """量測單一 event loop 的 lag，並擷取超過 threshold 的阻塞 stack"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float = 0.1, interval: Optional[float] = None):
+        self.threshold = threshold
+        self.interval = interval or min(0.1, threshold / 2)
+        self.events: deque[BlockingEvent] = deque(maxlen=MAX_EVENTS)
+        self.owners: Counter[str] = Counter()
+        self._loop = weakref.ref(loop)
+        """只保留 weakref：monitor 是 _monitors 的 value，強參照會讓 loop 永遠不會被回收"""
+        self._loop_thread = threading.get_ident()
+        self._beat = (0, time.monotonic())
+        """(heartbeat 序號, 開始 sleep 的時間)，以單一 tuple 讓 watchdog 一次讀到一致的值"""
+        self._samples: dict[int, list[list[traceback.FrameSummary]]] = {}
+        self._pending: deque[tuple[int, float]] = deque()
+        self._stopped = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """需在 event loop thread 中呼叫"""
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat(), name="loop-monitor")
+        threading.Thread(target=self._watch, name="loop-monitor", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self) -> None:
+        from shared.instrumentation import metrics
+
+        seq = 0
+        try:
+            while True:
+                seq += 1
+                started = time.monotonic()
+                self._beat = (seq, started)
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, time.monotonic() - started - self.interval)
+                metrics.observe("rag_event_loop_lag_seconds", lag)
+                if lag >= self.threshold:
+                    # 格式化與寫 log 交給 watchdog thread
+                    self._pending.append((seq, lag))
+        finally:
+            # loop 結束時(asyncio.run 取消所有 task)釋放 task，task 也參照著 loop
+            self._task = None
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval / 2):
+            loop = self._loop()
+            if loop is None or loop.is_closed():
+                self._stopped.set()
+                return
+            del loop
+            seq, started = self._beat
+            # 從 threshold 的一半開始取樣，剛超過 threshold 的短暫阻塞也有 stack
+            if time.monotonic() - started - self.interval >= self.threshold / 2:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._samples.setdefault(seq, []).append(traceback.extract_stack(frame)[-MAX_STACK_FRAMES:])
+            while self._pending:
+                self._report(*self._pending.popleft())
+
+    def _report(self, seq: int, duration: float) -> None:
+        from shared.instrumentation import metrics
+
+        samples = self._samples.pop(seq, [])
+        for stale in [key for key in self._samples if key < seq]:
+            del self._samples[stale]
+        attributed = [(attribute(frames), frames) for frames in samples]
+        owner, frames = "unknown", []
+        if attributed:
+            counts = Counter(name for name, _ in attributed)
+            owner = max(counts, key=lambda name: (name != IDLE_OWNER, counts[name]))
+            frames = next(frames for name, frames in attributed if name == owner)
+        site = f"{frames[-1].filename}:{frames[-1].lineno} in {frames[-1].name}" if frames else "unknown"
+        event = BlockingEvent(duration, owner, site, traceback.format_list(frames), time.time())
+        self.events.append(event)
+        self.owners[owner] += 1
+        metrics.inc("rag_event_loop_blocked_total", owner=owner)
+        metrics.observe("rag_event_loop_blocked_seconds", duration, owner=owner)
+        loop_monitor_logger.warning(
+            "event loop 阻塞 %.0f ms，來源 %s",
+            duration * 1000,
+            owner,
+            extra={"owner": owner, "site": site, "duration_ms": round(duration * 1000, 3), "stack": "".join(event.stack)},
+        )
+
+
+_monitors: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LoopMonitor]" = weakref.WeakKeyDictionary()
+
+
+def ensure_loop_monitor() -> Optional[LoopMonitor]:
+    """LOOP_MONITOR_ENABLED 時為目前執行中的 event loop 啟動 monitor(每個 loop 一次)，沒有執行中的 loop 時回傳 None"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    monitor = _monitors.get(loop)
+    if monitor is None:
+        from shared.settings import get_settings
+
+        settings = get_settings()
+        if not settings.loop_monitor_enabled:
+            return None
+        monitor = _monitors[loop] = LoopMonitor(loop, settings.loop_block_threshold_ms / 1000)
+        monitor.start()
+    return monitor
+
+
+def get_loop_monitor(loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[LoopMonitor]:
+    """已啟動的 monitor，未指定 loop 時為目前執行中的 loop"""
+    return _monitors.get(loop or asyncio.get_running_loop())
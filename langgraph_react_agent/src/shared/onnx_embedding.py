@@ -0,0 +1,190 @@
+"""
+以 ONNX Runtime 推論的本機嵌入模型。
+
+embedding_model 在模型名稱後加上 `-onnx` 或 `-onnx-int8` 即改用此後端，例如:
+    BAAI/bge-m3-onnx-int8
+    Microsoft/intfloat/multilingual-e5-large-onnx
+
+向量與 PyTorch 版本相容，沿用相同的 Qdrant collection。
+模型第一次使用時匯出到 ONNX_MODEL_DIR(預設 ./onnx_models)，之後直接載入；匯出細節見 shared.onnx_export。
+推論參數(batch_size、num_threads、max_length)沿用 shared.embedding_settings 中原模型的設定。
+"""
+
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_qdrant.sparse_embeddings import SparseEmbeddings, SparseVector
+
+from shared.embedding_settings import LocalEmbeddingSettings, get_embedding_settings
+from shared.instrumentation import timed
+
+ONNX_VARIANTS = {"-onnx-int8": True, "-onnx": False}
+"""模型名稱後綴與是否使用 int8 量化模型"""
+
+_export_lock = threading.Lock()
+
+
+def parse_onnx_model(model: str) -> Optional[tuple[str, bool]]:
+    """拆解 ONNX 模型名稱，回傳(原模型名稱, 是否 int8)；不是 ONNX 模型時回傳 None"""
+    for suffix, quantized in ONNX_VARIANTS.items():
+        if model.endswith(suffix):
+            return model.removesuffix(suffix), quantized
+    return None
+
+
+def onnx_model_dir(repo_id: str) -> Path:
+    """取得模型匯出的資料夾"""
+    return Path(os.environ.get("ONNX_MODEL_DIR", "./onnx_models")) / repo_id.replace("/", "__")
+
+
+def ensure_onnx_model(repo_id: str, quantized: bool) -> Path:
+    """取得 ONNX 模型路徑，尚未匯出時先匯出"""
+    output_dir = onnx_model_dir(repo_id)
+    fp32_path = output_dir / "model.onnx"
+    path = output_dir / "model.int8.onnx" if quantized else fp32_path
+    with _export_lock:
+        if path.exists():
+            return path
+        from shared.onnx_export import export_onnx, quantize_int8
+
+        if not fp32_path.exists():
+            export_onnx(repo_id, output_dir)
+        if quantized:
+            quantize_int8(fp32_path)
+    return path
+
+
+class OnnxEncoder:
+    """tokenizer 加上 ONNX Runtime session，依長度排序分批推論以減少 padding"""
+
+    def __init__(self, repo_id: str, quantized: bool, settings: LocalEmbeddingSettings):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        path = ensure_onnx_model(repo_id, quantized)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if settings.num_threads:
+            options.intra_op_num_threads = settings.num_threads
+        self.session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self.output_names = [output.name for output in self.session.get_outputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(path.parent))
+        self.settings = settings
+
+    def encode(self, texts: list[str]) -> list[tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]]:
+        """回傳與 texts 同順序的(input_ids, dense_vecs, sparse_weights)；逐 token 的輸出已去除 padding"""
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        results: list = [None] * len(texts)
+        for start in range(0, len(order), self.settings.batch_size):
+            indices = order[start:start + self.settings.batch_size]
+            inputs = self.tokenizer(
+                [texts[i] for i in indices],
+                padding=True,
+                truncation=True,
+                max_length=self.settings.max_length,
+                return_tensors="np",
+            )
+            feed = {"input_ids": inputs["input_ids"].astype(np.int64), "attention_mask": inputs["attention_mask"].astype(np.int64)}
+            outputs = dict(zip(self.output_names, self.session.run(None, feed)))
+            sparse_weights = outputs.get("sparse_weights")
+            for row, i in enumerate(indices):
+                length = int(feed["attention_mask"][row].sum())
+                results[i] = (
+                    feed["input_ids"][row, :length],
+                    outputs["dense_vecs"][row],
+                    None if sparse_weights is None else sparse_weights[row, :length],
+                )
+        return results
+
+
+@lru_cache
+def load_onnx_encoder(repo_id: str, quantized: bool, settings: LocalEmbeddingSettings) -> OnnxEncoder:
+    """相同模型與參數只建立一個 session"""
+    return OnnxEncoder(repo_id, quantized, settings)
+
+
+class OnnxDenseEmbeddings(Embeddings):
+    """ONNX Runtime 推論的密集向量嵌入模型"""
+
+    def __init__(self, encoder: OnnxEncoder):
+        self.encoder = encoder
+
+    @timed("embedding", model="onnx-dense")
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [dense.tolist() for _, dense, _ in self.encoder.encode(texts)]
+
+    @timed("embedding", model="onnx-dense")
+    def embed_query(self, query: str) -> list[float]:
+        return self.encoder.encode([query])[0][1].tolist()
+
+
+class OnnxBGEM3SparseEmbeddings(SparseEmbeddings):
+    """ONNX Runtime 推論的 bge-m3 稀疏向量嵌入模型，權重計算方式與 FlagEmbedding 的 lexical_weights 相同"""
+
+    def __init__(self, encoder: OnnxEncoder):
+        self.encoder = encoder
+        tokenizer = encoder.tokenizer
+        self.unused_tokens = {
+            tokenizer.cls_token_id,
+            tokenizer.eos_token_id,
+            tokenizer.pad_token_id,
+            tokenizer.unk_token_id,
+        }
+
+    def _to_sparse_vector(self, input_ids: np.ndarray, weights: np.ndarray) -> SparseVector:
+        # 同一個 token 出現多次時取最大權重
+        lexical: dict[int, float] = {}
+        for token_id, weight in zip(input_ids.tolist(), weights.tolist()):
+            if token_id in self.unused_tokens or weight <= 0:
+                continue
+            if weight > lexical.get(token_id, 0.0):
+                lexical[token_id] = weight
+        return SparseVector(indices=list(lexical.keys()), values=list(lexical.values()))
+
+    @timed("embedding", model="onnx-sparse")
+    def embed_documents(self, texts: list[str]) -> list[SparseVector]:
+        return [self._to_sparse_vector(input_ids, weights) for input_ids, _, weights in self.encoder.encode(texts)]
+
+    @timed("embedding", model="onnx-sparse")
+    def embed_query(self, query: str) -> SparseVector:
+        input_ids, _, weights = self.encoder.encode([query])[0]
+        return self._to_sparse_vector(input_ids, weights)
+
+
+class OnnxBGEM3Embedding(Embeddings):
+    """
+      1. ONNX Runtime 推論的 BAAI/bge-M3 嵌入模型，介面與 shared.baai_bge_m3.BAAIBGEM3Embedding 相同
+      2. 密集與稀疏向量由同一個 session 產生；embed_documents、embed_query 回傳為空陣列
+    """
+
+    def __init__(self, encoder: OnnxEncoder):
+        self.dense = OnnxDenseEmbeddings(encoder)
+        self.sparse = OnnxBGEM3SparseEmbeddings(encoder)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return []
+
+    def embed_query(self, query: str) -> list[float]:
+        return []
+
+
+def load_onnx_embedding(fully_specified_name: str) -> Embeddings:
+    """依 embedding_model 名稱(例如 BAAI/bge-m3-onnx-int8)載入 ONNX 嵌入模型"""
+    provider, model = fully_specified_name.split("/", maxsplit=1)
+    parsed = parse_onnx_model(model)
+    if parsed is None:
+        raise ValueError(f"不是 ONNX 嵌入模型: {fully_specified_name}")
+    base_model, quantized = parsed
+    settings = get_embedding_settings(f"{provider}/{base_model}")
+    match provider:
+        case "BAAI":
+            return OnnxBGEM3Embedding(load_onnx_encoder(f"BAAI/{base_model}", quantized, settings))
+        case "Microsoft":
+            return OnnxDenseEmbeddings(load_onnx_encoder(base_model, quantized, settings))
+        case _:
+            raise ValueError(f"不支援 ONNX 後端的 embedding provider: {provider}")
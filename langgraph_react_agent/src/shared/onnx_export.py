@@ -0,0 +1,94 @@
+"""
+將本機嵌入模型匯出為 ONNX，並可選擇做 dynamic int8 量化。
+
+匯出後的模型只包含 transformer 與 pooling，輸出與 PyTorch 版本相同：
+    BAAI/bge-m3                    dense_vecs(CLS 向量並正規化)、sparse_weights(每個 token 的 relu(sparse_linear) 權重)
+    intfloat/multilingual-e5-large dense_vecs(attention mask 平均並正規化)
+
+只有匯出時需要 torch，執行期只需要 onnxruntime 與 tokenizer，見 shared.onnx_embedding。
+"""
+
+import os
+from pathlib import Path
+
+import torch
+from huggingface_hub import snapshot_download
+from transformers import AutoModel, AutoTokenizer
+
+ONNX_OPSET = 17
+
+
+class _BGEM3Module(torch.nn.Module):
+    def __init__(self, model: torch.nn.Module, sparse_linear: torch.nn.Module):
+        super().__init__()
+        self.model = model
+        self.sparse_linear = sparse_linear
+
+    def forward(self, input_ids, attention_mask):
+        hidden = self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+        dense = torch.nn.functional.normalize(hidden[:, 0], dim=-1)
+        sparse = torch.relu(self.sparse_linear(hidden)).squeeze(-1)
+        return dense, sparse
+
+
+class _MeanPoolingModule(torch.nn.Module):
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        hidden = self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+        mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return (torch.nn.functional.normalize(pooled, dim=-1),)
+
+
+def _build_module(repo_id: str) -> tuple[torch.nn.Module, list[str]]:
+    cache_dir = os.environ.get("HUGGINGFACE_CACHE_FOLDER")
+    model = AutoModel.from_pretrained(repo_id, cache_dir=cache_dir)
+    if repo_id == "BAAI/bge-m3":
+        # sparse_linear.pt 是 FlagEmbedding 另外存放的稀疏權重層
+        snapshot = Path(snapshot_download(repo_id, cache_dir=cache_dir, allow_patterns=["sparse_linear.pt"]))
+        sparse_linear = torch.nn.Linear(model.config.hidden_size, 1)
+        sparse_linear.load_state_dict(torch.load(snapshot / "sparse_linear.pt", map_location="cpu"))
+        return _BGEM3Module(model, sparse_linear), ["dense_vecs", "sparse_weights"]
+    return _MeanPoolingModule(model), ["dense_vecs"]
+
+
+def export_onnx(repo_id: str, output_dir: Path) -> Path:
+    """匯出 fp32 ONNX 模型與 tokenizer 到 output_dir，回傳模型路徑"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(repo_id, cache_dir=os.environ.get("HUGGINGFACE_CACHE_FOLDER"))
+    tokenizer.save_pretrained(output_dir)
+    module, output_names = _build_module(repo_id)
+    module.eval()
+
+    sample = tokenizer(["onnx export"], return_tensors="pt")
+    dynamic_axes = {
+        "input_ids": {0: "batch", 1: "sequence"},
+        "attention_mask": {0: "batch", 1: "sequence"},
+        "dense_vecs": {0: "batch"},
+        "sparse_weights": {0: "batch", 1: "sequence"},
+    }
+    path = output_dir / "model.onnx"
+    with torch.no_grad():
+        # 超過 2GB 的模型(bge-m3)會自動以 external data 格式存放權重
+        torch.onnx.export(
+            module,
+            (sample["input_ids"], sample["attention_mask"]),
+            str(path),
+            input_names=["input_ids", "attention_mask"],
+            output_names=output_names,
+            dynamic_axes={k: v for k, v in dynamic_axes.items() if k in ("input_ids", "attention_mask", *output_names)},
+            opset_version=ONNX_OPSET,
+        )
+    return path
+
+
+def quantize_int8(fp32_path: Path) -> Path:
+    """以 dynamic int8 量化 fp32 ONNX 模型的權重，activation 在執行期才量化"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    path = fp32_path.with_name("model.int8.onnx")
+    quantize_dynamic(str(fp32_path), str(path), weight_type=QuantType.QInt8)
+    return path
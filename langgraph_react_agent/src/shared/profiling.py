@@ -0,0 +1,449 @@
+"""
+每個 graph run 的取樣式 CPU profiling 與 node 記憶體量測(opt-in)。
+
+run 以 PROFILE_SAMPLE_RATE 的比例隨機取樣，或以 configurable 的 profile=True 指定：
+
+    graph.ainvoke(inputs, {"configurable": {"thread_id": "t-1", "profile": True}})
+
+被 profile 的 run 執行期間，背景 thread 每 PROFILE_INTERVAL_MS 取樣一次執行該 run 的 thread 的 stack。
+async node 依 event loop 目前執行的 task 判斷屬於哪個 run 與 node / tool / 模型呼叫，
+同時進行的其他 run 不會混入。PROFILE_MEMORY 為 true 時在每個 node 前後各取一次 tracemalloc snapshot，
+記錄記憶體淨增量與增加最多的程式位置；snapshot 為整個 process 的分配，並行的 run 會互相計入，且取 snapshot 本身有明顯成本。
+
+run 結束後由背景 thread 寫入 PROFILE_DIR/<thread_id>/：
+
+    <graph>-<run_id>.folded        collapsed stacks(graph;node;frame... 次數)，可用 flamegraph.pl 或 speedscope 開啟
+    <graph>-<run_id>.json          各 node / tool / 模型呼叫的耗時，以及 node 的記憶體淨增量與前 10 名分配位置
+
+合併多個 run：python -m shared.profiling merge log/profiles > all.folded
+
+環境變數:
+    PROFILE_SAMPLE_RATE: 取樣的 run 比例(0~1)，預設 0
+    PROFILE_INTERVAL_MS: stack 取樣間隔，預設 10
+    PROFILE_MEMORY: 是否在 node 前後取 tracemalloc snapshot，預設 false
+    PROFILE_DIR: 輸出目錄，預設 LOG_DIR/profiles
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from shared.logger import LOG_DIR, get_logger
+
+MAX_STACK_DEPTH = 64
+
+TOP_ALLOCATIONS = 10
+
+profiling_logger = get_logger("profiling", "profiling.log", console=False)
+
+
+@dataclass
+class _Scope:
+    """run 中正在執行的 node / tool / 模型呼叫"""
+
+    label: str
+    started: float = field(default_factory=time.perf_counter)
+    snapshot: Optional[tracemalloc.Snapshot] = None
+    thread: Optional[int] = None
+    """在 executor / sync thread 中執行時的 thread id"""
+
+
+@dataclass
+class RunProfile:
+    """一次被 profile 的 graph run"""
+
+    graph: str
+    thread_id: str
+    run_id: UUID
+    started: float = field(default_factory=time.perf_counter)
+    stacks: Counter[str] = field(default_factory=Counter)
+    scopes: list[dict[str, Any]] = field(default_factory=list)
+    """已結束的 node / tool / 模型呼叫的耗時與記憶體"""
+    active: dict[UUID, _Scope] = field(default_factory=dict)
+    """run id → 執行中的 scope，依開始順序排列"""
+    duration: float = 0.0
+
+    @property
+    def label(self) -> str:
+        """最近開始且尚未結束的 scope；run 內並行的 tool 只會歸屬到其中之一"""
+        return next(reversed(self.active.values())).label if self.active else "graph"
+
+
+_current_profile: ContextVar[Optional[RunProfile]] = ContextVar("current_profile", default=None)
+"""graph run 開始時設定，之後建立的 task 繼承此值，task factory 據此記錄 task 所屬的 run"""
+
+
+def _frame_name(code: Any) -> str:
+    return f"{code.co_name} ({Path(code.co_filename).name})".replace(";", ",")
+
+
+def collapse(frame: Any) -> str:
+    """frame 由外而內以 ; 串接；event loop 的 frame(asyncio events.py 的 _run 以外)省略"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        if code.co_name == "_run" and code.co_filename.endswith(("asyncio/events.py", "asyncio\\events.py")):
+            break
+        names.append(_frame_name(code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """process 共用的取樣 profiler，只在有被 profile 的 run 執行時取樣
+
+    event loop thread 的取樣依 loop 目前執行的 task 對應到 run(task 建立時由 task factory 記錄)，
+    在 executor / sync 呼叫的 thread 中則依 node 開始時所在的 thread 對應
+    """
+
+    def __init__(self):
+        self._active: dict[UUID, RunProfile] = {}
+        self._tasks: "weakref.WeakKeyDictionary[asyncio.Task, RunProfile]" = weakref.WeakKeyDictionary()
+        self._threads: dict[int, RunProfile] = {}
+        self._loops: dict[int, asyncio.AbstractEventLoop] = {}
+        """event loop thread → 最近一次在該 thread 執行 run 的 loop"""
+        self._patched_loops: "weakref.WeakSet[asyncio.AbstractEventLoop]" = weakref.WeakSet()
+        self._finished: deque[tuple[RunProfile, Path]] = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_tracemalloc = False
+        self.interval = 0.01
+        self.memory = False
+
+    # ===== 由 callback 呼叫(run 所在的 thread) =====
+    def begin(self, profile: RunProfile) -> None:
+        from shared.settings import get_settings
+
+        settings = get_settings()
+        _current_profile.set(profile)
+        self._bind(profile)
+        with self._lock:
+            self.interval = settings.profile_interval_ms / 1000
+            self.memory = settings.profile_memory
+            self._active[profile.run_id] = profile
+            if self.memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def skip(self) -> None:
+        """未被 profile 的 run 開始時清除繼承自先前 run 的 profile"""
+        if _current_profile.get() is not None:
+            _current_profile.set(None)
+
+    def _bind(self, profile: RunProfile) -> None:
+        """將目前的 task(或 thread)對應到 profile，並在 loop 上安裝 task factory"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            with self._lock:
+                self._threads[threading.get_ident()] = profile
+            return
+        task = asyncio.current_task()
+        with self._lock:
+            if task is not None:
+                self._tasks[task] = profile
+            self._loops[threading.get_ident()] = loop
+            if loop not in self._patched_loops:
+                self._patched_loops.add(loop)
+                loop.set_task_factory(self._task_factory(loop.get_task_factory()))
+
+    def _task_factory(self, previous: Any) -> Any:
+        def factory(loop: asyncio.AbstractEventLoop, coro: Any, **kwargs: Any) -> asyncio.Future:
+            task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+            context = kwargs.get("context")
+            profile = context.get(_current_profile) if context is not None else _current_profile.get()
+            if profile is not None and profile.run_id in self._active:
+                self._tasks[task] = profile
+            return task
+
+        return factory
+
+    def enter(self, run_id: UUID, profile: RunProfile, label: str, memory: bool = False) -> None:
+        scope = _Scope(label)
+        if memory and self.memory and tracemalloc.is_tracing():
+            scope.snapshot = tracemalloc.take_snapshot()
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # sync node 在 executor thread 中執行
+            scope.thread = threading.get_ident()
+        with self._lock:
+            profile.active[run_id] = scope
+            if scope.thread is not None:
+                self._threads[scope.thread] = profile
+
+    def exit(self, run_id: UUID, profile: RunProfile) -> None:
+        with self._lock:
+            scope = profile.active.pop(run_id, None)
+            if scope is None:
+                return
+            if scope.thread is not None and self._threads.get(scope.thread) is profile:
+                if not any(s.thread == scope.thread for s in profile.active.values()):
+                    del self._threads[scope.thread]
+        entry: dict[str, Any] = {"scope": scope.label, "duration_ms": round((time.perf_counter() - scope.started) * 1000, 3)}
+        if scope.snapshot is not None and tracemalloc.is_tracing():
+            entry.update(_memory_diff(scope.snapshot))
+        profile.scopes.append(entry)
+
+    def end(self, profile: RunProfile, output_dir: Path) -> None:
+        """run 結束，檔案由背景 thread 寫入"""
+        profile.duration = time.perf_counter() - profile.started
+        with self._lock:
+            self._active.pop(profile.run_id, None)
+            for thread_id in [t for t, p in self._threads.items() if p is profile]:
+                del self._threads[thread_id]
+            self._finished.append((profile, output_dir))
+            if not self._active and self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+        self._wake.set()
+
+    # ===== 背景 thread =====
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                idle = not self._active
+            if idle:
+                self._flush()
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            self._sample()
+            self._flush()
+            time.sleep(self.interval)
+
+    def _sample(self) -> None:
+        with self._lock:
+            running = dict(self._threads)
+            for thread_id, loop in list(self._loops.items()):
+                if loop.is_closed():
+                    del self._loops[thread_id]
+                    continue
+                # event loop thread 目前執行的 task 才是這次取樣的 stack 所屬的 run
+                task = asyncio.current_task(loop)
+                profile = self._tasks.get(task) if task is not None else None
+                if profile is not None:
+                    running[thread_id] = profile
+            labels = {thread_id: profile.label for thread_id, profile in running.items() if profile.run_id in self._active}
+            frames = sys._current_frames()
+        for thread_id, label in labels.items():
+            frame = frames.get(thread_id)
+            if frame is not None:
+                profile = running[thread_id]
+                profile.stacks[f"{profile.graph};{label};{collapse(frame)}"] += 1
+
+    def _flush(self) -> None:
+        while self._finished:
+            profile, output_dir = self._finished.popleft()
+            try:
+                write_profile(profile, output_dir)
+            except OSError:
+                profiling_logger.exception("寫入 profile 失敗")
+
+
+def _memory_diff(before: tracemalloc.Snapshot) -> dict[str, Any]:
+    """與 before 相比的記憶體淨增量與增加最多的位置"""
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__),)
+    stats = tracemalloc.take_snapshot().filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+    top = sorted(stats, key=lambda s: abs(s.size_diff), reverse=True)[:TOP_ALLOCATIONS]
+    return {
+        "net_kb": round(sum(s.size_diff for s in stats) / 1024, 3),
+        "top": [
+            {"where": f"{s.traceback[0].filename}:{s.traceback[0].lineno}", "size_diff_kb": round(s.size_diff / 1024, 3), "count_diff": s.count_diff}
+            for s in top
+        ],
+    }
+
+
+def write_profile(profile: RunProfile, output_dir: Path) -> Path:
+    """寫入 collapsed stacks 與記憶體報告，回傳 .folded 檔案路徑"""
+    directory = output_dir / profile.thread_id.replace("/", "_")
+    directory.mkdir(parents=True, exist_ok=True)
+    base = directory / f"{profile.graph}-{profile.run_id}"
+    folded = base.with_suffix(".folded")
+    folded.write_text("".join(f"{stack} {count}\n" for stack, count in profile.stacks.most_common()), encoding="utf-8")
+    report = {
+        "graph": profile.graph,
+        "thread_id": profile.thread_id,
+        "run_id": str(profile.run_id),
+        "duration_ms": round(profile.duration * 1000, 3),
+        "samples": sum(profile.stacks.values()),
+        "scopes": profile.scopes,
+    }
+    base.with_suffix(".json").write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    profiling_logger.info(
+        "profile 已寫入 %s",
+        folded,
+        extra={"graph": profile.graph, "thread_id": profile.thread_id, "samples": sum(profile.stacks.values()), "duration_ms": round(profile.duration * 1000, 3)},
+    )
+    return folded
+
+
+profiler = SamplingProfiler()
+
+
+class ProfilingCallbackHandler(BaseCallbackHandler):
+    """決定 run 是否被 profile，並將 node / tool / 模型呼叫的開始與結束告知 profiler"""
+
+    run_inline = True
+    """必須在執行 node 的 task / thread 中呼叫，profiler 才能對應到 run"""
+
+    def __init__(self, graph_name: str):
+        self.graph_name = graph_name
+        self._profiles: dict[UUID, RunProfile] = {}
+        """root run id → profile"""
+        self._parents: dict[UUID, UUID] = {}
+        """子 run id → root run id，只記錄被 profile 的 run"""
+
+    def _profile_of(self, parent_run_id: Optional[UUID]) -> Optional[tuple[UUID, RunProfile]]:
+        if parent_run_id is None:
+            return None
+        root = parent_run_id if parent_run_id in self._profiles else self._parents.get(parent_run_id)
+        return (root, self._profiles[root]) if root is not None else None
+
+    def _enter(self, run_id: UUID, parent_run_id: Optional[UUID], label: str, memory: bool = False) -> None:
+        found = self._profile_of(parent_run_id)
+        if found is None:
+            return
+        self._parents[run_id] = found[0]
+        if label:
+            profiler.enter(run_id, found[1], label, memory)
+
+    def _exit(self, run_id: UUID) -> None:
+        profile = self._profiles.pop(run_id, None)
+        if profile is not None:
+            from shared.settings import get_settings
+
+            profiler.end(profile, Path(get_settings().profile_dir or LOG_DIR / "profiles"))
+            return
+        root = self._parents.pop(run_id, None)
+        if root is not None and root in self._profiles:
+            profiler.exit(run_id, self._profiles[root])
+
+    def on_chain_start(
+        self,
+        serialized: Optional[dict[str, Any]],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        metadata = metadata or {}
+        if parent_run_id is None:
+            if should_profile(metadata):
+                profile = self._profiles[run_id] = RunProfile(self.graph_name, str(metadata.get("thread_id") or "no_thread"), run_id)
+                profiler.begin(profile)
+            else:
+                profiler.skip()
+            return
+        name = kwargs.get("name") or ""
+        node = metadata.get("langgraph_node")
+        self._enter(run_id, parent_run_id, node if node and name == node else "", memory=True)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._exit(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._exit(run_id)
+
+    def on_chat_model_start(
+        self, serialized: Optional[dict[str, Any]], messages: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any
+    ) -> None:
+        self._enter(run_id, parent_run_id, f"model:{kwargs.get('name') or 'chat_model'}")
+
+    def on_llm_start(
+        self, serialized: Optional[dict[str, Any]], prompts: list[str], *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any
+    ) -> None:
+        self._enter(run_id, parent_run_id, f"model:{kwargs.get('name') or 'llm'}")
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._exit(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._exit(run_id)
+
+    def on_tool_start(
+        self, serialized: Optional[dict[str, Any]], input_str: str, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any
+    ) -> None:
+        self._enter(run_id, parent_run_id, f"tool:{kwargs.get('name') or (serialized or {}).get('name') or 'tool'}")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._exit(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._exit(run_id)
+
+    def on_retriever_start(
+        self, serialized: Optional[dict[str, Any]], query: str, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any
+    ) -> None:
+        self._enter(run_id, parent_run_id, f"retriever:{kwargs.get('name') or 'retriever'}")
+
+    def on_retriever_end(self, documents: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._exit(run_id)
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._exit(run_id)
+
+
+def should_profile(metadata: dict[str, Any]) -> bool:
+    """configurable 指定 profile 時一律 profile，否則依 PROFILE_SAMPLE_RATE 隨機取樣"""
+    if metadata.get("profile"):
+        return True
+    from shared.settings import get_settings
+
+    rate = get_settings().profile_sample_rate
+    return rate > 0 and random.random() < rate
+
+
+def merge(paths: list[Path]) -> Counter[str]:
+    """合併目錄或檔案中的 .folded，相同 stack 的次數相加"""
+    stacks: Counter[str] = Counter()
+    for path in paths:
+        for file in sorted(path.rglob("*.folded")) if path.is_dir() else [path]:
+            for line in file.read_text(encoding="utf-8").splitlines():
+                stack, _, count = line.rpartition(" ")
+                if stack:
+                    stacks[stack] += int(count)
+    return stacks
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m shared.profiling", description="處理 graph run 的 profile 輸出")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    merge_parser = subparsers.add_parser("merge", help="合併 .folded 檔案，輸出到 stdout 或 --output")
+    merge_parser.add_argument("paths", nargs="+", type=Path)
+    merge_parser.add_argument("--output", type=Path)
+    args = parser.parse_args(argv)
+
+    match args.command:
+        case "merge":
+            text = "".join(f"{stack} {count}\n" for stack, count in merge(args.paths).most_common())
+            if args.output:
+                args.output.write_text(text, encoding="utf-8")
+            else:
+                sys.stdout.write(text)
+
+
+if __name__ == "__main__":
+    main()
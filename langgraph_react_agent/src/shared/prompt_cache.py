@@ -0,0 +1,89 @@
+"""
+system prompt 的 prompt caching。
+
+call_model 每次都送出相同的 system prompt 與 tool 定義，但 system prompt 結尾的 {system_time} 每次都不同，
+使得整個 prompt 無法被 provider 快取。此模組將 system prompt 拆成兩段：
+
+    stable prefix    不含 VOLATILE_FIELDS 的行，與 tool 定義一起在快取有效期間內只計費、處理一次
+    volatile suffix  含 {system_time} 等每次變動欄位的行，放在 cache checkpoint 之後
+
+模型支援 prompt caching 時(Bedrock 上的 CACHE_SUPPORTED_MODELS)在 prefix 之後加上 checkpoint：
+
+    ChatBedrockConverse   system content 中的 {"cachePoint": {"type": "default"}}
+    ChatBedrock(Anthropic) prefix text block 的 cache_control
+
+Bedrock 的快取順序為 tools → system → messages，system 中的 checkpoint 同時涵蓋 tool 定義。
+不支援的模型送出 prefix + suffix 的純文字，內容與原本的 prompt 相同(只有 volatile 行移到最後)，
+Gemini 等自動快取相同前綴的 provider 也能受益。prefix 未達模型最低快取 token 數時 provider 會忽略 checkpoint。
+
+快取命中的 token 數記錄在 rag_llm_tokens_total{type="cache_read" / "cache_creation"}。
+"""
+
+from typing import Any, Literal, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import SystemMessage
+
+from shared.llm_gateway import GatewayChatModel
+
+
+VOLATILE_FIELDS = ("system_time",)
+"""每次呼叫都會變動、不可放進快取前綴的 prompt 欄位"""
+
+CACHE_SUPPORTED_MODELS = (
+    "claude-3-7-sonnet",
+    "claude-3-5-haiku",
+    "claude-sonnet-4",
+    "claude-opus-4",
+    "claude-haiku-4",
+    "nova-micro",
+    "nova-lite",
+    "nova-pro",
+    "nova-premier",
+)
+"""Bedrock 上支援 prompt caching 的模型 id 片段"""
+
+CacheStyle = Literal["converse", "anthropic"]
+
+
+def split_template(template: str, volatile: tuple[str, ...] = VOLATILE_FIELDS) -> tuple[str, str]:
+    """將 prompt template 拆為 (不含變動欄位的行, 含變動欄位的行)，各自保留原本的順序"""
+    stable, suffix = [], []
+    for line in template.splitlines():
+        (suffix if any(f"{{{name}}}" in line for name in volatile) else stable).append(line)
+    return "\n".join(stable).strip(), "\n".join(suffix).strip()
+
+
+def cache_style(model: BaseChatModel) -> Optional[CacheStyle]:
+    """模型支援的 checkpoint 格式，不支援 prompt caching 時回傳 None"""
+    if isinstance(model, GatewayChatModel):
+        model = model.inner
+    model_id = str(getattr(model, "model_id", "") or "")
+    if not any(marker in model_id for marker in CACHE_SUPPORTED_MODELS):
+        return None
+    # 以類別名稱判斷，不必為了 isinstance 載入 langchain_aws
+    match type(model).__name__:
+        case "ChatBedrockConverse":
+            return "converse"
+        case "ChatBedrock":
+            return "converse" if getattr(model, "beta_use_converse_api", False) else "anthropic"
+        case _:
+            return None
+
+
+def build_system_message(template: str, model: BaseChatModel, *, cache: bool = True, **values: Any) -> SystemMessage:
+    """以固定前綴 + 變動後綴建立 system message，cache 為 True 且模型支援時在前綴之後加上 checkpoint"""
+    stable, suffix = split_template(template)
+    stable = stable.format(**values)
+    suffix = suffix.format(**values)
+
+    match cache_style(model) if cache else None:
+        case "converse":
+            blocks = [{"type": "text", "text": stable}, {"cachePoint": {"type": "default"}}]
+        case "anthropic":
+            blocks = [{"type": "text", "text": stable, "cache_control": {"type": "ephemeral"}}]
+        case _:
+            return SystemMessage(content=f"{stable}\n\n{suffix}" if suffix else stable)
+    if suffix:
+        blocks.append({"type": "text", "text": suffix})
+    return SystemMessage(content=blocks)
@@ -0,0 +1,431 @@
+"""
+Qdrant collection 的宣告式設定與建立/遷移。
+
+每個 (embedding provider, document_type) 的 collection 設定集中定義於此(向量維度與距離、稀疏向量、HNSW、
+on_disk、量化與 payload index)，取代 qdrant_insert_data.ipynb 中依模型複製貼上的建立步驟。
+
+    verify_collection   比對實際設定，回傳差異
+    ensure_collection   不存在時建立；存在時將可線上調整的設定(HNSW、on_disk、量化、payload index)遷移到宣告值，
+                        重複執行不會有變動。向量維度、距離或缺少稀疏向量無法線上調整，需要重新建立 collection
+
+宣告的量化方式取自部署設定 QDRANT_VECTOR_QUANTIZATION，請求的 configurable 不會改變 collection 的宣告。
+第一次使用某個 collection 時依 QDRANT_COLLECTION_BOOTSTRAP 檢查：
+    verify(預設)  有差異時記錄 warning
+    migrate       啟動預熱(shared.warmup)時自動建立或遷移，請求中只做 verify；需要重新建立的差異記錄為預熱失敗
+    off           不檢查
+
+Qdrant 每個 payload 欄位只能有一種 index，metadata.doc_name 的 keyword(MatchAny)與全文(MatchText)index
+分別建立在 metadata.doc_name 與複製出來的 doc_name_text 欄位；doc_name_text 在建立 index 時由既有資料補齊，
+之後由 indexer 寫入文件時同步(copy_payload_fields)。
+
+命令列：
+    python -m shared.qdrant_collections                 # 檢查所有 collection
+    python -m shared.qdrant_collections --migrate       # 建立或遷移
+    python -m shared.qdrant_collections --provider BAAI --document-type system_analysis --migrate
+"""
+
+import argparse
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Optional
+
+from shared.logger import retrieval_graph_logger as logger
+from shared.vector_quantization import QuantizationMode, quantization_config
+
+DENSE_VECTOR_NAME = "dense_text"
+SPARSE_VECTOR_NAME = "sparse_text"
+
+DOCUMENT_TYPES = ("insurance", "system_analysis")
+
+PROVIDER_DENSE_SIZE = {
+    "AWS.Bedrock": 1024,  # cohere.embed-multilingual-v3
+    "BAAI": 1024,  # bge-m3
+    "Microsoft": 1024,  # multilingual-e5-large
+    "google_genai": 3072,  # gemini-embedding-exp-03-07
+}
+"""各 provider 嵌入模型的原始維度"""
+
+SPARSE_PROVIDERS = ("BAAI",)
+"""使用密集 + 稀疏混合檢索的 provider"""
+
+
+@dataclass(frozen=True)
+class PayloadIndex:
+    field_name: str
+    schema: str
+    """qdrant PayloadSchemaType 的值，例如 keyword、text、integer"""
+    source: Optional[str] = None
+    """欄位值由 source 欄位複製而來(同一個值需要第二種 index 時使用)"""
+
+
+DOC_NAME_TEXT_FIELD = "doc_name_text"
+
+DEFAULT_PAYLOAD_INDEXES = (
+    # retrieve_ctbc_sa_doc 以 MatchAny 篩選 doc_name，對應不到確切名稱時以 MatchText 篩選 doc_name_text，見 shared.doc_name_index。
+    # Qdrant 每個欄位只保留一個 index(筆記本先建 keyword 再建 text 會讓 text 取代 keyword)，全文 index 建立在複製的欄位
+    PayloadIndex("metadata.doc_name", "keyword"),
+    PayloadIndex(DOC_NAME_TEXT_FIELD, "text", source="metadata.doc_name"),
+)
+
+
+@dataclass(frozen=True)
+class CollectionSpec:
+    """單一 collection 的宣告式設定"""
+
+    name: str
+    dense_size: int
+    distance: str = "Euclid"
+    sparse: bool = False
+    sparse_idf: bool = False
+    """稀疏向量是否套用 Qdrant 的 IDF modifier"""
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    on_disk: bool = False
+    """原始密集向量放在磁碟；量化時一律放磁碟，記憶體只保留量化向量"""
+    quantization: QuantizationMode = "none"
+    payload_indexes: tuple[PayloadIndex, ...] = field(default=DEFAULT_PAYLOAD_INDEXES)
+
+    @property
+    def dense_on_disk(self) -> bool:
+        return self.on_disk or self.quantization != "none"
+
+
+def collection_spec(
+    provider: str,
+    document_type: str,
+    quantization: QuantizationMode = "none",
+    dimensions: Optional[int] = None,
+    name: Optional[str] = None,
+) -> CollectionSpec:
+    """依 provider、文件類型、量化與降維設定取得 collection 設定；name 預設為 get_qdrant_collection_name 的名稱(alias)"""
+    from shared.dimension_reduction import reduced_collection_name
+    from shared.retrieval import get_qdrant_collection_name
+
+    if provider not in PROVIDER_DENSE_SIZE:
+        raise ValueError(f"不支援的 embedding provider: {provider}")
+    return CollectionSpec(
+        name=name or reduced_collection_name(get_qdrant_collection_name(provider, document_type), dimensions),
+        dense_size=dimensions or PROVIDER_DENSE_SIZE[provider],
+        sparse=provider in SPARSE_PROVIDERS,
+        quantization=quantization,
+    )
+
+
+def configured_spec(configuration) -> CollectionSpec:
+    """BaseConfiguration 使用的 collection 的宣告設定，名稱為 alias 解析後的實際 collection
+
+    量化方式取自部署設定 QDRANT_VECTOR_QUANTIZATION，不使用請求的 vector_quantization(只影響檢索參數)；
+    embedding_dimensions 決定的是使用哪一個 `_d{維度}` collection，其維度即為該 collection 的宣告
+    """
+    from shared.retrieval import get_collection_name
+    from shared.settings import get_settings
+
+    provider = configuration.embedding_model.split("/", maxsplit=1)[0]
+    return collection_spec(
+        provider,
+        configuration.document_type,
+        get_settings().qdrant_vector_quantization,
+        configuration.embedding_dimensions,
+        name=get_collection_name(configuration),
+    )
+
+
+@dataclass
+class Drift:
+    """實際設定與宣告不一致之處；fix 為 None 表示無法線上遷移"""
+
+    message: str
+    fix: Optional[Callable[[], Any]] = None
+
+
+def _create(client, spec: CollectionSpec) -> None:
+    from qdrant_client.http import models
+
+    client.create_collection(
+        collection_name=spec.name,
+        vectors_config={
+            DENSE_VECTOR_NAME: models.VectorParams(
+                size=spec.dense_size, distance=models.Distance(spec.distance), on_disk=spec.dense_on_disk
+            )
+        },
+        sparse_vectors_config=(
+            {
+                SPARSE_VECTOR_NAME: models.SparseVectorParams(
+                    index=models.SparseIndexParams(on_disk=spec.on_disk),
+                    modifier=models.Modifier.IDF if spec.sparse_idf else models.Modifier.NONE,
+                )
+            }
+            if spec.sparse
+            else None
+        ),
+        hnsw_config=models.HnswConfigDiff(m=spec.hnsw_m, ef_construct=spec.hnsw_ef_construct),
+        quantization_config=quantization_config(spec.quantization),
+    )
+    for index in spec.payload_indexes if not _is_local(client) else ():
+        _create_payload_index(client, spec.name, index)
+
+
+def _payload_value(payload: dict, key: str) -> Any:
+    value: Any = payload
+    for part in key.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def copy_payload_fields(
+    client, collection_name: str, values: Optional[Iterable[Any]] = None, indexes: Iterable[PayloadIndex] = DEFAULT_PAYLOAD_INDEXES
+) -> None:
+    """將 source 欄位的值複製到有 source 的 index 欄位
+
+    values 為新寫入文件的 source 值(indexer 使用)；None 時掃描整個 collection(建立 index 時補齊既有資料)。
+    每個相異值以 source 的 keyword 篩選條件更新一次，不需逐筆寫入。
+    """
+    from qdrant_client.http import models
+
+    for index in indexes:
+        if index.source is None:
+            continue
+        if values is None:
+            targets: set[Any] = set()
+            offset = None
+            while True:
+                points, offset = client.scroll(
+                    collection_name=collection_name, limit=1024, offset=offset, with_payload=[index.source], with_vectors=False
+                )
+                targets.update(_payload_value(point.payload or {}, index.source) for point in points)
+                if offset is None:
+                    break
+        else:
+            targets = set(values)
+        for value in targets - {None}:
+            client.set_payload(
+                collection_name=collection_name,
+                payload={index.field_name: value},
+                points=models.Filter(must=[models.FieldCondition(key=index.source, match=models.MatchValue(value=value))]),
+            )
+
+
+def _quantization_kind(config) -> str:
+    from qdrant_client.http import models
+
+    match config:
+        case None:
+            return "none"
+        case models.ScalarQuantization():
+            return "scalar"
+        case models.BinaryQuantization():
+            return "binary"
+        case _:
+            return type(config).__name__
+
+
+def _is_local(client) -> bool:
+    """Qdrant local mode(QDRANT_URL=:memory: 或 QDRANT_PATH)不支援 payload index、量化與 on_disk"""
+    from qdrant_client.local.qdrant_local import QdrantLocal
+
+    return isinstance(getattr(client, "_client", None), QdrantLocal)
+
+
+def _diff(client, spec: CollectionSpec) -> list[Drift]:
+    from qdrant_client.http import models
+
+    info = client.get_collection(spec.name)
+    params = info.config.params
+    drifts: list[Drift] = []
+    server = not _is_local(client)
+
+    vectors = params.vectors if isinstance(params.vectors, dict) else {}
+    dense = vectors.get(DENSE_VECTOR_NAME)
+    if dense is None:
+        drifts.append(Drift(f"缺少密集向量 {DENSE_VECTOR_NAME}"))
+    else:
+        if dense.size != spec.dense_size or dense.distance != models.Distance(spec.distance):
+            drifts.append(
+                Drift(f"{DENSE_VECTOR_NAME} 為 {dense.size} 維 {dense.distance}，宣告為 {spec.dense_size} 維 {spec.distance}")
+            )
+        if server and bool(dense.on_disk) != spec.dense_on_disk:
+            drifts.append(
+                Drift(
+                    f"{DENSE_VECTOR_NAME} on_disk={bool(dense.on_disk)}，宣告為 {spec.dense_on_disk}",
+                    lambda: client.update_collection(
+                        collection_name=spec.name,
+                        vectors_config={DENSE_VECTOR_NAME: models.VectorParamsDiff(on_disk=spec.dense_on_disk)},
+                    ),
+                )
+            )
+
+    sparse = (params.sparse_vectors or {}).get(SPARSE_VECTOR_NAME)
+    if spec.sparse and sparse is None:
+        drifts.append(Drift(f"缺少稀疏向量 {SPARSE_VECTOR_NAME}"))
+    elif spec.sparse:
+        modifier = models.Modifier.IDF if spec.sparse_idf else models.Modifier.NONE
+        sparse_on_disk = bool(sparse.index and sparse.index.on_disk)
+        if (sparse.modifier or models.Modifier.NONE) != modifier or sparse_on_disk != spec.on_disk:
+            drifts.append(
+                Drift(
+                    f"{SPARSE_VECTOR_NAME} modifier={sparse.modifier} on_disk={sparse_on_disk}，宣告為 {modifier} {spec.on_disk}",
+                    lambda: client.update_collection(
+                        collection_name=spec.name,
+                        sparse_vectors_config={
+                            SPARSE_VECTOR_NAME: models.SparseVectorParams(
+                                index=models.SparseIndexParams(on_disk=spec.on_disk), modifier=modifier
+                            )
+                        },
+                    ),
+                )
+            )
+
+    hnsw = info.config.hnsw_config
+    if (hnsw.m, hnsw.ef_construct) != (spec.hnsw_m, spec.hnsw_ef_construct):
+        drifts.append(
+            Drift(
+                f"HNSW m={hnsw.m} ef_construct={hnsw.ef_construct}，宣告為 m={spec.hnsw_m} ef_construct={spec.hnsw_ef_construct}",
+                lambda: client.update_collection(
+                    collection_name=spec.name,
+                    hnsw_config=models.HnswConfigDiff(m=spec.hnsw_m, ef_construct=spec.hnsw_ef_construct),
+                ),
+            )
+        )
+
+    quantization = _quantization_kind(info.config.quantization_config)
+    if server and quantization != spec.quantization:
+        config = quantization_config(spec.quantization)
+        drifts.append(
+            Drift(
+                f"量化為 {quantization}，宣告為 {spec.quantization}",
+                lambda: client.update_collection(
+                    collection_name=spec.name,
+                    quantization_config=config if config is not None else models.Disabled.DISABLED,
+                ),
+            )
+        )
+
+    payload_schema = info.payload_schema or {}
+    for index in spec.payload_indexes if server else ():
+        current = payload_schema.get(index.field_name)
+        data_type = getattr(current.data_type, "value", current.data_type) if current is not None else None
+        if data_type != index.schema:
+            drifts.append(
+                Drift(
+                    f"payload index {index.field_name} 為 {data_type}，宣告為 {index.schema}",
+                    lambda index=index: _create_payload_index(client, spec.name, index),
+                )
+            )
+    return drifts
+
+
+def _create_payload_index(client, collection_name: str, index: PayloadIndex) -> None:
+    from qdrant_client.http import models
+
+    if index.source is not None:
+        copy_payload_fields(client, collection_name, indexes=[index])
+    client.create_payload_index(
+        collection_name=collection_name, field_name=index.field_name, field_schema=models.PayloadSchemaType(index.schema)
+    )
+
+
+def verify_collection(client, spec: CollectionSpec) -> list[str]:
+    """回傳實際設定與宣告的差異，collection 不存在時也列為差異"""
+    if not client.collection_exists(spec.name):
+        return [f"collection {spec.name} 不存在"]
+    return [drift.message for drift in _diff(client, spec)]
+
+
+def ensure_collection(client, spec: CollectionSpec) -> list[str]:
+    """建立或遷移 collection 到宣告的設定，回傳執行的變更；無法線上遷移時拋出 ValueError"""
+    if not client.collection_exists(spec.name):
+        _create(client, spec)
+        logger.info("建立 collection [%s]", spec.name)
+        return [f"建立 collection {spec.name}"]
+
+    drifts = _diff(client, spec)
+    blocking = [drift.message for drift in drifts if drift.fix is None]
+    if blocking:
+        raise ValueError(f"collection [{spec.name}] 需要重新建立: {'; '.join(blocking)}")
+    for drift in drifts:
+        drift.fix()
+        logger.info("遷移 collection [%s]: %s", spec.name, drift.message)
+    return [drift.message for drift in drifts]
+
+
+_checked: set[tuple[str, str]] = set()
+"""已執行過的 (collection 名稱, verify / migrate)"""
+_checked_lock = threading.Lock()
+
+
+def bootstrap_collection(client, spec: CollectionSpec, allow_migrate: bool = False) -> None:
+    """process 內第一次使用 collection 時依 QDRANT_COLLECTION_BOOTSTRAP 檢查或遷移
+
+    只有 allow_migrate=True(啟動預熱)時才會建立或遷移 collection，請求中呼叫時 migrate 視同 verify，
+    不會因請求而修改線上 collection。遷移遇到需要重新建立的差異時拋出 ValueError(記錄為預熱失敗)，不再重試
+    """
+    from shared.settings import get_settings
+
+    mode = get_settings().qdrant_collection_bootstrap
+    if mode == "off":
+        return
+    action = "migrate" if mode == "migrate" and allow_migrate else "verify"
+    key = (spec.name, action)
+    if key in _checked:
+        return
+    with _checked_lock:
+        if key in _checked:
+            return
+        _checked.add(key)
+        if action == "migrate":
+            try:
+                ensure_collection(client, spec)
+            except ValueError as e:
+                logger.error("collection [%s] 無法遷移，沿用現有設定: %s", spec.name, e)
+                raise
+        else:
+            for message in verify_collection(client, spec):
+                logger.warning("collection [%s] 與宣告設定不一致: %s", spec.name, message)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="檢查或建立/遷移 Qdrant collection")
+    parser.add_argument("--provider", choices=list(PROVIDER_DENSE_SIZE), help="只處理此 provider，預設全部")
+    parser.add_argument("--document-type", choices=DOCUMENT_TYPES, help="只處理此文件類型，預設全部")
+    parser.add_argument("--quantization", choices=["none", "scalar", "binary"], help="預設為 QDRANT_VECTOR_QUANTIZATION")
+    parser.add_argument("--dimensions", type=int, default=None, help="降維後的 collection")
+    parser.add_argument("--migrate", action="store_true", help="建立不存在的 collection 並遷移設定")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    from shared.retrieval import get_qdrant_client
+
+    from shared.settings import get_settings
+
+    args = parse_args(argv)
+    quantization = args.quantization or get_settings().qdrant_vector_quantization
+    specs = []
+    for provider in [args.provider] if args.provider else PROVIDER_DENSE_SIZE:
+        for document_type in [args.document_type] if args.document_type else DOCUMENT_TYPES:
+            try:
+                specs.append(collection_spec(provider, document_type, quantization, args.dimensions))
+            except KeyError as e:
+                sys.stdout.write(f"[SKIP] {provider}/{document_type}: 環境變數 {e} 未設定\n")
+    client = get_qdrant_client()
+    failed = 0
+    for spec in specs:
+        try:
+            messages = ensure_collection(client, spec) if args.migrate else verify_collection(client, spec)
+        except ValueError as e:
+            sys.stdout.write(f"[FAIL] {e}\n")
+            failed += 1
+            continue
+        if not messages:
+            sys.stdout.write(f"[OK]   {spec.name}\n")
+        for message in messages:
+            sys.stdout.write(f"[{'MIGRATED' if args.migrate else 'DRIFT'}] {spec.name}: {message}\n")
+        failed += bool(messages) and not args.migrate
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,204 @@
+"""
+遠端嵌入 API(Bedrock、Gemini)的批次與並行呼叫。
+
+BedrockEmbeddings 的 aembed_documents 對每段文字各送一次請求(且以 search_query 嵌入文件)，
+embed_documents 則依序送出每個 batch；索引上千個 chunk 時變成數千次串行的 HTTP 呼叫。
+PooledEmbeddings 包裝原本的嵌入模型：
+
+    1. 依 provider 的上限切分 batch(PROVIDER_LIMITS，Cohere 每次 96 筆、Gemini 100 筆、Titan 1 筆)
+    2. 以固定大小的 thread pool 並行送出，同時進行的請求數上限為 EMBEDDING_MAX_CONCURRENCY；
+       boto3 client 的 connection pool 與之相同並保持連線(client_config)，不必每次重新建立 TLS 連線
+    3. throttle 與暫時性錯誤(timeout、5xx)以 exponential backoff + jitter 重試，最多 MAX_RETRIES 次
+    4. 每次 embed_documents 記錄吞吐量
+
+查詢(embed_query)不經過 thread pool，避免大量索引時排擠檢索請求，只套用重試。
+
+metrics:
+    rag_embedding_requests_total{model, outcome}   ok / retried / error
+    rag_embedding_texts_total{model}               嵌入的文字筆數
+    rag_embedding_batch_seconds{model}             每個請求的耗時
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, TypeVar
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from shared.instrumentation import metrics
+from shared.llm_gateway import backoff_seconds, is_throttle
+from shared.logger import retrieval_graph_logger as logger
+from shared.settings import get_settings
+
+
+MAX_RETRIES = 4
+
+TRANSIENT_MARKERS = ("timeout", "timed out", "connection", "serviceunavailable", "internalserver", "modelnotready", "unavailable")
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class ProviderLimits:
+    """單一請求可送出的文字筆數與總字元數上限(0 表示不限)"""
+
+    max_items: int
+    max_chars: int = 0
+
+
+PROVIDER_LIMITS = {
+    "cohere": ProviderLimits(max_items=96),
+    "titan": ProviderLimits(max_items=1),
+    "google_genai": ProviderLimits(max_items=100),
+}
+
+
+def client_config(max_concurrency: Optional[int] = None) -> Any:
+    """Bedrock 嵌入用的 botocore 設定：connection pool 不小於並行數、TCP keepalive，重試交由 PooledEmbeddings 處理"""
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=max(max_concurrency or get_settings().embedding_max_concurrency, 10),
+        tcp_keepalive=True,
+        connect_timeout=5,
+        read_timeout=60,
+        retries={"mode": "standard", "max_attempts": 1},
+    )
+
+
+def is_retryable(error: BaseException) -> bool:
+    """throttle 或暫時性錯誤(timeout、連線中斷、5xx)"""
+    if is_throttle(error):
+        return True
+    response = getattr(error, "response", None)
+    status = (response.get("ResponseMetadata") or {}).get("HTTPStatusCode", 0) if isinstance(response, dict) else 0
+    status = status or getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int) and status >= 500:
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in TRANSIENT_MARKERS)
+
+
+def split_batches(texts: list[str], limits: ProviderLimits) -> list[list[str]]:
+    """依筆數與字元數上限切分，保持原本的順序"""
+    batches: list[list[str]] = []
+    chars = 0
+    for text in texts:
+        if not batches or len(batches[-1]) >= limits.max_items or (limits.max_chars and chars + len(text) > limits.max_chars):
+            batches.append([])
+            chars = 0
+        batches[-1].append(text)
+        chars += len(text)
+    return batches
+
+
+class PooledEmbeddings(Embeddings):
+    """以批次與有上限的並行請求呼叫遠端嵌入 API"""
+
+    def __init__(self, embedding: Embeddings, model: str, max_concurrency: Optional[int] = None):
+        self.embedding = embedding
+        self.model = model
+        """完整的模型名稱(provider/model)，作為 metrics 的 label"""
+        self.kind = self._kind(embedding)
+        self.limits = PROVIDER_LIMITS[self.kind]
+        self.max_concurrency = max_concurrency or get_settings().embedding_max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix=f"embedding-{self.kind}")
+
+    @property
+    def parallel_batch_size(self) -> int:
+        """一次 embed_documents 可填滿所有並行請求的筆數，供 vector store 的 add_texts(batch_size=...) 使用"""
+        return self.limits.max_items * self.max_concurrency
+
+    @staticmethod
+    def _kind(embedding: Embeddings) -> str:
+        model_id = getattr(embedding, "model_id", None)
+        if model_id is not None:
+            return "cohere" if (getattr(embedding, "provider", None) or model_id.split(".")[0]) == "cohere" else "titan"
+        return "google_genai"
+
+    def _retry(self, call: Callable[[], T]) -> T:
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return call()
+            except Exception as e:
+                if attempt >= MAX_RETRIES or not is_retryable(e):
+                    metrics.inc("rag_embedding_requests_total", model=self.model, outcome="error")
+                    raise
+                delay = backoff_seconds(attempt)
+                metrics.inc("rag_embedding_requests_total", model=self.model, outcome="retried")
+                logger.warning("[%s] 嵌入請求失敗(%s)，%.1f 秒後重試", self.model, type(e).__name__, delay)
+                time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    def _invoke_bedrock(self, body: dict[str, Any]) -> dict[str, Any]:
+        embedding = self.embedding
+        response = embedding.client.invoke_model(
+            body=json.dumps({**body, **(embedding.model_kwargs or {})}),
+            modelId=embedding.model_id,
+            accept="application/json",
+            contentType="application/json",
+        )
+        return json.loads(response["body"].read())
+
+    def _normalize(self, vectors: list[list[float]]) -> list[list[float]]:
+        if not getattr(self.embedding, "normalize", False):
+            return vectors
+        array = np.asarray(vectors, dtype=np.float64)
+        return (array / np.linalg.norm(array, axis=1, keepdims=True)).tolist()
+
+    def _call(self, texts: list[str], input_type: str) -> list[list[float]]:
+        """單一請求，texts 已符合 provider 的上限"""
+        match self.kind:
+            case "cohere":
+                # 與 BedrockEmbeddings 相同地將換行替換為空白，向量才會與既有的 collection 一致
+                texts = [text.replace(os.linesep, " ") for text in texts]
+                vectors = self._invoke_bedrock({"input_type": input_type, "texts": texts})["embeddings"]
+            case "titan":
+                vectors = [self._invoke_bedrock({"inputText": texts[0].replace(os.linesep, " ")})["embedding"]]
+            case _:
+                if input_type == "search_query":
+                    return [self.embedding.embed_query(texts[0])]
+                return self.embedding.embed_documents(texts, batch_size=len(texts))
+        return self._normalize(vectors)
+
+    def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        start = time.perf_counter()
+        vectors = self._retry(lambda: self._call(texts, "search_document"))
+        metrics.observe("rag_embedding_batch_seconds", time.perf_counter() - start, model=self.model)
+        metrics.inc("rag_embedding_requests_total", model=self.model, outcome="ok")
+        metrics.inc("rag_embedding_texts_total", len(texts), model=self.model)
+        return vectors
+
+    def _report(self, texts: list[str], batches: list[list[str]], start: float) -> None:
+        elapsed = time.perf_counter() - start
+        if len(batches) > 1:
+            logger.info(
+                "[%s] 嵌入 %d 筆(%d 個請求，並行 %d)耗時 %.2f 秒，%.0f texts/s",
+                self.model, len(texts), len(batches), min(len(batches), self.max_concurrency), elapsed, len(texts) / max(elapsed, 1e-9),
+            )
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        start = time.perf_counter()
+        batches = split_batches(list(texts), self.limits)
+        vectors = [vector for batch in self._executor.map(self._embed_batch, batches) for vector in batch]
+        self._report(texts, batches, start)
+        return vectors
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        start = time.perf_counter()
+        batches = split_batches(list(texts), self.limits)
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(loop.run_in_executor(self._executor, self._embed_batch, batch) for batch in batches))
+        self._report(texts, batches, start)
+        return [vector for batch in results for vector in batch]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._retry(lambda: self._call([text], "search_query"))[0]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed_query, text)
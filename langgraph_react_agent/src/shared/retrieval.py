@@ -6,15 +6,24 @@
 檢索器支援透過 user_id 過濾結果，確保使用者之間的資料隔離。
 """
 
-import os
+import threading
 from contextlib import contextmanager
-from typing import Generator
+from functools import lru_cache
+from typing import Any, Generator, Optional
 
+from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.runnables import RunnableConfig, ConfigurableField
-from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.vectorstores import VectorStore, VectorStoreRetriever
 
 from shared.base_configuration import BaseConfiguration
+from shared.embedding_settings import LocalEmbeddingSettings, apply_thread_settings, get_embedding_settings
+from shared.instrumentation import stage
+from shared.logger import retrieval_graph_logger as logger
+from shared.settings import get_settings
+
+_qdrant_client = None
+_qdrant_client_lock = threading.Lock()
 
 
 @contextmanager
@@ -23,12 +32,18 @@ def get_retriever(config: RunnableConfig) -> Generator[VectorStoreRetriever, Non
 
     configuration = BaseConfiguration.from_runnable_config(config)
 
-    embedding_model = get_match_embedding(configuration.embedding_model)
+    with stage("load_embedding", model=configuration.embedding_model):
+        embedding_model = get_match_embedding(configuration.embedding_model)
+        if configuration.embedding_dimensions:
+            embedding_model = get_reduced_embedding(embedding_model, configuration)
 
     match configuration.retriever_provider:
         case "qdrant":
             with get_qdrant_retriever(configuration, embedding_model) as retriever:
                 yield retriever
+        case "local":
+            with get_local_retriever(configuration, embedding_model) as retriever:
+                yield retriever
         # case "mongodb":
         #     with make_mongodb_retriever(configuration, embedding_model) as retriever:
         #         yield retriever
@@ -40,28 +55,78 @@ def get_retriever(config: RunnableConfig) -> Generator[VectorStoreRetriever, Non
             )
 
 
+@lru_cache
 def get_match_embedding(model: str) -> Embeddings:
-    """取得對應的 Embedding 模型"""
+    """取得對應的 Embedding 模型，同一個模型在 process 內共用(建立 boto3 client 等連線成本只付一次)"""
+    fully_specified_name = model
     provider, model = model.split("/", maxsplit=1)
-    huggingface_cache_folder = os.environ["HUGGINGFACE_CACHE_FOLDER"]
     match provider:
         case "AWS.Bedrock":
             from langchain_aws import BedrockEmbeddings
-            aws_region = os.environ["AWS_REGION"]
-            return BedrockEmbeddings(region_name=aws_region, model_id=model)
+
+            from shared.remote_embedding import PooledEmbeddings, client_config
+            aws_region = get_settings().require("aws_region")
+            # 批次並行送出並重試，見 shared.remote_embedding
+            return PooledEmbeddings(
+                BedrockEmbeddings(region_name=aws_region, model_id=model, config=client_config()), fully_specified_name
+            )
+        case "BAAI" | "Microsoft" if "-onnx" in model:
+            # 以 ONNX Runtime 推論，見 shared.onnx_embedding
+            from shared.onnx_embedding import load_onnx_embedding
+            return load_onnx_embedding(fully_specified_name)
         case "BAAI":
             from shared.baai_bge_m3 import BAAIBGEM3Embedding
             return BAAIBGEM3Embedding()
         case "Microsoft":
-            from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-            return HuggingFaceEmbeddings(model_name=model, cache_folder=huggingface_cache_folder)
+            return load_huggingface_embedding(model, get_embedding_settings(fully_specified_name))
         case "google_genai":
             from langchain_google_genai import GoogleGenerativeAIEmbeddings
-            return GoogleGenerativeAIEmbeddings(model=f"models/{model}")
+
+            from shared.remote_embedding import PooledEmbeddings
+            return PooledEmbeddings(
+                GoogleGenerativeAIEmbeddings(model=f"models/{model}", **get_settings().client_kwargs(provider)), fully_specified_name
+            )
         case _:
             raise ValueError(f"不支援的 embedding provider: {provider}")
 
 
+def get_reduced_embedding(embedding_model: Embeddings, configuration: BaseConfiguration) -> Embeddings:
+    """將密集嵌入模型包裝為降維後的模型，見 shared.dimension_reduction"""
+    from shared.dimension_reduction import ReducedEmbeddings, get_reducer
+
+    if configuration.embedding_model.startswith("BAAI/"):
+        raise ValueError("BAAI/bge-m3 的混合檢索不支援降維")
+    reducer = get_reducer(configuration.dimension_reduction, configuration.embedding_model, configuration.embedding_dimensions)
+    return ReducedEmbeddings(embedding_model, reducer)
+
+
+@lru_cache
+def load_huggingface_embedding(model: str, settings: LocalEmbeddingSettings) -> Embeddings:
+    """依推論參數載入 HuggingFace 嵌入模型，相同參數只載入一次"""
+    return create_huggingface_embedding(model, settings)
+
+
+def create_huggingface_embedding(model: str, settings: LocalEmbeddingSettings) -> Embeddings:
+    """載入新的 HuggingFace 嵌入模型，不經快取；參數量測(benchmark.embedding)每組參數載入一次，量測後即釋放"""
+    from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+    apply_thread_settings(settings)
+    model_kwargs = {}
+    if settings.use_fp16:
+        import torch
+
+        model_kwargs["model_kwargs"] = {"torch_dtype": torch.float16}
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model,
+        cache_folder=get_settings().require("huggingface_cache_folder"),
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": settings.batch_size},
+    )
+    client = getattr(embeddings, "_client", None) or embeddings.client
+    client.max_seq_length = settings.max_length
+    return embeddings
+
+
 # ===== get retriver 區塊 ================================================
 @contextmanager
 def get_qdrant_retriever(configuration: BaseConfiguration, embedding_model: Embeddings) -> Generator[VectorStoreRetriever, None, None]:
@@ -69,65 +134,83 @@ def get_qdrant_retriever(configuration: BaseConfiguration, embedding_model: Embe
     from langchain_qdrant import QdrantVectorStore, RetrievalMode
     from qdrant_client.http.models import Distance
 
+    from shared.vector_quantization import quantization_search_params
+
     fully_specified_name = configuration.embedding_model
     if "/" in fully_specified_name:
         provider, model = fully_specified_name.split("/", maxsplit=1)
     else:
         provider = ""
 
-    qdrant_url = os.environ["QDRANT_URL"]
-    qdrant_api_key = os.environ["QDRANT_API_KEY"]
-    print('qdrant_url',f'[{qdrant_url}]')
-    print('qdrant_api_key',f'[{qdrant_api_key}]')
-    qdrant_collection_name = get_qdrant_collection_name(provider, configuration.document_type)
-    print('qdrant_collection_name',f'[{qdrant_collection_name}]')
+    client = get_qdrant_client()
+    qdrant_collection_name = get_collection_name(configuration)
+    logger.debug("qdrant_collection_name=[%s]", qdrant_collection_name)
+    # 第一次使用時檢查 collection 設定與 payload index，見 shared.qdrant_collections
+    from shared.qdrant_collections import bootstrap_collection, configured_spec
+
+    with stage("collection_bootstrap", provider="qdrant"):
+        bootstrap_collection(client, configured_spec(configuration))
+    if configuration.chunk_store:
+        # 只向 Qdrant 取 point id，內容由本機 chunk store 讀取，見 shared.chunk_store
+        from shared.chunk_store import ChunkStoreClient, get_chunk_store
+
+        chunk_store = get_chunk_store(qdrant_collection_name)
+        if chunk_store is not None:
+            client = ChunkStoreClient(client, chunk_store)
+        else:
+            logger.warning("collection [%s] 尚未建立 chunk store，改向 Qdrant 取 payload", qdrant_collection_name)
 
     vstore = None
-    match provider:
-        case "AWS.Bedrock" | "Microsoft":
-            vstore = QdrantVectorStore.from_existing_collection(
-                url=qdrant_url,
-                api_key=qdrant_api_key,
-                collection_name=qdrant_collection_name,
-                embedding=embedding_model,
-                vector_name="dense_text",
-                # Euclidean distance，歐氏距離 (L2), Inner Product，內積 (IP), Cosine Similarity，餘弦相似性 (COSINE),
-                distance="Euclid",
-                retrieval_mode=RetrievalMode.DENSE,
-            )
-        case "google_genai":
-            vstore = QdrantVectorStore.from_existing_collection(
-                url=qdrant_url,
-                api_key=qdrant_api_key,
-                collection_name=qdrant_collection_name,
-                embedding=embedding_model,
-                vector_name="dense_text",
-                # Euclidean distance，歐氏距離 (L2), Inner Product，內積 (IP), Cosine Similarity，餘弦相似性 (COSINE),
-                distance=Distance.EUCLID,
-                retrieval_mode=RetrievalMode.DENSE,
-            )
-        case "BAAI":
-            vstore = QdrantVectorStore.from_existing_collection(
-                url=qdrant_url,
-                api_key=qdrant_api_key,
-                collection_name=qdrant_collection_name,
-                # 密集向量區
-                embedding=embedding_model.dense,
-                vector_name="dense_text",
-                # Euclidean distance，歐氏距離 (L2), Inner Product，內積 (IP), Cosine Similarity，餘弦相似性 (COSINE),
-                distance="Euclid",
-                # /密集向量區
-                # 稀疏向量區
-                sparse_embedding=embedding_model.sparse,
-                sparse_vector_name="sparse_text",
-                # /稀疏向量區
-                retrieval_mode=RetrievalMode.HYBRID,  # 混合檢索，必須搭配密集+稀疏向量
-            )
-        case _:
-            raise ValueError(f"不支援的 embedding provider: {provider}")
+    # QdrantVectorStore 建立時會連線 Qdrant 確認 collection 設定
+    with stage("retriever_setup", provider="qdrant"):
+        match provider:
+            case "AWS.Bedrock" | "Microsoft":
+                vstore = QdrantVectorStore(
+                    client=client,
+                    collection_name=qdrant_collection_name,
+                    embedding=embedding_model,
+                    vector_name="dense_text",
+                    # Euclidean distance，歐氏距離 (L2), Inner Product，內積 (IP), Cosine Similarity，餘弦相似性 (COSINE),
+                    distance="Euclid",
+                    retrieval_mode=RetrievalMode.DENSE,
+                )
+            case "google_genai":
+                vstore = QdrantVectorStore(
+                    client=client,
+                    collection_name=qdrant_collection_name,
+                    embedding=embedding_model,
+                    vector_name="dense_text",
+                    # Euclidean distance，歐氏距離 (L2), Inner Product，內積 (IP), Cosine Similarity，餘弦相似性 (COSINE),
+                    distance=Distance.EUCLID,
+                    retrieval_mode=RetrievalMode.DENSE,
+                )
+            case "BAAI":
+                vstore = QdrantVectorStore(
+                    client=client,
+                    collection_name=qdrant_collection_name,
+                    # 密集向量區
+                    embedding=embedding_model.dense,
+                    vector_name="dense_text",
+                    # Euclidean distance，歐氏距離 (L2), Inner Product，內積 (IP), Cosine Similarity，餘弦相似性 (COSINE),
+                    distance="Euclid",
+                    # /密集向量區
+                    # 稀疏向量區
+                    sparse_embedding=embedding_model.sparse,
+                    sparse_vector_name="sparse_text",
+                    # /稀疏向量區
+                    retrieval_mode=RetrievalMode.HYBRID,  # 混合檢索，必須搭配密集+稀疏向量
+                )
+            case _:
+                raise ValueError(f"不支援的 embedding provider: {provider}")
 
-    search_kwargs = configuration.search_kwargs
+    search_kwargs = dict(configuration.search_kwargs)
     search_kwargs.setdefault("k", configuration.retrieve_limit)
+    # 量化的 collection 以量化向量取候選，再以原始向量 rescore；參數在查詢時才併入，見 shared.vector_quantization
+    search_params = quantization_search_params(
+        configuration.vector_quantization,
+        configuration.quantization_rescore,
+        configuration.quantization_oversampling,
+    )
 
     # 設定 seach keyword arguments 篩選檢索結果
     # from qdrant_client.models import Filter, FieldCondition, MatchValue, MatchText
@@ -143,8 +226,65 @@ def get_qdrant_retriever(configuration: BaseConfiguration, embedding_model: Embe
     #     ),
     # )
 
-    # 這裡將回傳的 retriever 設定為可動態設置的
-    yield vstore.as_retriever(search_type="mmr", search_kwargs=search_kwargs).configurable_fields(
+    # 這裡將回傳的 retriever 設定為可動態設置的；混合檢索的分數為 RRF(越大越好)
+    yield as_configurable_retriever(
+        vstore, configuration, search_kwargs, higher_is_better=provider == "BAAI", search_params=search_params
+    )
+
+
+@contextmanager
+def get_local_retriever(configuration: BaseConfiguration, embedding_model: Embeddings) -> Generator[VectorStoreRetriever, None, None]:
+    """設定此 agent 使用 process 內的本機向量索引，collection 名稱與 Qdrant 相同，見 shared.local_vector_store"""
+    from shared.local_vector_store import LocalVectorStore
+
+    provider = configuration.embedding_model.split("/", maxsplit=1)[0]
+    collection_name = get_collection_name(configuration)
+    if provider == "BAAI":
+        # 密集 + 稀疏向量的混合檢索
+        vstore = LocalVectorStore(collection_name, embedding_model.dense, sparse_embedding=embedding_model.sparse)
+    else:
+        vstore = LocalVectorStore(collection_name, embedding_model)
+
+    search_kwargs = dict(configuration.search_kwargs)
+    search_kwargs.setdefault("k", configuration.retrieve_limit)
+    yield as_configurable_retriever(vstore, configuration, search_kwargs, higher_is_better=vstore.sparse_embedding is not None)
+
+
+def as_configurable_retriever(
+    vstore: VectorStore,
+    configuration: BaseConfiguration,
+    search_kwargs: dict,
+    higher_is_better: bool,
+    search_params: Optional[Any] = None,
+):
+    """建立 search_kwargs 可經由 configurable 動態調整的 retriever
+
+    預設以 MMR 檢索 k 筆；開啟 adaptive_k 時依分數分布決定筆數，見 shared.adaptive_k。
+    search_params(量化檢索參數)不屬於 search_kwargs，configurable 取代 search_kwargs 時仍會在查詢時帶上
+    """
+    if configuration.adaptive_k:
+        from shared.adaptive_k import AdaptiveRetriever
+
+        retriever = AdaptiveRetriever(
+            vectorstore=vstore,
+            search_kwargs=search_kwargs,
+            higher_is_better=higher_is_better,
+            min_k=configuration.adaptive_min_k,
+            max_k=configuration.adaptive_max_k,
+            score_gap=configuration.adaptive_score_gap,
+            relative_threshold=configuration.adaptive_relative_threshold,
+            token_budget=configuration.adaptive_token_budget,
+            search_params=search_params,
+        )
+    elif search_params is not None:
+        from shared.vector_quantization import QuantizedVectorStoreRetriever
+
+        retriever = QuantizedVectorStoreRetriever(
+            vectorstore=vstore, search_type="mmr", search_kwargs=search_kwargs, search_params=search_params
+        )
+    else:
+        retriever = vstore.as_retriever(search_type="mmr", search_kwargs=search_kwargs)
+    return retriever.configurable_fields(
         search_kwargs=ConfigurableField(
             id="search_kwargs",
             name="Search Kwargs",
@@ -153,41 +293,91 @@ def get_qdrant_retriever(configuration: BaseConfiguration, embedding_model: Embe
     )
 
 
-def get_qdrant_collection_name(provider: str, doc_type: str):
-    if provider == "AWS.Bedrock":
-        match doc_type:
-            case "insurance":
-                return os.environ["QDRANT_COLLECTION_COHERE_MULTILINGUAL_V3_AWS_EC2"]
-            case "system_analysis":
-                return os.environ["QDRANT_COLLECTION_COHERE_MULTILINGUAL_V3_SA"]
-            case _:
-                return os.environ["QDRANT_COLLECTION_COHERE_MULTILINGUAL_V3_AWS_EC2"]
-    elif provider == "BAAI":
-        match doc_type:
-            case "insurance":
-                return os.environ["QDRANT_COLLECTION_BAAI_BGEM3_AWS_EC2"]
-            case "system_analysis":
-                return os.environ["QDRANT_COLLECTION_BAAI_BGEM3_SA"]
-            case _:
-                return os.environ["QDRANT_COLLECTION_BAAI_BGEM3_AWS_EC2"]
-    elif provider == "Microsoft":
-        match doc_type:
-            case "insurance":
-                return os.environ["QDRANT_COLLECTION_MICROSOFT_E5_LARGE_AWS_EC2"]
-            case "system_analysis":
-                return os.environ["QDRANT_COLLECTION_MICROSOFT_E5_LARGE_SA"]
-            case _:
-                return os.environ["QDRANT_COLLECTION_MICROSOFT_E5_LARGE_AWS_EC2"]
-    elif provider == "google_genai":
-        match doc_type:
-            case "insurance":
-                return os.environ["QDRANT_COLLECTION_GEMINI_EXP_03_07_AWS_EC2"]
-            case "system_analysis":
-                return os.environ["QDRANT_COLLECTION_GEMINI_EXP_03_07_SA"]
-            case _:
-                return os.environ["QDRANT_COLLECTION_MICROSOFT_E5_LARGE_AWS_EC2"]
-    else:
-        raise ValueError(f"不支援的 embedding provider: {provider}")
+def get_collection_name(configuration: BaseConfiguration) -> str:
+    """依 embedding 模型、文件類型與降維設定取得 collection 名稱
+
+    Qdrant 的 collection 名稱是 alias，解析為目前版本的實際 collection；指定 collection_version 時直接使用該版本，
+    見 shared.collection_aliases
+    """
+    from shared.collection_aliases import resolve_alias, versioned_collection_name
+    from shared.dimension_reduction import reduced_collection_name
+
+    provider = configuration.embedding_model.split("/", maxsplit=1)[0]
+    name = reduced_collection_name(
+        get_qdrant_collection_name(provider, configuration.document_type), configuration.embedding_dimensions
+    )
+    if configuration.collection_version:
+        return versioned_collection_name(name, configuration.collection_version)
+    if configuration.retriever_provider == "qdrant":
+        return resolve_alias(get_qdrant_client(), name)
+    return name
+
+
+def get_qdrant_collection_name(provider: str, doc_type: str) -> str:
+    """查詢啟動時建立的路由表取得 collection 名稱，見 shared.settings"""
+    return get_settings().collection_name(provider, doc_type)
+
+
+def get_qdrant_client():
+    """取得 process 內共用的 QdrantClient，重複使用連線而不是每次檢索都重新建立
+
+    QDRANT_URL 設為 ":memory:" 時使用 Qdrant 的 in-memory local mode(例如 benchmark)，
+    設定 QDRANT_PATH 時使用存放在該目錄的 local mode
+    """
+    global _qdrant_client
+    if _qdrant_client is None:
+        with _qdrant_client_lock:
+            if _qdrant_client is None:
+                from qdrant_client import QdrantClient
+
+                settings = get_settings()
+                if settings.qdrant_url == ":memory:":
+                    _qdrant_client = QdrantClient(location=":memory:")
+                elif settings.qdrant_path:
+                    _qdrant_client = QdrantClient(path=settings.qdrant_path)
+                else:
+                    _qdrant_client = QdrantClient(url=settings.qdrant_url, api_key=settings.qdrant_api_key)
+    return _qdrant_client
+
+
+def fetch_documents(collection_name: str, point_ids: list[str]) -> dict[str, Document]:
+    """依 point id 取回完整文件；此 process 已開啟的本機 collection 直接讀取，其餘向 Qdrant 取回"""
+    from shared.local_vector_store import is_open, open_collection
+
+    from shared.chunk_store import get_chunk_store
+
+    if is_open(collection_name):
+        return open_collection(collection_name).fetch(point_ids)
+    chunk_store = get_chunk_store(collection_name)
+    if chunk_store is None:
+        return fetch_qdrant_documents(collection_name, point_ids)
+
+    docs = {}
+    for point_id in point_ids:
+        payload = chunk_store.payload(point_id)
+        if payload is not None:
+            metadata = {**payload["metadata"], "_id": point_id, "_collection_name": collection_name}
+            docs[str(point_id)] = Document(page_content=payload["page_content"], metadata=metadata)
+    missing = [point_id for point_id in point_ids if str(point_id) not in docs]
+    return {**docs, **fetch_qdrant_documents(collection_name, missing)}
+
+
+def fetch_qdrant_documents(collection_name: str, point_ids: list[str]) -> dict[str, Document]:
+    """依 point id 從 Qdrant 取回完整文件，回傳 point id 對應文件的 dict"""
+    if not point_ids:
+        return {}
+
+    client = get_qdrant_client()
+    points = client.retrieve(collection_name=collection_name, ids=point_ids, with_payload=True, with_vectors=False)
+    docs = {}
+    for point in points:
+        payload = point.payload or {}
+        metadata = dict(payload.get("metadata") or {})
+        metadata["_id"] = point.id
+        metadata["_collection_name"] = collection_name
+        docs[str(point.id)] = Document(page_content=payload.get("page_content", ""), metadata=metadata)
+    return docs
+
 
 # @contextmanager
 # def make_mongodb_retriever(configuration: IndexConfiguration, embedding_model: Embeddings) -> Generator[VectorStoreRetriever, None, None]:
@@ -199,7 +389,7 @@ def get_qdrant_collection_name(provider: str, doc_type: str):
 #         namespace="langgraph_retrieval_agent.default",
 #         embedding=embedding_model,
 #     )
-#     search_kwargs = configuration.search_kwargs
+#     search_kwargs = dict(configuration.search_kwargs)
 #     pre_filter = search_kwargs.setdefault("pre_filter", {})
 #     pre_filter["user_id"] = {"$eq": configuration.user_id}
 #     yield vstore.as_retriever(search_kwargs=search_kwargs)
@@ -0,0 +1,228 @@
+"""
+process 層級的環境變數設定。
+
+環境變數在第一次呼叫 get_settings 時讀取並驗證一次，之後各請求只讀取不可變的 Settings 物件，
+不再於每次檢索時查詢 os.environ 或走訪 provider/文件類型的 match 判斷。
+
+    get_settings()     取得設定；格式錯誤時拋出 SettingsError，列出所有錯誤
+    reload_settings()  環境變數在 process 中途被修改時(例如 benchmark 替換為本機服務)重新讀取
+
+collection 路由表 COLLECTION_ROUTES 定義 (embedding provider, document_type) 對應的環境變數，
+未列出的文件類型使用 DEFAULT_DOCUMENT_TYPE 的 collection；未設定環境變數的 collection 在使用時才拋出 KeyError。
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Literal, Mapping, Optional
+
+DEFAULT_DOCUMENT_TYPE = "insurance"
+
+COLLECTION_ROUTES: Mapping[tuple[str, str], str] = MappingProxyType({
+    ("AWS.Bedrock", "insurance"): "QDRANT_COLLECTION_COHERE_MULTILINGUAL_V3_AWS_EC2",
+    ("AWS.Bedrock", "system_analysis"): "QDRANT_COLLECTION_COHERE_MULTILINGUAL_V3_SA",
+    ("BAAI", "insurance"): "QDRANT_COLLECTION_BAAI_BGEM3_AWS_EC2",
+    ("BAAI", "system_analysis"): "QDRANT_COLLECTION_BAAI_BGEM3_SA",
+    ("Microsoft", "insurance"): "QDRANT_COLLECTION_MICROSOFT_E5_LARGE_AWS_EC2",
+    ("Microsoft", "system_analysis"): "QDRANT_COLLECTION_MICROSOFT_E5_LARGE_SA",
+    ("google_genai", "insurance"): "QDRANT_COLLECTION_GEMINI_EXP_03_07_AWS_EC2",
+    ("google_genai", "system_analysis"): "QDRANT_COLLECTION_GEMINI_EXP_03_07_SA",
+})
+"""(embedding provider, document_type) → collection 名稱的環境變數"""
+
+PROVIDERS = frozenset(provider for provider, _ in COLLECTION_ROUTES)
+
+BootstrapMode = Literal["verify", "migrate", "off"]
+
+CollectionQuantization = Literal["none", "scalar", "binary"]
+
+RATE_LIMIT_KEYS = ("rps", "tpm", "max_concurrency", "initial_concurrency")
+
+
+class SettingsError(ValueError):
+    """環境變數格式錯誤"""
+
+
+@dataclass(frozen=True)
+class Settings:
+    """驗證後的環境變數設定"""
+
+    aws_region: Optional[str] = None
+    huggingface_cache_folder: Optional[str] = None
+    qdrant_url: str = ""
+    qdrant_api_key: Optional[str] = None
+    qdrant_path: Optional[str] = None
+    qdrant_collection_bootstrap: BootstrapMode = "verify"
+    """migrate 只在啟動預熱與 `python -m shared.qdrant_collections` 執行，請求中最多只做 verify"""
+    qdrant_vector_quantization: CollectionQuantization = "none"
+    """collection 宣告的向量量化方式(建立、遷移與檢查 collection 時使用)，與請求的 configurable 無關"""
+    collections: Mapping[tuple[str, str], str] = field(default_factory=lambda: MappingProxyType({}))
+    """(embedding provider, document_type) → collection 名稱，只包含已設定環境變數的 collection"""
+    warmup_on_startup: bool = False
+    """graph 載入時在背景預先載入嵌入模型、聊天模型與 Qdrant 連線，見 shared.warmup"""
+    warmup_configurable: Mapping[str, object] = field(default_factory=lambda: MappingProxyType({}))
+    """預熱使用的 configurable，未指定的欄位使用各 graph Configuration 的預設值"""
+    llm_gateway_enabled: bool = True
+    """聊天模型的呼叫是否經過 LLM gateway(限流、排程與合併相同請求)，見 shared.llm_gateway"""
+    llm_rate_limits: Mapping[str, Mapping[str, float]] = field(default_factory=lambda: MappingProxyType({}))
+    """模型名稱、provider 或 "default" → 限制(rps、tpm、max_concurrency、initial_concurrency)"""
+    embedding_max_concurrency: int = 8
+    """遠端嵌入 API(Bedrock、Gemini)同時進行的請求數上限，見 shared.remote_embedding"""
+    google_api_endpoint: Optional[str] = None
+    """Gemini API 的替代 endpoint(例如 fake_services 的本機 server)，設定時改以 REST transport 連線"""
+    loop_monitor_enabled: bool = False
+    """量測 event loop lag 並記錄阻塞 event loop 的 stack，見 shared.loop_monitor"""
+    loop_block_threshold_ms: float = 100.0
+    """event loop lag 超過此值(毫秒)時視為阻塞"""
+    profile_sample_rate: float = 0.0
+    """以取樣 profiler 記錄的 graph run 比例(0~1)，configurable 的 profile=True 不受此限，見 shared.profiling"""
+    profile_interval_ms: float = 10.0
+    profile_memory: bool = False
+    """profile 時在每個 node 前後取 tracemalloc snapshot；tracemalloc 執行期間整個 process 的記憶體配置都會變慢"""
+    profile_dir: Optional[str] = None
+    """profile 輸出目錄，未設定時為 LOG_DIR/profiles"""
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "Settings":
+        errors = []
+
+        bootstrap = environ.get("QDRANT_COLLECTION_BOOTSTRAP", "verify")
+        if bootstrap not in ("verify", "migrate", "off"):
+            errors.append(f"QDRANT_COLLECTION_BOOTSTRAP 必須是 verify、migrate 或 off，而不是 {bootstrap!r}")
+        quantization = environ.get("QDRANT_VECTOR_QUANTIZATION", "none")
+        if quantization not in ("none", "scalar", "binary"):
+            errors.append(f"QDRANT_VECTOR_QUANTIZATION 必須是 none、scalar 或 binary，而不是 {quantization!r}")
+
+        collections = {}
+        for route, env_name in COLLECTION_ROUTES.items():
+            name = environ.get(env_name, "").strip()
+            if name:
+                collections[route] = name
+            elif env_name in environ:
+                errors.append(f"{env_name} 不可為空白")
+
+        qdrant_url = environ.get("QDRANT_URL", "")
+        qdrant_path = environ.get("QDRANT_PATH") or None
+        if qdrant_url and qdrant_url != ":memory:" and not qdrant_url.startswith(("http://", "https://")):
+            errors.append(f"QDRANT_URL 必須是 http(s):// 開頭的網址或 :memory:，而不是 {qdrant_url!r}")
+
+        warmup = environ.get("WARMUP_ON_STARTUP", "false").lower()
+        if warmup not in ("1", "true", "yes", "0", "false", "no", ""):
+            errors.append(f"WARMUP_ON_STARTUP 必須是 true 或 false，而不是 {warmup!r}")
+        try:
+            warmup_configurable = json.loads(environ.get("WARMUP_CONFIGURABLE") or "{}")
+            if not isinstance(warmup_configurable, dict):
+                raise ValueError("不是 JSON object")
+        except ValueError as e:
+            errors.append(f"WARMUP_CONFIGURABLE 必須是 JSON object: {e}")
+            warmup_configurable = {}
+
+        gateway = environ.get("LLM_GATEWAY_ENABLED", "true").lower()
+        if gateway not in ("1", "true", "yes", "0", "false", "no", ""):
+            errors.append(f"LLM_GATEWAY_ENABLED 必須是 true 或 false，而不是 {gateway!r}")
+        llm_rate_limits = {}
+        try:
+            raw_limits = json.loads(environ.get("LLM_RATE_LIMITS") or "{}")
+            if not isinstance(raw_limits, dict):
+                raise ValueError("不是 JSON object")
+            for model, limits in raw_limits.items():
+                unknown = set(limits) - set(RATE_LIMIT_KEYS) if isinstance(limits, dict) else None
+                if unknown is None or unknown or not all(isinstance(v, (int, float)) and v > 0 for v in limits.values()):
+                    raise ValueError(f"{model} 的限制必須是 {', '.join(RATE_LIMIT_KEYS)} 的正數")
+                llm_rate_limits[model] = MappingProxyType(dict(limits))
+        except ValueError as e:
+            errors.append(f"LLM_RATE_LIMITS 格式錯誤: {e}")
+
+        embedding_max_concurrency = environ.get("EMBEDDING_MAX_CONCURRENCY", "8")
+        if not embedding_max_concurrency.isdigit() or int(embedding_max_concurrency) < 1:
+            errors.append(f"EMBEDDING_MAX_CONCURRENCY 必須是正整數，而不是 {embedding_max_concurrency!r}")
+            embedding_max_concurrency = "8"
+
+        loop_monitor = environ.get("LOOP_MONITOR_ENABLED", "false").lower()
+        if loop_monitor not in ("1", "true", "yes", "0", "false", "no", ""):
+            errors.append(f"LOOP_MONITOR_ENABLED 必須是 true 或 false，而不是 {loop_monitor!r}")
+        try:
+            loop_block_threshold_ms = float(environ.get("LOOP_BLOCK_THRESHOLD_MS") or 100)
+            if loop_block_threshold_ms <= 0:
+                raise ValueError
+        except ValueError:
+            errors.append(f"LOOP_BLOCK_THRESHOLD_MS 必須是正數，而不是 {environ.get('LOOP_BLOCK_THRESHOLD_MS')!r}")
+            loop_block_threshold_ms = 100.0
+
+        try:
+            profile_sample_rate = float(environ.get("PROFILE_SAMPLE_RATE") or 0)
+            if not 0 <= profile_sample_rate <= 1:
+                raise ValueError
+        except ValueError:
+            errors.append(f"PROFILE_SAMPLE_RATE 必須是 0~1 的數值，而不是 {environ.get('PROFILE_SAMPLE_RATE')!r}")
+            profile_sample_rate = 0.0
+        try:
+            profile_interval_ms = float(environ.get("PROFILE_INTERVAL_MS") or 10)
+            if profile_interval_ms <= 0:
+                raise ValueError
+        except ValueError:
+            errors.append(f"PROFILE_INTERVAL_MS 必須是正數，而不是 {environ.get('PROFILE_INTERVAL_MS')!r}")
+            profile_interval_ms = 10.0
+        profile_memory = environ.get("PROFILE_MEMORY", "false").lower()
+        if profile_memory not in ("1", "true", "yes", "0", "false", "no", ""):
+            errors.append(f"PROFILE_MEMORY 必須是 true 或 false，而不是 {profile_memory!r}")
+
+        if errors:
+            raise SettingsError("環境變數設定錯誤:\n  " + "\n  ".join(errors))
+        return cls(
+            aws_region=environ.get("AWS_REGION") or None,
+            huggingface_cache_folder=environ.get("HUGGINGFACE_CACHE_FOLDER") or None,
+            qdrant_url=qdrant_url,
+            qdrant_api_key=environ.get("QDRANT_API_KEY") or None,
+            qdrant_path=qdrant_path,
+            qdrant_collection_bootstrap=bootstrap,
+            qdrant_vector_quantization=quantization,
+            collections=MappingProxyType(collections),
+            warmup_on_startup=warmup in ("1", "true", "yes"),
+            warmup_configurable=MappingProxyType(warmup_configurable),
+            llm_gateway_enabled=gateway in ("1", "true", "yes", ""),
+            llm_rate_limits=MappingProxyType(llm_rate_limits),
+            embedding_max_concurrency=int(embedding_max_concurrency),
+            google_api_endpoint=environ.get("GOOGLE_API_ENDPOINT") or None,
+            loop_monitor_enabled=loop_monitor in ("1", "true", "yes"),
+            loop_block_threshold_ms=loop_block_threshold_ms,
+            profile_sample_rate=profile_sample_rate,
+            profile_interval_ms=profile_interval_ms,
+            profile_memory=profile_memory in ("1", "true", "yes"),
+            profile_dir=environ.get("PROFILE_DIR") or None,
+        )
+
+    def collection_name(self, provider: str, document_type: str) -> str:
+        """查詢路由表取得 collection 名稱(alias)"""
+        if provider not in PROVIDERS:
+            raise ValueError(f"不支援的 embedding provider: {provider}")
+        route = (provider, document_type) if (provider, document_type) in COLLECTION_ROUTES else (provider, DEFAULT_DOCUMENT_TYPE)
+        try:
+            return self.collections[route]
+        except KeyError:
+            raise KeyError(COLLECTION_ROUTES[route]) from None
+
+    def client_kwargs(self, provider: str) -> dict[str, object]:
+        """建立 provider 的聊天 / 嵌入模型時額外傳入的參數；Bedrock 的替代 endpoint 由 boto3 讀取 AWS_ENDPOINT_URL_BEDROCK_RUNTIME"""
+        if provider == "google_genai" and self.google_api_endpoint:
+            return {"client_options": {"api_endpoint": self.google_api_endpoint}, "transport": "rest"}
+        return {}
+
+    def require(self, name: str) -> str:
+        """必要的設定值，未設定時以環境變數名稱拋出 KeyError(與直接讀取 os.environ 相同)"""
+        value = getattr(self, name)
+        if value is None:
+            raise KeyError(name.upper())
+        return value
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings.from_env()
+
+
+def reload_settings() -> Settings:
+    get_settings.cache_clear()
+    return get_settings()
@@ -0,0 +1,204 @@
+"""
+ReAct agent 的推測式檢索(speculative retrieval)。
+
+kb_retrieval_agent 第一次 call_model 幾乎都會決定呼叫檢索 tool，Qdrant 檢索要等 LLM 回應後才開始。
+開啟 speculative_retrieval 後，call_model 在呼叫 LLM 的同時，以使用者原始訊息向可能用到的 collection 預先檢索；
+tool 被呼叫時若查詢內容與原始訊息相近，直接使用預先檢索的結果，未被使用的預先檢索會被取消。
+
+    start_prefetch(config, text, document_types)  call_model 呼叫 LLM 前啟動
+    take_prefetched(config, collection, query, k, doc_filter)  tool 檢索前取用，不可用時回傳 None
+    cancel_prefetch(config, reason)  LLM 沒有呼叫 tool 或進入下一輪時取消剩餘的預先檢索
+
+預先檢索取 PREFETCH_K 筆(與 MMR 的 fetch_k 相同，前 k 筆即為 k 筆檢索的結果)，
+tool 帶有 doc_name 篩選時從中挑出符合的文件，不足 k 筆時改為實際檢索。
+
+metrics:
+    rag_cache_requests_total{cache="speculative_retrieval"}  命中率
+    rag_speculative_prefetch_total{outcome=...}              hit / dissimilar / filtered / error / cancelled
+    rag_speculative_saved_seconds                            命中時省下的檢索時間(檢索耗時扣除 tool 等待的時間)
+"""
+
+import asyncio
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Optional
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig
+
+from shared import retrieval
+from shared.base_configuration import BaseConfiguration
+from shared.instrumentation import metrics, record_cache
+from shared.logger import kb_retrieval_agent_logger as logger
+
+PREFETCH_K = 20
+"""預先檢索的筆數，與 MMR 預設的 fetch_k 相同"""
+
+PREFETCH_TTL = 120.0
+"""預先檢索保留的秒數，graph 中途失敗沒有取消時由下一次 start_prefetch 清除"""
+
+
+@dataclass
+class Prefetch:
+    """單一 collection 的預先檢索"""
+
+    collection: str
+    query: str
+    task: asyncio.Task
+    started: float = field(default_factory=time.perf_counter)
+    finished: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+
+_pending: dict[str, dict[str, Prefetch]] = {}
+"""thread_id → collection 名稱 → 預先檢索"""
+
+
+def _thread_id(config: RunnableConfig) -> Optional[str]:
+    return ((config or {}).get("configurable") or {}).get("thread_id")
+
+
+def _bigrams(text: str) -> set[str]:
+    text = "".join(ch for ch in unicodedata.normalize("NFKC", text).casefold() if ch.isalnum())
+    return {text[i : i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def similarity(prefetched: str, query: str) -> float:
+    """tool 查詢內容有多少比例出現在使用者原始訊息中(字元 bigram 的包含率)
+
+    tool 的參數通常是 LLM 從使用者訊息中擷取或改寫的片段，因此以包含率而非對稱的相似度比較
+    """
+    query_grams = _bigrams(query)
+    if not query_grams:
+        return 0.0
+    return len(query_grams & _bigrams(prefetched)) / len(query_grams)
+
+
+def _record(outcome: str, prefetch: Prefetch) -> None:
+    metrics.inc("rag_speculative_prefetch_total", collection=prefetch.collection, outcome=outcome)
+    if outcome != "cancelled":
+        record_cache("speculative_retrieval", outcome == "hit")
+
+
+async def _search(config: RunnableConfig, text: str) -> list[Document]:
+    with retrieval.get_retriever(config) as retriever:
+        return await retriever.ainvoke(
+            text, RunnableConfig(configurable={"search_kwargs": {"k": PREFETCH_K, "filter": None}})
+        )
+
+
+def _finished(prefetch: Prefetch, task: asyncio.Task) -> None:
+    prefetch.finished = time.perf_counter()
+    # 取出例外，取消或未被取用的預先檢索失敗時不會在 GC 時出現 "Task exception was never retrieved"
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug("預先檢索 %s 失敗: %r", prefetch.collection, task.exception())
+
+
+def _expire(now: float) -> None:
+    for thread_id in [t for t, entries in _pending.items() if all(now - p.started > PREFETCH_TTL for p in entries.values())]:
+        for prefetch in _pending.pop(thread_id).values():
+            prefetch.task.cancel()
+
+
+def start_prefetch(config: RunnableConfig, text: str, document_types: Iterable[str]) -> None:
+    """以使用者原始訊息向各 document_type 的 collection 預先檢索，同一個 collection 只檢索一次
+
+    必須在 graph 的 event loop 中呼叫；config 沒有 thread_id 時不做任何事
+    """
+    thread_id = _thread_id(config)
+    if not thread_id or not text.strip():
+        return
+    cancel_prefetch(config, "restarted")
+    _expire(time.perf_counter())
+
+    configurable = dict(config.get("configurable") or {})
+    entries: dict[str, Prefetch] = {}
+    for document_type in document_types:
+        prefetch_config = RunnableConfig(configurable={**configurable, "document_type": document_type})
+        try:
+            collection = retrieval.get_collection_name(BaseConfiguration.from_runnable_config(prefetch_config))
+        except KeyError as e:
+            # 該 document_type 的 collection 環境變數未設定，預先檢索不可影響 call_model
+            logger.warning("[thread_id=%s] %s 的 collection 未設定(%s)，略過預先檢索", thread_id, document_type, e)
+            continue
+        if collection in entries:
+            continue
+        prefetch = Prefetch(collection=collection, query=text, task=asyncio.create_task(_search(prefetch_config, text)))
+        prefetch.task.add_done_callback(lambda task, p=prefetch: _finished(p, task))
+        entries[collection] = prefetch
+    _pending[thread_id] = entries
+    logger.info("[thread_id=%s] 預先檢索 %s", thread_id, list(entries))
+
+
+def cancel_prefetch(config: RunnableConfig, reason: str = "unused") -> None:
+    """取消 thread 中尚未被取用的預先檢索"""
+    thread_id = _thread_id(config)
+    for prefetch in (_pending.pop(thread_id, None) or {}).values() if thread_id else ():
+        prefetch.task.cancel()
+        _record("cancelled", prefetch)
+        logger.info("[thread_id=%s] 取消預先檢索 %s(%s)", thread_id, prefetch.collection, reason)
+
+
+def _doc_names(doc_filter: Any) -> Optional[set[str]]:
+    """取出 doc_name_filter 產生的 MatchAny 篩選值，其他篩選條件無法在本機套用時回傳 None"""
+    from qdrant_client.models import MatchAny
+
+    conditions = getattr(doc_filter, "must", None) or []
+    if len(conditions) != 1 or getattr(conditions[0], "key", None) != "metadata.doc_name":
+        return None
+    match = conditions[0].match
+    return set(match.any) if isinstance(match, MatchAny) else None
+
+
+async def take_prefetched(
+    config: RunnableConfig,
+    collection: str,
+    query: str,
+    k: int,
+    doc_filter: Any = None,
+    min_similarity: float = 0.5,
+) -> Optional[list[Document]]:
+    """取用 collection 的預先檢索結果，沒有預先檢索或結果不適用時回傳 None(呼叫端改為實際檢索)"""
+    thread_id = _thread_id(config)
+    prefetch = (_pending.get(thread_id) or {}).pop(collection, None) if thread_id else None
+    if prefetch is None:
+        return None
+
+    score = similarity(prefetch.query, query)
+    if score < min_similarity:
+        prefetch.task.cancel()
+        _record("dissimilar", prefetch)
+        logger.info("[thread_id=%s] 查詢內容差異過大(%.2f)，不使用預先檢索", thread_id, score)
+        return None
+
+    wait_start = time.perf_counter()
+    try:
+        docs = await prefetch.task
+    except asyncio.CancelledError:
+        # 呼叫端本身被取消時往外拋，只有預先檢索被取消時才改為實際檢索
+        if asyncio.current_task().cancelling():
+            raise
+        _record("error", prefetch)
+        return None
+    except Exception:
+        logger.exception("[thread_id=%s] 預先檢索失敗", thread_id)
+        _record("error", prefetch)
+        return None
+    waited = time.perf_counter() - wait_start
+
+    if doc_filter is not None:
+        names = _doc_names(doc_filter)
+        docs = [doc for doc in docs if names is not None and doc.metadata.get("doc_name") in names]
+        if len(docs) < k:
+            _record("filtered", prefetch)
+            return None
+
+    saved = max(prefetch.duration - waited, 0.0)
+    _record("hit", prefetch)
+    metrics.observe("rag_speculative_saved_seconds", saved, collection=collection)
+    logger.info("[thread_id=%s] 使用預先檢索 %s，省下 %.0f ms", thread_id, collection, saved * 1000)
+    return docs[:k]
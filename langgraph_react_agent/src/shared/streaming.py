@@ -0,0 +1,79 @@
+"""
+回應串流：LLM 產生的 token 與檢索到的文件引用(citation)提早送到前端。
+
+    stream_mode="messages"  respond / call_model 以 astream 呼叫模型，每個 token chunk 產生時即送出；
+                            generate_query 等內部呼叫加上 NOSTREAM_TAGS，不會送到前端
+    stream_mode="custom"    檢索完成後立即送出 {"type": "citations", ...}，不必等 LLM 回應完成
+
+time-to-first-token 由 shared.instrumentation 記錄:
+    rag_llm_ttft_seconds    單次 LLM 呼叫開始到第一個 token
+    rag_graph_ttft_seconds  graph 開始執行到第一個送到前端的 token(使用者感受到的等待時間)
+
+用法(client 端)：
+    async for mode, chunk in graph.astream(inputs, config, stream_mode=["messages", "custom"]):
+        match mode:
+            case "messages": message_chunk, metadata = chunk
+            case "custom": chunk["citations"]
+"""
+
+from typing import Any, Optional, Sequence, Union
+
+from langchain_core.documents import Document
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.messages import AIMessage, AIMessageChunk, message_chunk_to_message
+from langchain_core.runnables import Runnable, RunnableConfig
+from langgraph.config import get_stream_writer
+from langgraph.constants import TAG_NOSTREAM
+
+from shared.doc_cache import DocRef
+
+
+NOSTREAM_TAGS = [TAG_NOSTREAM]
+"""加在不應以 stream_mode="messages" 送到前端的模型呼叫上，例如產生檢索查詢的 structured output"""
+
+
+async def astream_message(
+    model: Runnable[LanguageModelInput, Any], input: LanguageModelInput, config: Optional[RunnableConfig] = None
+) -> AIMessage:
+    """以 astream 呼叫模型並合併為完整的 AIMessage
+
+    token 經由 callback 送到 graph 的 messages stream，回傳值與 ainvoke 相同(包含 tool_calls)
+    """
+    aggregated: Optional[AIMessageChunk] = None
+    async for chunk in model.astream(input, config):
+        aggregated = chunk if aggregated is None else aggregated + chunk
+    if aggregated is None:
+        return AIMessage(content="")
+    return message_chunk_to_message(aggregated)
+
+
+def citations(docs: Sequence[Union[Document, DocRef]]) -> list[dict[str, Any]]:
+    """將檢索結果轉為前端顯示用的引用清單，DocRef 只有 collection、point id 與分數"""
+    items = []
+    for doc in docs:
+        if isinstance(doc, DocRef):
+            item = {"collection": doc.collection, "point_id": doc.point_id, "score": doc.score}
+        else:
+            metadata = doc.metadata or {}
+            item = {
+                "doc_name": metadata.get("doc_name"),
+                "page": metadata.get("page"),
+                "source": metadata.get("source"),
+                "collection": metadata.get("_collection_name"),
+                "point_id": str(metadata.get("_id", doc.id or "")) or None,
+                "score": metadata.get("_score"),
+            }
+        items.append({k: v for k, v in item.items() if v is not None})
+    return items
+
+
+def emit_citations(docs: Sequence[Union[Document, DocRef]], **extra: Any) -> None:
+    """在 graph 執行中以 custom stream 送出引用
+
+    不在 graph 執行中(例如直接呼叫 tool)或呼叫端未訂閱 custom stream 時不做任何事
+    """
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        return
+    writer({"type": "citations", "citations": citations(docs), **extra})
@@ -0,0 +1,87 @@
+"""
+Qdrant 向量量化設定。
+
+    scalar  float32 → int8，記憶體約為 1/4，準確度損失小
+    binary  每個維度 1 bit，記憶體約為 1/32，適合 1024 維以上的模型；需搭配 oversampling + rescore
+
+量化向量常駐記憶體(always_ram)，原始 float32 向量放在磁碟，rescore 時才讀取。
+檢索時先以量化向量取 k * oversampling 筆候選，再以原始向量重新計分取前 k 筆。
+
+檢索參數在每次查詢時才併入 search_kwargs(見 with_search_params)：configurable 的 search_kwargs 會整個取代 retriever 的
+search_kwargs，kb_retrieval_agent 的 tool 每次都帶 k 與 filter，若只放在預設的 search_kwargs 會被覆蓋而失去 oversampling 與 rescore。
+"""
+
+from typing import Any, Literal, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStoreRetriever
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+QuantizationMode = Literal["none", "scalar", "binary"]
+
+
+def quantization_config(mode: QuantizationMode) -> Optional[models.QuantizationConfig]:
+    """collection 建立或更新時使用的量化設定"""
+    match mode:
+        case "none":
+            return None
+        case "scalar":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8,
+                    # 捨棄最極端的 1% 數值，讓 int8 的範圍更貼近實際分布
+                    quantile=0.99,
+                    always_ram=True,
+                )
+            )
+        case "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+        case _:
+            raise ValueError(f"不支援的量化方式: {mode}")
+
+
+def quantization_search_params(mode: QuantizationMode, rescore: bool, oversampling: float) -> Optional[models.SearchParams]:
+    """檢索時的量化參數；mode 為 none 時回傳 None，沿用 Qdrant 預設"""
+    if mode == "none":
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(ignore=False, rescore=rescore, oversampling=oversampling)
+    )
+
+
+def with_search_params(search_kwargs: dict[str, Any], search_params: Optional[models.SearchParams]) -> dict[str, Any]:
+    """查詢時將量化的檢索參數併入 search_kwargs；呼叫端已指定 search_params 時以呼叫端為準"""
+    if search_params is None or "search_params" in search_kwargs:
+        return search_kwargs
+    return {**search_kwargs, "search_params": search_params}
+
+
+class QuantizedVectorStoreRetriever(VectorStoreRetriever):
+    """查詢時一律帶上量化檢索參數的 VectorStoreRetriever，search_kwargs 經由 configurable 取代時仍然有效"""
+
+    search_params: Optional[models.SearchParams] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, **kwargs: Any
+    ) -> list[Document]:
+        kwargs = with_search_params(self.search_kwargs | kwargs, self.search_params)
+        return super()._get_relevant_documents(query, run_manager=run_manager, **kwargs)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun, **kwargs: Any
+    ) -> list[Document]:
+        kwargs = with_search_params(self.search_kwargs | kwargs, self.search_params)
+        return await super()._aget_relevant_documents(query, run_manager=run_manager, **kwargs)
+
+
+def apply_quantization(client: QdrantClient, collection_name: str, mode: QuantizationMode) -> None:
+    """更新既有 collection 的量化設定，Qdrant 會在背景重建量化向量"""
+    config = quantization_config(mode)
+    client.update_collection(
+        collection_name=collection_name,
+        quantization_config=config if config is not None else models.Disabled.DISABLED,
+        # 原始向量改放磁碟，記憶體只保留量化向量
+        vectors_config={"dense_text": models.VectorParamsDiff(on_disk=config is not None)},
+    )
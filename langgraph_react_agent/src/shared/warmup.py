@@ -0,0 +1,97 @@
+"""
+graph 載入後的背景預熱。
+
+graph 模組只 import 執行流程需要的套件，嵌入模型(FlagEmbedding / torch / langchain_aws)、聊天模型與
+qdrant_client 都延後到第一次使用才載入；WARMUP_ON_STARTUP=true 時，graph 載入後會在背景 thread
+依 WARMUP_CONFIGURABLE(未指定的欄位使用該 graph 的預設值)預先完成：
+
+    embedding  載入嵌入模型；本機模型另外編碼一次，讓權重進入記憶體
+    chat_model 建立 query_model、response_model 的 client
+    qdrant     建立連線、解析 collection alias 並檢查 collection 設定(retriever_provider=local 時開啟本機索引)
+
+第一個請求不必再付這些成本，worker 也不需等預熱完成才能接受請求。各步驟耗時記錄在 rag_stage_duration_seconds(stage=warmup_*)。
+"""
+
+import threading
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+from shared.instrumentation import stage
+from shared.logger import retrieval_graph_logger as logger
+from shared.settings import get_settings
+
+_started: set[str] = set()
+_started_lock = threading.Lock()
+
+
+def _warm_embedding(configuration) -> None:
+    from shared import retrieval
+
+    embedding_model = retrieval.get_match_embedding(configuration.embedding_model)
+    if configuration.embedding_model.startswith(("BAAI/", "Microsoft/")):
+        # 本機模型第一次推論會配置記憶體與載入 kernel；遠端模型不送出請求，避免產生費用
+        dense = getattr(embedding_model, "dense", embedding_model)
+        dense.embed_query("warmup")
+
+
+def _warm_chat_models(configuration, load_chat_model: Callable[[str], Any]) -> None:
+    for model in {configuration.query_model, configuration.response_model}:
+        load_chat_model(model)
+
+
+def _warm_vector_store(configuration) -> None:
+    from shared import retrieval
+
+    match configuration.retriever_provider:
+        case "qdrant":
+            from shared.qdrant_collections import bootstrap_collection, configured_spec
+
+            # QDRANT_COLLECTION_BOOTSTRAP=migrate 只在預熱時建立或遷移 collection
+            bootstrap_collection(retrieval.get_qdrant_client(), configured_spec(configuration), allow_migrate=True)
+        case "local":
+            from shared.local_vector_store import open_collection
+
+            open_collection(retrieval.get_collection_name(configuration))
+
+
+def warm_up(configuration, load_chat_model: Callable[[str], Any]) -> dict[str, float]:
+    """依 configuration 預熱，回傳各步驟耗時(秒)；單一步驟失敗只記錄 warning，不影響其他步驟"""
+    steps = {
+        "embedding": lambda: _warm_embedding(configuration),
+        "chat_model": lambda: _warm_chat_models(configuration, load_chat_model),
+        "qdrant": lambda: _warm_vector_store(configuration),
+    }
+    timings = {}
+    for name, step in steps.items():
+        start = perf_counter()
+        try:
+            with stage(f"warmup_{name}"):
+                step()
+        except Exception:
+            logger.warning("預熱 %s 失敗，將在第一次使用時載入", name, exc_info=True)
+        timings[name] = perf_counter() - start
+    return timings
+
+
+def start_warm_up(graph_name: str, configuration_cls: type, load_chat_model: Callable[[str], Any]) -> Optional[threading.Thread]:
+    """WARMUP_ON_STARTUP=true 時在背景 thread 預熱 graph，每個 graph 只預熱一次"""
+    settings = get_settings()
+    if not settings.warmup_on_startup:
+        return None
+    with _started_lock:
+        if graph_name in _started:
+            return None
+        _started.add(graph_name)
+
+    def run() -> None:
+        configuration = configuration_cls.from_runnable_config({"configurable": dict(settings.warmup_configurable)})
+        timings = warm_up(configuration, load_chat_model)
+        logger.info(
+            "[%s] 預熱完成 %s",
+            graph_name,
+            ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in timings.items()),
+        )
+
+    thread = threading.Thread(target=run, name=f"warmup-{graph_name}", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,31 @@
+from shared.adaptive_k import Cutoff, choose_k
+
+
+def test_choose_k_empty() -> None:
+    assert choose_k([], [], higher_is_better=True) == Cutoff(0, "empty")
+
+
+def test_choose_k_relative_threshold_on_distances() -> None:
+    # Euclid 距離越小越好，第 3 筆與第一名差距超過 30%
+    cutoff = choose_k([1.0, 1.1, 1.5, 1.6], [10] * 4, higher_is_better=False, score_gap=0)
+    assert cutoff == Cutoff(2, "threshold")
+
+
+def test_choose_k_zero_best_distance_uses_spread() -> None:
+    # 第一名距離為 0 時不可把其後所有文件都截斷
+    cutoff = choose_k([0.0, 0.05, 0.1, 1.0], [10] * 4, higher_is_better=False, min_k=1, score_gap=0)
+    assert cutoff == Cutoff(3, "threshold")
+
+
+def test_choose_k_identical_scores_keeps_all() -> None:
+    assert choose_k([0.0, 0.0, 0.0], [10] * 3, higher_is_better=False, min_k=1) == Cutoff(3, "max")
+
+
+def test_choose_k_score_gap() -> None:
+    cutoff = choose_k([0.9, 0.88, 0.87, 0.4, 0.39], [10] * 5, higher_is_better=True, relative_threshold=0)
+    assert cutoff == Cutoff(3, "gap")
+
+
+def test_choose_k_token_budget_respects_min_k() -> None:
+    cutoff = choose_k([0.9, 0.9, 0.9, 0.9], [100] * 4, higher_is_better=True, min_k=2, token_budget=150)
+    assert cutoff == Cutoff(2, "budget")
@@ -0,0 +1,36 @@
+from types import MappingProxyType
+
+import pytest
+
+from kb_retrieval_agent.configuration import Configuration
+from shared.base_configuration import BaseConfiguration
+
+
+def _config(**configurable) -> dict:
+    return {"configurable": configurable}
+
+
+def test_same_configurable_returns_cached_instance() -> None:
+    config = _config(embedding_model="Microsoft/intfloat/multilingual-e5-large", retrieve_limit=7)
+    assert BaseConfiguration.from_runnable_config(config) is BaseConfiguration.from_runnable_config(config)
+
+
+def test_unknown_keys_are_ignored() -> None:
+    configuration = BaseConfiguration.from_runnable_config(_config(thread_id="t", retrieve_limit=3))
+    assert configuration.retrieve_limit == 3
+
+
+def test_shared_instance_fields_are_read_only() -> None:
+    config = _config(search_kwargs={"k": 3}, speculative_document_types=["insurance"])
+    configuration = Configuration.from_runnable_config(config)
+    assert isinstance(configuration.search_kwargs, MappingProxyType)
+    assert configuration.speculative_document_types == ("insurance",)
+    with pytest.raises(TypeError):
+        configuration.search_kwargs["k"] = 100
+    assert Configuration.from_runnable_config(config).search_kwargs == {"k": 3}
+
+
+def test_default_fields_are_read_only_too() -> None:
+    configuration = Configuration.from_runnable_config(_config())
+    assert isinstance(configuration.search_kwargs, MappingProxyType)
+    assert isinstance(configuration.speculative_document_types, tuple)
@@ -0,0 +1,32 @@
+from benchmark.harness import GraphReport, format_report, percentile, summarize_latency
+
+
+def test_percentile_interpolates() -> None:
+    assert percentile([], 50) == 0.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert percentile([1.0, 2.0, 3.0, 4.0], 100) == 4.0
+
+
+def test_summarize_latency_in_ms() -> None:
+    summary = summarize_latency([0.1, 0.2, 0.3])
+    assert summary["p50"] == 200.0
+    assert summary["max"] == 300.0
+
+
+def test_format_report_lists_errors() -> None:
+    report = GraphReport(
+        graph="retrieval_graph",
+        requests=10,
+        errors=7,
+        concurrency=2,
+        wall_seconds=1.0,
+        throughput_rps=3.0,
+        latency_ms=summarize_latency([0.1]),
+        peak_traced_mb=1.0,
+        max_rss_mb=100.0,
+        breakdown_ms={},
+        error_counts={"KeyError: 'QDRANT_COLLECTION_X'": 6, "TimeoutError: ": 1},
+    )
+    text = format_report([report])
+    assert "[retrieval_graph] 錯誤(2 種)" in text
+    assert "KeyError: 'QDRANT_COLLECTION_X'" in text
@@ -0,0 +1,76 @@
+import pytest
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from shared import chunk_store
+from shared.chunk_store import (
+    ChunkStore,
+    ChunkStoreClient,
+    append_chunks,
+    build_from_qdrant,
+    get_chunk_store,
+    write_chunk_store,
+)
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHUNK_STORE_DIR", str(tmp_path))
+    chunk_store._stores.clear()
+    yield tmp_path
+    chunk_store._stores.clear()
+
+
+def test_round_trip(tmp_path) -> None:
+    payloads = {
+        "b": {"page_content": "第二段", "metadata": {"doc_name": "b.pdf", "page": 2}},
+        "a": {"page_content": "", "metadata": {}},
+    }
+    write_chunk_store(tmp_path / "c", payloads)
+    store = ChunkStore(tmp_path / "c")
+
+    assert len(store) == 2
+    assert store.payload("b") == payloads["b"]
+    assert store.payload("a") == payloads["a"]
+    assert store.payload("missing") is None
+    assert dict(store.items()) == payloads
+
+
+def test_empty_store(tmp_path) -> None:
+    write_chunk_store(tmp_path / "c", {})
+    assert len(ChunkStore(tmp_path / "c")) == 0
+
+
+def test_appended_segments_are_compacted_newest_first(store_dir) -> None:
+    append_chunks("c", [1, 2], [Document("舊", metadata={"v": 1}), Document("二")])
+    append_chunks("c", [1], [Document("新", metadata={"v": 2})])
+    assert len(list((store_dir / "c.segments").iterdir())) == 2
+
+    store = get_chunk_store("c")
+    assert store.payload(1) == {"page_content": "新", "metadata": {"v": 2}}
+    assert store.payload(2)["page_content"] == "二"
+    assert not list((store_dir / "c.segments").iterdir())
+
+    append_chunks("c", [3], [Document("三")])
+    assert get_chunk_store("c") is not store
+    assert len(get_chunk_store("c")) == 3
+
+
+def test_client_fills_payloads_from_store_and_falls_back_to_qdrant(store_dir) -> None:
+    client = QdrantClient(":memory:")
+    client.create_collection("c", vectors_config={"dense_text": models.VectorParams(size=2, distance=models.Distance.EUCLID)})
+    client.upsert(
+        "c",
+        [
+            models.PointStruct(id=i, vector={"dense_text": [float(i), 0.0]}, payload={"page_content": f"qdrant {i}", "metadata": {}})
+            for i in (1, 2)
+        ],
+    )
+    build_from_qdrant(client, "c")
+    append_chunks("c", [1], [Document("本機")])
+    client.upsert("c", [models.PointStruct(id=3, vector={"dense_text": [3.0, 0.0]}, payload={"page_content": "qdrant 3", "metadata": {}})])
+
+    wrapped = ChunkStoreClient(client, get_chunk_store("c"))
+    points = wrapped.query_points("c", query=[0.0, 0.0], using="dense_text", with_payload=True, limit=3).points
+    assert [p.payload["page_content"] for p in points] == ["本機", "qdrant 2", "qdrant 3"]
@@ -0,0 +1,90 @@
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from shared.collection_aliases import (
+    check_version,
+    cleanup,
+    list_versions,
+    promote,
+    resolve_alias_now,
+    rollback,
+    swap_alias,
+    versioned_collection_name,
+)
+
+VERSIONS = ("v20250101000000", "v20250201000000", "v20250301000000")
+
+
+def _create(client: QdrantClient, name: str, count: int = 3) -> None:
+    client.create_collection(name, vectors_config={"dense_text": models.VectorParams(size=2, distance=models.Distance.EUCLID)})
+    if count:
+        client.upsert(name, [models.PointStruct(id=i, vector={"dense_text": [float(i), 1.0]}) for i in range(count)])
+
+
+@pytest.fixture
+def client() -> QdrantClient:
+    client = QdrantClient(":memory:")
+    for version in VERSIONS:
+        _create(client, versioned_collection_name("kb", version))
+    _create(client, "kb__latest")
+    _create(client, "kb_other__v20250101000000")
+    return client
+
+
+def test_version_names() -> None:
+    assert versioned_collection_name("kb", "v20250101000000") == "kb__v20250101000000"
+    assert check_version("v20250101000000") == "v20250101000000"
+    for bad in ("20250101000000", "v2025", "v20250101000000x", "latest"):
+        with pytest.raises(ValueError):
+            check_version(bad)
+
+
+def test_list_versions_ignores_other_names(client) -> None:
+    assert list_versions(client, "kb") == [versioned_collection_name("kb", v) for v in VERSIONS]
+
+
+def test_swap_rollback_and_cleanup(client) -> None:
+    first, second, third = (versioned_collection_name("kb", v) for v in VERSIONS)
+    assert swap_alias(client, "kb", second) is None
+    assert swap_alias(client, "kb", third) == second
+    assert resolve_alias_now(client, "kb") == third
+
+    assert rollback(client, "kb") == second
+    assert resolve_alias_now(client, "kb") == second
+    assert rollback(client, "kb") == first
+    with pytest.raises(ValueError):
+        rollback(client, "kb")
+
+    swap_alias(client, "kb", third)
+    assert cleanup(client, "kb", keep=1) == [first]
+    assert list_versions(client, "kb") == [second, third]
+
+
+def test_swap_requires_replace_for_existing_collection() -> None:
+    client = QdrantClient(":memory:")
+    _create(client, "kb")
+    _create(client, "kb__v20250101000000")
+
+    with pytest.raises(ValueError):
+        swap_alias(client, "kb", "kb__v20250101000000")
+    assert client.collection_exists("kb")
+
+    swap_alias(client, "kb", "kb__v20250101000000", replace_collection=True)
+    assert resolve_alias_now(client, "kb") == "kb__v20250101000000"
+
+
+def test_promote_rejects_smaller_or_empty_version() -> None:
+    client = QdrantClient(":memory:")
+    _create(client, "kb__v20250101000000", count=10)
+    _create(client, "kb__v20250201000000", count=5)
+    _create(client, "kb__v20250301000000", count=0)
+    swap_alias(client, "kb", "kb__v20250101000000")
+
+    report = promote(client, "kb", "v20250201000000")
+    assert not report.ok and report.live_count == 10
+    assert not promote(client, "kb", "v20250301000000").ok
+    assert resolve_alias_now(client, "kb") == "kb__v20250101000000"
+
+    assert promote(client, "kb", "v20250201000000", min_count_ratio=0.5).ok
+    assert resolve_alias_now(client, "kb") == "kb__v20250201000000"
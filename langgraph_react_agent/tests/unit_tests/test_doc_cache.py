@@ -0,0 +1,49 @@
+import asyncio
+import threading
+
+from langchain_core.documents import Document
+
+from shared import retrieval
+from shared.doc_cache import DocCache, DocRef, aresolve_docs, resolve_docs, to_doc_refs
+
+
+def _doc(point_id: str) -> Document:
+    return Document(page_content=f"內容 {point_id}", metadata={"_id": point_id, "_collection_name": "c", "doc_name": "d"})
+
+
+def test_resolve_docs_from_cache() -> None:
+    cache = DocCache()
+    refs = to_doc_refs([_doc("1"), _doc("2")], cache)
+    assert [doc.page_content for doc in resolve_docs(refs, cache)] == ["內容 1", "內容 2"]
+
+
+def test_doc_cache_evicts_least_recently_used() -> None:
+    cache = DocCache(maxsize=2)
+    refs = to_doc_refs([_doc("1"), _doc("2")], cache)
+    cache.get(refs[0])
+    to_doc_refs([_doc("3")], cache)
+    assert cache.get(refs[1]) is None
+    assert cache.get(refs[0]) is not None
+
+
+def test_aresolve_docs_fetches_misses_off_the_event_loop(monkeypatch) -> None:
+    threads = []
+
+    def fetch_documents(collection: str, point_ids: list[str]) -> dict[str, Document]:
+        threads.append(threading.get_ident())
+        return {point_id: _doc(point_id) for point_id in point_ids if point_id != "missing"}
+
+    monkeypatch.setattr(retrieval, "fetch_documents", fetch_documents)
+    cache = DocCache()
+    cached = to_doc_refs([_doc("1")], cache)[0]
+    items = [cached, DocRef("c", "2"), Document(page_content="原樣"), DocRef("c", "missing")]
+
+    async def main() -> list[Document]:
+        loop_thread = threading.get_ident()
+        docs = await aresolve_docs(items, cache)
+        assert threads and loop_thread not in threads
+        return docs
+
+    docs = asyncio.run(main())
+    assert [doc.page_content for doc in docs] == ["內容 1", "內容 2", "原樣"]
+    assert cache.get(DocRef("c", "2")) is not None
@@ -0,0 +1,72 @@
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from shared import doc_name_index
+from shared.doc_name_index import DOC_NAME_KEY, DocNameIndex, doc_name_filter, get_doc_name_index, save_doc_names
+
+NAMES = ["台幣轉帳_TWRBM_001", "台幣存款概要", "基金申購 v2", "外幣轉帳"]
+
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("DOC_NAME_INDEX_DIR", str(tmp_path))
+    doc_name_index._indexes.clear()
+    doc_name_index._text_indexes.clear()
+    doc_name_index._builds.clear()
+    return tmp_path
+
+
+def test_resolve_exact_after_normalization() -> None:
+    assert DocNameIndex(NAMES).resolve("  台幣存款概要 ") == ("台幣存款概要",)
+    assert DocNameIndex(NAMES).resolve("基金申購V2") == ("基金申購 v2",)
+
+
+def test_resolve_prefers_names_containing_the_query() -> None:
+    assert DocNameIndex(NAMES).resolve("台幣轉帳") == ("台幣轉帳_TWRBM_001",)
+    assert DocNameIndex(NAMES).resolve("轉帳") == ("外幣轉帳", "台幣轉帳_TWRBM_001")
+
+
+def test_resolve_unknown_and_empty() -> None:
+    index = DocNameIndex(NAMES)
+    assert index.resolve("信用卡年費") == ()
+    assert index.resolve("   ") == ()
+
+
+def test_filter_uses_keyword_match_with_dictionary() -> None:
+    save_doc_names("c", NAMES)
+    doc_filter = doc_name_filter("c", "台幣轉帳")
+    assert doc_filter.must[0].key == DOC_NAME_KEY
+    assert doc_filter.must[0].match == models.MatchAny(any=["台幣轉帳_TWRBM_001"])
+    assert doc_name_filter("c", None) is None
+
+
+def _collection_without_text_field() -> QdrantClient:
+    """verify 模式下的既有 collection：沒有 doc_name_text，也沒有 doc_name 字典"""
+    client = QdrantClient(":memory:")
+    client.create_collection("sa", vectors_config={"dense_text": models.VectorParams(size=2, distance=models.Distance.EUCLID)})
+    client.upsert(
+        "sa",
+        [
+            models.PointStruct(id=i, vector={"dense_text": [float(i), 0.0]}, payload={"page_content": "", "metadata": {"doc_name": name}})
+            for i, name in enumerate(NAMES)
+        ],
+    )
+    return client
+
+
+def test_filter_without_dictionary_or_text_index_matches_metadata_doc_name() -> None:
+    client = _collection_without_text_field()
+    doc_filter = doc_name_filter("sa", "台幣轉帳", client)
+    assert doc_filter.must[0].key == DOC_NAME_KEY
+    assert isinstance(doc_filter.must[0].match, models.MatchText)
+    assert client.count("sa", count_filter=doc_filter, exact=True).count == 1
+
+
+def test_first_miss_builds_dictionary_from_qdrant(index_dir) -> None:
+    client = _collection_without_text_field()
+    doc_name_filter("sa", "台幣轉帳", client)
+    doc_name_index._builds["sa"].join(timeout=10)
+    assert (index_dir / "sa.json").exists()
+    assert get_doc_name_index("sa") is not None
+    assert doc_name_filter("sa", "台幣轉帳", client).must[0].match == models.MatchAny(any=["台幣轉帳_TWRBM_001"])
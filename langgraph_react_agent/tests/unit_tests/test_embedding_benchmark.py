@@ -0,0 +1,32 @@
+import weakref
+
+from benchmark import embedding as embedding_benchmark
+from shared import retrieval
+from shared.embedding_settings import LocalEmbeddingSettings
+
+E5 = "Microsoft/intfloat/multilingual-e5-large"
+
+
+class FakeModel:
+    def __init__(self, settings: LocalEmbeddingSettings):
+        self.settings = settings
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [[float(len(text))] for text in texts]
+
+
+def test_measure_loads_and_releases_a_model_per_sweep_point(monkeypatch) -> None:
+    models: list[weakref.ref] = []
+
+    def create(model: str, settings: LocalEmbeddingSettings) -> FakeModel:
+        instance = FakeModel(settings)
+        models.append(weakref.ref(instance))
+        return instance
+
+    monkeypatch.setattr(retrieval, "create_huggingface_embedding", create)
+    corpus = embedding_benchmark.load_corpus(None, 20)
+    runs = [embedding_benchmark.measure(E5, LocalEmbeddingSettings(batch_size=b, max_length=512), corpus) for b in (4, 8)]
+
+    assert len(models) == 2
+    assert all(ref() is None for ref in models)
+    assert all(run.texts_per_second > 0 and run.rss_mb > 0 for run in runs)
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from shared.llm_gateway import ModelLimiter, RateLimits, TokenBucket
+
+
+def test_token_bucket_allows_burst_then_waits() -> None:
+    bucket = TokenBucket(rate=10, capacity=10)
+    assert bucket.reserve(10) == 0.0
+    wait = bucket.reserve(5)
+    assert 0.4 < wait <= 0.5
+
+
+def test_token_bucket_refills_over_time() -> None:
+    bucket = TokenBucket(rate=100, capacity=10)
+    bucket.reserve(10)
+    bucket.updated -= 0.1
+    assert bucket.reserve(10) == 0.0
+
+
+def test_non_streaming_latency_does_not_shrink_limit() -> None:
+    limiter = ModelLimiter("m", RateLimits(initial_concurrency=8, max_concurrency=32))
+    for _ in range(20):
+        limiter.on_success(None, output_tokens=2000)
+    assert limiter.limit > 8
+
+
+def test_slow_first_chunk_shrinks_limit() -> None:
+    limiter = ModelLimiter("m", RateLimits(initial_concurrency=8, max_concurrency=32))
+    limiter.on_success(0.1)
+    limiter.on_success(1.0)
+    assert limiter.limit < 8.2
+
+
+def test_throttle_halves_limit_and_pauses() -> None:
+    limiter = ModelLimiter("m", RateLimits(initial_concurrency=8))
+    backoff = limiter.on_throttle(0)
+    assert limiter.limit == 4
+    assert limiter.paused_until > time.monotonic()
+    assert 0.5 <= backoff <= 1.5
+
+
+def test_acquire_respects_concurrency_and_priority() -> None:
+    async def main() -> list[str]:
+        limiter = ModelLimiter("m", RateLimits(initial_concurrency=1))
+        order: list[str] = []
+        await limiter.acquire("interactive", 0)
+
+        async def wait(name: str, priority: str) -> None:
+            await limiter.acquire(priority, 0)
+            order.append(name)
+            limiter.release()
+
+        tasks = [asyncio.create_task(wait("batch", "batch")), asyncio.create_task(wait("interactive", "interactive"))]
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 1 and not order
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(main()) == ["interactive", "batch"]
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from qdrant_client.http import models
+
+from shared.local_vector_store import LocalCollection, compact_segments, write_segment
+
+VECTORS = np.array([[0.0, 0.0], [1.0, 0.0], [0.0, 2.0], [3.0, 3.0]], dtype=np.float32)
+PAYLOADS = [
+    {"page_content": "甲", "metadata": {"doc_name": "a.pdf", "tags": ["x", "y"]}},
+    {"page_content": "乙", "metadata": {"doc_name": "b.pdf", "tags": ["y"]}},
+    {"page_content": "丙", "metadata": {"doc_name": "a.pdf", "tags": []}},
+    {"page_content": "丁", "metadata": {"doc_name": "c.pdf"}},
+]
+
+
+@pytest.fixture(params=["float32", "int8"])
+def collection(tmp_path, request) -> LocalCollection:
+    LocalCollection.write(tmp_path / "c", ["p0", "p1", "p2", "p3"], VECTORS, PAYLOADS, dtype=request.param)
+    return LocalCollection("c", tmp_path / "c")
+
+
+def _rows(mask: np.ndarray) -> list[int]:
+    return np.flatnonzero(mask).tolist()
+
+
+def test_filter_mask_dict_and_match_value(collection) -> None:
+    assert _rows(collection.filter_mask({"metadata.doc_name": "a.pdf"})) == [0, 2]
+    condition = models.FieldCondition(key="metadata.doc_name", match=models.MatchValue(value="b.pdf"))
+    assert _rows(collection.filter_mask(models.Filter(must=[condition]))) == [1]
+
+
+def test_filter_mask_any_text_and_array_fields(collection) -> None:
+    any_of = models.FieldCondition(key="metadata.doc_name", match=models.MatchAny(any=["b.pdf", "c.pdf"]))
+    text = models.FieldCondition(key="metadata.doc_name", match=models.MatchText(text="a."))
+    tag = models.FieldCondition(key="metadata.tags", match=models.MatchValue(value="y"))
+    assert _rows(collection.filter_mask(models.Filter(must=[any_of]))) == [1, 3]
+    assert _rows(collection.filter_mask(models.Filter(must=[text]))) == [0, 2]
+    assert _rows(collection.filter_mask(models.Filter(must=[tag]))) == [0, 1]
+
+
+def test_filter_mask_should_and_must_not(collection) -> None:
+    a = models.FieldCondition(key="metadata.doc_name", match=models.MatchValue(value="a.pdf"))
+    tag = models.FieldCondition(key="metadata.tags", match=models.MatchValue(value="y"))
+    assert _rows(collection.filter_mask(models.Filter(should=[a, tag], must_not=[tag]))) == [2]
+    assert _rows(collection.filter_mask(models.Filter(should=[]))) == [0, 1, 2, 3]
+
+
+def test_dense_search_orders_by_distance_and_applies_mask(collection) -> None:
+    rows, distances = collection.dense_search([1.0, 0.1], k=3)
+    assert rows.tolist() == [1, 0, 2]
+    assert distances[0] == pytest.approx(0.1, abs=0.02)
+    assert np.all(np.diff(distances) >= 0)
+
+    rows, _ = collection.dense_search([1.0, 0.1], k=3, mask=collection.filter_mask({"metadata.doc_name": "a.pdf"}))
+    assert rows.tolist() == [0, 2]
+
+
+def test_segments_are_compacted_in_write_order(tmp_path) -> None:
+    path = tmp_path / "c"
+    write_segment(path, ["p0", "p1"], VECTORS[:2], PAYLOADS[:2])
+    write_segment(path, ["p2", "p3"], VECTORS[2:], PAYLOADS[2:])
+    compact_segments(path)
+
+    collection = LocalCollection("c", path)
+    assert collection.ids == ["p0", "p1", "p2", "p3"]
+    assert not any((path / "segments").iterdir())
+    assert collection.fetch(["p2"])["p2"].page_content == "丙"
+    assert collection.dense_search([3.0, 3.0], k=1)[0].tolist() == [3]
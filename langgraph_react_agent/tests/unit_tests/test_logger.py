@@ -0,0 +1,42 @@
+import json
+import logging
+import queue
+
+from shared.logger import JsonFormatter, NonBlockingQueueHandler, truncate
+
+
+def _record(msg: str, *args, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_truncate_keeps_head_and_tail() -> None:
+    value = "a" * 100 + "b" * 100
+    truncated = truncate(value, limit=40)
+    assert truncated.startswith("a" * 30)
+    assert truncated.endswith("b" * 10)
+    assert "160 chars truncated" in truncated
+    assert truncate("short", limit=40) == "short"
+
+
+def test_prepare_truncates_large_extra() -> None:
+    handler = NonBlockingQueueHandler(queue.SimpleQueue())
+    record = _record("阻塞 %s", "x" * 10_000, stack="frame\n" * 10_000, owner="node", duration_ms=12.5)
+    prepared = handler.prepare(record)
+    assert len(prepared.stack) < 2_100
+    assert "chars truncated" in prepared.stack
+    assert len(prepared.args[0]) < 2_100
+    assert prepared.owner == "node"
+    assert prepared.duration_ms == 12.5
+
+
+def test_prepare_snapshots_mutable_extra() -> None:
+    handler = NonBlockingQueueHandler(queue.SimpleQueue())
+    payload = {"ids": [1, 2], "text": "y" * 5_000}
+    prepared = handler.prepare(_record("payload", payload=payload))
+    payload["ids"].append(3)
+    entry = json.loads(JsonFormatter().format(prepared))
+    assert entry["payload"]["ids"] == [1, 2]
+    assert len(entry["payload"]["text"]) < 2_100
@@ -0,0 +1,30 @@
+import asyncio
+import gc
+import weakref
+
+from shared import loop_monitor
+from shared.settings import reload_settings
+
+
+def test_monitor_does_not_keep_finished_loop_alive(monkeypatch) -> None:
+    monkeypatch.setenv("LOOP_MONITOR_ENABLED", "true")
+    reload_settings()
+    loops: list[weakref.ref] = []
+
+    async def main() -> loop_monitor.LoopMonitor:
+        loops.append(weakref.ref(asyncio.get_running_loop()))
+        monitor = loop_monitor.ensure_loop_monitor()
+        await asyncio.sleep(0)
+        return monitor
+
+    try:
+        monitor = asyncio.run(main())
+    finally:
+        monkeypatch.undo()
+        reload_settings()
+    gc.collect()
+
+    assert monitor is not None
+    assert loops[0]() is None
+    assert len(loop_monitor._monitors) == 0
+    assert monitor._task is None
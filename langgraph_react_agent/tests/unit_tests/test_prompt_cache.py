@@ -0,0 +1,53 @@
+from shared.prompt_cache import build_system_message, cache_style, split_template
+
+
+def test_split_template_moves_volatile_lines() -> None:
+    template = "你是助理。\n\nSystem time: {system_time}\n請用繁體中文回答。"
+    assert split_template(template) == ("你是助理。\n\n請用繁體中文回答。", "System time: {system_time}")
+
+
+def test_split_template_without_volatile_fields() -> None:
+    assert split_template("只有固定內容\n第二行") == ("只有固定內容\n第二行", "")
+
+
+def test_split_template_custom_fields() -> None:
+    assert split_template("a {user}\nb\nc {now}", volatile=("user", "now")) == ("b", "a {user}\nc {now}")
+
+
+TEMPLATE = "你是助理。\nSystem time: {system_time}"
+
+
+def _model(class_name: str, model_id: str, **attrs: object) -> object:
+    return type(class_name, (), {"model_id": model_id, **attrs})()
+
+
+def test_cache_style_by_model_class_and_id() -> None:
+    assert cache_style(_model("ChatBedrockConverse", "anthropic.claude-3-7-sonnet-20250219-v1:0")) == "converse"
+    assert cache_style(_model("ChatBedrock", "us.anthropic.claude-sonnet-4-20250514-v1:0")) == "anthropic"
+    assert cache_style(_model("ChatBedrock", "amazon.nova-pro-v1:0", beta_use_converse_api=True)) == "converse"
+    assert cache_style(_model("ChatBedrockConverse", "anthropic.claude-3-5-sonnet-20240620-v1:0")) is None
+    assert cache_style(_model("ChatOpenAI", "claude-sonnet-4")) is None
+
+
+def test_build_system_message_converse_checkpoint() -> None:
+    model = _model("ChatBedrockConverse", "amazon.nova-pro-v1:0")
+    message = build_system_message(TEMPLATE, model, system_time="now")
+    assert message.content == [
+        {"type": "text", "text": "你是助理。"},
+        {"cachePoint": {"type": "default"}},
+        {"type": "text", "text": "System time: now"},
+    ]
+
+
+def test_build_system_message_anthropic_checkpoint() -> None:
+    model = _model("ChatBedrock", "anthropic.claude-3-5-haiku-20241022-v1:0")
+    message = build_system_message(TEMPLATE, model, system_time="now")
+    assert message.content == [
+        {"type": "text", "text": "你是助理。", "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "System time: now"},
+    ]
+
+
+def test_build_system_message_plain_text_without_cache() -> None:
+    model = _model("ChatBedrockConverse", "amazon.nova-pro-v1:0")
+    assert build_system_message(TEMPLATE, model, cache=False, system_time="now").content == "你是助理。\n\nSystem time: now"
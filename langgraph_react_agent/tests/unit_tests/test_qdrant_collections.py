@@ -0,0 +1,82 @@
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from fake_services.qdrant import qdrant_environment
+from shared import qdrant_collections
+from shared.base_configuration import BaseConfiguration
+from shared.qdrant_collections import (
+    DOC_NAME_TEXT_FIELD,
+    CollectionSpec,
+    bootstrap_collection,
+    configured_spec,
+    copy_payload_fields,
+)
+from shared.settings import reload_settings
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    for key, value in qdrant_environment().items():
+        monkeypatch.setenv(key, value)
+    qdrant_collections._checked.clear()
+    yield monkeypatch
+    monkeypatch.undo()
+    reload_settings()
+    qdrant_collections._checked.clear()
+
+
+def _spec(name: str = "c") -> CollectionSpec:
+    return CollectionSpec(name=name, dense_size=2)
+
+
+def test_sparse_vectors_default_to_no_idf_modifier() -> None:
+    assert _spec().sparse_idf is False
+
+
+def test_migrate_mode_only_verifies_in_request_path(environment) -> None:
+    environment.setenv("QDRANT_COLLECTION_BOOTSTRAP", "migrate")
+    reload_settings()
+    client = QdrantClient(":memory:")
+    bootstrap_collection(client, _spec())
+    assert not client.collection_exists("c")
+    bootstrap_collection(client, _spec(), allow_migrate=True)
+    assert client.collection_exists("c")
+
+
+def test_migrate_failure_raises_once(environment, monkeypatch) -> None:
+    environment.setenv("QDRANT_COLLECTION_BOOTSTRAP", "migrate")
+    reload_settings()
+    calls = []
+
+    def ensure_collection(client, spec):
+        calls.append(spec.name)
+        raise ValueError("需要重新建立")
+
+    monkeypatch.setattr(qdrant_collections, "ensure_collection", ensure_collection)
+    with pytest.raises(ValueError):
+        bootstrap_collection(None, _spec(), allow_migrate=True)
+    bootstrap_collection(None, _spec(), allow_migrate=True)
+    assert calls == ["c"]
+
+
+def test_spec_quantization_comes_from_deployment_settings(environment) -> None:
+    environment.setenv("QDRANT_VECTOR_QUANTIZATION", "scalar")
+    reload_settings()
+    configuration = BaseConfiguration(embedding_model="Microsoft/intfloat/multilingual-e5-large", vector_quantization="none")
+    assert configured_spec(configuration).quantization == "scalar"
+
+
+def test_copy_payload_fields_backfills_text_field() -> None:
+    client = QdrantClient(":memory:")
+    client.create_collection("c", vectors_config=models.VectorParams(size=2, distance=models.Distance.EUCLID))
+    client.upsert(
+        "c",
+        [
+            models.PointStruct(id=i, vector=[float(i), 0.0], payload={"metadata": {"doc_name": f"規格書{i % 2}"}})
+            for i in range(4)
+        ],
+    )
+    copy_payload_fields(client, "c")
+    points, _ = client.scroll("c", with_payload=True)
+    assert {point.id: point.payload[DOC_NAME_TEXT_FIELD] for point in points} == {0: "規格書0", 1: "規格書1", 2: "規格書0", 3: "規格書1"}
@@ -0,0 +1,21 @@
+from shared.remote_embedding import ProviderLimits, split_batches
+
+
+def test_split_batches_by_item_count() -> None:
+    texts = [str(i) for i in range(7)]
+    batches = split_batches(texts, ProviderLimits(max_items=3))
+    assert batches == [["0", "1", "2"], ["3", "4", "5"], ["6"]]
+
+
+def test_split_batches_by_char_count() -> None:
+    batches = split_batches(["aaaa", "bbbb", "cc", "dddddd"], ProviderLimits(max_items=10, max_chars=8))
+    assert batches == [["aaaa", "bbbb"], ["cc", "dddddd"]]
+
+
+def test_split_batches_oversized_text_gets_own_batch() -> None:
+    batches = split_batches(["a", "b" * 20, "c"], ProviderLimits(max_items=10, max_chars=5))
+    assert batches == [["a"], ["b" * 20], ["c"]]
+
+
+def test_split_batches_empty() -> None:
+    assert split_batches([], ProviderLimits(max_items=3)) == []
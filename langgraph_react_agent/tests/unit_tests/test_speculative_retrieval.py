@@ -0,0 +1,22 @@
+from shared.speculative_retrieval import similarity
+
+
+def test_similarity_contained_query() -> None:
+    assert similarity("請問台幣轉帳的手續費是多少", "台幣轉帳的手續費") == 1.0
+
+
+def test_similarity_ignores_width_case_and_punctuation() -> None:
+    assert similarity("ＥＣ２ 執行個體怎麼建立？", "ec2執行個體") == 1.0
+
+
+def test_similarity_unrelated_query() -> None:
+    assert similarity("基金申購流程", "保險理賠") == 0.0
+
+
+def test_similarity_extra_conditions_lower_score() -> None:
+    message = "30 歲男性適合哪種保險"
+    assert similarity(message, "保險") > similarity(message, "保險, 年齡: 30, 性別:女")
+
+
+def test_similarity_empty_query() -> None:
+    assert similarity("任何訊息", "") == 0.0